@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Batched multi-query search: per-query cost of VectorStore.search_batch for
+growing batch sizes, and the /search micro-batcher under open-loop load
+(queries arrive at a fixed rate whether or not earlier ones finished).
+
+Usage:
+    python scripts/benchmarks/bench_batch_search.py --size 100000 --rates 100,300,1000
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from common import embedding_like_vectors
+from services.vectorial_db.batcher import SearchBatcher
+from services.vectorial_db.main import VectorDatabase
+
+
+async def open_loop(search, queries, rate: float, duration: float):
+    """Issue queries at `rate` per second for `duration` seconds; returns (achieved QPS, latencies ms)"""
+    latencies = []
+
+    async def one(query, scheduled):
+        await search(query)
+        latencies.append(time.perf_counter() - scheduled)
+
+    tasks = []
+    start = time.perf_counter()
+    for i in range(int(rate * duration)):
+        scheduled = start + i / rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(queries[i % len(queries)], scheduled)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    return len(tasks) / elapsed, np.array(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--batch-sizes", default="1,8,32,128")
+    parser.add_argument("--rates", default="100,300,1000")
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--window-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    corpus, queries = embedding_like_vectors(args.size, 512, args.dim, rng)
+    db = VectorDatabase()
+    db.restore_rows([f"emb_{i}" for i in range(args.size)], corpus,
+                    [{"task_id": f"task_{i // 1000}"} for i in range(args.size)])
+
+    print(f"Batched search ({args.size} vectors, dim {args.dim}, top-{args.top_k})")
+    print("=" * 72)
+    print(f"{'batch':>8} {'loop ms/query':>15} {'batch ms/query':>16} {'speedup':>9}")
+    for batch_size in [int(b) for b in args.batch_sizes.split(",")]:
+        batch = queries[:batch_size]
+        start = time.perf_counter()
+        for query in batch:
+            db.vectors.search(query, args.top_k)
+        loop_ms = (time.perf_counter() - start) * 1000 / batch_size
+        start = time.perf_counter()
+        db.vectors.search_batch(batch, args.top_k)
+        batch_ms = (time.perf_counter() - start) * 1000 / batch_size
+        print(f"{batch_size:>8} {loop_ms:>15.2f} {batch_ms:>16.2f} {loop_ms / batch_ms:>8.1f}x")
+
+    print(f"\nOpen-loop /search load ({args.duration:.0f}s per rate, batcher window {args.window_ms} ms)")
+    print(f"{'offered':>8} {'mode':>10} {'QPS':>8} {'p50 ms':>10} {'p99 ms':>10} {'mean batch':>11}")
+    for rate in [float(r) for r in args.rates.split(",")]:
+        async def direct(query):
+            return db.search(query, args.top_k)
+
+        batcher = SearchBatcher(db, window_ms=args.window_ms, max_batch=256)
+        for mode, search in (("single", direct), ("batched", lambda q: batcher.search(q, args.top_k))):
+            qps, lat = asyncio.run(open_loop(search, queries, rate, args.duration))
+            mean_batch = batcher.get_stats()["mean_batch_size"] if mode == "batched" else 1
+            print(f"{rate:>8.0f} {mode:>10} {qps:>8.0f} {np.percentile(lat, 50):>10.1f} "
+                  f"{np.percentile(lat, 99):>10.1f} {mean_batch:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Sign-bit prefilter: recall@k and latency of a Hamming scan over packed
+binary codes whose top_k * multiplier candidates are re-ranked with exact
+cosine from the full-precision side store, against the exact float32 scan.
+
+Usage:
+    python scripts/benchmarks/bench_binary_prefilter.py --size 200000 --multipliers 0 5 10 20 50
+"""
+import argparse
+
+import numpy as np
+
+from common import embedding_like_vectors, recall_at_k, time_queries
+from services.vectorial_db.codecs import BinaryCodec
+from services.vectorial_db.store import VectorStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--multipliers", type=int, nargs="+", default=[0, 5, 10, 20, 50])
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    corpus, queries = embedding_like_vectors(args.size, args.queries, args.dim, rng)
+    ids = [f"emb_{i}" for i in range(args.size)]
+
+    exact_store = VectorStore(dimension=args.dim, initial_capacity=args.size)
+    exact_store.add_batch(ids, corpus)
+    exact = [exact_store.search(q, args.top_k)[0] for q in queries]
+    lat = time_queries(lambda q: exact_store.search(q, args.top_k), queries, args.queries)
+    scanned_mb = exact_store.codes.nbytes / 2 ** 20
+
+    print(f"Sign-bit prefilter ({args.size} vectors, dim {args.dim}, recall@{args.top_k})")
+    print("=" * 72)
+    print(f"{'scan':>16} {'multiplier':>11} {'scanned MB':>11} {'recall':>8} {'p50 ms':>9} {'p99 ms':>9}")
+    print(f"{'float32 exact':>16} {'-':>11} {scanned_mb:>11.1f} {1.0:>8.3f} "
+          f"{np.percentile(lat, 50):>9.2f} {np.percentile(lat, 99):>9.2f}")
+    del exact_store
+
+    for multiplier in args.multipliers:
+        store = VectorStore(dimension=args.dim, initial_capacity=args.size, codec=BinaryCodec(),
+                            codec_train_threshold=min(args.size, 65536), rerank_factor=multiplier)
+        store.add_batch(ids, corpus)
+        approx = [store.search(q, args.top_k)[0] for q in queries]
+        lat = time_queries(lambda q: store.search(q, args.top_k), queries, args.queries)
+        print(f"{'binary':>16} {multiplier or '-':>11} {store.codes.nbytes / 2 ** 20:>11.1f} "
+              f"{recall_at_k(approx, exact):>8.3f} {np.percentile(lat, 50):>9.2f} {np.percentile(lat, 99):>9.2f}")
+        del store
+
+    print("\nWith a multiplier the float32 rows are kept in the re-rank side store (on disk with RERANK_STORE_PATH);")
+    print("only top_k * multiplier of them are read per query.")
+
+
+if __name__ == "__main__":
+    main()
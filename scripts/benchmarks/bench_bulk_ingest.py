@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Ingestion throughput of the vectorial DB consumer path: the previous
+per-embedding path (pydantic validation, one add and one WAL sync per
+embedding, one status update per embedding) against the bulk append (one
+matrix block, one WAL record and sync per batch, one status update per task).
+
+Usage:
+    python scripts/benchmarks/bench_bulk_ingest.py --size 50000 --batch 500 --chunks-per-task 500
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from common import embedding_like_vectors
+from services.vectorial_db.main import VectorDatabase
+from services.vectorial_db.persistence import VectorPersistence
+from shared.models.embedding import Embedding
+
+
+def payloads(corpus, chunks_per_task):
+    return [{
+        "id": f"chunk_{i}_emb",
+        "chunk_id": f"chunk_{i}",
+        "task_id": f"task_{i // chunks_per_task}",
+        "vector": vector,
+        "model_name": "mock-embedding-model",
+        "dimension": len(vector),
+        "task_embedding_count": chunks_per_task
+    } for i, vector in enumerate(corpus.tolist())]
+
+
+def per_embedding(db, batches):
+    status_updates = 0
+    for batch in batches:
+        for emb_data in batch:
+            db.add_embedding(Embedding(**emb_data))
+            db.sync()
+            status_updates += 1
+    return status_updates
+
+
+def bulk(db, batches):
+    status_updates, done = 0, set()
+    for batch in batches:
+        received = db.add_embeddings(batch)
+        db.sync()
+        for task_id in received:
+            if task_id not in done and len(db.task_embeddings[task_id]) >= batch[0]["task_embedding_count"]:
+                done.add(task_id)
+                status_updates += 1
+    return status_updates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--chunks-per-task", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    corpus, _ = embedding_like_vectors(args.size, 1, args.dim, rng)
+    data = payloads(corpus, args.chunks_per_task)
+    batches = [data[i:i + args.batch] for i in range(0, len(data), args.batch)]
+
+    print(f"Ingestion ({args.size} embeddings, dim {args.dim}, batches of {args.batch}, "
+          f"{args.chunks_per_task} chunks per task)")
+    print("=" * 72)
+    print(f"{'path':>16} {'wal':>5} {'seconds':>9} {'emb/s':>10} {'status PUTs':>12}")
+    for wal in (False, True):
+        for name, ingest in (("per-embedding", per_embedding), ("bulk", bulk)):
+            data_dir = tempfile.mkdtemp()
+            db = VectorDatabase(persistence=VectorPersistence(data_dir) if wal else None)
+            start = time.perf_counter()
+            updates = ingest(db, batches)
+            seconds = time.perf_counter() - start
+            print(f"{name:>16} {str(wal):>5} {seconds:>9.2f} {args.size / seconds:>10.0f} {updates:>12}")
+            if db.persistence is not None:
+                db.persistence.close()
+            shutil.rmtree(data_dir)
+
+
+if __name__ == "__main__":
+    main()
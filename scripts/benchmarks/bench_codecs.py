@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Memory per million vectors, recall@k and scan latency for each vector codec,
+with and without exact re-ranking from the full-precision side store.
+
+Usage:
+    python scripts/benchmarks/bench_codecs.py --size 200000 --rerank-factor 4
+"""
+import argparse
+
+import numpy as np
+
+from common import embedding_like_vectors, recall_at_k, time_queries
+from services.vectorial_db.codecs import create_codec
+from services.vectorial_db.store import VectorStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--codecs", default="float32,float16,sq8,pq,binary")
+    parser.add_argument("--pq-subspaces", type=int, default=48)
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    corpus, queries = embedding_like_vectors(args.size, args.queries, args.dim, rng)
+    ids = [f"emb_{i}" for i in range(args.size)]
+
+    exact_store = VectorStore(dimension=args.dim, initial_capacity=args.size)
+    exact_store.add_batch(ids, corpus)
+    exact = [exact_store.search(q, args.top_k)[0] for q in queries]
+    del exact_store
+
+    print(f"Vector codecs ({args.size} vectors, dim {args.dim}, recall@{args.top_k})")
+    print("=" * 72)
+    print(f"{'codec':>8} {'rerank':>7} {'MB / 1M vectors':>16} {'recall':>8} {'p50 ms':>10} {'p99 ms':>10}")
+    for name in args.codecs.split(","):
+        for rerank_factor in sorted({0, args.rerank_factor}):
+            if name == "float32" and rerank_factor:
+                continue
+            store = VectorStore(dimension=args.dim, initial_capacity=args.size,
+                                codec=create_codec(name, pq_subspaces=args.pq_subspaces),
+                                codec_train_threshold=min(args.size, 65536), rerank_factor=rerank_factor)
+            store.add_batch(ids, corpus)
+            per_million = store.codes.nbytes / args.size * 1_000_000 / 2 ** 20
+            approx = [store.search(q, args.top_k)[0] for q in queries]
+            lat = time_queries(lambda q: store.search(q, args.top_k), queries, args.queries)
+            print(f"{name:>8} {rerank_factor or '-':>7} {per_million:>16.0f} {recall_at_k(approx, exact):>8.3f} "
+                  f"{np.percentile(lat, 50):>10.2f} {np.percentile(lat, 99):>10.2f}")
+            del store
+
+    print("\nThe re-rank side store adds dim * 4 bytes per vector, on disk when RERANK_STORE_PATH is set.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Scan latency of the vectorial DB as tasks are deleted: before any delete,
+with a share of the rows tombstoned (still scanned, then masked out), and
+after the purge rewrote the store without them. Also reports how long the
+purge build (off the event loop) and the commit (the only blocking part) take.
+
+Usage:
+    python scripts/benchmarks/bench_delete_compaction.py --size 200000 --deleted 0.2 0.5
+"""
+import argparse
+import time
+
+import numpy as np
+
+from common import embedding_like_vectors, time_queries
+from services.vectorial_db.main import VectorDatabase
+
+
+def build_db(corpus, chunks_per_task):
+    db = VectorDatabase()
+    db.add_embeddings([{
+        "id": f"emb_{i}",
+        "chunk_id": f"chunk_{i}",
+        "task_id": f"task_{i // chunks_per_task}",
+        "model_name": "mock-embedding-model",
+        "dimension": corpus.shape[1]
+    } for i in range(corpus.shape[0])], vectors=corpus)
+    return db
+
+
+def row(label, db, queries, repeats, task_id):
+    unfiltered = time_queries(lambda q: db.search(q, top_k=10), queries, repeats)
+    filtered = time_queries(lambda q: db.search(q, top_k=10, task_ids=[task_id]), queries, repeats)
+    print(f"{label:>22} {len(db.vectors):>9} {db.vectors.dead_rows:>9} "
+          f"{np.percentile(unfiltered, 50):>12.2f} {np.percentile(filtered, 50):>12.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--chunks-per-task", type=int, default=1000)
+    parser.add_argument("--deleted", type=float, nargs="+", default=[0.2, 0.5])
+    parser.add_argument("--repeats", type=int, default=30)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    corpus, queries = embedding_like_vectors(args.size, 16, args.dim, rng)
+    queries = queries.tolist()
+    n_tasks = args.size // args.chunks_per_task
+
+    print(f"Delete + purge ({args.size} vectors, dim {args.dim}, {n_tasks} tasks, p50 ms of top-10)")
+    print("=" * 72)
+    print(f"{'state':>22} {'rows':>9} {'dead':>9} {'unfiltered':>12} {'one task':>12}")
+    for share in args.deleted:
+        db = build_db(corpus, args.chunks_per_task)
+        kept_task = f"task_{n_tasks - 1}"
+        row("before delete", db, queries, args.repeats, kept_task)
+        # Every k-th task, so deleted rows are spread over the whole store
+        step = max(1, round(1 / share))
+        for t in range(0, n_tasks - 1, step):
+            db.delete_task(f"task_{t}")
+        row(f"{share:.0%} tombstoned", db, queries, args.repeats, kept_task)
+
+        job = db.start_purge()
+        start = time.perf_counter()
+        db.build_purge(job)
+        built = time.perf_counter() - start
+        start = time.perf_counter()
+        db.commit_purge(job)
+        committed = time.perf_counter() - start
+        row("after purge", db, queries, args.repeats, kept_task)
+        print(f"{'':>22} purge build {built * 1000:.0f} ms (background), commit {committed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
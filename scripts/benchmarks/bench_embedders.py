@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Embedder throughput for capacity planning: embeddings per second, and the
+characters per second behind them, for each EMBEDDER backend against batch
+size, on synthetic chunks of --chars characters drawn from a Zipf-distributed
+vocabulary. Single-threaded, i.e. what one embedding container's CPU gives.
+
+Usage:
+    python scripts/benchmarks/bench_embedders.py --texts 5000 --chars 1000 --batch-sizes 1 32 256 1024
+"""
+import argparse
+import time
+
+import numpy as np
+
+import common  # noqa: F401  (puts the repository root on sys.path)
+from shared.utils.embedders import create_embedder
+
+
+def synthetic_chunks(n: int, chars: int, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    vocabulary = ["".join(rng.choice(letters, rng.integers(2, 11))) for _ in range(20_000)]
+    texts = []
+    for _ in range(n):
+        words = rng.zipf(1.3, chars // 4) % len(vocabulary)
+        texts.append(" ".join(vocabulary[w] for w in words)[:chars])
+    return texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--texts", type=int, default=5000)
+    parser.add_argument("--chars", type=int, default=1000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--backends", nargs="+", default=["mock", "hashing-tfidf"])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 32, 256, 1024])
+    args = parser.parse_args()
+
+    texts = synthetic_chunks(args.texts, args.chars)
+    total_chars = sum(len(text) for text in texts)
+
+    print(f"Embedders ({args.texts} texts of ~{args.chars} chars, dimension {args.dimension})")
+    print("=" * 80)
+    print(f"{'backend':>14} {'batch':>7} {'embeddings/s':>13} {'MB text/s':>10} {'ms/batch':>9}")
+    for backend in args.backends:
+        started = time.perf_counter()
+        embedder = create_embedder(backend, args.dimension)
+        setup = time.perf_counter() - started
+        embedder.embed_batch(texts[:8])
+        for batch_size in args.batch_sizes:
+            batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+            started = time.perf_counter()
+            for batch in batches:
+                embedder.embed_batch(batch)
+            elapsed = time.perf_counter() - started
+            print(f"{backend:>14} {batch_size:>7} {len(texts) / elapsed:>13,.0f} "
+                  f"{total_chars / elapsed / 1e6:>10.2f} {1000 * elapsed / len(batches):>9.2f}")
+        print(f"{backend:>14} set-up {1000 * setup:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
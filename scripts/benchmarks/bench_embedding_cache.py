@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+EmbeddingCache effect on embedding throughput: chunks per second through
+EmbeddingCache.embed_batch for a stream where --repeat of the chunks are
+re-sent (re-uploads, boilerplate), uncached vs the memory tier vs the disk
+tier alone (memory tier disabled, e.g. after a restart), plus the plain
+lookup cost of a fully warm cache.
+
+Usage:
+    python scripts/benchmarks/bench_embedding_cache.py --backend hashing-tfidf --texts 20000 --repeat 0.5
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import common  # noqa: F401  (puts the repository root on sys.path)
+from bench_embedders import synthetic_chunks
+from shared.utils.embedders import create_embedder
+from shared.utils.embedding_cache import EmbeddingCache
+
+
+def run(cache, embedder, batches) -> float:
+    start = time.perf_counter()
+    for batch in batches:
+        if cache is None:
+            embedder.embed_batch(batch)
+        else:
+            cache.embed_batch(embedder, batch)
+    return sum(len(batch) for batch in batches) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default="hashing-tfidf")
+    parser.add_argument("--texts", type=int, default=20_000)
+    parser.add_argument("--chars", type=int, default=1000)
+    parser.add_argument("--repeat", type=float, default=0.5, help="fraction of the stream that repeats a chunk")
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    distinct = synthetic_chunks(int(args.texts * (1 - args.repeat)) or 1, args.chars)
+    picks = np.concatenate([np.arange(len(distinct)), rng.integers(0, len(distinct), args.texts - len(distinct))])
+    rng.shuffle(picks)
+    stream = [distinct[i] for i in picks]
+    batches = [stream[start:start + args.batch_size] for start in range(0, len(stream), args.batch_size)]
+    embedder = create_embedder(args.backend)
+
+    print(f"EmbeddingCache ({args.backend}, {args.texts} chunks of ~{args.chars} chars, "
+          f"{args.repeat:.0%} repeats, batches of {args.batch_size}), chunks/s")
+    print("=" * 80)
+    with tempfile.TemporaryDirectory() as directory:
+        memory = EmbeddingCache(max_entries=args.texts)
+        disk = EmbeddingCache(max_entries=0, path=os.path.join(directory, "cache.sqlite"))
+        rows = [("uncached", run(None, embedder, batches)),
+                ("memory tier, cold", run(memory, embedder, batches)),
+                ("disk tier only, cold", run(disk, embedder, batches)),
+                ("memory tier, warm", run(memory, embedder, batches)),
+                ("disk tier only, warm", run(disk, embedder, batches))]
+        for label, rate in rows:
+            print(f"{label:>22} {rate:>12,.0f}")
+        stats = memory.get_stats()
+        print(f"hit ratio after both passes {stats['hit_ratio']:.2f}, "
+              f"{stats['text_bytes_saved'] / 1e6:.1f} MB of text not re-embedded, "
+              f"memory tier {stats['memory_bytes'] / 1e6:.1f} MB, "
+              f"disk file {disk.get_stats()['disk']['file_bytes'] / 1e6:.1f} MB")
+        disk.close()
+
+
+if __name__ == "__main__":
+    main()
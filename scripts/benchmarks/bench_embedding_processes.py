@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Embedding throughput against worker processes, and what it costs the event
+loop. Each configuration embeds --texts chunks through EmbeddingScheduler
+(batches of --max-batch, up to one in flight per worker) while a ticker
+coroutine, like heartbeat_loop, measures how late the event loop wakes it:
+
+    in-loop      the embedder called on the event loop, as before the scheduler
+    thread       one background thread (EMBEDDING_PROCESSES=0)
+    N processes  EmbeddingProcessPool with N workers (EMBEDDING_PROCESSES=N)
+
+Also compares returning a batch through the shared-memory slot with
+returning it as pickled lists. Scaling is bounded by the cores available
+(os.sched_getaffinity is printed).
+
+Usage:
+    python scripts/benchmarks/bench_embedding_processes.py --processes 1 2 4 --texts 8000
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import common  # noqa: F401  (puts the repository root on sys.path)
+from bench_embedders import synthetic_chunks
+from services.embedding.scheduler import EmbeddingScheduler
+from services.embedding.workers import EmbeddingProcessPool, start_worker
+from shared.utils.embedders import create_embedder
+
+
+def embed_as_lists(texts):
+    """Worker-side baseline: ship the vectors back pickled"""
+    from services.embedding import workers
+    return workers._embedder.embed_batch(texts).tolist()
+
+
+async def run(embed_task, texts, max_batch):
+    """(texts/s, worst event-loop lag in ms) embedding `texts` in tasks of max_batch chunks"""
+    lag = [0.0]
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            expected = time.monotonic() + 0.01
+            await asyncio.sleep(0.01)
+            lag[0] = max(lag[0], time.monotonic() - expected)
+
+    tick = asyncio.ensure_future(ticker())
+    await asyncio.sleep(0.02)
+    start = time.monotonic()
+    await asyncio.gather(*(embed_task(f"task_{i}", texts[i:i + max_batch]) for i in range(0, len(texts), max_batch)))
+    elapsed = time.monotonic() - start
+    done.set()
+    await tick
+    return len(texts) / elapsed, lag[0] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default="hashing-tfidf")
+    parser.add_argument("--texts", type=int, default=8000)
+    parser.add_argument("--chars", type=int, default=1000)
+    parser.add_argument("--max-batch", type=int, default=256)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    # Worker processes build their embedder from the environment, like the service's
+    os.environ["EMBEDDER"] = args.backend
+    texts = synthetic_chunks(args.texts, args.chars)
+    embedder = create_embedder()
+    embedder.embed_batch(texts[:8])
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+
+    print(f"Embedding workers ({args.backend}, {args.texts} chunks of ~{args.chars} chars, "
+          f"batches of {args.max_batch}, {cores} cores available)")
+    print("=" * 80)
+    print(f"{'':>12} {'texts/s':>9} {'max loop lag ms':>16}")
+
+    async def in_loop(_, batch):
+        return embedder.embed_batch(batch)
+
+    rate, lag = asyncio.run(run(in_loop, texts, args.max_batch))
+    print(f"{'in-loop':>12} {rate:>9,.0f} {lag:>16.0f}")
+
+    scheduler = EmbeddingScheduler(embedder.embed_batch, max_batch=args.max_batch, max_wait_ms=5)
+    rate, lag = asyncio.run(run(scheduler.embed, texts, args.max_batch))
+    print(f"{'thread':>12} {rate:>9,.0f} {lag:>16.0f}")
+    scheduler.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for processes in args.processes:
+            pool = EmbeddingProcessPool(processes, embedder.dimension, os.path.join(directory, str(processes)))
+            pool.embed_batch(texts[:processes])
+            scheduler = EmbeddingScheduler(pool.embed_batch, max_batch=args.max_batch, max_wait_ms=5,
+                                           max_in_flight=processes)
+            # One warm-up pass so every worker has built its embedder
+            asyncio.run(run(scheduler.embed, texts[:args.max_batch * processes], args.max_batch))
+            rate, lag = asyncio.run(run(scheduler.embed, texts, args.max_batch))
+            print(f"{f'{processes} processes':>12} {rate:>9,.0f} {lag:>16.0f}")
+            scheduler.close()
+            pool.close()
+
+        pool = EmbeddingProcessPool(1, embedder.dimension, os.path.join(directory, "transfer"))
+        lists = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+                                    initializer=start_worker)
+        batch = texts[:args.max_batch]
+        paths = {"shared-memory slot": pool.embed_batch,
+                 "pickled lists": lambda b: np.array(lists.submit(embed_as_lists, b).result(), dtype=np.float32)}
+        seconds = dict.fromkeys(paths, 0.0)
+        # Alternated, so drift on a shared host hits both paths alike
+        for _ in range(21):
+            for label, fn in paths.items():
+                start = time.perf_counter()
+                fn(batch)
+                seconds[label] += time.perf_counter() - start
+        for label, total in seconds.items():
+            print(f"{label:>20}: {1000 * total / 21:.1f} ms per batch of {len(batch)}")
+        lists.shutdown()
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Cross-task micro-batching vs embedding each task on its own: one huge
+document arrives first, then small documents keep arriving (Poisson, --rate
+per second). The per-task baseline embeds each task's chunks in a single
+call, one task at a time in arrival order, as process_single_task did; the
+scheduler mixes every waiting task's chunks into fair batches of
+--max-batch. Reports small-task latency percentiles, the huge task's
+latency, total time and batch statistics.
+
+Usage:
+    python scripts/benchmarks/bench_embedding_scheduler.py --huge 20000 --small-tasks 200 --rate 20
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import common  # noqa: F401  (puts the repository root on sys.path)
+from bench_embedders import synthetic_chunks
+from services.embedding.scheduler import EmbeddingScheduler
+from shared.utils.embedders import create_embedder
+
+
+async def drive(embed_task, tasks, arrivals):
+    """Submit every task at its arrival time; returns each task's latency in seconds"""
+    start = time.monotonic()
+
+    async def one(texts, at):
+        await asyncio.sleep(max(0.0, start + at - time.monotonic()))
+        submitted = time.monotonic()
+        await embed_task(texts)
+        return time.monotonic() - submitted
+
+    latencies = await asyncio.gather(*(one(texts, at) for texts, at in zip(tasks, arrivals)))
+    return np.array(latencies), time.monotonic() - start
+
+
+def report(label, latencies, elapsed, extra=""):
+    small = latencies[1:] * 1000
+    print(f"{label:>10} {np.percentile(small, 50):>9.0f} {np.percentile(small, 95):>9.0f} "
+          f"{small.max():>9.0f} {latencies[0]:>10.1f} {elapsed:>8.1f}  {extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default="hashing-tfidf")
+    parser.add_argument("--huge", type=int, default=20_000, help="chunks in the huge document")
+    parser.add_argument("--small-tasks", type=int, default=200)
+    parser.add_argument("--small-chunks", type=int, nargs=2, default=[2, 20])
+    parser.add_argument("--rate", type=float, default=20.0, help="small documents per second")
+    parser.add_argument("--chars", type=int, default=500)
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    sizes = [args.huge] + rng.integers(args.small_chunks[0], args.small_chunks[1] + 1, args.small_tasks).tolist()
+    pool = synthetic_chunks(sum(sizes), args.chars)
+    bounds = np.cumsum([0] + sizes)
+    tasks = [pool[bounds[i]:bounds[i + 1]] for i in range(len(sizes))]
+    arrivals = np.concatenate([[0.0], np.cumsum(rng.exponential(1 / args.rate, args.small_tasks))])
+    embedder = create_embedder(args.backend)
+    embedder.embed_batch(pool[:8])
+
+    print(f"Embedding scheduler ({args.backend}; 1 task of {args.huge} chunks, then {args.small_tasks} tasks of "
+          f"{args.small_chunks[0]}-{args.small_chunks[1]} chunks at {args.rate:g}/s)")
+    print("=" * 80)
+    print(f"{'':>10} {'small p50':>9} {'small p95':>9} {'small max':>9} {'huge (s)':>10} {'total s':>8}  (ms)")
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    lock = asyncio.Lock()
+
+    async def per_task(texts):
+        async with lock:
+            await asyncio.get_running_loop().run_in_executor(executor, embedder.embed_batch, texts)
+
+    latencies, elapsed = asyncio.run(drive(per_task, tasks, arrivals))
+    report("per-task", latencies, elapsed)
+
+    scheduler = EmbeddingScheduler(embedder.embed_batch, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    latencies, elapsed = asyncio.run(drive(lambda texts: scheduler.embed(str(id(texts)), texts), tasks, arrivals))
+    stats = scheduler.get_stats()
+    report("scheduler", latencies, elapsed,
+           f"fill {stats['fill_ratio']:.2f}, {stats['mean_tasks_per_batch']:.1f} tasks/batch, "
+           f"queue delay mean {stats['mean_queue_delay_ms']:.0f} ms")
+    scheduler.close()
+    executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Task-filtered search: the previous id-list gather against the planner's
+strategies, on a corpus whose tasks arrive interleaved in small batches
+(fragmented) and after compaction (one contiguous range per task).
+
+Usage:
+    python scripts/benchmarks/bench_filtered_search.py --size 200000 --tasks 200 --arrival-batch 50
+"""
+import argparse
+
+import numpy as np
+
+from common import embedding_like_vectors, time_queries
+from services.vectorial_db.main import VectorDatabase
+from services.vectorial_db.planner import QueryPlanner
+
+
+def legacy_filtered_search(db, query, top_k, task_ids):
+    """The pre-planner path: concatenate id lists, look up rows one by one, gather and score"""
+    relevant_ids = []
+    for task_id in task_ids:
+        relevant_ids.extend(db.task_embeddings.get(task_id, []))
+    rows = np.fromiter((db.vectors.id_to_row[i] for i in relevant_ids), dtype=np.int64, count=len(relevant_ids))
+    return db.vectors.search(query, top_k, rows=rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--arrival-batch", type=int, default=50, help="rows per task per arrival batch")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    corpus, queries = embedding_like_vectors(args.size, args.queries, args.dim, rng)
+    # Round-robin arrival of small per-task batches, as with several embedding workers
+    task_of = (np.arange(args.size) // args.arrival_batch) % args.tasks
+    metadata = [{"task_id": f"task_{t}"} for t in task_of.tolist()]
+
+    print(f"Filtered search ({args.size} vectors, dim {args.dim}, {args.tasks} tasks of "
+          f"~{args.size // args.tasks} rows, top-{args.top_k})")
+    print("=" * 72)
+    print(f"{'layout':>12} {'strategy':>10} {'ranges':>8} {'p50 ms':>10} {'p99 ms':>10}")
+    task_ids = ["task_7"]
+    strategies = {
+        "slices": QueryPlanner(max_slices=10 ** 9),
+        "mask": QueryPlanner(max_slices=0, mask_min_selectivity=0.0),
+        "gather": QueryPlanner(max_slices=0, mask_min_selectivity=1.0),
+    }
+    db = VectorDatabase()
+    db.restore_rows([f"emb_{i}" for i in range(args.size)], corpus, metadata)
+    for layout in ("fragmented", "compacted"):
+        if layout == "compacted":
+            db.compact()
+        ranges = len(db.task_ranges["task_7"])
+        lat = time_queries(lambda q: legacy_filtered_search(db, q, args.top_k, task_ids), queries, args.queries)
+        print(f"{layout:>12} {'legacy':>10} {ranges:>8} {np.percentile(lat, 50):>10.2f} {np.percentile(lat, 99):>10.2f}")
+        for name, planner in strategies.items():
+            db.planner = planner
+            lat = time_queries(lambda q: db.search(q, args.top_k, task_ids), queries, args.queries)
+            print(f"{layout:>12} {name:>10} {ranges:>8} {np.percentile(lat, 50):>10.2f} {np.percentile(lat, 99):>10.2f}")
+        db.planner = QueryPlanner()
+        lat = time_queries(lambda q: db.search(q, args.top_k, task_ids), queries, args.queries)
+        print(f"{layout:>12} {'planner':>10} {ranges:>8} {np.percentile(lat, 50):>10.2f} {np.percentile(lat, 99):>10.2f}")
+
+    print(f"\nUnfiltered scan for reference: "
+          f"{np.percentile(time_queries(lambda q: db.search(q, args.top_k), queries, 20), 50):.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
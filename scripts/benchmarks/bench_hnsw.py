@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+HNSW build rate, recall@k and query latency vs ef_search, across corpus sizes.
+
+Usage:
+    python scripts/benchmarks/bench_hnsw.py --sizes 10000,50000 --ef-search 16,32,64,128
+"""
+import argparse
+import time
+
+import numpy as np
+
+from common import embedding_like_vectors, recall_at_k, time_queries
+from services.vectorial_db.hnsw import HNSWIndex
+from services.vectorial_db.store import VectorStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,50000")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--M", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=100)
+    parser.add_argument("--ef-search", default="16,32,64,128")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"HNSW (M={args.M}, ef_construction={args.ef_construction}, dim {args.dim})")
+    print("=" * 60)
+    for n in [int(s) for s in args.sizes.split(",")]:
+        rng = np.random.default_rng(0)
+        corpus, queries = embedding_like_vectors(n, args.queries, args.dim, rng)
+        store = VectorStore(dimension=args.dim, initial_capacity=n)
+        store.add_batch([f"emb_{i}" for i in range(n)], corpus)
+
+        index = HNSWIndex(M=args.M, ef_construction=args.ef_construction)
+        start = time.perf_counter()
+        index.train(store)
+        build = time.perf_counter() - start
+
+        exact = [store.search(q, args.top_k)[0] for q in queries]
+        exact_lat = time_queries(lambda q: store.search(q, args.top_k), queries, args.queries)
+        print(f"\n{n} vectors: built in {build:.1f}s ({n / build:.0f} inserts/s), {len(index.graph)} levels")
+        print(f"{'ef_search':>10} {'recall':>8} {'p50 ms':>10} {'p99 ms':>10}")
+        print(f"{'exact':>10} {1.0:>8.3f} {np.percentile(exact_lat, 50):>10.2f} {np.percentile(exact_lat, 99):>10.2f}")
+        for ef in [int(e) for e in args.ef_search.split(",")]:
+            approx = [index.search(store, q, args.top_k, ef_search=ef)[0] for q in queries]
+            lat = time_queries(lambda q: index.search(store, q, args.top_k, ef_search=ef), queries, args.queries)
+            print(f"{ef:>10} {recall_at_k(approx, exact):>8.3f} {np.percentile(lat, 50):>10.2f} "
+                  f"{np.percentile(lat, 99):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
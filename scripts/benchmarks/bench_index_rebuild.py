@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Index rebuild stalls: search latency and the longest gap between searches
+on the event loop while an IVF index is retrained over a grown store,
+retraining in place (the old synchronous path) versus building a new index
+in a worker thread and swapping it in. Ingest keeps appending rows during
+the rebuild; the swap indexes that delta.
+
+Usage:
+    python scripts/benchmarks/bench_index_rebuild.py --size 200000 --delta 5000
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from common import embedding_like_vectors
+from services.vectorial_db.ivf import IVFIndex
+from services.vectorial_db.main import VectorDatabase
+
+
+def build_db(corpus: np.ndarray, size: int) -> VectorDatabase:
+    db = VectorDatabase(index=IVFIndex(nprobe=8, train_threshold=size), background_rebuilds=True)
+    db.add_embeddings([{"id": f"emb_{i}", "chunk_id": f"chunk_{i}", "task_id": f"task_{i % 100}"}
+                       for i in range(size)], vectors=corpus[:size])
+    db.train_index()
+    return db
+
+
+async def run(db: VectorDatabase, corpus: np.ndarray, queries: np.ndarray, size: int, delta: int,
+              background: bool, top_k: int):
+    latencies, starts = [], []
+    done = asyncio.Event()
+
+    async def query_loop():
+        i = 0
+        while not done.is_set():
+            start = time.perf_counter()
+            starts.append(start)
+            db.search(queries[i % len(queries)], top_k=top_k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            i += 1
+            await asyncio.sleep(0)
+
+    async def ingest_loop():
+        for start in range(size, size + delta, 100):
+            stop = min(start + 100, size + delta)
+            db.add_embeddings([{"id": f"emb_{i}", "chunk_id": f"chunk_{i}", "task_id": f"task_{i % 100}"}
+                               for i in range(start, stop)], vectors=corpus[start:stop])
+            await asyncio.sleep(0.005)
+
+    async def rebuild():
+        await asyncio.sleep(0.05)
+        if background:
+            job = db.start_rebuild()
+            await asyncio.to_thread(db.build_rebuild, job)
+            db.commit_rebuild(job)
+        else:
+            db.train_index()
+        await asyncio.sleep(0.05)
+        done.set()
+
+    tasks = [asyncio.create_task(query_loop()), asyncio.create_task(ingest_loop())]
+    start = time.perf_counter()
+    await rebuild()
+    elapsed = time.perf_counter() - start
+    await asyncio.gather(*tasks)
+    return np.array(latencies), np.diff(starts).max() * 1000, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=200_000)
+    parser.add_argument("--delta", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    corpus, queries = embedding_like_vectors(args.size + args.delta, args.queries, args.dim, rng)
+
+    print(f"IVF rebuild during queries ({args.size} vectors, dim {args.dim}, {args.delta} rows ingested meanwhile)")
+    print("=" * 80)
+    print(f"{'mode':>12} {'rebuild s':>10} {'queries':>8} {'p50 ms':>9} {'p99 ms':>9} {'max gap ms':>11} {'indexed':>9}")
+    for background in (False, True):
+        db = build_db(corpus, args.size)
+        lat, gap, elapsed = asyncio.run(run(db, corpus, queries, args.size, args.delta, background, args.top_k))
+        indexed = sum(len(lst) for lst in db.index.lists)
+        print(f"{'background' if background else 'in place':>12} {elapsed:>10.2f} {lat.shape[0]:>8} "
+              f"{np.percentile(lat, 50):>9.2f} {np.percentile(lat, 99):>9.2f} {gap:>11.1f} {indexed:>9}")
+        del db
+
+    print("\n'max gap' is the longest stretch with no query served. In place, the event loop is blocked for the")
+    print("whole rebuild; in the background, queries keep running against the old index until the swap.")
+
+
+if __name__ == "__main__":
+    main()
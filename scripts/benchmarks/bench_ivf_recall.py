@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Recall@k vs latency of the IVF index against the exact scan, per nprobe.
+
+Usage:
+    python scripts/benchmarks/bench_ivf_recall.py --size 200000 --nlist 512 --nprobes 1,4,8,16,32,64,128
+"""
+import argparse
+
+import numpy as np
+
+from common import embedding_like_vectors, recall_at_k, time_queries
+from services.vectorial_db.ivf import IVFIndex
+from services.vectorial_db.store import VectorStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--nlist", type=int, default=0, help="0 means sqrt(size)")
+    parser.add_argument("--nprobes", default="1,4,8,16,32,64,128")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    store = VectorStore(dimension=args.dim, initial_capacity=args.size)
+    corpus, queries = embedding_like_vectors(args.size, args.queries, args.dim, rng)
+    store.add_batch([f"emb_{i}" for i in range(args.size)], corpus)
+    del corpus
+
+    index = IVFIndex(n_lists=args.nlist or None)
+    index.train(store)
+    exact = [store.search(q, args.top_k)[0] for q in queries]
+    exact_lat = time_queries(lambda q: store.search(q, args.top_k), queries, args.queries)
+
+    print(f"IVF recall@{args.top_k} vs latency ({args.size} vectors, dim {args.dim}, {index.centroids.shape[0]} lists)")
+    print("=" * 60)
+    print(f"{'nprobe':>8} {'recall':>8} {'p50 ms':>10} {'p99 ms':>10} {'speedup':>8}")
+    print(f"{'exact':>8} {1.0:>8.3f} {np.percentile(exact_lat, 50):>10.2f} {np.percentile(exact_lat, 99):>10.2f} {1.0:>8.1f}")
+    for nprobe in [int(p) for p in args.nprobes.split(",")]:
+        approx = [index.search(store, q, args.top_k, nprobe=nprobe)[0] for q in queries]
+        lat = time_queries(lambda q: index.search(store, q, args.top_k, nprobe=nprobe), queries, args.queries)
+        speedup = np.percentile(exact_lat, 50) / np.percentile(lat, 50)
+        print(f"{nprobe:>8} {recall_at_k(approx, exact):>8.3f} {np.percentile(lat, 50):>10.2f} "
+              f"{np.percentile(lat, 99):>10.2f} {speedup:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Memory held by per-row embedding metadata, and the cost of assembling
+top-k results: the previous dict per embedding (ISO timestamp string,
+model name and dimension repeated on every row) against the columnar store
+(interned task and model codes, int64 epoch timestamps, chunk id strings).
+Memory is measured with tracemalloc and scaled to one million rows.
+
+Usage:
+    python scripts/benchmarks/bench_metadata.py --rows 200000 --chunks-per-task 500
+"""
+import argparse
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from services.vectorial_db.metadata import ColumnarMetadata
+from services.vectorial_db.store import VectorStore
+
+
+def payloads(rows, chunks_per_task):
+    start = datetime(2024, 5, 1)
+    return [{
+        "chunk_id": f"task_{i // chunks_per_task:06d}_chunk_{i % chunks_per_task}",
+        "task_id": f"task_{i // chunks_per_task:06d}",
+        "model_name": "mock-embedding-model",
+        "dimension": 384,
+        # One ingestion batch (one timestamp) per 500 rows
+        "timestamp": (start + timedelta(seconds=i // 500, microseconds=123456)).isoformat()
+    } for i in range(rows)]
+
+
+def measure(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    held = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return held, after - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--chunks-per-task", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=20000)
+    args = parser.parse_args()
+
+    ids = [f"emb_{i}" for i in range(args.rows)]
+    store = VectorStore(dimension=384)
+    store.ids = ids
+    store.id_to_row = {embedding_id: row for row, embedding_id in enumerate(ids)}
+    store._size = args.rows
+
+    # What stays allocated once the ingested payloads themselves are dropped
+    by_dict, dict_bytes = measure(lambda: dict(zip(ids, payloads(args.rows, args.chunks_per_task))))
+
+    def columnar():
+        metadata = ColumnarMetadata(store)
+        metadata.set_rows(np.arange(args.rows), payloads(args.rows, args.chunks_per_task))
+        return metadata
+
+    by_column, column_bytes = measure(columnar)
+
+    rng = np.random.default_rng(0)
+    top_rows = [rng.choice(args.rows, args.top_k, replace=False).tolist() for _ in range(args.repeats)]
+    start = time.perf_counter()
+    for rows in top_rows:
+        [by_dict[ids[row]] for row in rows]
+    dict_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for rows in top_rows:
+        by_column.at_rows(rows)
+    column_seconds = time.perf_counter() - start
+
+    scale = 1_000_000 / args.rows
+    print(f"Embedding metadata ({args.rows} rows, {args.chunks_per_task} chunks per task)")
+    print("=" * 72)
+    print(f"{'layout':>10} {'MB per 1M rows':>15} {'bytes/row':>10} {'top-' + str(args.top_k) + ' assembly us':>20}")
+    for name, held, seconds in (("dict", dict_bytes, dict_seconds), ("columnar", column_bytes, column_seconds)):
+        print(f"{name:>10} {held * scale / 2**20:>15.1f} {held / args.rows:>10.0f} "
+              f"{seconds / args.repeats * 1e6:>20.1f}")
+    print("(both exclude the embedding id strings, which the store holds either way)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Metadata-filtered search latency at several selectivities. A filter on the
+owning user (metadata.user_id "in" a list of users) is answered three ways:
+
+- full scan:   the unfiltered search, for reference
+- post-filter: build a row mask by testing every row's metadata in Python,
+               then scan with it (what a caller had to do without filters)
+- bitmaps:     the bitmap index resolves the filter to a row set, and the
+               planner scans slices, a mask, or gathers only the matches
+
+Usage:
+    python scripts/benchmarks/bench_metadata_filters.py --size 200000 --users 1000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from common import embedding_like_vectors, time_queries
+from services.vectorial_db.filters import parse_filter
+from services.vectorial_db.main import VectorDatabase
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--selected-users", type=int, nargs="+", default=[1, 10, 100, 500])
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    corpus, queries = embedding_like_vectors(args.size, 64, args.dim, rng)
+    queries = queries.tolist()
+    owners = rng.integers(0, args.users, args.size)
+    db = VectorDatabase()
+    start = time.perf_counter()
+    db.add_embeddings([{"id": f"emb_{i}", "chunk_id": f"chunk_{i}", "task_id": f"task_{i // 1000}",
+                        "metadata": {"user_id": f"user_{owners[i]}"}} for i in range(args.size)], vectors=corpus)
+    print(f"Ingest with bitmaps: {time.perf_counter() - start:.1f}s, "
+          f"{db.bitmaps.get_stats()['bytes'] / 2 ** 20:.1f} MB of bitmaps")
+
+    full = time_queries(lambda q: db.search(q, top_k=10), queries, args.repeats)
+    print(f"Filtered search ({args.size} vectors, dim {args.dim}, top-10, {args.users} users)")
+    print("=" * 80)
+    print(f"{'selectivity':>12} {'full scan ms':>13} {'post-filter ms':>15} {'bitmaps ms':>11} "
+          f"{'filter eval ms':>15} {'plan':>8}")
+    for selected in args.selected_users:
+        users = [f"user_{u}" for u in range(selected)]
+        where = {"field": "metadata.user_id", "in": users}
+        wanted = set(users)
+
+        def post_filter(q):
+            mask = np.fromiter((db.metadata.at_row(row)["metadata"]["user_id"] in wanted
+                                for row in range(len(db.vectors))), dtype=bool, count=len(db.vectors))
+            return db.vectors.search(q, 10, mask=mask)
+
+        post = time_queries(post_filter, queries, max(1, args.repeats // 10))
+        before = dict(db.plan_counts)
+        bitmap = time_queries(lambda q: db.search(q, top_k=10, where=where), queries, args.repeats)
+        plan = max(db.plan_counts, key=lambda p: db.plan_counts[p] - before.get(p, 0))
+        condition = parse_filter(where)
+        evaluation = time_queries(lambda q: db._filter_mask(condition, None), queries, args.repeats)
+
+        for q in queries[:5]:
+            found = db.search(q, top_k=10, where=where)
+            assert all(r["metadata"]["metadata"]["user_id"] in wanted for r in found)
+        selectivity = np.isin(owners, np.arange(selected)).mean()
+        print(f"{selectivity:>11.2%} {np.median(full):>13.2f} {np.median(post):>15.1f} "
+              f"{np.median(bitmap):>11.2f} {np.median(evaluation):>15.2f} {plan:>8}")
+
+
+if __name__ == "__main__":
+    main()
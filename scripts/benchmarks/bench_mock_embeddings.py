@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+MockEmbeddingLLM throughput: embeddings per second against batch size for
+the previous per-text loop (reseeding the global np.random state, one
+list per text), the (n, d) float32 batch path, and the batch path
+converted to lists as the embedding service needs them. Also runs the batch
+path from several threads, which the global-state loop could not do safely.
+
+Usage:
+    python scripts/benchmarks/bench_mock_embeddings.py --batch-sizes 1 10 100 1000 --threads 4
+"""
+import argparse
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import common  # noqa: F401  (puts the repository root on sys.path)
+from shared.utils.mock_llm import MockEmbeddingLLM
+
+
+def global_state_embedding(text: str, dimension: int) -> list:
+    """The previous MockEmbeddingLLM.generate_embedding"""
+    seed = int(hashlib.md5(text.encode()).hexdigest(), 16) % (2 ** 32)
+    np.random.seed(seed)
+    embedding = np.random.randn(dimension)
+    return (embedding / np.linalg.norm(embedding)).tolist()
+
+
+def rate(fn, batches) -> float:
+    start = time.perf_counter()
+    for batch in batches:
+        fn(batch)
+    return sum(len(batch) for batch in batches) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--texts", type=int, default=20_000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    texts = [f"chunk {i}: " + "lorem ipsum dolor sit amet " * 20 for i in range(args.texts)]
+    llm = MockEmbeddingLLM(dimension=args.dimension)
+
+    print(f"MockEmbeddingLLM ({args.texts} texts, dimension {args.dimension}), embeddings/s")
+    print("=" * 80)
+    print(f"{'batch':>7} {'per-text loop':>14} {'embed_batch':>12} {'as lists':>10} "
+          f"{f'embed_batch x{args.threads} threads':>26}")
+    pool = ThreadPoolExecutor(args.threads)
+    for batch_size in args.batch_sizes:
+        batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+        loop = rate(lambda batch: [global_state_embedding(text, args.dimension) for text in batch], batches)
+        block = rate(llm.embed_batch, batches)
+        lists = rate(llm.generate_embeddings, batches)
+        start = time.perf_counter()
+        list(pool.map(llm.embed_batch, batches))
+        threaded = len(texts) / (time.perf_counter() - start)
+        print(f"{batch_size:>7} {loop:>14,.0f} {block:>12,.0f} {lists:>10,.0f} {threaded:>26,.0f}")
+    pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
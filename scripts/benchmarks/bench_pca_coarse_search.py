@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+PCA coarse search: recall@k and latency of a first pass over the vectors
+projected onto their top principal axes, re-ranked from the full-precision
+side store, for several projection sizes and re-rank depths, against the
+exact float32 scan. Also times a background refit of the projection.
+
+The synthetic corpus has `--latent-dim` informative directions; real
+embeddings spread their variance wider, so try a larger value to see how
+recall degrades when the projection drops signal.
+
+Usage:
+    python scripts/benchmarks/bench_pca_coarse_search.py --size 200000 --dimensions 32 64 128 --rerank 5 10 20
+"""
+import argparse
+import time
+
+import numpy as np
+
+from common import embedding_like_vectors, recall_at_k, time_queries
+from services.vectorial_db.codecs import PCACodec
+from services.vectorial_db.store import VectorStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--latent-dim", type=int, default=32)
+    parser.add_argument("--dimensions", type=int, nargs="+", default=[32, 64, 128])
+    parser.add_argument("--rerank", type=int, nargs="+", default=[5, 10, 20])
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    corpus, queries = embedding_like_vectors(args.size, args.queries, args.dim, rng, latent_dim=args.latent_dim)
+    ids = [f"emb_{i}" for i in range(args.size)]
+
+    exact_store = VectorStore(dimension=args.dim, initial_capacity=args.size)
+    exact_store.add_batch(ids, corpus)
+    exact = [exact_store.search(q, args.top_k)[0] for q in queries]
+    lat = time_queries(lambda q: exact_store.search(q, args.top_k), queries, args.queries)
+
+    print(f"PCA coarse search ({args.size} vectors, dim {args.dim}, latent dim {args.latent_dim}, "
+          f"recall@{args.top_k})")
+    print("=" * 80)
+    print(f"{'scan':>14} {'rerank':>7} {'scanned MB':>11} {'variance':>9} {'recall':>8} {'p50 ms':>9} {'p99 ms':>9}")
+    print(f"{'float32 exact':>14} {'-':>7} {exact_store.codes.nbytes / 2 ** 20:>11.1f} {1.0:>9.3f} {1.0:>8.3f} "
+          f"{np.percentile(lat, 50):>9.2f} {np.percentile(lat, 99):>9.2f}")
+    del exact_store
+
+    for dimensions in args.dimensions:
+        store = VectorStore(dimension=args.dim, initial_capacity=args.size, codec=PCACodec(dimensions=dimensions),
+                            codec_train_threshold=min(args.size, 65536), rerank_factor=max(args.rerank))
+        store.add_batch(ids, corpus)
+        for rerank_factor in args.rerank:
+            store.rerank_factor = rerank_factor
+            approx = [store.search(q, args.top_k)[0] for q in queries]
+            lat = time_queries(lambda q: store.search(q, args.top_k), queries, args.queries)
+            print(f"{'pca-' + str(dimensions):>14} {rerank_factor:>7} {store.codes.nbytes / 2 ** 20:>11.1f} "
+                  f"{store.codec.explained_variance:>9.3f} {recall_at_k(approx, exact):>8.3f} "
+                  f"{np.percentile(lat, 50):>9.2f} {np.percentile(lat, 99):>9.2f}")
+        start = time.perf_counter()
+        store.commit_refit(store.build_refit(len(store)))
+        print(f"{'':>14} refit of {len(store)} rows: {time.perf_counter() - start:.2f}s")
+        del store
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Restart time of the vectorial DB against corpus size: recovery from a
+snapshot plus a WAL tail, compared with replaying the whole WAL.
+
+Usage:
+    python scripts/benchmarks/bench_persistence.py --sizes 10000,100000 --tail 1000
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from common import embedding_like_vectors
+from services.vectorial_db.main import VectorDatabase
+from services.vectorial_db.persistence import VectorPersistence
+
+
+def write(data_dir, vectors, snapshot_rows):
+    db = VectorDatabase(persistence=VectorPersistence(data_dir))
+    start = time.perf_counter()
+    for i, vector in enumerate(vectors):
+        if i == snapshot_rows:
+            db.snapshot()
+        metadata = {"chunk_id": f"chunk_{i}", "task_id": f"task_{i // 1000}",
+                    "model_name": "bench", "dimension": len(vector), "timestamp": ""}
+        db.persistence.log_add(f"emb_{i}", vector, metadata)
+        db.apply_add(f"emb_{i}", vector, metadata)
+    db.persistence.close()
+    return time.perf_counter() - start
+
+
+def recover(data_dir):
+    db = VectorDatabase(persistence=VectorPersistence(data_dir))
+    stats = db.recover()
+    db.persistence.close()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,50000,100000")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--tail", type=int, default=1000, help="WAL records written after the snapshot")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"Restart time (dim {args.dim}, WAL tail {args.tail} records)")
+    print("=" * 72)
+    print(f"{'vectors':>10} {'ingest/s':>10} {'WAL only s':>12} {'snapshot+tail s':>16} {'of which load s':>16}")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        vectors, _ = embedding_like_vectors(size, 1, args.dim, rng)
+        row = []
+        for snapshot_rows in (None, max(size - args.tail, 0)):
+            data_dir = tempfile.mkdtemp(prefix="bench_persistence_")
+            try:
+                ingest = write(data_dir, vectors, snapshot_rows)
+                row.append((ingest, recover(data_dir)))
+            finally:
+                shutil.rmtree(data_dir, ignore_errors=True)
+        (ingest, wal_only), (_, snapshot) = row
+        print(f"{size:>10} {size / ingest:>10.0f} {wal_only['total_seconds']:>12.2f} "
+              f"{snapshot['total_seconds']:>16.2f} {snapshot['snapshot_seconds']:>16.2f}")
+
+
+if __name__ == "__main__":
+    main()
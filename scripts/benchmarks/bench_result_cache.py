@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Search throughput with and without the versioned result cache under
+FAQ-like traffic: queries drawn from a Zipf distribution over a fixed pool
+(the same question always embeds to the same vector), with task-scoped and
+unfiltered queries mixed and a write to a random task every N queries.
+
+Usage:
+    python scripts/benchmarks/bench_result_cache.py --size 100000 --queries 3000 --write-every 50
+"""
+import argparse
+import time
+
+import numpy as np
+
+from common import embedding_like_vectors
+from services.vectorial_db.main import VectorDatabase
+from services.vectorial_db.result_cache import SearchResultCache
+
+
+def load(db, corpus, chunks_per_task):
+    db.add_embeddings([{
+        "id": f"emb_{i}",
+        "chunk_id": f"chunk_{i}",
+        "task_id": f"task_{i // chunks_per_task}",
+        "dimension": corpus.shape[1]
+    } for i in range(corpus.shape[0])], vectors=corpus)
+
+
+def run(db, workload, extra, write_every):
+    latencies = []
+    for n, (query, task_ids) in enumerate(workload):
+        if write_every and n % write_every == write_every - 1:
+            vector, task_id = extra[n // write_every]
+            db.add_embeddings([{"id": f"extra_{n}", "chunk_id": f"extra_{n}", "task_id": task_id}],
+                              vectors=vector[None, :])
+        start = time.perf_counter()
+        db.search(query, top_k=10, task_ids=task_ids)
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--chunks-per-task", type=int, default=500)
+    parser.add_argument("--pool", type=int, default=500, help="distinct questions")
+    parser.add_argument("--queries", type=int, default=3000)
+    parser.add_argument("--zipf", type=float, default=1.2)
+    parser.add_argument("--write-every", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    corpus, pool = embedding_like_vectors(args.size, args.pool, args.dim, rng)
+    n_tasks = args.size // args.chunks_per_task
+    # Half of the questions are scoped to one task, the rest search everything
+    scopes = [[f"task_{rng.integers(n_tasks)}"] if i % 2 else None for i in range(args.pool)]
+    picks = np.minimum(rng.zipf(args.zipf, args.queries) - 1, args.pool - 1)
+    workload = [(pool[p].tolist(), scopes[p]) for p in picks]
+    extra = [(rng.standard_normal(args.dim).astype(np.float32), f"task_{rng.integers(n_tasks)}")
+             for _ in range(args.queries // max(1, args.write_every) + 1)]
+
+    print(f"Result cache ({args.size} vectors, dim {args.dim}, {args.queries} queries over {args.pool} "
+          f"questions, zipf {args.zipf}, a write every {args.write_every} queries)")
+    print("=" * 72)
+    print(f"{'cache':>8} {'p50 ms':>8} {'mean ms':>8} {'qps':>8} {'hit rate':>9} {'invalidated':>12}")
+    for cached in (False, True):
+        db = VectorDatabase(cache=SearchResultCache(max_entries=10000) if cached else None)
+        load(db, corpus, args.chunks_per_task)
+        latencies = run(db, workload, extra, args.write_every)
+        stats = db.cache.get_stats() if cached else {"hit_rate": 0.0, "invalidations": 0}
+        print(f"{str(cached):>8} {np.percentile(latencies, 50):>8.3f} {latencies.mean():>8.3f} "
+              f"{1000 / latencies.mean():>8.0f} {stats['hit_rate']:>9.1%} {stats['invalidations']:>12}")
+
+
+if __name__ == "__main__":
+    main()
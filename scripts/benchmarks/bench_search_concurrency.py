@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Search latency under concurrent clients, with the scan run inline on the
+event loop (the previous /search behaviour) or on the search executor, with
+and without parallel row-range scans. A heartbeat coroutine stands in for
+health checks and the ingestion consumer: its lag is how long the event
+loop was unable to run anything else.
+
+Usage:
+    python scripts/benchmarks/bench_search_concurrency.py --size 200000 --clients 1 4 16
+"""
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from common import embedding_like_vectors
+from services.vectorial_db.main import VectorDatabase
+from services.vectorial_db.store import VectorStore
+
+
+async def heartbeat(stop: asyncio.Event, interval: float = 0.005) -> list:
+    lags = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+    return lags
+
+
+async def drive(db, queries, clients, per_client, executor):
+    loop = asyncio.get_running_loop()
+    latencies = []
+
+    async def client(offset):
+        for i in range(per_client):
+            query = queries[(offset + i) % len(queries)]
+            start = time.perf_counter()
+            if executor is None:
+                db.search(query, top_k=10)
+            else:
+                await loop.run_in_executor(executor, db.search, query, 10)
+            latencies.append(time.perf_counter() - start)
+
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(client(c * per_client) for c in range(clients)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    lags = await beat
+    return np.array(latencies) * 1000, clients * per_client / elapsed, max(lags, default=0.0) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--per-client", type=int, default=10)
+    parser.add_argument("--search-threads", type=int, default=4)
+    parser.add_argument("--scan-threads", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    corpus, queries = embedding_like_vectors(args.size, 64, args.dim, rng)
+    queries = queries.tolist()
+    modes = [("on loop", 1, False), ("executor", 1, True)]
+    if args.scan_threads > 1:
+        modes.append((f"executor+{args.scan_threads} scan", args.scan_threads, True))
+
+    print(f"Concurrent search ({args.size} vectors, dim {args.dim}, top-10, {os.cpu_count()} CPUs, "
+          f"{args.search_threads} search threads)")
+    print("=" * 80)
+    print(f"{'mode':>20} {'clients':>8} {'p50 ms':>9} {'p99 ms':>9} {'qps':>7} {'max loop lag ms':>16}")
+    for name, scan_threads, off_loop in modes:
+        db = VectorDatabase(store=VectorStore(scan_threads=scan_threads))
+        db.add_embeddings([{"id": f"emb_{i}", "chunk_id": f"chunk_{i}", "task_id": f"task_{i // 1000}"}
+                           for i in range(args.size)], vectors=corpus)
+        executor = ThreadPoolExecutor(args.search_threads) if off_loop else None
+        for clients in args.clients:
+            latencies, qps, lag = asyncio.run(drive(db, queries, clients, args.per_client, executor))
+            print(f"{name:>20} {clients:>8} {np.percentile(latencies, 50):>9.1f} "
+                  f"{np.percentile(latencies, 99):>9.1f} {qps:>7.1f} {lag:>16.1f}")
+        if executor is not None:
+            executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Flat search throughput under concurrent clients: searches on the writer's
+search threads (one process, where Python-level work such as result
+formatting holds the GIL) versus reader processes that map the rows the
+writer published to shared memory. Also reports the heap each reader adds
+and the cost of publishing appends (Linux: memory is read from /proc).
+
+Usage:
+    python scripts/benchmarks/bench_search_processes.py --size 200000 --processes 2 4 --clients 16
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from common import embedding_like_vectors
+from services.vectorial_db.main import VectorDatabase
+from services.vectorial_db.shared_store import SharedStorePublisher, attach_reader, search_shared_store
+
+
+def reader_memory_mb(_=None) -> tuple:
+    """(private, shared) resident MB of this process: heap versus mapped tmpfs pages"""
+    with open("/proc/self/status") as f:
+        fields = dict(line.split(":", 1) for line in f)
+    return tuple(int(fields[name].split()[0]) / 1024 for name in ("RssAnon", "RssShmem"))
+
+
+async def drive(search, queries, clients: int, per_client: int):
+    loop = asyncio.get_running_loop()
+    latencies = []
+
+    async def client(offset):
+        for i in range(per_client):
+            start = time.perf_counter()
+            await search(loop, queries[(offset + i) % len(queries)])
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(c * per_client) for c in range(clients)))
+    return np.array(latencies) * 1000, clients * per_client / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--processes", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--per-client", type=int, default=10)
+    parser.add_argument("--shared-dir", default="/dev/shm" if os.path.isdir("/dev/shm") else None)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    corpus, queries = embedding_like_vectors(args.size + 1000, 64, args.dim, rng)
+    queries = queries.tolist()
+    db = VectorDatabase()
+    db.add_embeddings([{"id": f"emb_{i}", "chunk_id": f"chunk_{i}", "task_id": f"task_{i // 1000}"}
+                       for i in range(args.size)], vectors=corpus[:args.size])
+
+    with tempfile.TemporaryDirectory(dir=args.shared_dir) as tmp:
+        publisher = SharedStorePublisher(os.path.join(tmp, "vectorial-db"))
+        start = time.perf_counter()
+        publisher.publish(db)
+        full_seconds = time.perf_counter() - start
+        db.add_embeddings([{"id": f"emb_{i}", "chunk_id": f"chunk_{i}", "task_id": "task_new"}
+                           for i in range(args.size, args.size + 1000)], vectors=corpus[args.size:])
+        start = time.perf_counter()
+        publisher.publish(db)
+        append_ms = (time.perf_counter() - start) * 1000
+
+        print(f"Flat search across processes ({args.size} vectors, dim {args.dim}, top-10, {os.cpu_count()} CPUs, "
+              f"{args.clients} clients)")
+        print(f"Initial publish {full_seconds:.2f}s ({publisher.get_stats()['mapped_bytes'] / 2 ** 20:.0f} MB), "
+              f"publishing 1000 appended rows {append_ms:.1f} ms")
+        print("=" * 80)
+        print(f"{'mode':>16} {'p50 ms':>9} {'p99 ms':>9} {'qps':>8} {'reader heap MB':>15} {'reader shm MB':>14}")
+
+        threads = ThreadPoolExecutor(args.threads)
+
+        async def on_threads(loop, query):
+            return await loop.run_in_executor(threads, partial(db.search, query, 10))
+
+        latencies, qps = asyncio.run(drive(on_threads, queries, args.clients, args.per_client))
+        print(f"{f'{args.threads} threads':>16} {np.percentile(latencies, 50):>9.1f} "
+              f"{np.percentile(latencies, 99):>9.1f} {qps:>8.1f} {'-':>15} {'-':>14}")
+        threads.shutdown()
+
+        for processes in args.processes:
+            pool = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn"),
+                                       initializer=attach_reader, initargs=(publisher.directory,))
+            # Warm up: spawn every process and map the files before timing
+            list(pool.map(search_shared_store, queries[:processes * 2], [10] * (processes * 2)))
+
+            async def in_processes(loop, query):
+                return await loop.run_in_executor(pool, partial(search_shared_store, query, 10))
+
+            latencies, qps = asyncio.run(drive(in_processes, queries, args.clients, args.per_client))
+            private, shared = max(pool.map(reader_memory_mb, range(processes)))
+            print(f"{f'{processes} processes':>16} {np.percentile(latencies, 50):>9.1f} "
+                  f"{np.percentile(latencies, 99):>9.1f} {qps:>8.1f} {private:>15.0f} {shared:>14.0f}")
+            pool.shutdown()
+        publisher.close()
+
+    print("\nReaders map the published rows, so their page-cache footprint is shared; scans run one")
+    print("per core. With fewer cores than processes the readers only time-share.")
+
+
+if __name__ == "__main__":
+    main()
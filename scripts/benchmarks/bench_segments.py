@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Out-of-core flat search over memory-mapped segments: resident memory and
+query latency with a cold page cache (segment pages dropped before every
+query) and a warm one, against the in-heap VectorStore.
+
+Usage:
+    python scripts/benchmarks/bench_segments.py --size 1000000 --segment-rows 65536
+"""
+import argparse
+import mmap
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from common import embedding_like_vectors, time_queries
+from services.vectorial_db.segments import SegmentedVectorStore
+from services.vectorial_db.store import VectorStore
+
+INGEST_BLOCK_ROWS = 65536
+
+
+def resident_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def drop_page_cache(store: SegmentedVectorStore):
+    """Evict the (clean) segment pages so the next scan reads from disk"""
+    for segment in store.segments:
+        segment.flush()
+        # Unmap the pages from this process first; fadvise skips pages still mapped
+        segment._mmap.madvise(mmap.MADV_DONTNEED)
+        fd = os.open(segment.filename, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def ingest(store, size, dim, rng):
+    start = time.perf_counter()
+    for block_start in range(0, size, INGEST_BLOCK_ROWS):
+        rows = min(INGEST_BLOCK_ROWS, size - block_start)
+        block, _ = embedding_like_vectors(rows, 0, dim, rng)
+        store.add_batch([f"emb_{i}" for i in range(block_start, block_start + rows)], block)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=500_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--segment-rows", type=int, default=65536)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--skip-in-memory", action="store_true", help="skip the in-heap baseline (needs size * dim * 4 bytes)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    _, queries = embedding_like_vectors(0, args.queries, args.dim, rng)
+    segment_dir = tempfile.mkdtemp(prefix="bench_segments_")
+    try:
+        baseline_mb = resident_mb()
+        store = SegmentedVectorStore(segment_dir, segment_rows=args.segment_rows, dimension=args.dim)
+        seconds = ingest(store, args.size, args.dim, rng)
+        drop_page_cache(store)
+
+        print(f"Segmented flat search ({args.size} vectors, dim {args.dim}, {len(store.segments)} sealed segments "
+              f"of {args.segment_rows} rows, top-{args.top_k})")
+        print("=" * 72)
+        print(f"ingest: {args.size / seconds:.0f} vectors/s")
+        print(f"heap (active segment): {store.memory_bytes() / 2 ** 20:.0f} MB, "
+              f"mapped: {store.mapped_bytes() / 2 ** 20:.0f} MB, RSS after ingest: {resident_mb() - baseline_mb:.0f} MB")
+
+        def cold(query):
+            drop_page_cache(store)
+            return store.search(query, args.top_k)
+
+        cold_lat = time_queries(cold, queries, args.queries)
+        warm_lat = time_queries(lambda q: store.search(q, args.top_k), queries, args.queries)
+        scanned_mb = store.mapped_bytes() / 2 ** 20
+        print(f"\n{'cache':>10} {'p50 ms':>10} {'p99 ms':>10} {'MB/s':>10}")
+        for label, lat in (("cold", cold_lat), ("warm", warm_lat)):
+            print(f"{label:>10} {np.percentile(lat, 50):>10.1f} {np.percentile(lat, 99):>10.1f} "
+                  f"{scanned_mb / (np.percentile(lat, 50) / 1000):>10.0f}")
+        print(f"RSS after warm queries: {resident_mb() - baseline_mb:.0f} MB (page cache, reclaimable)")
+        del store
+
+        if not args.skip_in_memory:
+            in_memory = VectorStore(dimension=args.dim, initial_capacity=args.size)
+            ingest(in_memory, args.size, args.dim, np.random.default_rng(0))
+            lat = time_queries(lambda q: in_memory.search(q, args.top_k), queries, args.queries)
+            print(f"\nin-heap VectorStore: p50 {np.percentile(lat, 50):.1f} ms, heap {in_memory.memory_bytes() / 2 ** 20:.0f} MB")
+    finally:
+        shutil.rmtree(segment_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
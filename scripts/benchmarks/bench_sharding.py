@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Consistent-hash sharding by task_id: rows per shard, key movement when a
+shard is added, and scatter-gather latency for unfiltered and task-filtered
+queries. Shards run one after another in this process, so the parallel
+latency is modelled as the slowest shard plus the k-way merge, which is what
+a fan-out over separate nodes costs.
+
+Usage:
+    python scripts/benchmarks/bench_sharding.py --size 200000 --tasks 400 --shards 1,2,4
+"""
+import argparse
+import heapq
+import time
+from itertools import islice
+
+import numpy as np
+
+from common import embedding_like_vectors
+from services.vectorial_db.main import VectorDatabase
+from shared.utils.sharding import ConsistentHashRing
+
+
+def build_shards(n_shards, corpus, task_of, tasks):
+    urls = [f"http://vectorial-db-{i + 1}:8006" for i in range(n_shards)]
+    ring = ConsistentHashRing(urls)
+    owner = np.array([urls.index(ring.node_for(t)) for t in tasks])[task_of]
+    shards = {}
+    for i, url in enumerate(urls):
+        rows = np.flatnonzero(owner == i)
+        db = VectorDatabase()
+        db.restore_rows([f"emb_{r}" for r in rows.tolist()], corpus[rows],
+                        [{"task_id": tasks[t]} for t in task_of[rows].tolist()])
+        shards[url] = db
+    return ring, shards
+
+
+def scatter_gather(ring, shards, query, top_k, task_ids=None):
+    """(merged results, slowest shard ms, merge ms)"""
+    routes = {url: None for url in shards} if task_ids is None else ring.partition(task_ids)
+    result_lists, slowest = [], 0.0
+    for url, shard_task_ids in routes.items():
+        start = time.perf_counter()
+        result_lists.append(shards[url].search(query, top_k, shard_task_ids))
+        slowest = max(slowest, time.perf_counter() - start)
+    start = time.perf_counter()
+    merged = list(islice(heapq.merge(*result_lists, key=lambda r: -r["score"]), top_k))
+    return merged, slowest * 1000, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--tasks", type=int, default=400)
+    parser.add_argument("--shards", default="1,2,4")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=30)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    corpus, queries = embedding_like_vectors(args.size, args.queries, args.dim, rng)
+    tasks = [f"task_{t}" for t in range(args.tasks)]
+    task_of = rng.integers(0, args.tasks, size=args.size)
+
+    print(f"Sharded search ({args.size} vectors, dim {args.dim}, {args.tasks} tasks, top-{args.top_k})")
+    print("=" * 86)
+    print(f"{'shards':>6} {'max rows':>10} {'imbalance':>10} {'all p50 ms':>11} {'merge ms':>9} "
+          f"{'task p50 ms':>12} {'exact':>6}")
+    reference = None
+    for n_shards in [int(s) for s in args.shards.split(",")]:
+        ring, shards = build_shards(n_shards, corpus, task_of, tasks)
+        sizes = [len(db.vectors) for db in shards.values()]
+        unfiltered, merge, filtered, exact = [], [], [], True
+        for i, query in enumerate(queries):
+            results, slowest, merge_ms = scatter_gather(ring, shards, query, args.top_k)
+            unfiltered.append(slowest + merge_ms)
+            merge.append(merge_ms)
+            ids = [r["embedding_id"] for r in results]
+            if reference is None or len(reference) < len(queries):
+                reference = (reference or []) + [ids]
+            exact = exact and ids == reference[i]
+            _, slowest, merge_ms = scatter_gather(ring, shards, query, args.top_k, [tasks[i % args.tasks]])
+            filtered.append(slowest + merge_ms)
+        print(f"{n_shards:>6} {max(sizes):>10} {max(sizes) / (args.size / n_shards):>10.2f} "
+              f"{np.percentile(unfiltered, 50):>11.2f} {np.percentile(merge, 50):>9.3f} "
+              f"{np.percentile(filtered, 50):>12.2f} {str(exact):>6}")
+
+    keys = [f"task_{t}" for t in range(100_000)]
+    print("\nKey movement when adding one shard")
+    for n_shards in [int(s) for s in args.shards.split(",")]:
+        urls = [f"http://vectorial-db-{i + 1}:8006" for i in range(n_shards)]
+        before, after = ConsistentHashRing(urls), ConsistentHashRing(urls + ["http://vectorial-db-new:8006"])
+        moved = sum(before.node_for(k) != after.node_for(k) for k in keys) / len(keys)
+        print(f"  {n_shards} -> {n_shards + 1}: {moved:.1%} of tasks move (ideal {1 / (n_shards + 1):.1%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of per-query latency for VectorStore exact search.
+
+Usage:
+    python scripts/benchmarks/bench_vector_search.py --sizes 100000,1000000,5000000
+
+Each size needs roughly size * dim * 4 bytes of RAM (5M x 384 ~ 7.7 GB).
+"""
+import argparse
+
+import numpy as np
+
+from common import time_queries
+from services.vectorial_db.store import VectorStore
+
+
+def build_store(n: int, dim: int, rng: np.random.Generator, block: int = 100_000) -> VectorStore:
+    store = VectorStore(dimension=dim, initial_capacity=n)
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        vectors = rng.standard_normal((stop - start, dim), dtype=np.float32)
+        store.add_batch([f"emb_{i}" for i in range(start, stop)], vectors)
+    return store
+
+
+def legacy_search(vectors: dict, query: np.ndarray, top_k: int):
+    """The previous dict-of-float64-arrays implementation, kept for comparison"""
+    relevant_ids = list(vectors.keys())
+    vectors_matrix = np.array([vectors[id] for id in relevant_ids])
+    dot_products = np.dot(vectors_matrix, query.reshape(1, -1).T).flatten()
+    similarities = dot_products / (np.linalg.norm(query) * np.linalg.norm(vectors_matrix, axis=1) + 1e-10)
+    return np.argsort(similarities)[-top_k:][::-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100000,1000000,5000000")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--legacy-max", type=int, default=100_000,
+                        help="largest size for which the legacy dict-based search is also timed")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    queries = rng.standard_normal((16, args.dim), dtype=np.float32)
+
+    print("VectorStore exact search benchmark")
+    print("=" * 60)
+    print(f"{'vectors':>10} {'engine':>8} {'p50 ms':>10} {'p99 ms':>10} {'QPS':>10}")
+    for n in [int(s) for s in args.sizes.split(",")]:
+        try:
+            store = build_store(n, args.dim, rng)
+        except MemoryError:
+            print(f"{n:>10} skipped: not enough memory")
+            continue
+
+        lat = time_queries(lambda q: store.search(q, args.top_k), queries, args.queries)
+        print(f"{n:>10} {'matrix':>8} {np.percentile(lat, 50):>10.2f} {np.percentile(lat, 99):>10.2f} {1000 / lat.mean():>10.1f}")
+
+        if n <= args.legacy_max:
+            legacy = {store.ids[row]: store.matrix[row].astype(np.float64) for row in range(n)}
+            lat = time_queries(lambda q: legacy_search(legacy, q, args.top_k), queries, max(5, args.queries // 10))
+            print(f"{n:>10} {'legacy':>8} {np.percentile(lat, 50):>10.2f} {np.percentile(lat, 99):>10.2f} {1000 / lat.mean():>10.1f}")
+            del legacy
+        del store
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Vector wire formats: encode and decode time and bytes on the wire for JSON
+float lists (as FastAPI serializes them) against binary vector frames, for
+an embedding batch (GET /embeddings/batch) and a single query (POST /search).
+
+Usage:
+    python scripts/benchmarks/bench_wire_format.py --batch 500 --dim 384
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+
+from common import embedding_like_vectors
+from shared.utils.vector_wire import decode_frame, encode_frame
+
+
+def timed(fn, repeats):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return (time.perf_counter() - start) / repeats * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    corpus, queries = embedding_like_vectors(args.batch, 1, args.dim, rng)
+    embeddings = [{
+        "id": f"chunk_{i}_emb", "chunk_id": f"chunk_{i}", "task_id": "task_1",
+        "vector": vector, "model_name": "mock-embedding-model", "dimension": args.dim, "task_embedding_count": args.batch
+    } for i, vector in enumerate(corpus.tolist())]
+    query = queries[0].tolist()
+
+    payloads = {
+        f"batch of {args.batch}": (
+            lambda: json.dumps(jsonable_encoder({"embeddings": embeddings, "count": len(embeddings)})).encode(),
+            lambda data: np.asarray([e["vector"] for e in json.loads(data)["embeddings"]], dtype=np.float32),
+            lambda dtype: encode_frame([e["vector"] for e in embeddings],
+                                       {"embeddings": [{k: v for k, v in e.items() if k != "vector"} for e in embeddings],
+                                        "count": len(embeddings)}, dtype=dtype),
+        ),
+        "single query": (
+            lambda: json.dumps(jsonable_encoder({"query_vector": query, "top_k": 5, "task_ids": None})).encode(),
+            lambda data: np.asarray(json.loads(data)["query_vector"], dtype=np.float32),
+            lambda dtype: encode_frame(query, {"top_k": 5, "task_ids": None}, dtype=dtype),
+        ),
+    }
+
+    print(f"Wire formats (dim {args.dim})")
+    print("=" * 72)
+    print(f"{'payload':>14} {'format':>8} {'bytes':>10} {'encode ms':>10} {'decode ms':>10} {'max err':>9}")
+    for name, (json_encode, json_decode, frame_encode) in payloads.items():
+        repeats = args.repeats if name.startswith("batch") else args.repeats * 100
+        encode_ms, data = timed(json_encode, repeats)
+        decode_ms, decoded = timed(lambda: json_decode(data), repeats)
+        reference = decoded
+        print(f"{name:>14} {'json':>8} {len(data):>10} {encode_ms:>10.3f} {decode_ms:>10.3f} {0.0:>9.1e}")
+        for dtype in ("float32", "float16"):
+            encode_ms, frame = timed(lambda: frame_encode(dtype), repeats)
+            decode_ms, (_, vectors) = timed(lambda: decode_frame(frame), repeats)
+            error = np.abs(vectors.reshape(reference.shape) - reference).max()
+            print(f"{name:>14} {dtype:>8} {len(frame):>10} {encode_ms:>10.3f} {decode_ms:>10.3f} {error:>9.1e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Shared helpers for the vectorial-db benchmark scripts"""
+import os
+import sys
+import time
+from typing import Callable, Sequence
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+
+def embedding_like_vectors(n_corpus: int, n_queries: int, dim: int, rng: np.random.Generator,
+                           latent_dim: int = 32, noise: float = 0.5):
+    """
+    (corpus, queries) drawn from the same low-rank latent model plus noise.
+
+    Real embeddings have low intrinsic dimension without clean cluster
+    boundaries; isotropic noise is too hard (every ANN degenerates to a full
+    scan) and well-separated blobs are too easy (every ANN looks perfect).
+    """
+    projection = rng.standard_normal((latent_dim, dim), dtype=np.float32)
+
+    def sample(n: int) -> np.ndarray:
+        latent = rng.standard_normal((n, latent_dim), dtype=np.float32)
+        return latent @ projection + noise * rng.standard_normal((n, dim), dtype=np.float32)
+
+    return sample(n_corpus), sample(n_queries)
+
+
+def time_queries(fn: Callable, queries: Sequence, repeats: int) -> np.ndarray:
+    """Per-call latency in milliseconds (after one warm-up call)"""
+    fn(queries[0])
+    latencies = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        fn(queries[i % len(queries)])
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies) * 1000
+
+
+def recall_at_k(approx_rows: Sequence[np.ndarray], exact_rows: Sequence[np.ndarray]) -> float:
+    """Mean fraction of the exact top-k found by the approximate search"""
+    hits = [len(set(a.tolist()) & set(e.tolist())) / max(1, len(e)) for a, e in zip(approx_rows, exact_rows)]
+    return float(np.mean(hits))
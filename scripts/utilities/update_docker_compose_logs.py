@@ -10,7 +10,7 @@ with open('docker-compose.yml', 'r') as f:
 services_to_update = [
     'master-task-db', 'chunk-config', 'upload', 
     'chunking-1', 'chunking-2', 'embedding-1', 
-    'embedding-2', 'vectorial-db', 'rag-query'
+    'embedding-2', 'vectorial-db-1', 'vectorial-db-2', 'rag-query'
 ]
 
 # Update each service
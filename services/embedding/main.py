@@ -1,35 +1,75 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, Response
 import httpx
 import asyncio
-from typing import Dict, List
+from typing import Dict, List, Optional, Set
 import uuid
 import os
 from datetime import datetime
 from contextlib import asynccontextmanager
 import queue
 import threading
+import time
 
+from services.embedding.scheduler import EmbeddingScheduler
+from services.embedding.workers import EmbeddingProcessPool
 from shared.models.task import Task, TaskStatus
 from shared.models.chunk import Chunk
 from shared.models.embedding import Embedding
-from shared.utils.mock_llm import MockEmbeddingLLM
+from shared.utils.embedders import create_embedder
+from shared.utils.embedding_cache import embedding_cache_from_env
+from shared.utils.sharding import ring_from_env
+from shared.utils.vector_wire import VECTOR_FRAME_CONTENT_TYPE, accepts_vector_frame, encode_frame
 from shared.utils.logging_config import setup_logger, log_request, log_response, log_error
 
+# How long a task waits before retrying to hand embeddings to a full queue
+QUEUE_FULL_RETRY_SECONDS = 0.05
+
 
 class EmbeddingService:
     def __init__(self):
         self.logger = setup_logger("embedding-service", os.getenv("LOG_LEVEL", "INFO"))
         self.embeddings_queue = queue.Queue(maxsize=1000)
+        # With several vectorial-db shards, each shard pulls only the embeddings
+        # of the tasks it owns on the hash ring from its own queue
+        self.shard_ring = ring_from_env(os.getenv("VECTORIAL_DB_URLS"))
+        self.shard_queues: Dict[str, queue.Queue] = {}
+        if self.shard_ring is not None:
+            self.shard_queues = {url: queue.Queue(maxsize=1000) for url in self.shard_ring.nodes}
         self.worker_id = str(uuid.uuid4())
         self.master_task_db_url = os.getenv("MASTER_TASK_DB_URL", "http://master-task-db:8001")
         # Support multiple chunking services
         chunking_urls = os.getenv("CHUNKING_SERVICE_URLS", "http://chunking-1:8004,http://chunking-2:8004")
         self.chunking_service_urls = [url.strip() for url in chunking_urls.split(",")]
+        # Element type of binary embedding batches (float32, or float16 for half the bytes)
+        self.wire_dtype = os.getenv("VECTOR_WIRE_DTYPE", "float32")
         self.running = True
-        self.llm = MockEmbeddingLLM()
+        # Backend chosen by EMBEDDER; texts and seconds spent embedding are
+        # counted so each container's embedding capacity can be read off /queue/status
+        self.llm = create_embedder()
+        self.embedded_texts = 0
+        self.embedding_seconds = 0.0
+        self._stats_lock = threading.Lock()
+        # Batches can run in worker processes, one core each, that return vectors through shared memory
+        embedding_processes = int(os.getenv("EMBEDDING_PROCESSES", "0"))
+        self.process_pool = None
+        if embedding_processes > 0:
+            self.process_pool = EmbeddingProcessPool(
+                embedding_processes, self.llm.dimension,
+                directory=os.getenv("EMBEDDING_WORKER_DIR", "/dev/shm/embedding")
+            )
+        # Repeated chunks (re-uploads, boilerplate, overlapping windows) are served from here
+        self.embedding_cache = embedding_cache_from_env()
+        # Chunks of every claimed task are embedded together in micro-batches
+        self.scheduler = EmbeddingScheduler(self.embed_batch,
+                                            max_batch=int(os.getenv("EMBEDDING_MAX_BATCH", "64")),
+                                            max_wait_ms=float(os.getenv("EMBEDDING_MAX_WAIT_MS", "20")),
+                                            max_in_flight=max(1, embedding_processes))
+        self.max_concurrent_tasks = int(os.getenv("EMBEDDING_MAX_CONCURRENT_TASKS", "8"))
         self.processing_tasks = set()
         self.logger.info(f"EmbeddingService initialized. Worker ID: {self.worker_id}")
         self.logger.info(f"URLs - Master: {self.master_task_db_url}, Chunking: {self.chunking_service_urls}")
+        self.logger.info(f"Vectorial DB shards: {list(self.shard_queues) or 'unsharded'}")
+        self.logger.info(f"Embedder: {self.llm.name} ({self.llm.dimension} dimensions)")
     
     async def start(self):
         # Create a task processor for each chunking service
@@ -40,29 +80,40 @@ class EmbeddingService:
     async def process_tasks_from_service(self, chunking_url: str):
         """Process tasks using a specific chunking service"""
         async with httpx.AsyncClient() as client:
-            while self.running:
-                try:
-                    self.logger.debug("Checking for CHUNKED tasks...")
-                    response = await client.get(
-                        f"{self.master_task_db_url}/tasks/status/{TaskStatus.CHUNKED.value}"
-                    )
-                    self.logger.debug(f"Status check response: {response.status_code}")
+            # Runs of the tasks claimed here: they borrow this client, so they finish before it closes
+            runs: Set[asyncio.Task] = set()
+            try:
+                while self.running:
+                    try:
+                        self.logger.debug("Checking for CHUNKED tasks...")
+                        response = await client.get(
+                            f"{self.master_task_db_url}/tasks/status/{TaskStatus.CHUNKED.value}"
+                        )
+                        self.logger.debug(f"Status check response: {response.status_code}")
                     
-                    if response.status_code == 200:
-                        tasks = response.json()
-                        self.logger.info(f"Found {len(tasks)} tasks with CHUNKED status")
-                        for task_data in tasks:
-                            task = Task(**task_data)
-                            if not task.worker_id and task.id not in self.processing_tasks:
-                                await self.process_single_task(task, client, chunking_url)
+                        if response.status_code == 200:
+                            tasks = response.json()
+                            self.logger.info(f"Found {len(tasks)} tasks with CHUNKED status")
+                            for task_data in tasks:
+                                if len(self.processing_tasks) >= self.max_concurrent_tasks:
+                                    break
+                                task = Task(**task_data)
+                                if not task.worker_id and task.id not in self.processing_tasks:
+                                    # Claimed tasks run concurrently so their chunks share embedding batches
+                                    self.processing_tasks.add(task.id)
+                                    run = asyncio.create_task(self.process_single_task(task, client, chunking_url))
+                                    runs.add(run)
+                                    run.add_done_callback(runs.discard)
                 
-                except Exception as e:
-                    log_error(self.logger, e, "process_tasks")
+                    except Exception as e:
+                        log_error(self.logger, e, "process_tasks")
                 
-                await asyncio.sleep(5)
+                    await asyncio.sleep(5)
+            finally:
+                if runs:
+                    await asyncio.gather(*runs, return_exceptions=True)
     
     async def process_single_task(self, task: Task, client: httpx.AsyncClient, chunking_url: str):
-        self.processing_tasks.add(task.id)
         try:
             self.logger.info(f"Processing task {task.id} for embedding")
             await client.put(
@@ -84,18 +135,16 @@ class EmbeddingService:
             embeddings = await self.generate_embeddings(chunks)
             self.logger.info(f"Generated {len(embeddings)} embeddings for task {task.id}")
             
-            for embedding in embeddings:
-                try:
-                    self.embeddings_queue.put(embedding.dict(), timeout=1)
-                except queue.Full:
-                    self.logger.warning(f"Embeddings queue full for task {task.id}")
-            
+            # Mark EMBEDDED before the vectors become visible to the vectorial DB,
+            # so its VECTORIZED transition can never be overwritten by this one
             await client.put(
                 f"{self.master_task_db_url}/tasks/{task.id}/status",
                 params={"status": TaskStatus.EMBEDDED.value}
             )
             self.logger.info(f"Task {task.id} marked as EMBEDDED")
             
+            await self.enqueue_embeddings(task.id, embeddings)
+            
             await client.delete(f"{chunking_url}/chunks/{task.id}")
             self.logger.info(f"Cleared chunks for task {task.id}")
             
@@ -109,11 +158,29 @@ class EmbeddingService:
         finally:
             self.processing_tasks.discard(task.id)
     
+    async def enqueue_embeddings(self, task_id: str, embeddings: List[Embedding]):
+        """Hand a task's embeddings to its queue; a full queue is waited on (without blocking the loop), never dropped"""
+        embeddings_queue = self.queue_for(task_id)
+        warned = False
+        for embedding in embeddings:
+            item = embedding.dict()
+            while True:
+                try:
+                    embeddings_queue.put_nowait(item)
+                    break
+                except queue.Full:
+                    if not warned:
+                        self.logger.warning(f"Embeddings queue full for task {task_id}, waiting for the vectorial DB")
+                        warned = True
+                    await asyncio.sleep(QUEUE_FULL_RETRY_SECONDS)
+    
     async def generate_embeddings(self, chunks: List[Chunk]) -> List[Embedding]:
         embeddings = []
         
         texts = [chunk.content for chunk in chunks]
-        vectors = self.llm.generate_embeddings(texts)
+        # One (n, dimension) block, converted to lists in a single call
+        task_id = chunks[0].task_id if chunks else ""
+        vectors = (await self.scheduler.embed(task_id, texts)).tolist()
         
         for chunk, vector in zip(chunks, vectors):
             embedding = Embedding(
@@ -121,13 +188,40 @@ class EmbeddingService:
                 chunk_id=chunk.id,
                 task_id=chunk.task_id,
                 vector=vector,
-                model_name="mock-embedding-model",
-                dimension=len(vector)
+                model_name=self.llm.name,
+                dimension=len(vector),
+                task_embedding_count=len(chunks),
+                metadata=chunk.metadata
             )
             embeddings.append(embedding)
         
         return embeddings
     
+    def embed_batch(self, texts: List[str]):
+        """One scheduler batch: cached texts are served, the rest embedded in a single call"""
+        return self.embedding_cache.embed_batch(self.llm, texts, self.embed_texts)
+
+    def embed_texts(self, texts: List[str]):
+        """Cache misses go through here, so the throughput counters measure the embedder alone"""
+        started = time.perf_counter()
+        vectors = (self.process_pool or self.llm).embed_batch(texts)
+        with self._stats_lock:
+            self.embedding_seconds += time.perf_counter() - started
+            self.embedded_texts += len(texts)
+        return vectors
+
+    def get_embedder_stats(self) -> dict:
+        seconds = self.embedding_seconds
+        return {
+            "name": self.llm.name,
+            "dimension": self.llm.dimension,
+            "embedded_texts": self.embedded_texts,
+            "embedding_seconds": round(seconds, 3),
+            # Per worker: batches in different processes overlap, so the container does up to `workers` times this
+            "texts_per_second": round(self.embedded_texts / seconds, 1) if seconds else None,
+            "workers": self.process_pool.processes if self.process_pool is not None else 1
+        }
+
     async def heartbeat_loop(self):
         async with httpx.AsyncClient() as client:
             while self.running:
@@ -142,11 +236,19 @@ class EmbeddingService:
                 
                 await asyncio.sleep(10)
     
-    def get_embeddings(self, batch_size: int = 10) -> List[dict]:
+    def queue_for(self, task_id: str) -> queue.Queue:
+        """Queue of the shard that owns task_id, or the shared queue when unsharded"""
+        if self.shard_ring is None:
+            return self.embeddings_queue
+        return self.shard_queues[self.shard_ring.node_for(task_id)]
+    
+    def get_embeddings(self, batch_size: int = 10, shard: Optional[str] = None) -> List[dict]:
+        """Up to batch_size queued embeddings; when sharded, from the queue of `shard` (one of shard_queues)"""
+        source = self.embeddings_queue if self.shard_ring is None else self.shard_queues[shard]
         embeddings = []
         for _ in range(batch_size):
             try:
-                embedding = self.embeddings_queue.get_nowait()
+                embedding = source.get_nowait()
                 embeddings.append(embedding)
             except queue.Empty:
                 break
@@ -161,16 +263,32 @@ async def lifespan(app: FastAPI):
     await embedding_service.start()
     yield
     embedding_service.running = False
+    embedding_service.scheduler.close()
+    if embedding_service.process_pool is not None:
+        embedding_service.process_pool.close()
 
 
 app = FastAPI(title="Embedding Service", lifespan=lifespan)
 
 
 @app.get("/embeddings/batch")
-async def get_embeddings_batch(batch_size: int = 10):
-    log_request(embedding_service.logger, "GET", "/embeddings/batch", batch_size=batch_size)
-    embeddings = embedding_service.get_embeddings(batch_size)
+async def get_embeddings_batch(request: Request, batch_size: int = 10, shard: Optional[str] = None):
+    log_request(embedding_service.logger, "GET", "/embeddings/batch", batch_size=batch_size, shard=shard)
+    if embedding_service.shard_ring is not None and shard not in embedding_service.shard_queues:
+        # Sharded embeddings only ever go to per-shard queues, so nothing else can be served
+        raise HTTPException(status_code=400,
+                            detail=f"Unknown shard {shard!r}; expected one of {list(embedding_service.shard_queues)}")
+    embeddings = embedding_service.get_embeddings(batch_size, shard)
     log_response(embedding_service.logger, "GET", "/embeddings/batch", 200, count=len(embeddings))
+    if accepts_vector_frame(request.headers.get("accept")):
+        # Vectors as one binary block, everything else as JSON fields
+        frame = encode_frame(
+            [embedding["vector"] for embedding in embeddings],
+            {"embeddings": [{k: v for k, v in embedding.items() if k != "vector"} for embedding in embeddings],
+             "count": len(embeddings)},
+            dtype=embedding_service.wire_dtype
+        )
+        return Response(content=frame, media_type=VECTOR_FRAME_CONTENT_TYPE)
     return {"embeddings": embeddings, "count": len(embeddings)}
 
 
@@ -180,12 +298,23 @@ async def queue_status():
     status = {
         "queue_size": embedding_service.embeddings_queue.qsize(),
         "max_size": embedding_service.embeddings_queue.maxsize,
-        "processing_tasks": list(embedding_service.processing_tasks)
+        "shard_queues": {url: q.qsize() for url, q in embedding_service.shard_queues.items()},
+        "processing_tasks": list(embedding_service.processing_tasks),
+        "embedder": embedding_service.get_embedder_stats(),
+        "scheduler": embedding_service.scheduler.get_stats()
     }
     log_response(embedding_service.logger, "GET", "/queue/status", 200)
     return status
 
 
+@app.get("/cache/stats")
+async def cache_stats():
+    log_request(embedding_service.logger, "GET", "/cache/stats")
+    stats = embedding_service.embedding_cache.get_stats()
+    log_response(embedding_service.logger, "GET", "/cache/stats", 200)
+    return stats
+
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "embedding", "worker_id": embedding_service.worker_id}
\ No newline at end of file
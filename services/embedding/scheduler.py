@@ -0,0 +1,226 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable, Deque, List, Optional, Set, Tuple
+
+import numpy as np
+
+
+class _Request:
+    """One embed() call: its texts, how many were handed to batches, and the rows returned so far"""
+
+    __slots__ = ("task_id", "texts", "future", "enqueued_at", "next", "filled", "vectors")
+
+    def __init__(self, task_id: str, texts: List[str], future: asyncio.Future):
+        self.task_id = task_id
+        self.texts = texts
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.next = 0
+        self.filled = 0
+        self.vectors: Optional[np.ndarray] = None
+
+
+class EmbeddingScheduler:
+    """
+    Dynamic micro-batching of embedding work across tasks.
+
+    Callers hand over a task's texts with embed(). One dispatcher packs the
+    pending texts of every task into batches of up to `max_batch`, sent once
+    a batch is full or the oldest waiting text has waited `max_wait_ms`, and
+    routes each batch's rows back to the calls they came from. Up to
+    `max_in_flight` batches run at a time on `executor` (one thread each by
+    default), so the event loop stays free and texts that arrive while they
+    run collect into the next batch.
+
+    Batches are shared fairly: every task with pending texts is offered an
+    equal share (what a task cannot use goes to the others), and tasks left
+    out of a full batch go first in the next one, so one huge document
+    cannot starve small ones.
+    """
+
+    def __init__(self, embed: Callable[[List[str]], np.ndarray], max_batch: int = 64, max_wait_ms: float = 20.0,
+                 executor: Optional[Executor] = None, max_in_flight: int = 1):
+        self.embed_fn = embed
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_in_flight = max_in_flight
+        self.executor = executor or ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="embedding-batch")
+        # task_id -> its waiting requests, oldest first; iteration order is the round-robin order
+        self._tasks: "OrderedDict[str, Deque[_Request]]" = OrderedDict()
+        self._pending_texts = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.full_batches = 0
+        self.texts = 0
+        self.task_slots = 0
+        self.queue_delay_total = 0.0
+        self.queue_delay_max = 0.0
+        self.failed_batches = 0
+
+    async def embed(self, task_id: str, texts: List[str]) -> np.ndarray:
+        """Embeddings of one task's texts as a (len(texts), dimension) array, batched with other tasks' texts"""
+        if not texts:
+            return self.embed_fn([])
+        self._ensure_dispatcher()
+        request = _Request(task_id, list(texts), self._loop.create_future())
+        self._tasks.setdefault(task_id, deque()).append(request)
+        self._pending_texts += len(texts)
+        self._wakeup.set()
+        try:
+            return await request.future
+        finally:
+            # A caller that gave up leaves nothing behind in the queue
+            self._drop(request)
+
+    def _ensure_dispatcher(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Requests queued on another (closed) event loop can no longer be answered
+            self._tasks.clear()
+            self._pending_texts = 0
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._dispatcher = None
+            self._running = set()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = loop.create_task(self._dispatch())
+
+    def _drop(self, request: _Request):
+        requests = self._tasks.get(request.task_id)
+        if requests is None or request not in requests:
+            return
+        requests.remove(request)
+        self._pending_texts -= len(request.texts) - request.next
+        request.next = len(request.texts)
+        if not requests:
+            del self._tasks[request.task_id]
+
+    def _oldest_wait(self) -> float:
+        return time.monotonic() - min(requests[0].enqueued_at for requests in self._tasks.values())
+
+    async def _dispatch(self):
+        while True:
+            if not self._pending_texts or len(self._running) >= self.max_in_flight:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            if self._pending_texts < self.max_batch:
+                remaining = self.max_wait - self._oldest_wait()
+                if remaining > 0:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+            batch = self._loop.create_task(self._run_batch(self._take_batch()))
+            self._running.add(batch)
+            batch.add_done_callback(self._batch_done)
+
+    def _batch_done(self, batch: asyncio.Task):
+        self._running.discard(batch)
+        self._wakeup.set()
+
+    def _take_batch(self) -> List[Tuple[_Request, int, int]]:
+        """
+        (request, start, stop) slices filling one batch: every active task is
+        offered room // active texts per round until the batch is full or
+        nothing is left; served tasks then move to the back of the order.
+        """
+        slices = []
+        room = self.max_batch
+        served = []
+        active = list(self._tasks)
+        while room and active:
+            share = max(1, room // len(active))
+            still_pending = []
+            for task_id in active:
+                if not room:
+                    still_pending.append(task_id)
+                    continue
+                requests = self._tasks[task_id]
+                want = min(share, room)
+                while want and requests:
+                    request = requests[0]
+                    take = min(want, len(request.texts) - request.next)
+                    slices.append((request, request.next, request.next + take))
+                    request.next += take
+                    want -= take
+                    room -= take
+                    if request.next == len(request.texts):
+                        requests.popleft()
+                served.append(task_id)
+                if requests:
+                    still_pending.append(task_id)
+                else:
+                    del self._tasks[task_id]
+            active = still_pending if room else []
+        for task_id in dict.fromkeys(served):
+            if task_id in self._tasks:
+                self._tasks.move_to_end(task_id)
+        self._pending_texts -= self.max_batch - room
+        return slices
+
+    async def _run_batch(self, slices: List[Tuple[_Request, int, int]]):
+        dispatched = time.monotonic()
+        texts = [text for request, start, stop in slices for text in request.texts[start:stop]]
+        self.batches += 1
+        self.full_batches += len(texts) == self.max_batch
+        self.texts += len(texts)
+        self.task_slots += len({request.task_id for request, _, _ in slices})
+        for request, start, stop in slices:
+            delay = dispatched - request.enqueued_at
+            self.queue_delay_total += delay * (stop - start)
+            self.queue_delay_max = max(self.queue_delay_max, delay)
+
+        try:
+            vectors = await self._loop.run_in_executor(self.executor, self.embed_fn, texts)
+        except Exception as e:
+            self.failed_batches += 1
+            for request, _, _ in slices:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+
+        offset = 0
+        for request, start, stop in slices:
+            rows = vectors[offset:offset + stop - start]
+            offset += stop - start
+            if request.future.done():
+                continue
+            if request.vectors is None:
+                request.vectors = np.empty((len(request.texts), rows.shape[1]), dtype=np.float32)
+            request.vectors[start:stop] = rows
+            request.filled += stop - start
+            if request.filled == len(request.texts):
+                request.future.set_result(request.vectors)
+
+    def close(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+        for batch in self._running:
+            batch.cancel()
+        self.executor.shutdown(wait=False)
+
+    def get_stats(self) -> dict:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "full_batches": self.full_batches,
+            "failed_batches": self.failed_batches,
+            "texts": self.texts,
+            "fill_ratio": self.texts / (self.batches * self.max_batch) if self.batches else 0.0,
+            "mean_tasks_per_batch": self.task_slots / self.batches if self.batches else 0.0,
+            "mean_queue_delay_ms": 1000 * self.queue_delay_total / self.texts if self.texts else 0.0,
+            "max_queue_delay_ms": 1000 * self.queue_delay_max,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": len(self._running),
+            "pending_texts": self._pending_texts,
+            "pending_tasks": len(self._tasks)
+        }
@@ -0,0 +1,103 @@
+import itertools
+import multiprocessing
+import os
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from shared.utils.embedders import create_embedder
+
+# Output slots start with room for this many rows and double when a batch outgrows them
+INITIAL_SLOT_ROWS = 256
+
+_embedder = None
+# slot index -> (path, mapping) in this worker process
+_slots: Dict[int, Tuple[str, np.memmap]] = {}
+
+
+def start_worker():
+    """ProcessPoolExecutor initializer: build this process's embedder from the same environment as the service"""
+    global _embedder
+    _embedder = create_embedder()
+
+
+def embed_into_slot(slot: int, path: str, shape: Tuple[int, int], texts: List[str]) -> int:
+    """Embed `texts` into the first rows of an output slot; only the row count goes back through the pipe"""
+    cached = _slots.get(slot)
+    if cached is None or cached[0] != path:
+        cached = path, np.memmap(path, dtype=np.float32, mode="r+", shape=shape)
+        _slots[slot] = cached
+    cached[1][:len(texts)] = _embedder.embed_batch(texts)
+    return len(texts)
+
+
+class EmbeddingProcessPool:
+    """
+    Runs embedding batches in worker processes, one core each.
+
+    Every worker builds its own embedder from the service's environment
+    (EMBEDDER, EMBEDDING_DIMENSION, ...), so it embeds exactly like the
+    service would. Texts go to a worker pickled; vectors come back through
+    shared memory: each calling thread owns an output slot, a float32 file
+    in `directory` (a tmpfs such as /dev/shm) that the worker maps once and
+    fills in place, so no list of floats is ever pickled. A slot that is too
+    small for a batch is replaced by one twice the size.
+
+    embed_batch() blocks its calling thread, so run it from as many threads
+    as there are processes to keep every worker busy.
+    """
+
+    def __init__(self, processes: int, dimension: int, directory: str = "/dev/shm/embedding"):
+        self.processes = processes
+        self.dimension = dimension
+        self.directory = directory
+        # Slots are scratch space, so any left over from a previous run are removed
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        # Spawned, not forked: a worker starts from a clean interpreter instead of the service's event loop
+        self.pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=start_worker)
+        self._local = threading.local()
+        self._slot_ids = itertools.count()
+        self.batches = 0
+        self.texts = 0
+
+    def _slot(self, rows: int) -> Tuple[int, np.memmap]:
+        slot = getattr(self._local, "slot", None)
+        if slot is None:
+            slot = self._local.slot = next(self._slot_ids)
+        mapping = getattr(self._local, "mapping", None)
+        if mapping is None or mapping.shape[0] < rows:
+            capacity = max(rows, INITIAL_SLOT_ROWS, 2 * mapping.shape[0] if mapping is not None else 0)
+            path = os.path.join(self.directory, f"slot-{slot}.{capacity}.bin")
+            if mapping is not None:
+                os.remove(mapping.filename)
+            mapping = self._local.mapping = np.memmap(path, dtype=np.float32, mode="w+",
+                                                      shape=(capacity, self.dimension))
+        return slot, mapping
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        """Embeddings of `texts` computed in a worker process, as a (len(texts), dimension) float32 array"""
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        slot, mapping = self._slot(len(texts))
+        self.pool.submit(embed_into_slot, slot, mapping.filename, mapping.shape, texts).result()
+        self.batches += 1
+        self.texts += len(texts)
+        # Copied out: the slot is overwritten by this thread's next batch
+        return np.array(mapping[:len(texts)])
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def get_stats(self) -> dict:
+        return {
+            "processes": self.processes,
+            "directory": self.directory,
+            "batches": self.batches,
+            "texts": self.texts
+        }
@@ -1,10 +1,17 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 import httpx
+import asyncio
+import heapq
 import os
-from typing import List, Optional
+from itertools import islice
+from typing import Dict, List, Optional
 
-from shared.utils.mock_llm import MockEmbeddingLLM, MockChatLLM
+from shared.utils.embedders import create_embedder
+from shared.utils.embedding_cache import embedding_cache_from_env
+from shared.utils.mock_llm import MockChatLLM
+from shared.utils.sharding import ring_from_env
+from shared.utils.vector_wire import VECTOR_FRAME_CONTENT_TYPE, encode_frame
 from shared.utils.logging_config import setup_logger, log_request, log_response, log_error
 
 
@@ -23,46 +30,93 @@ class QueryResponse(BaseModel):
 class RAGQueryService:
     def __init__(self):
         self.logger = setup_logger("rag-query-service", os.getenv("LOG_LEVEL", "INFO"))
-        self.embedding_llm = MockEmbeddingLLM()
+        # Must match the embedding services' EMBEDDER, or queries and chunks live in different spaces
+        self.embedding_llm = create_embedder()
+        # Popular queries are asked again and again; their vectors are served from here
+        self.embedding_cache = embedding_cache_from_env()
         self.chat_llm = MockChatLLM()
         # Support multiple vectorial DB and chunking services
-        vectorial_urls = os.getenv("VECTORIAL_DB_URLS", "http://vectorial-db:8006")
+        vectorial_urls = os.getenv("VECTORIAL_DB_URLS", "http://vectorial-db-1:8006")
         self.vectorial_db_urls = [url.strip() for url in vectorial_urls.split(",")]
+        # Vectorial DBs are shards keyed by task_id on the same ring the embedding services use
+        self.shard_ring = ring_from_env(vectorial_urls)
+        # Query vectors go out as binary frames unless disabled; shards that
+        # turn out to read only JSON are remembered and sent JSON from then on
+        self.wire_format = os.getenv("VECTOR_WIRE_FORMAT", "binary")
+        self.json_only_shards = set()
         chunking_urls = os.getenv("CHUNKING_SERVICE_URLS", "http://chunking-1:8004,http://chunking-2:8004")
         self.chunking_service_urls = [url.strip() for url in chunking_urls.split(",")]
         self.logger.info("RAGQueryService initialized")
         self.logger.info(f"URLs - Vectorial DBs: {self.vectorial_db_urls}, Chunking: {self.chunking_service_urls}")
     
+    def route(self, task_ids: Optional[List[str]]) -> Dict[str, Optional[List[str]]]:
+        """
+        Shards to query, each with the task ids it owns (None: no task filter).
+        An empty list means no filter too, as it does to the vectorial DB, so
+        sharded and unsharded deployments answer it alike.
+        """
+        if not task_ids or self.shard_ring is None:
+            return {url: task_ids or None for url in self.vectorial_db_urls}
+        return self.shard_ring.partition(task_ids)
+    
+    async def search_shard(self, client: httpx.AsyncClient, db_url: str, query_embedding: List[float],
+                           top_k: int, task_ids: Optional[List[str]]) -> List[dict]:
+        fields = {"top_k": top_k, "task_ids": task_ids}
+        if self.wire_format == "binary" and db_url not in self.json_only_shards:
+            response = await client.post(
+                f"{db_url}/search",
+                content=encode_frame(query_embedding, fields),
+                headers={"Content-Type": VECTOR_FRAME_CONTENT_TYPE}
+            )
+            if response.status_code == 200:
+                return response.json()["results"]
+            if response.status_code not in (400, 415, 422):
+                raise Exception(f"Search returned {response.status_code}")
+        response = await client.post(f"{db_url}/search", json={"query_vector": query_embedding, **fields})
+        if response.status_code != 200:
+            raise Exception(f"Search returned {response.status_code}")
+        if self.wire_format == "binary" and db_url not in self.json_only_shards:
+            self.logger.info(f"{db_url} does not accept binary vector frames, using JSON")
+            self.json_only_shards.add(db_url)
+        return response.json()["results"]
+    
+    async def search_shards(self, client: httpx.AsyncClient, query_embedding: List[float],
+                            top_k: int, task_ids: Optional[List[str]]) -> List[dict]:
+        """
+        Scatter the query to the shards owning task_ids in parallel and
+        k-way merge their score-sorted top-k lists into the global top-k
+        """
+        routes = self.route(task_ids)
+        if not routes:
+            return []
+        responses = await asyncio.gather(
+            *(self.search_shard(client, url, query_embedding, top_k, shard_task_ids)
+              for url, shard_task_ids in routes.items()),
+            return_exceptions=True
+        )
+        result_lists = []
+        last_error = None
+        for db_url, response in zip(routes, responses):
+            if isinstance(response, Exception):
+                self.logger.warning(f"Failed to search in {db_url}: {response}")
+                last_error = response
+            else:
+                result_lists.append(response)
+        if not result_lists:
+            raise HTTPException(status_code=500, detail=f"Failed to search embeddings: {last_error}")
+        if len(routes) > len(result_lists):
+            self.logger.warning(f"Partial results: {len(result_lists)}/{len(routes)} shards answered")
+        return list(islice(heapq.merge(*result_lists, key=lambda result: -result["score"]), top_k))
+    
     async def process_query(self, query_request: QueryRequest) -> QueryResponse:
         self.logger.info(f"Processing query: {query_request.query[:50]}...")
-        query_embedding = self.embedding_llm.generate_embedding(query_request.query)
+        query_embedding = self.embedding_cache.embed_batch(self.embedding_llm, [query_request.query])[0].tolist()
         self.logger.debug(f"Generated query embedding with dimension {len(query_embedding)}")
         
         async with httpx.AsyncClient() as client:
-            # Try each vectorial DB until we get a successful response
-            search_results = []
-            for db_url in self.vectorial_db_urls:
-                try:
-                    search_response = await client.post(
-                        f"{db_url}/search",
-                        json={
-                            "query_vector": query_embedding,
-                            "top_k": query_request.top_k,
-                            "task_ids": query_request.task_ids
-                        }
-                    )
-                    
-                    if search_response.status_code == 200:
-                        search_results.extend(search_response.json()["results"])
-                except Exception as e:
-                    self.logger.warning(f"Failed to search in {db_url}: {e}")
-            
-            if not search_results:
-                raise HTTPException(status_code=500, detail="Failed to search embeddings")
-            
-            # Sort all results by score and take top_k
-            search_results.sort(key=lambda x: x["score"], reverse=True)
-            search_results = search_results[:query_request.top_k]
+            search_results = await self.search_shards(
+                client, query_embedding, query_request.top_k, query_request.task_ids
+            )
             self.logger.info(f"Found {len(search_results)} matching results across all DBs")
             
             context_chunks = []
@@ -132,11 +186,22 @@ async def query_rag(query_request: QueryRequest):
         response = await rag_service.process_query(query_request)
         log_response(rag_service.logger, "POST", "/query", 200)
         return response
+    except HTTPException as e:
+        log_error(rag_service.logger, e, "query_rag")
+        raise
     except Exception as e:
         log_error(rag_service.logger, e, "query_rag")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/cache/stats")
+async def cache_stats():
+    log_request(rag_service.logger, "GET", "/cache/stats")
+    stats = rag_service.embedding_cache.get_stats()
+    log_response(rag_service.logger, "GET", "/cache/stats", 200)
+    return stats
+
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "rag_query"}
\ No newline at end of file
@@ -0,0 +1,104 @@
+import asyncio
+from concurrent.futures import Executor
+from functools import partial
+from typing import List, Optional, Tuple
+
+
+class SearchBatcher:
+    """
+    Coalesces concurrent single-query searches into one VectorDatabase.search_batch.
+
+    The first query to arrive opens a window of `window_ms`; every query
+    submitted before it closes (or until `max_batch` are waiting) is answered
+    by the same batched scan. Under light load a query waits at most one
+    window; under heavy load the scan cost is shared across the batch.
+
+    With an `executor`, the batched scan runs there and the event loop only
+    hands out the answers.
+    """
+
+    def __init__(self, db, window_ms: float = 2.0, max_batch: int = 64, executor: Optional[Executor] = None):
+        self.db = db
+        self.executor = executor
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._pending: List[Tuple[List[float], int, Optional[List[str]], asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self.batches = 0
+        self.queries = 0
+
+    async def search(self, query_vector: List[float], top_k: int = 5,
+                     task_ids: Optional[List[str]] = None) -> List[dict]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((query_vector, top_k, task_ids, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        self.batches += 1
+        self.queries += len(pending)
+        if self.executor is None:
+            self._resolve(pending, self._answer(pending))
+            return
+        answers = asyncio.get_running_loop().run_in_executor(self.executor, self._answer, pending)
+        answers.add_done_callback(partial(self._answered, pending))
+
+    def _answered(self, pending, done: asyncio.Future):
+        """Hand out an executor batch's answers, or its failure to every query still waiting on it"""
+        if not done.cancelled() and done.exception() is None:
+            self._resolve(pending, done.result())
+            return
+        for *_, future in pending:
+            if future.done():
+                continue
+            if done.cancelled():
+                future.cancel()
+            else:
+                future.set_exception(done.exception())
+
+    def _answer(self, pending) -> List[Tuple[bool, object]]:
+        """(True, results) or (False, exception) per pending query; touches no futures, so it may run off the loop"""
+        try:
+            results = self.db.search_batch(
+                [query_vector for query_vector, _, _, _ in pending],
+                [top_k for _, top_k, _, _ in pending],
+                [task_ids for _, _, task_ids, _ in pending]
+            )
+            return [(True, result) for result in results]
+        except Exception:
+            # One malformed query must not fail its neighbours: answer each on its own
+            answers = []
+            for query_vector, top_k, task_ids, _ in pending:
+                try:
+                    answers.append((True, self.db.search(query_vector, top_k, task_ids)))
+                except Exception as e:
+                    answers.append((False, e))
+            return answers
+
+    @staticmethod
+    def _resolve(pending, answers: List[Tuple[bool, object]]):
+        for (*_, future), (ok, value) in zip(pending, answers):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def get_stats(self) -> dict:
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "batches": self.batches,
+            "mean_batch_size": self.queries / self.batches if self.batches else 0.0
+        }
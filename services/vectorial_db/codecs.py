@@ -0,0 +1,344 @@
+from typing import Optional
+import numpy as np
+
+# Rows decoded/scored per step: small enough for the float32 temporary to stay in cache,
+# and lossy codecs never materialize a full float32 copy
+SCAN_BLOCK_ROWS = 4096
+
+# Set bits of every 16-bit value: a Hamming distance is a table lookup per 16 bits of XOR
+POPCOUNT16 = sum(((np.arange(1 << 16) >> bit) & 1).astype(np.uint8) for bit in range(16))
+
+
+def kmeans(vectors: np.ndarray, n_clusters: int, n_iter: int = 10, seed: int = 0) -> np.ndarray:
+    """Plain (L2) Lloyd's k-means; empty clusters are re-seeded from random points"""
+    rng = np.random.default_rng(seed)
+    n = vectors.shape[0]
+    n_clusters = min(n_clusters, n)
+    centroids = vectors[rng.choice(n, n_clusters, replace=False)].copy()
+
+    for _ in range(n_iter):
+        # argmin ||x - c||^2 == argmax (x.c - ||c||^2 / 2)
+        assignments = np.argmax(vectors @ centroids.T - 0.5 * np.sum(centroids ** 2, axis=1), axis=1)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        if not filled.all():
+            centroids[~filled] = vectors[rng.choice(n, int((~filled).sum()), replace=False)]
+
+    return centroids.astype(np.float32)
+
+
+class Float32Codec:
+    """Full precision: codes are the normalized rows themselves"""
+    name = "float32"
+    dtype = np.float32
+    trained = True
+
+    def code_width(self, dimension: int) -> int:
+        return dimension
+
+    def train(self, vectors: np.ndarray):
+        pass
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.asarray(vectors, dtype=np.float32)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return codes
+
+    def scores(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        return codes @ query
+
+    def scores_batch(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        return queries @ codes.T
+
+
+class Float16Codec:
+    """Half precision: 2 bytes per dimension, upcast block by block for the matmul"""
+    name = "float16"
+    dtype = np.float16
+    trained = True
+
+    def code_width(self, dimension: int) -> int:
+        return dimension
+
+    def train(self, vectors: np.ndarray):
+        pass
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.asarray(vectors, dtype=np.float16)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32)
+
+    def scores(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        out = np.empty(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], SCAN_BLOCK_ROWS):
+            block = codes[start:start + SCAN_BLOCK_ROWS]
+            out[start:start + block.shape[0]] = block.astype(np.float32) @ query
+        return out
+
+    def scores_batch(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        out = np.empty((queries.shape[0], codes.shape[0]), dtype=np.float32)
+        for start in range(0, codes.shape[0], SCAN_BLOCK_ROWS):
+            block = codes[start:start + SCAN_BLOCK_ROWS]
+            out[:, start:start + block.shape[0]] = queries @ block.astype(np.float32).T
+        return out
+
+
+class ScalarQuantizer8Codec:
+    """
+    Per-dimension int8 scalar quantization: each dimension is mapped linearly
+    from its trained [min, max] range onto 0..255. Scoring folds the affine
+    transform into the query, so it is one uint8->float32 matmul per block.
+    """
+    name = "sq8"
+    dtype = np.uint8
+
+    def __init__(self):
+        self.minimum: Optional[np.ndarray] = None
+        self.scale: Optional[np.ndarray] = None
+
+    @property
+    def trained(self) -> bool:
+        return self.scale is not None
+
+    def code_width(self, dimension: int) -> int:
+        return dimension
+
+    def train(self, vectors: np.ndarray):
+        self.minimum = vectors.min(axis=0).astype(np.float32)
+        spread = vectors.max(axis=0) - self.minimum
+        spread[spread == 0] = 1.0
+        self.scale = (spread / 255.0).astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint((vectors - self.minimum) / self.scale)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32) * self.scale + self.minimum
+
+    def scores(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        scaled_query = query * self.scale
+        offset = float(query @ self.minimum)
+        out = np.empty(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], SCAN_BLOCK_ROWS):
+            block = codes[start:start + SCAN_BLOCK_ROWS]
+            out[start:start + block.shape[0]] = block.astype(np.float32) @ scaled_query + offset
+        return out
+
+    def scores_batch(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        scaled_queries = queries * self.scale
+        offsets = (queries @ self.minimum)[:, None]
+        out = np.empty((queries.shape[0], codes.shape[0]), dtype=np.float32)
+        for start in range(0, codes.shape[0], SCAN_BLOCK_ROWS):
+            block = codes[start:start + SCAN_BLOCK_ROWS]
+            out[:, start:start + block.shape[0]] = scaled_queries @ block.astype(np.float32).T + offsets
+        return out
+
+
+class ProductQuantizerCodec:
+    """
+    Product quantization: the vector is split into `n_subspaces` sub-vectors,
+    each replaced by the index of its nearest of 256 k-means centroids (one
+    byte per subspace). Queries use asymmetric distance tables: the query's
+    dot product with every sub-centroid is computed once, and a row's score
+    is the sum of its table entries.
+    """
+    name = "pq"
+    dtype = np.uint8
+
+    def __init__(self, n_subspaces: int = 48, n_centroids: int = 256, seed: int = 0):
+        self.n_subspaces = n_subspaces
+        self.n_centroids = n_centroids
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None  # (n_subspaces, n_centroids, sub_dim)
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def code_width(self, dimension: int) -> int:
+        return self.n_subspaces
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        n, dimension = vectors.shape
+        if dimension % self.n_subspaces:
+            raise ValueError(f"Dimension {dimension} is not divisible by {self.n_subspaces} PQ subspaces")
+        return vectors.reshape(n, self.n_subspaces, dimension // self.n_subspaces)
+
+    def train(self, vectors: np.ndarray):
+        sub_vectors = self._split(np.asarray(vectors, dtype=np.float32))
+        n_centroids = min(self.n_centroids, sub_vectors.shape[0])
+        self.centroids = np.stack([
+            kmeans(sub_vectors[:, m], n_centroids, seed=self.seed + m) for m in range(self.n_subspaces)
+        ])
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        sub_vectors = self._split(np.asarray(vectors, dtype=np.float32))
+        codes = np.empty((sub_vectors.shape[0], self.n_subspaces), dtype=np.uint8)
+        half_norms = 0.5 * np.sum(self.centroids ** 2, axis=2)
+        for m in range(self.n_subspaces):
+            codes[:, m] = np.argmax(sub_vectors[:, m] @ self.centroids[m].T - half_norms[m], axis=1)
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        parts = [self.centroids[m][codes[:, m]] for m in range(self.n_subspaces)]
+        return np.concatenate(parts, axis=1)
+
+    def scores(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        sub_query = query.reshape(self.n_subspaces, -1)
+        tables = np.einsum("mkd,md->mk", self.centroids, sub_query)
+        out = np.zeros(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], SCAN_BLOCK_ROWS):
+            block = codes[start:start + SCAN_BLOCK_ROWS]
+            acc = out[start:start + block.shape[0]]
+            for m in range(self.n_subspaces):
+                acc += np.take(tables[m], block[:, m])
+        return out
+
+    def scores_batch(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """One table gather per subspace and block serves every query"""
+        sub_queries = queries.reshape(queries.shape[0], self.n_subspaces, -1)
+        tables = np.einsum("mkd,qmd->mqk", self.centroids, sub_queries)
+        out = np.zeros((queries.shape[0], codes.shape[0]), dtype=np.float32)
+        for start in range(0, codes.shape[0], SCAN_BLOCK_ROWS):
+            block = codes[start:start + SCAN_BLOCK_ROWS]
+            acc = out[:, start:start + block.shape[0]]
+            for m in range(self.n_subspaces):
+                acc += tables[m][:, block[:, m]]
+        return out
+
+
+class BinaryCodec:
+    """
+    Sign-bit codes: one bit per dimension (set when the component is above
+    the trained per-dimension mean), packed into uint64 words, so 384
+    dimensions take 48 bytes. A row's score is 1 - 2 * hamming / dimension,
+    the dot product of the +-1 sign vectors scaled to [-1, 1], computed as
+    XOR plus a popcount table lookup. Only a coarse shortlist: pair it with
+    a rerank_factor so the candidates are re-scored exactly.
+    """
+    name = "binary"
+    dtype = np.uint64
+
+    def __init__(self):
+        self.center: Optional[np.ndarray] = None
+
+    @property
+    def trained(self) -> bool:
+        return self.center is not None
+
+    def code_width(self, dimension: int) -> int:
+        return -(-dimension // 64)
+
+    def train(self, vectors: np.ndarray):
+        # Centering splits every dimension near its median, so each bit carries information
+        self.center = np.asarray(vectors, dtype=np.float32).mean(axis=0)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        n, dimension = vectors.shape
+        bits = np.zeros((n, self.code_width(dimension) * 64), dtype=bool)
+        bits[:, :dimension] = vectors > self.center
+        return np.packbits(bits, axis=1, bitorder="little").view(np.uint64)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        dimension = self.center.shape[0]
+        bits = np.unpackbits(codes.view(np.uint8), axis=1, count=dimension, bitorder="little")
+        return (bits.astype(np.float32) * 2 - 1) / np.sqrt(dimension)
+
+    def _hamming(self, query_codes: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Bit distances between (..., words) query codes and (rows, words) codes"""
+        differing = np.bitwise_xor(query_codes[..., None, :], codes)
+        return POPCOUNT16[differing.view(np.uint16)].sum(axis=-1, dtype=np.int32)
+
+    def scores(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        query_code = self.encode(query.reshape(1, -1))[0]
+        scale = np.float32(2.0 / self.center.shape[0])
+        out = np.empty(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], SCAN_BLOCK_ROWS):
+            block = codes[start:start + SCAN_BLOCK_ROWS]
+            out[start:start + block.shape[0]] = 1 - scale * self._hamming(query_code, block)
+        return out
+
+    def scores_batch(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        query_codes = self.encode(queries)
+        scale = np.float32(2.0 / self.center.shape[0])
+        out = np.empty((queries.shape[0], codes.shape[0]), dtype=np.float32)
+        for start in range(0, codes.shape[0], SCAN_BLOCK_ROWS):
+            block = codes[start:start + SCAN_BLOCK_ROWS]
+            out[:, start:start + block.shape[0]] = 1 - scale * self._hamming(query_codes, block)
+        return out
+
+
+class PCACodec:
+    """
+    Principal-component projection: each row is kept as its float32
+    coordinates on the top `dimensions` principal axes of the trained
+    sample, so a scan reads dimensions/dim of the bytes (64 of 384 is a
+    sixth). x . q ~= mean . q + code . (components q), so scoring is one
+    projected matmul. Pair it with a rerank_factor for exact final scores.
+    """
+    name = "pca"
+    dtype = np.float32
+
+    def __init__(self, dimensions: int = 64, sample_rows: int = 65536, seed: int = 0):
+        self.dimensions = dimensions
+        self.sample_rows = sample_rows
+        self.seed = seed
+        self.mean: Optional[np.ndarray] = None
+        self.components: Optional[np.ndarray] = None  # (dimensions, dim), orthonormal rows
+        self.explained_variance = 0.0
+
+    @property
+    def trained(self) -> bool:
+        return self.components is not None
+
+    def code_width(self, dimension: int) -> int:
+        return min(self.dimensions, dimension)
+
+    def train(self, vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.shape[0] > self.sample_rows:
+            rng = np.random.default_rng(self.seed)
+            vectors = vectors[np.sort(rng.choice(vectors.shape[0], self.sample_rows, replace=False))]
+        self.mean = vectors.mean(axis=0)
+        centered = vectors - self.mean
+        # eigh of the dim x dim covariance is far cheaper than an SVD of the sample
+        variances, axes = np.linalg.eigh((centered.T @ centered).astype(np.float64) / max(1, vectors.shape[0]))
+        top = np.argsort(variances)[::-1][:self.code_width(vectors.shape[1])]
+        self.components = np.ascontiguousarray(axes[:, top].T, dtype=np.float32)
+        total = variances.sum()
+        self.explained_variance = float(variances[top].sum() / total) if total > 0 else 1.0
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return (np.asarray(vectors, dtype=np.float32) - self.mean) @ self.components.T
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return codes @ self.components + self.mean
+
+    def scores(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        return codes @ (self.components @ query) + np.float32(self.mean @ query)
+
+    def scores_batch(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        return (queries @ self.components.T) @ codes.T + (queries @ self.mean)[:, None]
+
+
+def create_codec(name: str, pq_subspaces: int = 48, pca_dimensions: int = 64):
+    if name == "float32":
+        return Float32Codec()
+    if name == "float16":
+        return Float16Codec()
+    if name == "sq8":
+        return ScalarQuantizer8Codec()
+    if name == "pq":
+        return ProductQuantizerCodec(n_subspaces=pq_subspaces)
+    if name == "binary":
+        return BinaryCodec()
+    if name == "pca":
+        return PCACodec(dimensions=pca_dimensions)
+    raise ValueError(f"Unknown VECTOR_CODEC: {name}")
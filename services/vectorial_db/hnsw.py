@@ -0,0 +1,209 @@
+import heapq
+import math
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+
+class HNSWIndex:
+    """
+    Hierarchical navigable small-world graph over the rows of a VectorStore.
+
+    Pure Python/NumPy implementation of Malkov & Yashunin's algorithm. Each
+    node lives on levels 0..L (L drawn from an exponential distribution) and
+    keeps up to M neighbours per upper level and 2*M on level 0. Queries
+    descend greedily from the top-level entry point and run a best-first
+    search of width ef_search on level 0. Similarity is the dot product of the
+    store's normalized rows, evaluated one numpy call per expanded node.
+    """
+
+    # Insertions keep the graph as good as a fresh build
+    retrain_on_growth = False
+
+    def __init__(self, M: int = 16, ef_construction: int = 100, ef_search: int = 50, seed: int = 0):
+        self.M = M
+        self.max_neighbors_0 = 2 * M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.level_mult = 1 / math.log(M)
+        self.rng = np.random.default_rng(seed)
+        # graph[level][row] -> neighbour rows
+        self.graph: List[Dict[int, List[int]]] = []
+        self.entry_point: Optional[int] = None
+        self.max_level = -1
+
+    @property
+    def trained(self) -> bool:
+        return self.entry_point is not None
+
+    def should_train(self, total_rows: int) -> bool:
+        """Only an empty graph over a non-empty store (e.g. after recovery) needs a full build"""
+        return self.entry_point is None and total_rows > 1
+
+    def __len__(self) -> int:
+        return len(self.graph[0]) if self.graph else 0
+
+    def _random_level(self) -> int:
+        return int(-math.log(1.0 - self.rng.random()) * self.level_mult)
+
+    def _search_layer(self, store, query: np.ndarray, entry_points: List[Tuple[float, int]],
+                      ef: int, level: int) -> List[Tuple[float, int]]:
+        """Best-first search on one level; returns up to ef (similarity, row) pairs, best first"""
+        layer = self.graph[level]
+        visited = {row for _, row in entry_points}
+        # candidates is a max-heap on similarity, results a min-heap of the best ef found
+        candidates = [(-sim, row) for sim, row in entry_points]
+        heapq.heapify(candidates)
+        results = list(entry_points)
+        heapq.heapify(results)
+
+        while candidates:
+            neg_sim, row = heapq.heappop(candidates)
+            if -neg_sim < results[0][0] and len(results) >= ef:
+                break
+            fresh = [n for n in layer.get(row, ()) if n not in visited]
+            if not fresh:
+                continue
+            visited.update(fresh)
+            sims = store.vectors_at(np.array(fresh)) @ query
+            for sim, neighbor in zip(sims.tolist(), fresh):
+                if len(results) < ef or sim > results[0][0]:
+                    heapq.heappush(candidates, (-sim, neighbor))
+                    heapq.heappush(results, (sim, neighbor))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+
+        return sorted(results, reverse=True)
+
+    def _select_neighbors(self, store, candidates: List[Tuple[float, int]], max_neighbors: int) -> List[int]:
+        """
+        Neighbour-selection heuristic: keep a candidate only if it is closer to
+        the base node than to every neighbour already kept, which preserves
+        links between clusters. Candidates must be sorted best first.
+        """
+        if len(candidates) <= max_neighbors:
+            return [row for _, row in candidates]
+        rows = np.array([row for _, row in candidates])
+        sims = np.array([sim for sim, _ in candidates], dtype=np.float32)
+        vectors = store.vectors_at(rows)
+        pairwise = vectors @ vectors.T
+        # closest_kept[i] is candidate i's highest similarity to any neighbour kept so far
+        closest_kept = np.full(len(candidates), -np.inf, dtype=np.float32)
+        kept: List[int] = []
+        for i in range(len(candidates)):
+            if closest_kept[i] < sims[i]:
+                kept.append(i)
+                if len(kept) == max_neighbors:
+                    break
+                np.maximum(closest_kept, pairwise[i], out=closest_kept)
+        if len(kept) < max_neighbors:
+            # Fill the remaining slots with the closest discarded candidates
+            kept_set = set(kept)
+            kept.extend([i for i in range(len(candidates)) if i not in kept_set][:max_neighbors - len(kept)])
+        return [int(rows[i]) for i in kept]
+
+    def add(self, store, row: int):
+        """Insert a stored row into the graph (rows already present keep their links)"""
+        if self.graph and row in self.graph[0]:
+            return
+        query = store.vectors_at(np.array([row]))[0]
+        level = self._random_level()
+        while len(self.graph) <= level:
+            self.graph.append({})
+        for lvl in range(level + 1):
+            self.graph[lvl][row] = []
+
+        if self.entry_point is None:
+            self.entry_point = row
+            self.max_level = level
+            return
+
+        entry_sim = float(store.vectors_at(np.array([self.entry_point]))[0] @ query)
+        nearest = [(entry_sim, self.entry_point)]
+        for lvl in range(self.max_level, level, -1):
+            nearest = self._search_layer(store, query, nearest[:1], 1, lvl)
+
+        for lvl in range(min(level, self.max_level), -1, -1):
+            nearest = self._search_layer(store, query, nearest, self.ef_construction, lvl)
+            max_neighbors = self.max_neighbors_0 if lvl == 0 else self.M
+            neighbors = self._select_neighbors(store, nearest, self.M)
+            self.graph[lvl][row] = neighbors
+            for neighbor in neighbors:
+                links = self.graph[lvl][neighbor]
+                links.append(row)
+                if len(links) > max_neighbors:
+                    sims = store.vectors_at(np.array(links)) @ store.vectors_at(np.array([neighbor]))[0]
+                    ranked = sorted(zip(sims.tolist(), links), reverse=True)
+                    self.graph[lvl][neighbor] = self._select_neighbors(store, ranked, max_neighbors)
+
+        if level > self.max_level:
+            self.max_level = level
+            self.entry_point = row
+
+    def train(self, store, rows: Optional[int] = None):
+        """Rebuild the graph from the first `rows` stored rows (default: all)"""
+        self.graph = []
+        self.entry_point = None
+        self.max_level = -1
+        for row in range(len(store) if rows is None else rows):
+            self.add(store, row)
+
+    def remap(self, new_row_of: np.ndarray):
+        """
+        Renumber rows after the store was reordered or rewritten
+        (new_row_of[old_row] -> new row, -1 for rows that were dropped).
+
+        A dropped node's links are patched over: each neighbour that linked to
+        it inherits its surviving neighbours (up to the degree limit), which
+        keeps the graph navigable without a rebuild.
+        """
+        mapping = new_row_of.tolist()
+        graph = []
+        for level, layer in enumerate(self.graph):
+            limit = self.max_neighbors_0 if level == 0 else self.M
+            remapped = {}
+            for row, neighbors in layer.items():
+                if mapping[row] < 0:
+                    continue
+                linked = []
+                for neighbor in neighbors:
+                    if mapping[neighbor] >= 0:
+                        linked.append(mapping[neighbor])
+                    else:
+                        linked.extend(mapping[n] for n in layer.get(neighbor, ()) if mapping[n] >= 0 and n != row)
+                remapped[mapping[row]] = list(dict.fromkeys(linked))[:limit]
+            if not remapped:
+                break
+            graph.append(remapped)
+        self.graph = graph
+        self.max_level = len(graph) - 1
+        if self.entry_point is not None and mapping[self.entry_point] >= 0:
+            self.entry_point = mapping[self.entry_point]
+        else:
+            # The entry point was dropped: any node on the top level will do
+            self.entry_point = next(iter(graph[-1])) if graph else None
+
+    def search(self, store, query_vector, top_k: int, nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None):
+        """Approximate top_k as (rows, scores) like VectorStore.search; nprobe is IVF-only and ignored"""
+        if self.entry_point is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = store.prepare_query(query_vector)
+        entry_sim = float(store.vectors_at(np.array([self.entry_point]))[0] @ query)
+        nearest = [(entry_sim, self.entry_point)]
+        for lvl in range(self.max_level, 0, -1):
+            nearest = self._search_layer(store, query, nearest, 1, lvl)
+        ef = max(ef_search or self.ef_search, top_k)
+        nearest = self._search_layer(store, query, nearest, ef, 0)[:top_k]
+        rows = np.array([row for _, row in nearest], dtype=np.int64)
+        scores = np.array([sim for sim, _ in nearest], dtype=np.float32)
+        return rows, scores
+
+    def get_stats(self) -> dict:
+        return {
+            "type": "hnsw",
+            "nodes": len(self),
+            "levels": len(self.graph),
+            "M": self.M,
+            "ef_construction": self.ef_construction,
+            "ef_search": self.ef_search
+        }
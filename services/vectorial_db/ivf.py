@@ -0,0 +1,156 @@
+from array import array
+from typing import List, Optional
+import numpy as np
+
+
+def assign_to_centroids(vectors: np.ndarray, centroids: np.ndarray, block_size: int = 65536) -> np.ndarray:
+    """Index of the most similar centroid for every row, computed in blocks to bound memory"""
+    assignments = np.empty(vectors.shape[0], dtype=np.int64)
+    for start in range(0, vectors.shape[0], block_size):
+        block = vectors[start:start + block_size]
+        assignments[start:start + block.shape[0]] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def spherical_kmeans(vectors: np.ndarray, n_clusters: int, n_iter: int = 10, seed: int = 0) -> np.ndarray:
+    """
+    k-means on the unit sphere: points are assigned by dot product and
+    centroids are re-normalized after every update. Empty clusters are
+    re-seeded from random points.
+    """
+    rng = np.random.default_rng(seed)
+    n = vectors.shape[0]
+    n_clusters = min(n_clusters, n)
+    centroids = vectors[rng.choice(n, n_clusters, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assignments = assign_to_centroids(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = vectors[rng.choice(n, int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file index over the rows of a VectorStore.
+
+    Coarse centroids are trained with spherical k-means on (a sample of) the
+    stored vectors; every row is kept in the posting list of its nearest
+    centroid. A query scans only the posting lists of its `nprobe` nearest
+    centroids. New rows are assigned incrementally once the index is trained.
+    """
+
+    # Centroids fit the rows seen at training time, so a grown store is worth a rebuild
+    retrain_on_growth = True
+
+    def __init__(self, n_lists: Optional[int] = None, nprobe: int = 8,
+                 train_threshold: int = 10000, max_train_samples: int = 100000, seed: int = 0):
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.train_threshold = train_threshold
+        self.max_train_samples = max_train_samples
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self.lists: List[array] = []
+        self.row_list = array("q")
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def should_train(self, total_rows: int) -> bool:
+        return not self.trained and total_rows >= self.train_threshold
+
+    def train(self, store, rows: Optional[int] = None):
+        """Fit centroids from the first `rows` stored (normalized) vectors (default: all) and rebuild every posting list"""
+        n = len(store) if rows is None else rows
+        n_lists = self.n_lists or max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(self.seed)
+        if n > self.max_train_samples:
+            sample = store.vectors_at(np.sort(rng.choice(n, self.max_train_samples, replace=False)))
+        else:
+            sample = store.vectors_at(slice(0, n))
+        self.centroids = spherical_kmeans(sample, n_lists, seed=self.seed)
+
+        # Decode block by block so compressed stores never materialize a full float32 copy
+        block_size = 65536
+        assignments = np.concatenate([
+            assign_to_centroids(store.vectors_at(slice(start, min(start + block_size, n))), self.centroids)
+            for start in range(0, n, block_size)
+        ])
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(self.centroids.shape[0] + 1))
+        self.lists = [array("q", order[bounds[i]:bounds[i + 1]].tolist()) for i in range(self.centroids.shape[0])]
+        self.row_list = array("q", assignments.tolist())
+
+    def add(self, store, row: int):
+        """Assign a stored row to its nearest centroid; overwritten rows are moved"""
+        if not self.trained:
+            return
+        target = int(np.argmax(self.centroids @ store.vectors_at(row)))
+        if row < len(self.row_list):
+            current = self.row_list[row]
+            if current == target:
+                return
+            if current >= 0:
+                self.lists[current].remove(row)
+            self.row_list[row] = target
+        else:
+            while len(self.row_list) < row:
+                self.row_list.append(-1)
+            self.row_list.append(target)
+        self.lists[target].append(row)
+
+    def remap(self, new_row_of: np.ndarray):
+        """
+        Renumber rows after the store was reordered or rewritten
+        (new_row_of[old_row] -> new row, -1 for rows that were dropped)
+        """
+        lists = []
+        for lst in self.lists:
+            rows = new_row_of[np.array(lst, dtype=np.int64)]
+            lists.append(array("q", rows[rows >= 0].tolist()))
+        self.lists = lists
+        old_rows = new_row_of[:len(self.row_list)]
+        kept = old_rows >= 0
+        row_list = np.full(int(old_rows.max()) + 1 if kept.any() else 0, -1, dtype=np.int64)
+        row_list[old_rows[kept]] = np.array(self.row_list, dtype=np.int64)[kept]
+        self.row_list = array("q", row_list.tolist())
+
+    def candidates(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """Rows in the posting lists of the nprobe centroids closest to the (normalized) query"""
+        nprobe = min(nprobe or self.nprobe, self.centroids.shape[0])
+        centroid_scores = self.centroids @ query
+        probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        posting = [np.array(self.lists[p], dtype=np.int64) for p in probes if len(self.lists[p])]
+        if not posting:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(posting)
+
+    def search(self, store, query_vector, top_k: int, nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None):
+        """
+        Exact re-scoring of the probed posting lists; returns (rows, scores)
+        like VectorStore.search. ef_search is HNSW-only and ignored.
+        """
+        query = store.prepare_query(query_vector)
+        return store.search(query, top_k, rows=self.candidates(query, nprobe))
+
+    def get_stats(self) -> dict:
+        sizes = [len(lst) for lst in self.lists]
+        return {
+            "type": "ivf",
+            "trained": self.trained,
+            "n_lists": len(self.lists),
+            "nprobe": self.nprobe,
+            "max_list_size": max(sizes) if sizes else 0,
+            "mean_list_size": float(np.mean(sizes)) if sizes else 0.0
+        }
@@ -1,138 +1,1313 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
 import httpx
 import asyncio
-from typing import Dict, List, Optional
+import bisect
+import copy
+from typing import Any, Dict, List, Optional, Tuple
 import numpy as np
 from datetime import datetime
 import os
-from contextlib import asynccontextmanager
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+import multiprocessing
+from functools import partial, wraps
 
 from shared.models.task import TaskStatus
 from shared.models.embedding import Embedding
 from shared.utils.logging_config import setup_logger, log_request, log_response, log_error
+from shared.utils.sharding import ring_from_env
+from shared.utils.vector_wire import VECTOR_FRAME_CONTENT_TYPE, decode_frame, is_vector_frame
+from services.vectorial_db.store import VectorStore
+from services.vectorial_db.segments import SegmentedVectorStore
+from services.vectorial_db.ivf import IVFIndex
+from services.vectorial_db.hnsw import HNSWIndex
+from services.vectorial_db.codecs import create_codec
+from services.vectorial_db.persistence import VectorPersistence
+from services.vectorial_db.batcher import SearchBatcher
+from services.vectorial_db.metadata import ColumnarMetadata
+from services.vectorial_db.filters import (
+    TIMESTAMP_COMPARISONS, BitmapIndex, Condition, FilterError, evaluate, mask_ranges, pack_mask, parse_filter,
+    unpack_words
+)
+from services.vectorial_db.result_cache import SearchResultCache, query_key
+from services.vectorial_db.shared_store import SharedStorePublisher, attach_reader, search_shared_store
+from services.vectorial_db.planner import QueryPlanner, PLAN_ANN, PLAN_EMPTY, PLAN_MASK, PLAN_SLICES
+
+# Attempts a search makes to read a consistent state while writes go on beside it
+SEARCH_MAX_ATTEMPTS = 3
+# Codecs whose scores only shortlist candidates: they re-rank from full precision by default
+SHORTLIST_CODECS = ("binary", "pca")
+
+
+class SearchRequest(BaseModel):
+    query_vector: List[float]
+    top_k: int = 5
+    task_ids: Optional[List[str]] = None
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+    # Metadata filter expression, see services/vectorial_db/filters.py
+    filter: Optional[Dict[str, Any]] = None
+
+
+class BatchQuery(BaseModel):
+    query_vector: List[float]
+    top_k: int = 5
+    task_ids: Optional[List[str]] = None
+
+
+class BatchSearchRequest(BaseModel):
+    queries: List[BatchQuery]
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+
+
+def create_index(index_type: str):
+    """Build the ANN index selected for this deployment (None means exact flat scan)"""
+    if index_type == "flat":
+        return None
+    if index_type == "ivf":
+        n_lists = os.getenv("IVF_NLIST")
+        return IVFIndex(
+            n_lists=int(n_lists) if n_lists else None,
+            nprobe=int(os.getenv("IVF_NPROBE", "8")),
+            train_threshold=int(os.getenv("IVF_TRAIN_THRESHOLD", "10000"))
+        )
+    if index_type == "hnsw":
+        return HNSWIndex(
+            M=int(os.getenv("HNSW_M", "16")),
+            ef_construction=int(os.getenv("HNSW_EF_CONSTRUCTION", "100")),
+            ef_search=int(os.getenv("HNSW_EF_SEARCH", "50"))
+        )
+    raise ValueError(f"Unknown VECTOR_INDEX type: {index_type}")
+
+
+def create_store() -> VectorStore:
+    """Build the vector store with the codec configured for this deployment"""
+    codec = create_codec(os.getenv("VECTOR_CODEC", "float32"), pq_subspaces=int(os.getenv("PQ_SUBSPACES", "48")),
+                         pca_dimensions=int(os.getenv("PCA_DIMENSIONS", "64")))
+    options = dict(
+        codec=codec,
+        codec_train_threshold=int(os.getenv("CODEC_TRAIN_THRESHOLD", "10000")),
+        rerank_factor=int(os.getenv("RERANK_FACTOR", "10" if codec.name in SHORTLIST_CODECS else "0")),
+        rerank_path=os.getenv("RERANK_STORE_PATH") or None,
+        scan_threads=int(os.getenv("SCAN_THREADS", str(os.cpu_count() or 1))),
+        parallel_min_rows=int(os.getenv("SCAN_PARALLEL_MIN_ROWS", "32768"))
+    )
+    segment_dir = os.getenv("VECTOR_SEGMENT_DIR")
+    if segment_dir:
+        # Out-of-core: sealed segments are memory-mapped, only the active one stays in heap
+        return SegmentedVectorStore(segment_dir, segment_rows=int(os.getenv("VECTOR_SEGMENT_ROWS", "65536")), **options)
+    return VectorStore(**options)
+
+
+def _writes(method):
+    """Run a VectorDatabase write under its write lock, which the last attempt of a search takes too"""
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        with self._write_lock:
+            return method(self, *args, **kwargs)
+    return locked
+
+
+def _rewrites_rows(method):
+    """A _writes method that changes existing rows in place, bracketed by VectorDatabase._rewriting()"""
+    @wraps(method)
+    def bracketed(self, *args, **kwargs):
+        with self._write_lock, self._rewriting():
+            return method(self, *args, **kwargs)
+    return bracketed
 
 
 class VectorDatabase:
-    def __init__(self):
-        self.vectors: Dict[str, np.ndarray] = {}
-        self.metadata: Dict[str, dict] = {}
+    def __init__(self, index=None, store: Optional[VectorStore] = None, persistence=None,
+                 planner: Optional[QueryPlanner] = None, cache: Optional[SearchResultCache] = None,
+                 background_rebuilds: bool = False):
+        self.vectors = store if store is not None else VectorStore()
+        # embedding_id -> metadata dict, held as columns aligned with the store rows
+        self.metadata = ColumnarMetadata(self.vectors)
+        # (field, value) -> packed row bitmap, for metadata-filtered searches
+        self.bitmaps = BitmapIndex()
         self.task_embeddings: Dict[str, List[str]] = {}
+        # task_id -> [start, stop) runs of rows, so filtered queries scan slices in place
+        self.task_ranges: Dict[str, List[List[int]]] = {}
+        # The serving ANN index. Rebuilds train a separate copy and swap it in
+        # with one assignment, so a search uses either the old or the new one
+        self.index = index
+        # Rows the serving index was trained on; later rows were added incrementally
+        self.index_rows = 0
+        # When set, writes never train the index inline: the owner runs
+        # start_rebuild/build_rebuild/commit_rebuild off the event loop
+        self.background_rebuilds = background_rebuilds
+        self._rebuild_in_flight = False
+        self.persistence = persistence
+        self.planner = planner or QueryPlanner()
+        self.plan_counts: Dict[str, int] = {}
+        # Bumped by every change to existing rows (overwrite, delete, reorder, purge),
+        # so a job built in the background knows when what it read went stale
+        self._rewrites = 0
+        # Odd while a change to existing rows is running, bumped again when it
+        # ends: a search on an executor thread compares it around its read
+        self._rewrite_seq = 0
+        # Leading store rows whose metadata is written too: a store append lands before its
+        # metadata, so readers on other threads (the shared-store publisher) stop here
+        self.registered_rows = 0
+        # Held by every write; a search that keeps racing writes makes its last attempt under it
+        self._write_lock = threading.RLock()
+        self._purge_in_flight = False
+        self._compact_in_flight = False
+        self._refit_in_flight = False
+        self._snapshot_in_flight = False
+        self.cache = cache
+        # Versions of the searchable data for the result cache: the global
+        # generation moves on every write, a task's generation only on writes
+        # to that task, and the index epoch on every (re)train
+        self._generation = 0
+        self.task_generations: Dict[str, int] = {}
+        self._index_epoch = 0
     
     def add_embedding(self, embedding: Embedding):
-        self.vectors[embedding.id] = np.array(embedding.vector)
-        self.metadata[embedding.id] = {
+        metadata = {
             "chunk_id": embedding.chunk_id,
             "task_id": embedding.task_id,
             "model_name": embedding.model_name,
             "dimension": embedding.dimension,
             "timestamp": datetime.utcnow().isoformat()
         }
+        if embedding.metadata:
+            metadata["metadata"] = embedding.metadata
+        # Write-ahead: the mutation is logged before it becomes visible
+        if self.persistence is not None:
+            self.persistence.log_add(embedding.id, embedding.vector, metadata)
+        self.apply_add(embedding.id, embedding.vector, metadata)
+    
+    @_writes
+    def apply_add(self, embedding_id: str, vector, metadata: dict):
+        """Insert one vector without logging it (used directly by WAL replay)"""
+        is_new = embedding_id not in self.vectors
+        # An overwrite, or an append that trains the codec, changes rows a concurrent read may be scanning
+        with self._rewriting(not is_new or self.vectors.codec_due(len(self.vectors) + 1)):
+            if not is_new:
+                previous_task = self.metadata.task_of(embedding_id)
+                self._rewrites += 1
+                self._touch([previous_task, metadata["task_id"]])
+            else:
+                self._touch([metadata["task_id"]])
+            row = self.vectors.add(embedding_id, vector)
+            if self.index is not None:
+                if self.index.should_train(len(self.vectors)) and not self.background_rebuilds:
+                    self.train_index()
+                else:
+                    self.index.add(self.vectors, row)
+            self.metadata.set_row(row, metadata)
+            self.registered_rows = len(self.vectors)
+            if not is_new:
+                self.bitmaps.clear_row(row)
+            self.bitmaps.add_rows(np.array([row]), [metadata])
+            
+            task_id = metadata["task_id"]
+            if task_id not in self.task_embeddings:
+                self.task_embeddings[task_id] = []
+            if is_new:
+                self.task_embeddings[task_id].append(embedding_id)
+                self._extend_task_ranges(task_id, row)
+            elif previous_task != task_id:
+                # The row moves to its new task, so task filters and deletes follow it
+                self._release_task_row(previous_task, embedding_id, row)
+                self.task_embeddings[task_id].append(embedding_id)
+                self._extend_task_ranges(task_id, row)
+    
+    def _extend_task_ranges(self, task_id: str, row: int):
+        """Add a row to a task's sorted [start, stop) ranges, merging it into its neighbours"""
+        ranges = self.task_ranges.setdefault(task_id, [])
+        if not ranges or ranges[-1][1] <= row:
+            # Appends, the common case, only ever touch the last range
+            if ranges and ranges[-1][1] == row:
+                ranges[-1][1] = row + 1
+            else:
+                ranges.append([row, row + 1])
+            return
+        i = bisect.bisect_left(ranges, [row, row + 1])
+        joins_previous = i > 0 and ranges[i - 1][1] == row
+        joins_next = ranges[i][0] == row + 1
+        if joins_previous and joins_next:
+            ranges[i - 1][1] = ranges.pop(i)[1]
+        elif joins_previous:
+            ranges[i - 1][1] = row + 1
+        elif joins_next:
+            ranges[i][0] = row
+        else:
+            ranges.insert(i, [row, row + 1])
+    
+    def _release_task_row(self, task_id: str, embedding_id: str, row: int):
+        """Take one row out of a task's bookkeeping; a task left empty is dropped like a deleted one"""
+        embedding_ids = self.task_embeddings.get(task_id)
+        if embedding_ids is None:
+            return
+        embedding_ids.remove(embedding_id)
+        if not embedding_ids:
+            del self.task_embeddings[task_id]
+            self.task_ranges.pop(task_id, None)
+            return
+        ranges = self.task_ranges[task_id]
+        i = bisect.bisect_right(ranges, [row, float("inf")]) - 1
+        start, stop = ranges[i]
+        ranges[i:i + 1] = [[a, b] for a, b in ((start, row), (row + 1, stop)) if b > a]
+    
+    def add_embeddings(self, embeddings: List[dict], vectors: Optional[np.ndarray] = None) -> Dict[str, int]:
+        """
+        Append a batch of embedding payloads as one matrix block and one WAL
+        record. Returns the number of embeddings received per task.
         
-        if embedding.task_id not in self.task_embeddings:
-            self.task_embeddings[embedding.task_id] = []
-        self.task_embeddings[embedding.task_id].append(embedding.id)
+        vectors, when given, holds the rows already decoded from a binary
+        frame and the payloads carry no "vector" field.
+        """
+        if not embeddings:
+            return {}
+        if vectors is None:
+            vectors = np.asarray([embedding["vector"] for embedding in embeddings], dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[0] != len(embeddings):
+            raise ValueError("Embeddings in a batch must share one dimension")
+        timestamp = datetime.utcnow().isoformat()
+        embedding_ids, metadata, received = [], [], {}
+        for embedding in embeddings:
+            embedding_ids.append(embedding["id"])
+            metadata.append({
+                "chunk_id": embedding["chunk_id"],
+                "task_id": embedding["task_id"],
+                "model_name": embedding.get("model_name", "mock-embedding-model"),
+                "dimension": vectors.shape[1],
+                "timestamp": timestamp
+            })
+            if embedding.get("metadata"):
+                metadata[-1]["metadata"] = embedding["metadata"]
+            received[embedding["task_id"]] = received.get(embedding["task_id"], 0) + 1
+        if self.persistence is not None:
+            self.persistence.log_add_batch(embedding_ids, vectors, metadata)
+        self.apply_add_batch(embedding_ids, vectors, metadata)
+        return received
+    
+    @_writes
+    def apply_add_batch(self, embedding_ids: List[str], vectors: np.ndarray, metadata: List[dict]):
+        """
+        Insert a block of vectors without logging it. New ids are appended in
+        one store copy; ids already stored or repeated in the batch overwrite
+        in order through apply_add, so the last occurrence wins.
+        """
+        fresh, repeated, seen = [], [], set()
+        for position, embedding_id in enumerate(embedding_ids):
+            if embedding_id in seen or embedding_id in self.vectors:
+                repeated.append(position)
+            else:
+                seen.add(embedding_id)
+                fresh.append(position)
+        if fresh:
+            fresh_ids = [embedding_ids[position] for position in fresh]
+            with self._rewriting(self.vectors.codec_due(len(self.vectors) + len(fresh))):
+                rows = self.vectors.add_batch(fresh_ids, vectors[fresh])
+                if self.index is not None:
+                    if self.index.should_train(len(self.vectors)) and not self.background_rebuilds:
+                        self.train_index()
+                    else:
+                        for row in rows.tolist():
+                            self.index.add(self.vectors, row)
+                self._register_rows(fresh_ids, rows, [metadata[position] for position in fresh])
+        for position in repeated:
+            self.apply_add(embedding_ids[position], vectors[position], metadata[position])
+    
+    @_writes
+    def restore_rows(self, embedding_ids: List[str], vectors: np.ndarray, metadata: List[dict]):
+        """Bulk-load snapshot rows into an empty database; the index is trained once recovery ends"""
+        with self._rewriting(self.vectors.codec_due(len(self.vectors) + len(embedding_ids))):
+            rows = self.vectors.add_batch(embedding_ids, vectors)
+            self._register_rows(embedding_ids, rows, metadata)
+    
+    def _register_rows(self, embedding_ids: List[str], rows: np.ndarray, metadata: List[dict]):
+        self._touch({row_metadata["task_id"] for row_metadata in metadata})
+        self.metadata.set_rows(rows, metadata)
+        self.registered_rows = len(self.vectors)
+        self.bitmaps.add_rows(rows, metadata)
+        for embedding_id, row, row_metadata in zip(embedding_ids, rows.tolist(), metadata):
+            self.task_embeddings.setdefault(row_metadata["task_id"], []).append(embedding_id)
+            self._extend_task_ranges(row_metadata["task_id"], row)
+    
+    def delete_task(self, task_id: str) -> int:
+        """Remove every embedding of a task; returns how many were removed"""
+        if task_id not in self.task_embeddings:
+            return 0
+        if self.persistence is not None:
+            self.persistence.log_delete_task(task_id)
+        return self.apply_delete_task(task_id)
+    
+    @_rewrites_rows
+    def apply_delete_task(self, task_id: str) -> int:
+        """
+        Drop a task without logging it (used directly by WAL replay). Its rows
+        are tombstoned in the store and masked out of searches until purge()
+        rewrites the storage without them.
+        """
+        embedding_ids = self.task_embeddings.pop(task_id, [])
+        self.task_ranges.pop(task_id, None)
+        self._touch([task_id])
+        self._rewrites += 1
+        return self.vectors.delete(embedding_ids)
+    
+    @contextmanager
+    def _rewriting(self, rewrites: bool = True):
+        """
+        Bracket an in-place change to existing rows, seqlock style: the
+        rewrite sequence is odd while it runs and moves on when it ends, so a
+        read on another thread that overlaps it at all sees an odd or a
+        changed sequence. Only taken under the write lock; nested brackets
+        count once.
+        """
+        if not rewrites or self._rewrite_seq % 2:
+            yield
+            return
+        self._rewrite_seq += 1
+        try:
+            yield
+        finally:
+            self._rewrite_seq += 1
+    
+    def _touch(self, task_ids):
+        """Invalidate cached results that could include rows of these tasks"""
+        self._generation += 1
+        for task_id in task_ids:
+            self.task_generations[task_id] = self.task_generations.get(task_id, 0) + 1
+    
+    def _data_version(self, task_ids: Optional[List[str]]) -> tuple:
+        if task_ids:
+            # Counters are never reset, so a deleted and re-created task cannot repeat a version
+            return self._index_epoch, tuple(self.task_generations.get(task_id, 0) for task_id in sorted(set(task_ids)))
+        return self._index_epoch, self._generation
+    
+    def dead_ratio(self) -> float:
+        """Share of stored rows that are tombstoned"""
+        return self.vectors.dead_rows / len(self.vectors) if len(self.vectors) else 0.0
+    
+    def start_purge(self) -> Optional[dict]:
+        """
+        Begin rewriting the store without its tombstoned rows. Returns a job
+        for build_purge() (safe in a worker thread, beside searches and
+        appends) and commit_purge(), or None when there is nothing to purge.
+        """
+        live = self.vectors.live_mask()
+        if live is None or self._purge_in_flight or self._compact_in_flight:
+            return None
+        self._purge_in_flight = True
+        return {"keep": np.flatnonzero(live), "size": len(self.vectors), "rewrites": self._rewrites,
+                "dead_rows": self.vectors.dead_rows}
+    
+    def build_purge(self, job: dict) -> dict:
+        job["built"] = self.vectors.build_rewrite(job["keep"], job["size"])
+        return job
+    
+    @_rewrites_rows
+    def commit_purge(self, job: dict) -> bool:
+        """
+        Swap in the rewritten store and renumber everything that refers to
+        rows. Returns False, discarding the copy, if existing rows changed
+        while it was being built; the next purge starts over.
+        """
+        self._purge_in_flight = False
+        if job["rewrites"] != self._rewrites:
+            self.vectors.discard_rewrite(job["built"])
+            return False
+        new_row_of = self.vectors.commit_rewrite(job["built"])
+        if new_row_of is None:
+            return False
+        self._rewrites += 1
+        self.metadata.rewrite(new_row_of)
+        self.registered_rows = len(self.vectors)
+        self.bitmaps.rewrite(new_row_of)
+        if self.index is not None:
+            self.index.remap(new_row_of)
+            # Patched links can change what the index finds
+            self._index_epoch += 1
+        for task_id, ranges in self.task_ranges.items():
+            # Live tasks hold no tombstoned rows, so every range stays contiguous
+            self.task_ranges[task_id] = [[int(new_row_of[start]), int(new_row_of[start]) + stop - start]
+                                         for start, stop in ranges]
+        return True
+    
+    def purge(self) -> bool:
+        """start_purge/build_purge/commit_purge in one blocking call"""
+        job = self.start_purge()
+        return job is not None and self.commit_purge(self.build_purge(job))
+    
+    def refit_due(self, growth: float) -> bool:
+        """True when the store has grown `growth` times past the rows its codec was trained on"""
+        return (growth > 0 and self.vectors.can_refit() and not self._refit_in_flight
+                and len(self.vectors) >= growth * self.vectors.codec_fit_rows)
+    
+    def start_refit(self) -> Optional[dict]:
+        """
+        Begin retraining the vector codec (a PCA projection, quantizer
+        tables) on everything stored so far. Like a purge: build_refit() runs
+        in a worker thread, commit_refit() swaps the re-encoded rows in.
+        """
+        if not self.vectors.can_refit() or self._refit_in_flight:
+            return None
+        self._refit_in_flight = True
+        return {"size": len(self.vectors), "rewrites": self._rewrites}
+    
+    def build_refit(self, job: dict) -> dict:
+        job["built"] = self.vectors.build_refit(job["size"])
+        return job
+    
+    @_rewrites_rows
+    def commit_refit(self, job: dict) -> bool:
+        """Install the re-encoded rows; False, discarding them, if existing rows changed meanwhile"""
+        self._refit_in_flight = False
+        if job["rewrites"] != self._rewrites:
+            self.vectors.discard_refit(job["built"])
+            return False
+        self.vectors.commit_refit(job["built"])
+        self._rewrites += 1
+        # New codes can change what the coarse pass shortlists
+        self._index_epoch += 1
+        return True
+    
+    def refit(self) -> bool:
+        """start_refit/build_refit/commit_refit in one blocking call"""
+        job = self.start_refit()
+        return job is not None and self.commit_refit(self.build_refit(job))
+    
+    def recover(self) -> Optional[dict]:
+        """Rebuild in-memory state from the latest snapshot plus the WAL tail"""
+        if self.persistence is None:
+            return None
+        # Replay without per-row index maintenance, then build the index once
+        index, self.index = self.index, None
+        try:
+            stats = self.persistence.recover(self)
+        finally:
+            self.index = index
+        if self.index is not None and self.index.should_train(len(self.vectors)):
+            self.train_index()
+        return stats
+    
+    @_writes
+    def start_snapshot(self) -> Optional[dict]:
+        """
+        Seal the WAL and capture the rows a snapshot will hold. Like a purge:
+        build_snapshot() writes the files in a worker thread, commit_snapshot()
+        swaps them in. None without persistence or while one is running.
+        """
+        if self.persistence is None or self._snapshot_in_flight:
+            return None
+        self._snapshot_in_flight = True
+        job = self.persistence.start_snapshot(self)
+        job["rewrites"] = self._rewrites
+        return job
+    
+    def build_snapshot(self, job: dict) -> dict:
+        return self.persistence.build_snapshot(self, job)
+    
+    @_writes
+    def commit_snapshot(self, job: dict) -> Optional[dict]:
+        """
+        Swap the written snapshot in. Returns None, discarding it, if existing
+        rows changed while it was written; the sealed logs stay until the
+        next snapshot covers them.
+        """
+        self._snapshot_in_flight = False
+        if job["rewrites"] != self._rewrites:
+            self.persistence.discard_snapshot(job)
+            return None
+        return self.persistence.commit_snapshot(job)
+    
+    @_writes
+    def discard_snapshot(self, job: dict):
+        """Give up on a snapshot whose build failed"""
+        self._snapshot_in_flight = False
+        self.persistence.discard_snapshot(job)
+    
+    def snapshot(self) -> Optional[dict]:
+        """start_snapshot/build_snapshot/commit_snapshot in one blocking call"""
+        job = self.start_snapshot()
+        return None if job is None else self.commit_snapshot(self.build_snapshot(job))
+    
+    def sync(self):
+        if self.persistence is not None:
+            self.persistence.sync()
+    
+    def fragmentation(self) -> float:
+        """Mean number of row ranges per task (1.0 when every task is contiguous)"""
+        if not self.task_ranges:
+            return 1.0
+        return sum(len(ranges) for ranges in self.task_ranges.values()) / len(self.task_ranges)
+    
+    def start_compact(self) -> Optional[dict]:
+        """
+        Begin rewriting the store so each task's rows form a single contiguous
+        range. Like a purge: build_compact() copies the rows in their new
+        order in a worker thread, commit_compact() swaps the copy in. Returns
+        None when there is nothing to do.
+        """
+        if self.fragmentation() <= 1.0 or self._purge_in_flight or self._compact_in_flight:
+            return None
+        spans = [np.arange(start, stop) for ranges in self.task_ranges.values() for start, stop in ranges]
+        live = self.vectors.live_mask()
+        if live is not None:
+            # Tombstoned rows go last and stay deleted, so the order is still a permutation of every row
+            spans.append(np.flatnonzero(~live))
+        order = np.concatenate(spans)
+        self._compact_in_flight = True
+        return {"order": order, "size": len(self.vectors), "rewrites": self._rewrites,
+                "tombstoned": None if live is None else ~live[order]}
+    
+    def build_compact(self, job: dict) -> dict:
+        job["built"] = self.vectors.build_rewrite(job["order"], job["size"], job["tombstoned"])
+        return job
+    
+    @_rewrites_rows
+    def commit_compact(self, job: dict) -> bool:
+        """
+        Swap in the reordered store and renumber everything that refers to
+        rows; the ANN index is renumbered rather than rebuilt. Returns False,
+        discarding the copy, if existing rows changed while it was built.
+        """
+        self._compact_in_flight = False
+        if job["rewrites"] != self._rewrites:
+            self.vectors.discard_rewrite(job["built"])
+            return False
+        new_row_of = self.vectors.commit_rewrite(job["built"])
+        if new_row_of is None:
+            return False
+        self._rewrites += 1
+        self.metadata.rewrite(new_row_of)
+        self.bitmaps.rewrite(new_row_of)
+        if self.index is not None:
+            self.index.remap(new_row_of)
+            # Patched links can change what the index finds
+            self._index_epoch += 1
+        
+        size = job["size"]
+        for task_id, ranges in self.task_ranges.items():
+            # Rows below the job's size now sit in one block per task; later appends follow as they were
+            moved = []
+            for start, stop in ranges:
+                for lo, hi in ((start, min(stop, size)), (max(start, size), stop)):
+                    if lo < hi:
+                        moved.append([int(new_row_of[lo]), int(new_row_of[lo]) + hi - lo])
+            moved.sort()
+            merged = moved[:1]
+            for start, stop in moved[1:]:
+                if start == merged[-1][1]:
+                    merged[-1][1] = stop
+                else:
+                    merged.append([start, stop])
+            self.task_ranges[task_id] = merged
+        return True
+    
+    def compact(self) -> bool:
+        """start_compact/build_compact/commit_compact in one blocking call"""
+        job = self.start_compact()
+        return job is not None and self.commit_compact(self.build_compact(job))
+    
+    @_rewrites_rows
+    def train_index(self):
+        """(Re)train the ANN index from every stored vector, in place (blocks searches meanwhile)"""
+        if self.index is not None and len(self.vectors):
+            self.index.train(self.vectors)
+            self.index_rows = len(self.vectors)
+            self._index_epoch += 1
+    
+    def rebuild_due(self, growth: float) -> bool:
+        """
+        True when the ANN index needs its first training, or (for indexes
+        whose structure is fit to the data, like IVF centroids) the store has
+        grown `growth` times past the rows it was trained on
+        """
+        if self.index is None or self._rebuild_in_flight or not len(self.vectors):
+            return False
+        if self.index.should_train(len(self.vectors)):
+            return True
+        return (growth > 0 and self.index.trained and self.index.retrain_on_growth
+                and len(self.vectors) >= growth * self.index_rows)
+    
+    def start_rebuild(self) -> Optional[dict]:
+        """
+        Begin building a new index over the current rows while the serving
+        one keeps answering searches (and taking incremental adds; before the
+        first training, searches are flat scans). build_rebuild() is safe in
+        a worker thread; commit_rebuild() adds the rows appended meanwhile
+        (the delta) and swaps the new index in.
+        """
+        if self.index is None or self._rebuild_in_flight or not len(self.vectors):
+            return None
+        self._rebuild_in_flight = True
+        # train() rebinds every piece of index state, so a shallow copy shares nothing it rebuilds;
+        # only a random generator is advanced in place, by the build and by live inserts alike
+        index = copy.copy(self.index)
+        if hasattr(index, "rng"):
+            index.rng = copy.deepcopy(self.index.rng)
+        return {"index": index, "size": len(self.vectors), "rewrites": self._rewrites,
+                "encoded": self.vectors.encoded}
+    
+    def build_rebuild(self, job: dict) -> dict:
+        job["index"].train(self.vectors, rows=job["size"])
+        return job
+    
+    @_rewrites_rows
+    def commit_rebuild(self, job: dict) -> bool:
+        """Swap in the new index; False, dropping it, if existing rows changed while it was built"""
+        self._rebuild_in_flight = False
+        # A compaction, purge, overwrite or codec change renumbered or altered rows the build read
+        if job["rewrites"] != self._rewrites or job["encoded"] != self.vectors.encoded or self.index is None:
+            return False
+        index = job["index"]
+        for row in range(job["size"], len(self.vectors)):
+            index.add(self.vectors, row)
+        self.index = index
+        self.index_rows = job["size"]
+        self._index_epoch += 1
+        return True
+    
+    def rebuild(self) -> bool:
+        """start_rebuild/build_rebuild/commit_rebuild in one blocking call"""
+        job = self.start_rebuild()
+        return job is not None and self.commit_rebuild(self.build_rebuild(job))
+    
+    def search(self, query_vector: List[float], top_k: int = 5, task_ids: Optional[List[str]] = None,
+               nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+               where: Optional[dict] = None) -> List[dict]:
+        """
+        where is a metadata filter expression (see filters.py); a malformed
+        one, or one on a field too diverse to index, raises FilterError.
+        """
+        condition = parse_filter(where) if where is not None else None
+        search = partial(self._search, query_vector, top_k, task_ids, nprobe, ef_search, condition)
+        if self.cache is None:
+            return self._consistent(search)
+        key = query_key(query_vector, top_k, task_ids, nprobe, ef_search, where)
+        version = self._data_version(task_ids)
+        results = self.cache.get(key, version)
+        if results is None:
+            results = self._consistent(search)
+            self.cache.put(key, version, results)
+        return results
+    
+    def _read_version(self) -> int:
+        return self._rewrite_seq
     
-    def search(self, query_vector: List[float], top_k: int = 5, task_ids: Optional[List[str]] = None) -> List[dict]:
+    def _consistent(self, read):
+        """
+        Run a read that may be on an executor thread while the event loop
+        keeps writing. Appends are safe to race (rows below the size a scan
+        started with never move), but deletes, overwrites, purges, compaction
+        and index or codec training change rows under a scan. They run inside
+        _rewriting(), so the read is repeated when one of them overlapped it
+        or tripped it up. The last attempt, and any that finds a rewrite
+        running, holds the write lock, so it always reads a stable state.
+        """
+        for _ in range(SEARCH_MAX_ATTEMPTS - 1):
+            version = self._read_version()
+            if version % 2:
+                break
+            try:
+                result = read()
+            except FilterError:
+                raise
+            except (KeyError, IndexError, ValueError):
+                # Also covers a row appended to the store whose metadata is not written yet
+                continue
+            if self._read_version() == version:
+                return result
+        with self._write_lock:
+            return read()
+    
+    def _search(self, query_vector: List[float], top_k: int = 5, task_ids: Optional[List[str]] = None,
+                nprobe: Optional[int] = None, ef_search: Optional[int] = None, condition=None) -> List[dict]:
         if not self.vectors:
             return []
         
-        query_np = np.array(query_vector).reshape(1, -1)
-        
+        if condition is not None:
+            mask = self._filter_mask(condition, task_ids)
+            return self._filtered_search(query_vector, top_k, mask_ranges(mask), nprobe, ef_search, mask)
         if task_ids:
-            relevant_ids = []
-            for task_id in task_ids:
-                relevant_ids.extend(self.task_embeddings.get(task_id, []))
-        else:
-            relevant_ids = list(self.vectors.keys())
+            return self._filtered_search(query_vector, top_k, self._task_ranges(task_ids), nprobe, ef_search)
         
-        if not relevant_ids:
+        live = self.vectors.live_mask()
+        live_rows = len(self.vectors) - self.vectors.dead_rows
+        if live_rows == 0:
+            return []
+        if self.index is not None and self.index.trained:
+            # The index still holds tombstoned rows; over-fetch and drop them
+            candidates = top_k if live is None else self.planner.ann_top_k(top_k, len(self.vectors), live_rows)
+            top_rows, scores = self.index.search(self.vectors, query_vector, candidates,
+                                                  nprobe=nprobe, ef_search=ef_search)
+            if live is None:
+                return self._format_results(top_rows, scores)
+            keep = live[top_rows]
+            if keep.sum() >= min(top_k, live_rows):
+                return self._format_results(top_rows[keep][:top_k], scores[keep][:top_k])
+        # Rows are stored L2-normalized, so cosine similarity is a single matmul
+        top_rows, scores = self.vectors.search(query_vector, top_k, mask=live)
+        return self._format_results(top_rows, scores)
+    
+    def _plan(self, ranges: List[Tuple[int, int]]) -> Tuple[str, int]:
+        filtered_rows = sum(stop - start for start, stop in ranges)
+        plan = self.planner.plan(len(self.vectors), filtered_rows, len(ranges),
+                                 self.index is not None and self.index.trained)
+        self.plan_counts[plan] = self.plan_counts.get(plan, 0) + 1
+        return plan, filtered_rows
+    
+    def _filtered_search(self, query_vector: List[float], top_k: int, ranges: List[Tuple[int, int]],
+                         nprobe: Optional[int], ef_search: Optional[int],
+                         mask: Optional[np.ndarray] = None) -> List[dict]:
+        """Search the rows in ranges (mask, when given, is the same rows as a bool mask)"""
+        plan, filtered_rows = self._plan(ranges)
+        if plan == PLAN_EMPTY:
             return []
         
-        vectors_matrix = np.array([self.vectors[id] for id in relevant_ids])
-        # Compute cosine similarity manually
-        # cosine_similarity = (A·B) / (||A|| * ||B||)
-        dot_products = np.dot(vectors_matrix, query_np.T).flatten()
-        query_norm = np.linalg.norm(query_np)
-        vector_norms = np.linalg.norm(vectors_matrix, axis=1)
-        similarities = dot_products / (query_norm * vector_norms + 1e-10)  # Add small epsilon to avoid division by zero
+        if plan == PLAN_ANN:
+            candidates = self.planner.ann_top_k(top_k, len(self.vectors), filtered_rows)
+            top_rows, scores = self.index.search(self.vectors, query_vector, candidates,
+                                                  nprobe=nprobe, ef_search=ef_search)
+            keep = (mask if mask is not None else self._range_mask(ranges))[top_rows]
+            if keep.sum() >= min(top_k, filtered_rows):
+                return self._format_results(top_rows[keep][:top_k], scores[keep][:top_k])
+            # The index did not surface enough matches; fall back to an exact scan
+            plan = PLAN_SLICES if len(ranges) <= self.planner.max_slices else PLAN_MASK
+        
+        if plan == PLAN_SLICES:
+            top_rows, scores = self.vectors.search(query_vector, top_k, ranges=ranges)
+        elif plan == PLAN_MASK:
+            top_rows, scores = self.vectors.search(query_vector, top_k,
+                                                   mask=mask if mask is not None else self._range_mask(ranges))
+        else:
+            rows = np.flatnonzero(mask) if mask is not None else self._range_rows(ranges)
+            top_rows, scores = self.vectors.search(query_vector, top_k, rows=rows)
+        return self._format_results(top_rows, scores)
+    
+    def search_batch(self, query_vectors: List[List[float]], top_k: List[int],
+                     task_ids: List[Optional[List[str]]], nprobe: Optional[int] = None,
+                     ef_search: Optional[int] = None) -> List[List[dict]]:
+        """
+        Answer several queries at once. Queries that scan the same rows (no
+        filter, or the same task_ids) share one matrix-matrix pass over the
+        store; queries served by a trained ANN index are searched one by one.
+        Queries answered by the result cache are not searched at all.
+        """
+        if self.cache is None:
+            return self._consistent(partial(self._search_batch, query_vectors, top_k, task_ids, nprobe, ef_search))
+        results: List[Optional[List[dict]]] = [None] * len(query_vectors)
+        misses = []
+        for i, query_vector in enumerate(query_vectors):
+            key = query_key(query_vector, top_k[i], task_ids[i], nprobe, ef_search)
+            version = self._data_version(task_ids[i])
+            results[i] = self.cache.get(key, version)
+            if results[i] is None:
+                misses.append((i, key, version))
+        if misses:
+            found = self._consistent(partial(
+                self._search_batch, [query_vectors[i] for i, _, _ in misses], [top_k[i] for i, _, _ in misses],
+                [task_ids[i] for i, _, _ in misses], nprobe, ef_search))
+            for (i, key, version), result in zip(misses, found):
+                self.cache.put(key, version, result)
+                results[i] = result
+        return results
+    
+    def _search_batch(self, query_vectors: List[List[float]], top_k: List[int],
+                      task_ids: List[Optional[List[str]]], nprobe: Optional[int] = None,
+                      ef_search: Optional[int] = None) -> List[List[dict]]:
+        results: List[List[dict]] = [[] for _ in query_vectors]
+        if not self.vectors:
+            return results
+        
+        groups: Dict[tuple, List[int]] = {}
+        for i, tasks in enumerate(task_ids):
+            groups.setdefault(tuple(tasks) if tasks else (), []).append(i)
+        
+        for tasks, members in groups.items():
+            if not tasks and self.index is not None and self.index.trained:
+                for i in members:
+                    results[i] = self._search(query_vectors[i], top_k[i], nprobe=nprobe, ef_search=ef_search)
+                continue
+            rows, ranges = None, None
+            if tasks:
+                ranges = self._task_ranges(tasks)
+                plan, _ = self._plan(ranges)
+                if plan == PLAN_EMPTY:
+                    continue
+                if plan == PLAN_ANN:
+                    for i in members:
+                        results[i] = self._search(query_vectors[i], top_k[i], list(tasks),
+                                                 nprobe=nprobe, ef_search=ef_search)
+                    continue
+                if plan != PLAN_SLICES:
+                    rows, ranges = self._range_rows(ranges), None
+            found = self.vectors.search_batch([query_vectors[i] for i in members],
+                                              max(top_k[i] for i in members), rows, ranges,
+                                              mask=None if tasks else self.vectors.live_mask())
+            for i, (top_rows, scores) in zip(members, found):
+                results[i] = self._format_results(top_rows[:top_k[i]], scores[:top_k[i]])
+        return results
+    
+    def _filter_mask(self, condition, task_ids: Optional[List[str]]) -> np.ndarray:
+        """
+        Bool mask of the live rows matching a parsed filter (and task_ids).
+        Every condition resolves to packed uint64 words over the current rows,
+        so combining them costs N/64 word operations whatever they match.
+        """
+        rows = len(self.vectors)
+        words = -(-rows // 64)
+        live = self.vectors.live_mask()
+        all_rows = pack_mask(live) if live is not None else pack_mask(np.ones(rows, dtype=bool))
         
-        # Limit top_k to the actual number of relevant embeddings
-        actual_top_k = min(top_k, len(relevant_ids))
-        top_indices = np.argsort(similarities)[-actual_top_k:][::-1]
+        def leaf(node: Condition) -> np.ndarray:
+            if node.field == "task_id":
+                return pack_mask(self._range_mask(self._task_ranges(node.value)))
+            if node.field == "timestamp":
+                stamps = self.metadata.timestamps(rows)
+                return pack_mask(TIMESTAMP_COMPARISONS[node.op](stamps, node.value))
+            return self.bitmaps.matching(node.field, node.value, words)
         
+        matched = evaluate(condition, leaf, all_rows) & all_rows
+        if task_ids:
+            matched &= pack_mask(self._range_mask(self._task_ranges(task_ids)))
+        return unpack_words(matched, rows)
+    
+    def _task_ranges(self, task_ids) -> List[Tuple[int, int]]:
+        """Sorted row ranges covering the given tasks, with adjacent ranges merged"""
+        ranges = sorted(
+            (start, stop) for task_id in set(task_ids) for start, stop in self.task_ranges.get(task_id, [])
+        )
+        merged: List[Tuple[int, int]] = []
+        for start, stop in ranges:
+            if merged and merged[-1][1] == start:
+                merged[-1] = (merged[-1][0], stop)
+            else:
+                merged.append((start, stop))
+        return merged
+    
+    def _range_rows(self, ranges: List[Tuple[int, int]]) -> np.ndarray:
+        if not ranges:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(start, stop) for start, stop in ranges])
+    
+    def _range_mask(self, ranges: List[Tuple[int, int]]) -> np.ndarray:
+        mask = np.zeros(len(self.vectors), dtype=bool)
+        for start, stop in ranges:
+            mask[start:stop] = True
+        return mask
+    
+    def _format_results(self, top_rows: np.ndarray, scores: np.ndarray) -> List[dict]:
         results = []
-        for idx in top_indices:
-            embedding_id = relevant_ids[idx]
+        rows = top_rows.tolist()
+        # Only the returned rows are materialized into metadata dicts
+        for row, score, metadata in zip(rows, scores.tolist(), self.metadata.at_rows(rows)):
             results.append({
-                "embedding_id": embedding_id,
-                "score": float(similarities[idx]),
-                "metadata": self.metadata[embedding_id]
+                "embedding_id": self.vectors.ids[row],
+                "score": score,
+                "metadata": metadata
             })
         
         return results
     
     def get_stats(self) -> dict:
         return {
-            "total_embeddings": len(self.vectors),
+            "total_embeddings": len(self.vectors) - self.vectors.dead_rows,
             "total_tasks": len(self.task_embeddings),
-            "tasks": list(self.task_embeddings.keys())
+            "deleted_rows": self.vectors.dead_rows,
+            "dead_ratio": self.dead_ratio(),
+            "tasks": list(self.task_embeddings.keys()),
+            "index": dict(self.index.get_stats(), trained_rows=self.index_rows,
+                          rebuild_in_flight=self._rebuild_in_flight) if self.index is not None else {"type": "flat"},
+            "codec": self.vectors.codec.name,
+            "codec_fit_rows": self.vectors.codec_fit_rows,
+            "vector_memory_bytes": self.vectors.memory_bytes(),
+            "vector_mapped_bytes": self.vectors.mapped_bytes(),
+            "task_fragmentation": self.fragmentation(),
+            "query_plans": dict(self.plan_counts),
+            "result_cache": self.cache.get_stats() if self.cache is not None else None,
+            "filter_bitmaps": self.bitmaps.get_stats(),
+            "persistence": {
+                "wal_records_since_snapshot": self.persistence.wal.records_since_snapshot,
+                "last_snapshot": self.persistence.last_snapshot
+            } if self.persistence is not None else None
         }
 
 
 class VectorDatabaseService:
     def __init__(self):
         self.logger = setup_logger("vectorial-db-service", os.getenv("LOG_LEVEL", "INFO"))
-        self.db = VectorDatabase()
+        data_dir = os.getenv("VECTOR_DATA_DIR")
+        persistence = None
+        if data_dir:
+            persistence = VectorPersistence(data_dir, fsync=os.getenv("WAL_FSYNC", "false").lower() == "true")
+        # Repeated queries (the same FAQ text embeds to the same vector) are answered from memory
+        cache_size = int(os.getenv("SEARCH_CACHE_SIZE", "10000"))
+        self.db = VectorDatabase(
+            index=create_index(os.getenv("VECTOR_INDEX", "flat")),
+            store=create_store(),
+            persistence=persistence,
+            cache=SearchResultCache(max_entries=cache_size,
+                                    ttl_seconds=float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "300")))
+                  if cache_size > 0 else None,
+            background_rebuilds=True,
+            planner=QueryPlanner(
+                ann_min_selectivity=float(os.getenv("FILTER_ANN_MIN_SELECTIVITY", "0.3")),
+                max_slices=int(os.getenv("FILTER_MAX_SLICES", "256")),
+                mask_min_selectivity=float(os.getenv("FILTER_MASK_MIN_SELECTIVITY", "0.5"))
+            )
+        )
+        # Searches run here, so a long scan never stalls ingestion or health checks on the event loop
+        self.search_executor = ThreadPoolExecutor(max_workers=int(os.getenv("SEARCH_THREADS", "4")),
+                                                  thread_name_prefix="search")
+        # Flat searches can run in worker processes, one core each, that map the
+        # rows this process (the only writer) publishes to shared memory
+        search_processes = int(os.getenv("SEARCH_PROCESSES", "0"))
+        self.publisher = None
+        self.search_processes = None
+        self.publish_task: Optional[asyncio.Task] = None
+        # Write generation (VectorDatabase._generation) the readers' mirror is known to hold
+        self.published_generation: Optional[int] = None
+        if search_processes > 0:
+            shared_dir = os.getenv("SHARED_STORE_DIR", "/dev/shm/vectorial-db")
+            self.publisher = SharedStorePublisher(shared_dir)
+            # Spawned, not forked: a reader maps the published rows instead of inheriting the writer's heap
+            self.search_processes = ProcessPoolExecutor(max_workers=search_processes,
+                                                        mp_context=multiprocessing.get_context("spawn"),
+                                                        initializer=attach_reader, initargs=(shared_dir,))
+        # Coalesce concurrent /search calls into batched scans when a window is set
+        batch_window_ms = float(os.getenv("SEARCH_BATCH_WINDOW_MS", "0"))
+        self.batcher = None
+        if batch_window_ms > 0:
+            self.batcher = SearchBatcher(self.db, window_ms=batch_window_ms,
+                                         max_batch=int(os.getenv("SEARCH_MAX_BATCH", "64")),
+                                         executor=self.search_executor)
+        self.snapshot_interval = int(os.getenv("SNAPSHOT_INTERVAL_SECONDS", "300"))
+        self.snapshot_min_records = int(os.getenv("SNAPSHOT_MIN_WAL_RECORDS", "1000"))
+        self.compact_max_ranges = float(os.getenv("TASK_COMPACT_MAX_RANGES", "8"))
+        self.purge_min_dead_ratio = float(os.getenv("PURGE_MIN_DEAD_RATIO", "0.2"))
+        # Rebuild an IVF index once the store has grown this many times past its training rows (0: never)
+        self.index_rebuild_growth = float(os.getenv("INDEX_REBUILD_GROWTH", "4"))
+        self.rebuild_task: Optional[asyncio.Task] = None
+        # Retrain a lossy codec once the store has grown this many times past its training rows (0: never)
+        self.codec_refit_growth = float(os.getenv("CODEC_REFIT_GROWTH", "2"))
         self.master_task_db_url = os.getenv("MASTER_TASK_DB_URL", "http://master-task-db:8001")
         
         # Support multiple embedding services
         embedding_urls = os.getenv("EMBEDDING_SERVICE_URLS", "http://embedding-1:8005,http://embedding-2:8005")
         self.embedding_service_urls = [url.strip() for url in embedding_urls.split(",")]
+        # This shard's own URL as listed in VECTORIAL_DB_URLS; embedding services
+        # route each task to its owner on the hash ring built from that list
+        self.shard_url = os.getenv("VECTOR_SHARD_URL") or None
+        self.shard_ring = ring_from_env(os.getenv("VECTORIAL_DB_URLS"))
+        self.misrouted_embeddings = 0
+        # task_id -> embeddings the embedding service produced for it, until all have arrived
+        self.expected_embeddings: Dict[str, int] = {}
+        # Tasks whose vectors are all searchable but whose VECTORIZED update has not gone through
+        self.vectorized_tasks = set()
+        self.pull_batch_size = int(os.getenv("EMBEDDING_PULL_BATCH_SIZE", "500"))
+        # Ask embedding services for binary vector frames; older ones answer JSON
+        wire_format = os.getenv("VECTOR_WIRE_FORMAT", "binary")
+        self.embeddings_accept = (f"{VECTOR_FRAME_CONTENT_TYPE}, application/json" if wire_format == "binary"
+                                  else "application/json")
         
         self.running = True
         self.logger.info(f"VectorDatabaseService initialized")
         self.logger.info(f"Master DB URL: {self.master_task_db_url}")
         self.logger.info(f"Embedding Service URLs: {self.embedding_service_urls}")
+        self.logger.info(f"Persistence directory: {data_dir or 'disabled'}")
+        self.logger.info(f"Shard: {self.shard_url or 'unsharded'}")
     
     async def start(self):
+        recovery = self.db.recover()
+        if recovery:
+            self.logger.info(
+                f"Recovered {recovery['snapshot_rows']} snapshot rows and {recovery['wal_records']} WAL records "
+                f"in {recovery['total_seconds']:.2f}s"
+            )
+        asyncio.create_task(self.maintenance_loop())
+        self.schedule_publish()
+        
         # Create a consumer task for each embedding service
         for url in self.embedding_service_urls:
             asyncio.create_task(self.consume_embeddings_from_service(url))
     
+    def stop(self):
+        self.running = False
+        self.search_executor.shutdown(wait=False)
+        if self.search_processes is not None:
+            self.search_processes.shutdown(wait=False, cancel_futures=True)
+            self.publisher.close()
+        if self.db.persistence is not None:
+            self.db.persistence.close()
+    
+    async def maintenance_loop(self):
+        """
+        Periodically purge deleted rows, rebuild the index and retrain the codec on a grown store,
+        regroup fragmented tasks into contiguous rows, and fold the WAL into a
+        snapshot once enough records have accumulated
+        """
+        while self.running:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                dead_ratio = self.db.dead_ratio()
+                if dead_ratio > self.purge_min_dead_ratio:
+                    await self.purge()
+                self.schedule_index_rebuild()
+                if self.db.refit_due(self.codec_refit_growth):
+                    await self.refit()
+                fragmentation = self.db.fragmentation()
+                if fragmentation > self.compact_max_ranges and await self.compact():
+                    self.logger.info(f"Compacted task rows (was {fragmentation:.1f} ranges per task)")
+                self.schedule_publish()
+                persistence = self.db.persistence
+                if persistence is not None and persistence.wal.records_since_snapshot >= self.snapshot_min_records:
+                    await self.snapshot()
+            except Exception as e:
+                log_error(self.logger, e, "maintenance_loop")
+    
+    async def purge(self) -> bool:
+        """
+        Rewrite the store without tombstoned rows. The copy is built in a
+        worker thread while searches keep reading the current rows; only the
+        swap runs on the event loop, and it is abandoned if a delete or
+        overwrite raced the build.
+        """
+        job = self.db.start_purge()
+        if job is None:
+            return False
+        start = time.time()
+        await asyncio.to_thread(self.db.build_purge, job)
+        if not self.db.commit_purge(job):
+            self.logger.info("Purge abandoned: rows were rewritten while it was building")
+            return False
+        self.logger.info(f"Purged {job['dead_rows']} deleted rows in {time.time() - start:.2f}s")
+        return True
+    
+    async def compact(self) -> bool:
+        """
+        Make each task's rows contiguous. Like a purge, the reordered copy is
+        built in a worker thread and only the swap runs on the event loop.
+        """
+        job = self.db.start_compact()
+        if job is None:
+            return False
+        start = time.time()
+        await asyncio.to_thread(self.db.build_compact, job)
+        if not self.db.commit_compact(job):
+            self.logger.info("Compaction abandoned: rows were rewritten while it was building")
+            return False
+        self.logger.info(f"Compacted {len(self.db.task_ranges)} tasks in {time.time() - start:.2f}s")
+        return True
+    
+    async def snapshot(self) -> Optional[dict]:
+        """
+        Fold the WAL into a snapshot. Only sealing the log runs on the event
+        loop; the matrix and metadata are written in a worker thread, and the
+        snapshot is abandoned if a compaction, purge or overwrite raced it.
+        """
+        job = self.db.start_snapshot()
+        if job is None:
+            return None
+        try:
+            await asyncio.to_thread(self.db.build_snapshot, job)
+        except Exception:
+            self.db.discard_snapshot(job)
+            raise
+        snapshot = self.db.commit_snapshot(job)
+        if snapshot is None:
+            self.logger.info("Snapshot abandoned: rows were rewritten while it was being written")
+            return None
+        self.logger.info(f"Snapshot of {snapshot['rows']} rows written in {snapshot['seconds']:.2f}s")
+        return snapshot
+    
+    def schedule_index_rebuild(self):
+        """Start a background index rebuild when one is due and none is running"""
+        if (self.rebuild_task is None or self.rebuild_task.done()) and self.db.rebuild_due(self.index_rebuild_growth):
+            self.rebuild_task = asyncio.create_task(self.rebuild_index())
+    
+    def schedule_publish(self):
+        """Start a background publish to the reader processes when they lag and none is running"""
+        if (self.publisher is not None and self.published_generation != self.db._generation
+                and (self.publish_task is None or self.publish_task.done())):
+            self.publish_task = asyncio.create_task(self.publish_to_readers())
+    
+    async def publish_to_readers(self):
+        """
+        Copy the writes the reader processes have not seen into shared memory,
+        in a worker thread so the event loop keeps serving; readers answer
+        from the last published generation meanwhile. Writes that land during
+        a pass are picked up by another one.
+        """
+        while self.published_generation != self.db._generation:
+            generation, version = self.db._generation, self.db._read_version()
+            try:
+                published = await asyncio.to_thread(self.publisher.publish, self.db)
+            except Exception as e:
+                log_error(self.logger, e, "publish_to_readers")
+                return
+            if self.db._read_version() != version:
+                # Rows were rewritten under the copy; the next pass starts a new generation of files
+                continue
+            self.published_generation = generation
+            if published:
+                self.logger.debug(f"Published generation {self.publisher.generation} "
+                                  f"({self.publisher.rows} rows) to reader processes")
+    
+    async def rebuild_index(self) -> bool:
+        """
+        Build a new index in a worker thread and swap it in. Searches keep
+        using the old index (or flat scans before the first training)
+        meanwhile; only the delta of rows ingested during the build is
+        indexed on the event loop, at the swap.
+        """
+        job = self.db.start_rebuild()
+        if job is None:
+            return False
+        start = time.time()
+        await asyncio.to_thread(self.db.build_rebuild, job)
+        if not self.db.commit_rebuild(job):
+            self.logger.info("Index rebuild abandoned: rows were rewritten while it was building")
+            return False
+        self.logger.info(f"Rebuilt {type(self.db.index).__name__} over {job['size']} rows "
+                         f"(+{len(self.db.vectors) - job['size']} delta) in {time.time() - start:.2f}s")
+        return True
+    
+    async def refit(self) -> bool:
+        """Retrain the codec on the current rows in a worker thread and swap the new codes in"""
+        job = self.db.start_refit()
+        if job is None:
+            return False
+        start = time.time()
+        await asyncio.to_thread(self.db.build_refit, job)
+        if not self.db.commit_refit(job):
+            self.logger.info("Codec refit abandoned: rows were rewritten while it was building")
+            return False
+        self.logger.info(f"Refit {self.db.vectors.codec.name} codec on {job['size']} rows "
+                         f"in {time.time() - start:.2f}s")
+        return True
+    
+    async def run_search(self, search, *args, **kwargs):
+        """Run a VectorDatabase search method on the search executor"""
+        return await asyncio.get_running_loop().run_in_executor(
+            self.search_executor, partial(search, *args, **kwargs))
+    
+    def searches_in_processes(self, search_request: SearchRequest) -> bool:
+        """
+        Reader processes answer exact flat searches once something has been
+        published to them; filters and ANN searches stay with the writer
+        """
+        index = self.db.index
+        return (self.search_processes is not None and self.published_generation is not None
+                and search_request.filter is None
+                and search_request.nprobe is None and search_request.ef_search is None
+                and (index is None or not index.trained))
+    
+    async def search_in_processes(self, query_vector: List[float], top_k: int,
+                                  task_ids: Optional[List[str]]) -> List[dict]:
+        """
+        Run the search in a reader process, which answers from the last
+        published generation; writes it has not seen yet are published in
+        the background. Results go through the writer's result cache like any
+        other search, but are only stored when the readers were up to date.
+        """
+        cache = self.db.cache
+        if cache is not None:
+            key = query_key(query_vector, top_k, task_ids, None, None)
+            version = self.db._data_version(task_ids)
+            results = cache.get(key, version)
+            if results is not None:
+                return results
+        self.schedule_publish()
+        current = self.published_generation == self.db._generation
+        results = await asyncio.get_running_loop().run_in_executor(
+            self.search_processes, partial(search_shared_store, query_vector, top_k, task_ids))
+        if cache is not None and current:
+            cache.put(key, version, results)
+        return results
+    
+    def owns_task(self, task_id: str) -> bool:
+        if self.shard_ring is None or not self.shard_url:
+            return True
+        return self.shard_ring.node_for(task_id) == self.shard_url
+    
+    def ingest_batch(self, embeddings: List[dict], vectors: Optional[np.ndarray] = None):
+        """
+        Append a pulled batch as one block and mark the tasks it completes.
+
+        A task is complete once the database holds as many distinct embeddings
+        for it as the embedding service produced, so re-delivered embeddings
+        never count twice.
+        """
+        for embedding in embeddings:
+            if not self.owns_task(embedding["task_id"]):
+                # Keep it rather than drop data; rag-query will not route
+                # queries for this task here until the ring agrees again
+                self.misrouted_embeddings += 1
+                self.logger.warning(f"Embedding {embedding['id']} of task {embedding['task_id']} "
+                                    f"belongs to another shard")
+            if embedding.get("task_embedding_count") is not None:
+                self.expected_embeddings[embedding["task_id"]] = embedding["task_embedding_count"]
+        received = self.db.add_embeddings(embeddings, vectors)
+        self.db.sync()
+        for task_id, count in received.items():
+            self.logger.debug(f"Added {count} embeddings for task {task_id}")
+            expected = self.expected_embeddings.get(task_id)
+            # Producers that do not announce a count get one transition per batch
+            if expected is None or len(self.db.task_embeddings.get(task_id, ())) >= expected:
+                self.expected_embeddings.pop(task_id, None)
+                self.vectorized_tasks.add(task_id)
+    
+    async def report_vectorized_tasks(self, client: httpx.AsyncClient):
+        """One VECTORIZED transition per completed task; failed updates are retried next round"""
+        for task_id in list(self.vectorized_tasks):
+            try:
+                response = await client.put(
+                    f"{self.master_task_db_url}/tasks/{task_id}/status",
+                    params={"status": TaskStatus.VECTORIZED.value}
+                )
+                if response.status_code == 200:
+                    self.vectorized_tasks.discard(task_id)
+                    self.logger.info(f"Task {task_id} marked as VECTORIZED")
+            except Exception as e:
+                log_error(self.logger, e, f"report_vectorized_tasks for {task_id}")
+    
     async def consume_embeddings_from_service(self, service_url: str):
         """Consume embeddings from a specific embedding service"""
         async with httpx.AsyncClient() as client:
             while self.running:
+                embeddings = []
                 try:
                     self.logger.debug(f"Fetching embeddings batch from {service_url}...")
-                    response = await client.get(
-                        f"{service_url}/embeddings/batch",
-                        params={"batch_size": 50}
-                    )
+                    params = {"batch_size": self.pull_batch_size}
+                    if self.shard_url:
+                        params["shard"] = self.shard_url
+                    response = await client.get(f"{service_url}/embeddings/batch", params=params,
+                                                headers={"Accept": self.embeddings_accept})
                     self.logger.debug(f"Embeddings batch response from {service_url}: {response.status_code}")
                     
                     if response.status_code == 200:
-                        data = response.json()
-                        embeddings = data.get("embeddings", [])
-                        
+                        vectors = None
+                        if is_vector_frame(response.headers.get("content-type")):
+                            fields, vectors = decode_frame(response.content)
+                            embeddings = fields["embeddings"]
+                        else:
+                            embeddings = response.json().get("embeddings", [])
                         if embeddings:
                             self.logger.info(f"Processing {len(embeddings)} embeddings from {service_url}")
-                        
-                        for emb_data in embeddings:
-                            embedding = Embedding(**emb_data)
-                            self.db.add_embedding(embedding)
-                            self.logger.debug(f"Added embedding {embedding.id} for task {embedding.task_id}")
-                            
-                            await client.put(
-                                f"{self.master_task_db_url}/tasks/{embedding.task_id}/status",
-                                params={"status": TaskStatus.VECTORIZED.value}
-                            )
-                            self.logger.info(f"Task {embedding.task_id} marked as VECTORIZED")
+                            self.ingest_batch(embeddings, vectors)
+                            self.schedule_index_rebuild()
+                            self.schedule_publish()
+                    
+                    await self.report_vectorized_tasks(client)
                 
                 except Exception as e:
                     log_error(self.logger, e, f"consume_embeddings from {service_url}")
                 
-                await asyncio.sleep(2)
+                # Keep draining while the producer has a backlog
+                if len(embeddings) < self.pull_batch_size:
+                    await asyncio.sleep(2)
 
 
 vector_service = VectorDatabaseService()
@@ -142,32 +1317,147 @@ vector_service = VectorDatabaseService()
 async def lifespan(app: FastAPI):
     await vector_service.start()
     yield
-    vector_service.running = False
+    vector_service.stop()
 
 
 app = FastAPI(title="Vectorial Database Service", lifespan=lifespan)
 
 
+async def parse_search_body(request: Request, model):
+    """Validate a JSON body, or a binary vector frame whose fields carry everything but the vectors"""
+    body = await request.body()
+    try:
+        if not is_vector_frame(request.headers.get("content-type")):
+            return model.model_validate_json(body)
+        fields, vectors = decode_frame(body)
+        if model is SearchRequest:
+            if len(vectors) != 1:
+                raise ValueError("A /search frame carries exactly one query vector")
+            return SearchRequest(query_vector=vectors[0], **fields)
+        queries = fields.pop("queries")
+        if len(queries) != len(vectors):
+            raise ValueError("Frame has a different number of queries and vectors")
+        return BatchSearchRequest(
+            queries=[BatchQuery(query_vector=vector, **query) for query, vector in zip(queries, vectors)],
+            **fields
+        )
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+    except (ValueError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Malformed vector frame: {e}")
+
+
+async def search_request_body(request: Request) -> SearchRequest:
+    return await parse_search_body(request, SearchRequest)
+
+
+async def batch_search_request_body(request: Request) -> BatchSearchRequest:
+    return await parse_search_body(request, BatchSearchRequest)
+
+
 @app.post("/search")
-async def search_embeddings(
-    query_vector: List[float],
-    top_k: int = 5,
-    task_ids: Optional[List[str]] = None
-):
-    log_request(vector_service.logger, "POST", "/search", top_k=top_k, task_ids=task_ids)
-    results = vector_service.db.search(query_vector, top_k, task_ids)
+async def search_embeddings(search_request: SearchRequest = Depends(search_request_body)):
+    log_request(vector_service.logger, "POST", "/search", top_k=search_request.top_k,
+                task_ids=search_request.task_ids, nprobe=search_request.nprobe,
+                ef_search=search_request.ef_search, filter=search_request.filter)
+    if vector_service.searches_in_processes(search_request):
+        results = await vector_service.search_in_processes(
+            search_request.query_vector,
+            search_request.top_k,
+            search_request.task_ids
+        )
+    elif (vector_service.batcher is not None and search_request.nprobe is None and search_request.ef_search is None
+            and search_request.filter is None):
+        results = await vector_service.batcher.search(
+            search_request.query_vector,
+            search_request.top_k,
+            search_request.task_ids
+        )
+    else:
+        try:
+            results = await vector_service.run_search(
+                vector_service.db.search,
+                search_request.query_vector,
+                search_request.top_k,
+                search_request.task_ids,
+                nprobe=search_request.nprobe,
+                ef_search=search_request.ef_search,
+                where=search_request.filter
+            )
+        except FilterError as e:
+            raise HTTPException(status_code=422, detail=f"Invalid filter: {e}")
     log_response(vector_service.logger, "POST", "/search", 200, results_count=len(results))
     return {"results": results}
 
 
+@app.post("/search/batch")
+async def search_embeddings_batch(batch_request: BatchSearchRequest = Depends(batch_search_request_body)):
+    log_request(vector_service.logger, "POST", "/search/batch", queries=len(batch_request.queries),
+                nprobe=batch_request.nprobe, ef_search=batch_request.ef_search)
+    results = await vector_service.run_search(
+        vector_service.db.search_batch,
+        [query.query_vector for query in batch_request.queries],
+        [query.top_k for query in batch_request.queries],
+        [query.task_ids for query in batch_request.queries],
+        nprobe=batch_request.nprobe,
+        ef_search=batch_request.ef_search
+    )
+    log_response(vector_service.logger, "POST", "/search/batch", 200, queries=len(results))
+    return {"results": results}
+
+
 @app.get("/stats")
 async def get_database_stats():
     log_request(vector_service.logger, "GET", "/stats")
     stats = vector_service.db.get_stats()
+    if vector_service.batcher is not None:
+        stats["search_batcher"] = vector_service.batcher.get_stats()
+    stats["ingestion"] = {"tasks_in_progress": len(vector_service.expected_embeddings),
+                          "tasks_pending_status": len(vector_service.vectorized_tasks)}
+    if vector_service.publisher is not None:
+        stats["shared_store"] = vector_service.publisher.get_stats()
+        stats["shared_store"]["current"] = vector_service.published_generation == vector_service.db._generation
+    if vector_service.shard_ring is not None:
+        stats["shard"] = {"url": vector_service.shard_url, "shards": len(vector_service.shard_ring),
+                          "misrouted_embeddings": vector_service.misrouted_embeddings}
     log_response(vector_service.logger, "GET", "/stats", 200)
     return stats
 
 
+@app.post("/index/train")
+async def train_index():
+    log_request(vector_service.logger, "POST", "/index/train")
+    if vector_service.db.index is None:
+        raise HTTPException(status_code=400, detail="No ANN index configured (VECTOR_INDEX=flat)")
+    # Built beside the serving index and swapped in, so searches are not held up meanwhile
+    rebuilt = await vector_service.rebuild_index()
+    stats = dict(vector_service.db.index.get_stats(), rebuilt=rebuilt)
+    log_response(vector_service.logger, "POST", "/index/train", 200, **stats)
+    return stats
+
+
+@app.post("/compact")
+async def compact_tasks():
+    log_request(vector_service.logger, "POST", "/compact")
+    before = vector_service.db.fragmentation()
+    compacted = await vector_service.compact()
+    log_response(vector_service.logger, "POST", "/compact", 200, compacted=compacted)
+    return {"compacted": compacted, "ranges_per_task_before": before,
+            "ranges_per_task_after": vector_service.db.fragmentation()}
+
+
+@app.post("/snapshot")
+async def create_snapshot():
+    log_request(vector_service.logger, "POST", "/snapshot")
+    if vector_service.db.persistence is None:
+        raise HTTPException(status_code=400, detail="Persistence is disabled (VECTOR_DATA_DIR not set)")
+    snapshot = await vector_service.snapshot()
+    if snapshot is None:
+        raise HTTPException(status_code=409, detail="Snapshot abandoned: another one is running or rows were rewritten")
+    log_response(vector_service.logger, "POST", "/snapshot", 200, **snapshot)
+    return snapshot
+
+
 @app.get("/embeddings/{task_id}")
 async def get_task_embeddings(task_id: str):
     log_request(vector_service.logger, "GET", f"/embeddings/{task_id}")
@@ -187,6 +1477,23 @@ async def get_task_embeddings(task_id: str):
     return {"task_id": task_id, "embeddings": embeddings}
 
 
+@app.delete("/embeddings/{task_id}")
+async def delete_task_embeddings(task_id: str):
+    log_request(vector_service.logger, "DELETE", f"/embeddings/{task_id}")
+    if task_id not in vector_service.db.task_embeddings:
+        vector_service.logger.warning(f"No embeddings found for task {task_id}")
+        raise HTTPException(status_code=404, detail="No embeddings found for task")
+    
+    # Rows are tombstoned now and reclaimed by the next purge
+    deleted = vector_service.db.delete_task(task_id)
+    vector_service.expected_embeddings.pop(task_id, None)
+    vector_service.vectorized_tasks.discard(task_id)
+    vector_service.db.sync()
+    
+    log_response(vector_service.logger, "DELETE", f"/embeddings/{task_id}", 200, deleted=deleted)
+    return {"task_id": task_id, "deleted": deleted}
+
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "vectorial_db"}
\ No newline at end of file
@@ -0,0 +1,188 @@
+from collections.abc import Mapping
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+EPOCH = datetime(1970, 1, 1)
+FORMATTED_TIMESTAMP_CACHE = 4096
+
+
+class InternTable:
+    """Assigns each distinct string a small integer code, in order of first appearance"""
+
+    def __init__(self):
+        self.values: List[str] = []
+        self.codes: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def code(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+def timestamp_micros(value: str) -> int:
+    """ISO-8601 timestamp (naive UTC, as written by datetime.utcnow().isoformat()) to epoch microseconds"""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return (parsed - EPOCH) // timedelta(microseconds=1)
+
+
+def timestamp_iso(micros: int) -> str:
+    return (EPOCH + timedelta(microseconds=int(micros))).isoformat()
+
+
+class ColumnarMetadata(Mapping):
+    """
+    Per-row embedding metadata held as columns aligned with the store rows.
+
+    A dict per embedding repeats the model name, the dimension and a 26-char
+    timestamp string on every row. Here task ids and model names are
+    interned into tables and stored as integer codes, timestamps as int64
+    epoch microseconds, and the dimension comes from the store. Only chunk
+    ids stay strings, one per row, plus the chunk's own metadata dict for
+    the rows that have one.
+
+    It reads like the old dict: a Mapping from embedding id to a metadata
+    dict, materialized on access, so only the top-k rows a search returns
+    ever become dicts. Rows follow the store: callers that reorder or
+    rewrite the store must permute()/rewrite() the columns the same way.
+    """
+
+    def __init__(self, store, initial_capacity: int = 1024):
+        self.store = store
+        self.tasks = InternTable()
+        self.models = InternTable()
+        self._task = np.zeros(initial_capacity, dtype=np.int32)
+        self._model = np.zeros(initial_capacity, dtype=np.uint16)
+        self._timestamp = np.zeros(initial_capacity, dtype=np.int64)
+        self._chunk: List[Optional[str]] = []
+        self._attributes: List[Optional[dict]] = []
+        # The last timestamp string parsed: a batch shares one
+        self._last_timestamp = (None, 0)
+        self._formatted: Dict[int, str] = {}
+
+    def __getitem__(self, embedding_id: str) -> dict:
+        return self.at_row(self.store.id_to_row[embedding_id])
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self.store.id_to_row))
+
+    def __len__(self) -> int:
+        return len(self.store.id_to_row)
+
+    def __contains__(self, embedding_id: object) -> bool:
+        return embedding_id in self.store.id_to_row
+
+    def at_row(self, row: int) -> dict:
+        return self.at_rows([row])[0]
+
+    def at_rows(self, rows: List[int]) -> List[dict]:
+        """at_row() for several rows, reading each column once"""
+        index = np.asarray(rows, dtype=np.int64)
+        tasks = self._task[index].tolist()
+        models = self._model[index].tolist()
+        stamps = [self._format_timestamp(micros) for micros in self._timestamp[index].tolist()]
+        results = []
+        for row, task, model, stamp in zip(rows, tasks, models, stamps):
+            row_metadata = {
+                "chunk_id": self._chunk[row],
+                "task_id": self.tasks.values[task],
+                "model_name": self.models.values[model],
+                "dimension": self.store.dimension,
+                "timestamp": stamp
+            }
+            if self._attributes[row]:
+                row_metadata["metadata"] = self._attributes[row]
+            results.append(row_metadata)
+        return results
+
+    def _format_timestamp(self, micros: int) -> str:
+        # Rows of one ingested batch share a timestamp, so a few strings cover most results
+        stamp = self._formatted.get(micros)
+        if stamp is None:
+            if len(self._formatted) >= FORMATTED_TIMESTAMP_CACHE:
+                self._formatted.clear()
+            stamp = self._formatted[micros] = timestamp_iso(micros)
+        return stamp
+
+    def timestamps(self, rows: int) -> np.ndarray:
+        """Epoch-microsecond timestamps of rows 0..rows-1 (a view)"""
+        return self._timestamp[:rows]
+
+    def column_slice(self, start: int, stop: int) -> dict:
+        """Rows start..stop-1 as stored: task and model codes, timestamps, chunk ids and attributes"""
+        return {
+            "task": self._task[start:stop],
+            "model": self._model[start:stop],
+            "timestamp": self._timestamp[start:stop],
+            "chunk": self._chunk[start:stop],
+            "attributes": self._attributes[start:stop]
+        }
+
+    def task_of(self, embedding_id: str) -> str:
+        return self.tasks.values[self._task[self.store.id_to_row[embedding_id]]]
+
+    def set_row(self, row: int, metadata: dict):
+        self.set_rows(np.array([row], dtype=np.int64), [metadata])
+
+    def set_rows(self, rows: np.ndarray, metadata: List[dict]):
+        """Write the metadata of store rows (new rows are always at or past the current end)"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if rows.shape[0] == 0:
+            return
+        self._reserve(int(rows.max()) + 1)
+        self._task[rows] = [self.tasks.code(row_metadata["task_id"]) for row_metadata in metadata]
+        self._model[rows] = [self.models.code(row_metadata.get("model_name", "")) for row_metadata in metadata]
+        self._timestamp[rows] = [self._parse_timestamp(row_metadata["timestamp"]) for row_metadata in metadata]
+        for row, row_metadata in zip(rows.tolist(), metadata):
+            self._chunk[row] = row_metadata["chunk_id"]
+            self._attributes[row] = row_metadata.get("metadata") or None
+
+    def _parse_timestamp(self, value: str) -> int:
+        if self._last_timestamp[0] != value:
+            self._last_timestamp = (value, timestamp_micros(value))
+        return self._last_timestamp[1]
+
+    def _reserve(self, rows: int):
+        if rows > self._task.shape[0]:
+            capacity = max(rows, 2 * self._task.shape[0])
+            for name in ("_task", "_model", "_timestamp"):
+                column = getattr(self, name)
+                grown = np.zeros(capacity, dtype=column.dtype)
+                grown[:column.shape[0]] = column
+                setattr(self, name, grown)
+        if rows > len(self._chunk):
+            self._chunk.extend([None] * (rows - len(self._chunk)))
+            self._attributes.extend([None] * (rows - len(self._attributes)))
+
+    def permute(self, order: np.ndarray):
+        """Follow VectorStore.reorder(order): new row i takes what was row order[i]"""
+        count = order.shape[0]
+        for name in ("_task", "_model", "_timestamp"):
+            getattr(self, name)[:count] = getattr(self, name)[order]
+        self._chunk[:count] = [self._chunk[row] for row in order.tolist()]
+        self._attributes[:count] = [self._attributes[row] for row in order.tolist()]
+
+    def rewrite(self, new_row_of: np.ndarray):
+        """Follow a store rewrite: old row r moves to new_row_of[r], rows mapped to -1 are dropped"""
+        kept = np.flatnonzero(new_row_of >= 0)
+        targets = new_row_of[kept]
+        count = int(targets.max()) + 1 if targets.shape[0] else 0
+        for name in ("_task", "_model", "_timestamp"):
+            column = getattr(self, name)
+            moved = np.zeros(max(count, 1024), dtype=column.dtype)
+            moved[targets] = column[kept]
+            setattr(self, name, moved)
+        chunks: List[Optional[str]] = [None] * count
+        attributes: List[Optional[dict]] = [None] * count
+        for old, new in zip(kept.tolist(), targets.tolist()):
+            chunks[new] = self._chunk[old]
+            attributes[new] = self._attributes[old]
+        self._chunk, self._attributes = chunks, attributes
@@ -0,0 +1,245 @@
+import glob
+import json
+import os
+import shutil
+import struct
+import time
+import zlib
+from typing import Iterator, List, Optional, Tuple
+import numpy as np
+
+# Record layout: header (op, metadata length, vector length) | metadata JSON | float32 vector | crc32
+WAL_HEADER = struct.Struct("<cII")
+WAL_CRC = struct.Struct("<I")
+OP_ADD = b"A"
+# One record per ingested batch: ids and metadata lists, the vectors as one row-major block
+OP_ADD_BATCH = b"B"
+OP_DELETE_TASK = b"D"
+
+SNAPSHOT_BLOCK_ROWS = 65536
+
+
+class WriteAheadLog:
+    """
+    Append-only binary log of vector mutations.
+
+    Each record carries a CRC32, so a torn write at the tail (crash mid-append)
+    ends replay cleanly instead of corrupting the recovered state.
+    """
+
+    def __init__(self, path: str, fsync: bool = False):
+        self.path = path
+        self.fsync = fsync
+        self.records_since_snapshot = 0
+        if os.path.exists(path):
+            # Drop a torn tail so new records are not appended after garbage
+            valid_end = 0
+            for valid_end, *_ in self._scan(path):
+                pass
+            if os.path.getsize(path) > valid_end:
+                with open(path, "r+b") as f:
+                    f.truncate(valid_end)
+        self._file = open(path, "ab")
+
+    def append(self, op: bytes, record: dict, vector: Optional[np.ndarray] = None, rows: int = 1):
+        meta = json.dumps(record, separators=(",", ":")).encode("utf-8")
+        payload = b"" if vector is None else np.asarray(vector, dtype="<f4").tobytes()
+        body = WAL_HEADER.pack(op, len(meta), len(payload)) + meta + payload
+        self._file.write(body + WAL_CRC.pack(zlib.crc32(body)))
+        self.records_since_snapshot += rows
+
+    def sync(self):
+        """Flush buffered records to the OS (and to disk when fsync is enabled)"""
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def seal(self, sealed_path: str):
+        """Close the current log under a new name and start an empty one"""
+        self.sync()
+        self._file.close()
+        os.replace(self.path, sealed_path)
+        self._file = open(self.path, "ab")
+        self.records_since_snapshot = 0
+
+    def close(self):
+        self.sync()
+        self._file.close()
+
+    @staticmethod
+    def _scan(path: str) -> Iterator[Tuple[int, bytes, dict, Optional[np.ndarray]]]:
+        with open(path, "rb") as f:
+            while True:
+                header = f.read(WAL_HEADER.size)
+                if len(header) < WAL_HEADER.size:
+                    return
+                op, meta_len, vector_len = WAL_HEADER.unpack(header)
+                rest = f.read(meta_len + vector_len + WAL_CRC.size)
+                if len(rest) < meta_len + vector_len + WAL_CRC.size:
+                    return
+                body = header + rest[:-WAL_CRC.size]
+                if zlib.crc32(body) != WAL_CRC.unpack(rest[-WAL_CRC.size:])[0]:
+                    return
+                record = json.loads(rest[:meta_len])
+                vector = np.frombuffer(rest[meta_len:meta_len + vector_len], dtype="<f4") if vector_len else None
+                yield f.tell(), op, record, vector
+
+    @classmethod
+    def replay(cls, path: str) -> Iterator[Tuple[bytes, dict, Optional[np.ndarray]]]:
+        """Yield (op, record, vector) for every intact record, stopping at the first torn or corrupt one"""
+        if not os.path.exists(path):
+            return
+        for _, op, record, vector in cls._scan(path):
+            yield op, record, vector
+
+
+class VectorPersistence:
+    """
+    WAL plus periodic compacted snapshots for a VectorDatabase.
+
+    Layout of data_dir:
+        snapshot/vectors.npy    normalized float32 matrix, one row per embedding
+        snapshot/metadata.json  embedding ids and per-row metadata, aligned with the rows
+        wal.log                 mutations since the last snapshot
+        wal.<n>.sealed          logs sealed by a snapshot that has not finished yet
+
+    A snapshot seals the live WAL, writes the current state to snapshot.tmp/,
+    swaps it in with renames and deletes the sealed logs. Replaying a record
+    already contained in the snapshot is harmless (adds overwrite by id), so a
+    crash at any point recovers to the latest acknowledged state.
+    """
+
+    def __init__(self, data_dir: str, fsync: bool = False):
+        self.data_dir = data_dir
+        os.makedirs(data_dir, exist_ok=True)
+        self.snapshot_dir = os.path.join(data_dir, "snapshot")
+        self.wal = WriteAheadLog(os.path.join(data_dir, "wal.log"), fsync=fsync)
+        self.last_snapshot: Optional[dict] = None
+
+    def log_add(self, embedding_id: str, vector, metadata: dict):
+        self.wal.append(OP_ADD, {"id": embedding_id, **metadata}, np.asarray(vector, dtype=np.float32))
+
+    def log_add_batch(self, embedding_ids: List[str], vectors: np.ndarray, metadata: List[dict]):
+        """Log a whole batch as one record, so a crash keeps all of it or none"""
+        self.wal.append(OP_ADD_BATCH, {"ids": embedding_ids, "metadata": metadata},
+                        np.asarray(vectors, dtype=np.float32), rows=len(embedding_ids))
+
+    def log_delete_task(self, task_id: str):
+        self.wal.append(OP_DELETE_TASK, {"task_id": task_id})
+
+    def sync(self):
+        self.wal.sync()
+
+    def close(self):
+        self.wal.close()
+
+    def _sealed_logs(self):
+        return sorted(glob.glob(os.path.join(self.data_dir, "wal.*.sealed")),
+                      key=lambda path: int(path.rsplit(".", 2)[1]))
+
+    def start_snapshot(self, db) -> dict:
+        """
+        Seal the live WAL and capture the rows it covers. Returns a job for
+        build_snapshot(), which writes the files and may run in a worker
+        thread, and commit_snapshot(), which swaps them in.
+        """
+        sealed = self._sealed_logs()
+        next_seal = int(sealed[-1].rsplit(".", 2)[1]) + 1 if sealed else 0
+        self.wal.seal(os.path.join(self.data_dir, f"wal.{next_seal}.sealed"))
+        # Tombstoned rows are left out, so a snapshot is also a purge
+        live = db.vectors.live_mask()
+        live_rows = np.arange(len(db.vectors)) if live is None else np.flatnonzero(live)
+        return {"seal": next_seal, "live_rows": live_rows, "started": time.perf_counter()}
+
+    def build_snapshot(self, db, job: dict) -> dict:
+        """Write the captured rows to snapshot.tmp/, only reading the store"""
+        tmp_dir = self.snapshot_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        store = db.vectors
+        live_rows = job["live_rows"]
+        rows = live_rows.shape[0]
+        ids = [store.ids[row] for row in live_rows.tolist()]
+        matrix = np.lib.format.open_memmap(os.path.join(tmp_dir, "vectors.npy"), mode="w+",
+                                           dtype=np.float32, shape=(rows, store.dimension or 0))
+        for block_start in range(0, rows, SNAPSHOT_BLOCK_ROWS):
+            block = live_rows[block_start:block_start + SNAPSHOT_BLOCK_ROWS]
+            # Prefer the exact side store over decoding lossy codes
+            matrix[block_start:block_start + block.shape[0]] = (
+                store.full_precision.rows(block) if store.full_precision is not None else store.vectors_at(block)
+            )
+        matrix.flush()
+        del matrix
+        with open(os.path.join(tmp_dir, "metadata.json"), "w") as f:
+            json.dump({"version": 1, "ids": ids, "metadata": [db.metadata.at_row(row) for row in live_rows.tolist()]}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        return job
+
+    def commit_snapshot(self, job: dict) -> dict:
+        """Swap the written snapshot in and delete the sealed logs it covers"""
+        tmp_dir = self.snapshot_dir + ".tmp"
+        old_dir = self.snapshot_dir + ".old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(self.snapshot_dir):
+            os.replace(self.snapshot_dir, old_dir)
+        os.replace(tmp_dir, self.snapshot_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        for path in self._sealed_logs():
+            if int(path.rsplit(".", 2)[1]) <= job["seal"]:
+                os.remove(path)
+
+        self.last_snapshot = {"rows": int(job["live_rows"].shape[0]), "seconds": time.perf_counter() - job["started"]}
+        return self.last_snapshot
+
+    def discard_snapshot(self, job: dict):
+        """Drop a snapshot that was not committed; its sealed logs are replayed until a later one lands"""
+        shutil.rmtree(self.snapshot_dir + ".tmp", ignore_errors=True)
+
+    def snapshot(self, db) -> dict:
+        """Write a compacted snapshot of db and truncate the WAL it covers"""
+        job = self.start_snapshot(db)
+        return self.commit_snapshot(self.build_snapshot(db, job))
+
+    def recover(self, db) -> dict:
+        """Load the latest snapshot into an empty db, then replay the WAL tail"""
+        start = time.perf_counter()
+        snapshot_dir = self.snapshot_dir
+        if not os.path.exists(snapshot_dir) and os.path.exists(snapshot_dir + ".old"):
+            # Crashed between the two renames of a snapshot swap
+            snapshot_dir = snapshot_dir + ".old"
+
+        snapshot_rows = 0
+        if os.path.exists(os.path.join(snapshot_dir, "metadata.json")):
+            with open(os.path.join(snapshot_dir, "metadata.json")) as f:
+                snapshot = json.load(f)
+            matrix = np.load(os.path.join(snapshot_dir, "vectors.npy"), mmap_mode="r")
+            ids, metadata = snapshot["ids"], snapshot["metadata"]
+            for block_start in range(0, len(ids), SNAPSHOT_BLOCK_ROWS):
+                block = slice(block_start, block_start + SNAPSHOT_BLOCK_ROWS)
+                db.restore_rows(ids[block], np.asarray(matrix[block]), metadata[block])
+            snapshot_rows = len(ids)
+        snapshot_seconds = time.perf_counter() - start
+
+        wal_records = 0
+        for path in self._sealed_logs() + [self.wal.path]:
+            for op, record, vector in WriteAheadLog.replay(path):
+                if op == OP_ADD:
+                    embedding_id = record.pop("id")
+                    db.apply_add(embedding_id, vector, record)
+                    wal_records += 1
+                elif op == OP_ADD_BATCH:
+                    ids = record["ids"]
+                    db.apply_add_batch(ids, vector.reshape(len(ids), -1), record["metadata"])
+                    wal_records += len(ids)
+                elif op == OP_DELETE_TASK:
+                    db.apply_delete_task(record["task_id"])
+                    wal_records += 1
+        self.wal.records_since_snapshot = wal_records
+
+        return {
+            "snapshot_rows": snapshot_rows,
+            "wal_records": wal_records,
+            "snapshot_seconds": snapshot_seconds,
+            "total_seconds": time.perf_counter() - start
+        }
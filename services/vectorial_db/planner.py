@@ -0,0 +1,43 @@
+import math
+
+PLAN_EMPTY = "empty"
+PLAN_ANN = "ann"
+PLAN_SLICES = "slices"
+PLAN_MASK = "mask"
+PLAN_GATHER = "gather"
+
+
+class QueryPlanner:
+    """
+    Picks the execution strategy for a task-filtered search.
+
+    - ann:    the filter keeps a large share of the corpus, so the ANN index
+              is queried with enough over-fetch to survive post-filtering
+    - slices: the filtered rows form few contiguous ranges, scanned in place
+    - mask:   the rows are fragmented and cover most of the corpus; one
+              full scan with the others masked out is cheaper than copying
+    - gather: fragmented rows; copy them out and score the copy
+    """
+
+    def __init__(self, ann_min_selectivity: float = 0.3, max_slices: int = 256,
+                 mask_min_selectivity: float = 0.5, ann_overfetch: float = 2.0):
+        self.ann_min_selectivity = ann_min_selectivity
+        self.max_slices = max_slices
+        self.mask_min_selectivity = mask_min_selectivity
+        self.ann_overfetch = ann_overfetch
+
+    def plan(self, total_rows: int, filtered_rows: int, n_ranges: int, index_trained: bool) -> str:
+        if filtered_rows == 0:
+            return PLAN_EMPTY
+        selectivity = filtered_rows / total_rows
+        if index_trained and selectivity >= self.ann_min_selectivity:
+            return PLAN_ANN
+        if n_ranges <= self.max_slices:
+            return PLAN_SLICES
+        if selectivity >= self.mask_min_selectivity:
+            return PLAN_MASK
+        return PLAN_GATHER
+
+    def ann_top_k(self, top_k: int, total_rows: int, filtered_rows: int) -> int:
+        """Candidates to request from the index so about top_k survive the filter"""
+        return min(total_rows, math.ceil(top_k * total_rows / filtered_rows * self.ann_overfetch))
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, List, Optional, Tuple
+
+import numpy as np
+
+# Normalized components are rounded to multiples of 2**-QUERY_QUANTIZATION_BITS, so
+# float64 and float32 copies of one query share a key; two queries that differ by less
+# than that per component may also share one, but their rankings are indistinguishable
+QUERY_QUANTIZATION_BITS = 14
+
+
+def query_key(query_vector, top_k: int, task_ids: Optional[List[str]] = None,
+              nprobe: Optional[int] = None, ef_search: Optional[int] = None, where: Optional[dict] = None) -> Tuple:
+    """Cache key: a digest of the quantized, normalized query plus everything else that shapes the answer"""
+    query = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(query)
+    if norm > 0:
+        query = query / norm
+    quantized = np.round(query * (1 << QUERY_QUANTIZATION_BITS)).astype(np.int16)
+    digest = hashlib.blake2b(quantized.tobytes(), digest_size=16).digest()
+    tasks = tuple(sorted(set(task_ids))) if task_ids else None
+    if where is None:
+        return digest, top_k, tasks, nprobe, ef_search
+    return digest, top_k, tasks, nprobe, ef_search, json.dumps(where, sort_keys=True)
+
+
+class SearchResultCache:
+    """
+    LRU + TTL cache of search results, validated by version rather than flushed.
+
+    Every entry is stored with the version of the data it was computed from
+    (the database's per-task generation counters for a filtered query, its
+    global generation for an unfiltered one). A lookup whose version no
+    longer matches is a miss and drops the entry, so writes to one task never
+    evict cached answers scoped to other tasks.
+
+    Cached result lists are shared between callers and must not be mutated.
+    Safe to use from several search threads.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._entries: "OrderedDict[Tuple, Tuple[Hashable, float, List[dict]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.expirations = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Tuple, version: Hashable) -> Optional[List[dict]]:
+        with self._lock:
+            return self._get(key, version)
+
+    def _get(self, key: Tuple, version: Hashable) -> Optional[List[dict]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        entry_version, stored_at, results = entry
+        if entry_version != version:
+            self.invalidations += 1
+        elif time.monotonic() - stored_at > self.ttl:
+            self.expirations += 1
+        else:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return results
+        del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: Tuple, version: Hashable, results: List[dict]):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (version, time.monotonic(), results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "expirations": self.expirations,
+            "evictions": self.evictions
+        }
@@ -0,0 +1,193 @@
+import glob
+import os
+from typing import Iterator, List, Optional, Tuple
+import numpy as np
+
+from services.vectorial_db.store import VectorStore
+
+SEGMENT_FILE_PATTERN = "segment_*.bin"
+
+
+class SegmentedVectorStore(VectorStore):
+    """
+    VectorStore whose rows are split into fixed-size segments.
+
+    Only the active (write) segment is a heap array. When it fills up it is
+    sealed: written to `segment_dir` and reopened as an np.memmap, so sealed
+    rows cost page cache instead of heap and the kernel can evict them under
+    memory pressure. Row numbers stay global (row // segment_rows picks the
+    segment), so ANN indexes and the id <-> row map are unaffected.
+
+    A full scan visits the segments in order, scoring each through the codec
+    (which blocks internally to stay in cache) and merging its top-k into the
+    running best, so a query reads the files sequentially and holds one
+    segment's scores at a time.
+
+    Segment files are scratch space rebuilt from the WAL/snapshot on start,
+    so any left over from a previous process are removed.
+    """
+
+    def __init__(self, segment_dir: str, segment_rows: int = 65536, dimension: Optional[int] = None,
+                 codec=None, codec_train_threshold: int = 10000, rerank_factor: int = 0,
+                 rerank_path: Optional[str] = None, scan_threads: int = 1, parallel_min_rows: int = 32768):
+        # Lossy codecs must be trained before the first segment is sealed in its final format
+        super().__init__(dimension=dimension, initial_capacity=segment_rows, codec=codec,
+                         codec_train_threshold=min(codec_train_threshold, segment_rows),
+                         rerank_factor=rerank_factor, rerank_path=rerank_path,
+                         scan_threads=scan_threads, parallel_min_rows=parallel_min_rows)
+        self.segment_dir = segment_dir
+        self.segment_rows = segment_rows
+        self.segments: List[np.memmap] = []
+        # Bumped by reorder() and rewrites, which write a fresh set of segment files
+        self._generation = 0
+        os.makedirs(segment_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(segment_dir, SEGMENT_FILE_PATTERN)):
+            os.remove(path)
+
+    @property
+    def _active_start(self) -> int:
+        return len(self.segments) * self.segment_rows
+
+    @property
+    def codes(self) -> np.ndarray:
+        """Every populated row as stored; a copy, since segments are not contiguous"""
+        blocks = [codes for _, codes in self._scan_blocks()]
+        if not blocks:
+            return super().codes
+        return np.concatenate(blocks)
+
+    def memory_bytes(self) -> int:
+        """Heap bytes of the active segment (sealed segments are memory-mapped)"""
+        active_rows = self._size - self._active_start
+        in_heap = self.full_precision is not None and self.rerank_path is None
+        active = self._matrix[:active_rows].nbytes if self._matrix is not None else 0
+        return active + (self._size * (self.dimension or 0) * 4 if in_heap else 0)
+
+    def mapped_bytes(self) -> int:
+        """Bytes of sealed segments, paged in from disk on demand"""
+        return sum(segment.nbytes for segment in self.segments)
+
+    def _segment(self, index: int) -> np.ndarray:
+        return self.segments[index] if index < len(self.segments) else self._matrix
+
+    def _codes_at(self, rows) -> np.ndarray:
+        if isinstance(rows, (int, np.integer)):
+            segment, offset = divmod(int(rows), self.segment_rows)
+            return self._segment(segment)[offset]
+        rows = np.arange(self._size)[rows] if isinstance(rows, slice) else np.asarray(rows, dtype=np.int64)
+        return self._gather(self.segments + [self._matrix], rows)
+
+    def _gather(self, buffers: List[np.ndarray], rows: np.ndarray) -> np.ndarray:
+        """Codes of `rows` from a list of per-segment buffers, reading each segment once"""
+        out = np.empty((rows.shape[0], buffers[0].shape[1]), dtype=buffers[0].dtype)
+        segment_of = rows // self.segment_rows
+        for segment in np.unique(segment_of):
+            mask = segment_of == segment
+            out[mask] = buffers[int(segment)][rows[mask] - segment * self.segment_rows]
+        return out
+
+    def _write_rows(self, start: int, codes: np.ndarray):
+        written = 0
+        while written < codes.shape[0]:
+            segment, offset = divmod(start + written, self.segment_rows)
+            count = min(codes.shape[0] - written, self.segment_rows - offset)
+            self._segment(segment)[offset:offset + count] = codes[written:written + count]
+            written += count
+
+    def _scan_blocks(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[int, np.ndarray]]:
+        stop = self._size if stop is None else stop
+        while start < stop:
+            segment, offset = divmod(start, self.segment_rows)
+            count = min(stop - start, self.segment_rows - offset)
+            yield start, self._segment(segment)[offset:offset + count]
+            start += count
+
+    def _ensure_capacity(self, extra_rows: int):
+        """Callers never write past the active segment; a full one is sealed first"""
+        if self._matrix is not None and self._size == self._active_start + self.segment_rows:
+            self._seal()
+        if self._matrix is None:
+            dtype, width = self._storage_layout()
+            self._matrix = np.empty((self.segment_rows, width), dtype=dtype)
+
+    def _seal(self):
+        path = os.path.join(self.segment_dir, f"segment_{self._generation:04d}_{len(self.segments):06d}.bin")
+        segment = np.memmap(path, dtype=self._matrix.dtype, mode="w+", shape=self._matrix.shape)
+        segment[:] = self._matrix
+        segment.flush()
+        self.segments.append(segment)
+        self._matrix = None
+
+    def _permute_codes(self, order: np.ndarray):
+        """Rewrite every row into a new generation of segments, then drop the old files"""
+        old_buffers = self.segments + [self._matrix]
+        old_paths = [segment.filename for segment in self.segments]
+        size = self._size
+        self.segments, self._matrix, self._size = [], None, 0
+        self._generation += 1
+        for start in range(0, size, self.segment_rows):
+            block = order[start:start + self.segment_rows]
+            self._ensure_capacity(block.shape[0])
+            self._write_rows(start, self._gather(old_buffers, block))
+            self._size += block.shape[0]
+        del old_buffers
+        for path in old_paths:
+            os.remove(path)
+
+    def _rewrite_codes(self, keep: np.ndarray, codec=None) -> dict:
+        """Write rows `keep` (re-encoded through `codec` if given) as a new generation of segments"""
+        generation = self._generation + 1
+        dtype, width = self._storage_layout(codec)
+        buffers = self.segments + [self._matrix]
+        segments = []
+        sealed_rows = keep.shape[0] - keep.shape[0] % self.segment_rows
+        for start in range(0, sealed_rows, self.segment_rows):
+            path = os.path.join(self.segment_dir, f"segment_{generation:04d}_{len(segments):06d}.bin")
+            segment = np.memmap(path, dtype=dtype, mode="w+", shape=(self.segment_rows, width))
+            segment[:] = self._recoded(buffers, keep[start:start + self.segment_rows], codec)
+            segment.flush()
+            segments.append(segment)
+        active = None
+        if keep.shape[0] > sealed_rows:
+            active = np.empty((self.segment_rows, width), dtype=dtype)
+            active[:keep.shape[0] - sealed_rows] = self._recoded(buffers, keep[sealed_rows:], codec)
+        return {"generation": generation, "segments": segments, "active": active}
+
+    def _recoded(self, buffers: List[np.ndarray], rows: np.ndarray, codec) -> np.ndarray:
+        if codec is None:
+            return self._gather(buffers, rows)
+        return self._rewritten_rows(rows, codec)
+
+    def _install_codes(self, codes: dict):
+        old_paths = [segment.filename for segment in self.segments]
+        self.segments, self._matrix, self._generation = codes["segments"], codes["active"], codes["generation"]
+        for path in old_paths:
+            os.remove(path)
+
+    def _discard_codes(self, codes: dict):
+        for segment in codes["segments"]:
+            os.remove(segment.filename)
+
+    def _append_codes(self, codes: np.ndarray, full: Optional[np.ndarray]):
+        """Split at segment boundaries, like add_batch"""
+        start = 0
+        while start < codes.shape[0]:
+            room = self.segment_rows - (self._size - self._active_start) or self.segment_rows
+            stop = start + room
+            super()._append_codes(codes[start:stop], None if full is None else full[start:stop])
+            start = stop
+
+    def add_batch(self, embedding_ids: List[str], vectors) -> np.ndarray:
+        """add_batch split at segment boundaries, so each part lands in one active segment"""
+        block = np.asarray(vectors, dtype=np.float32)
+        self._check_batch(embedding_ids, block)
+        rows = []
+        start = 0
+        while start < block.shape[0]:
+            room = self.segment_rows - (self._size - self._active_start)
+            if room == 0:
+                room = self.segment_rows
+            stop = start + room
+            rows.append(super().add_batch(embedding_ids[start:stop], block[start:stop]))
+            start = stop
+        return np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
@@ -0,0 +1,313 @@
+import glob
+import json
+import os
+import pickle
+import shutil
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from services.vectorial_db.codecs import SCAN_BLOCK_ROWS
+from services.vectorial_db.filters import mask_ranges
+from services.vectorial_db.metadata import timestamp_iso
+from services.vectorial_db.store import VectorStore
+
+HEADER_FILE = "header.json"
+CONTROL_FILE = "control.bin"
+# Columns with one value per store row (codes and full-precision rows are 2-D, typed per generation)
+ROW_COLUMNS = {"task": np.int32, "model": np.uint16, "timestamp": np.int64, "dead": np.bool_, "record_end": np.int64}
+# A reader re-reads the header this many times when the writer starts a new generation under it
+REFRESH_MAX_ATTEMPTS = 3
+# Task-filtered reads scan up to this many row ranges in place, and mask a full scan beyond
+MAX_SLICES = 256
+
+
+def column_path(directory: str, name: str, generation: int) -> str:
+    return os.path.join(directory, f"{name}.{generation}.bin")
+
+
+class SharedStorePublisher:
+    """
+    Single writer of a read-only mirror of a VectorDatabase in shared memory.
+
+    Everything a flat search reads is published as files in `directory`
+    (a tmpfs such as /dev/shm, so any process can map them without a copy):
+    the stored codes and the full-precision rows kept for re-ranking, the
+    numeric metadata columns, tombstones, and one JSON record per row
+    ([embedding id, chunk id, attributes]) in an append-only blob that
+    readers only decode for the rows they return.
+
+    Appended rows are copied incrementally into files grown by doubling,
+    like the store itself. A change to existing rows (overwrite, compaction,
+    purge, codec training or refit) starts a new generation of files copied
+    in full; deletes only rewrite the tombstones. Each publish replaces
+    header.json (sizes, generation, task and model names) and then bumps the
+    counter in control.bin, which readers check with one memory read.
+    """
+
+    def __init__(self, directory: str, initial_capacity: int = 1024):
+        self.directory = directory
+        self.initial_capacity = initial_capacity
+        # Files are scratch space rebuilt from the live database, so any left over are removed
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        self.generation = 0
+        self.layout: Optional[tuple] = None
+        self.rows = 0
+        self.dead_rows = 0
+        self.capacity = 0
+        self.record_bytes = 0
+        self.record_capacity = 0
+        self.columns: Dict[str, np.memmap] = {}
+        self.publishes = 0
+        self.full_publishes = 0
+        self._control = np.memmap(os.path.join(directory, CONTROL_FILE), dtype=np.int64, mode="w+", shape=(1,))
+        self._write_header({"generation": 0, "rows": 0})
+
+    def publish(self, db) -> bool:
+        """
+        Bring the mirror up to date with `db`; False when nothing changed
+        since the last publish. Only rows whose metadata is registered are
+        copied, so a publish in a worker thread can race an ingest on the
+        event loop: rows appended meanwhile go out with the next publish.
+        """
+        store = db.vectors
+        size = min(db.registered_rows, len(store))
+        layout = (store.layout_version, store.encoded)
+        dead_rows = store.dead_rows
+        if store.dimension is None or (layout == self.layout and size == self.rows
+                                       and dead_rows == self.dead_rows):
+            return False
+        if layout != self.layout:
+            self._start_generation(store, layout, size)
+        if size > self.rows:
+            self._append(db, self.rows, size)
+        if dead_rows != self.dead_rows:
+            live = store.live_mask()
+            self.columns["dead"][:size] = False if live is None else ~live[:size]
+        self.rows = size
+        self.dead_rows = dead_rows
+        self._write_header({
+            "generation": self.generation,
+            "rows": size,
+            "dead_rows": self.dead_rows,
+            "capacity": self.capacity,
+            "record_capacity": self.record_capacity,
+            "dimension": store.dimension,
+            "codes_dtype": self.columns["codes"].dtype.str,
+            "codes_width": self.columns["codes"].shape[1],
+            "full_precision": "full" in self.columns,
+            "rerank_factor": store.rerank_factor,
+            "tasks": list(db.metadata.tasks.values),
+            "models": list(db.metadata.models.values)
+        })
+        self._control[0] += 1
+        self.publishes += 1
+        return True
+
+    def _start_generation(self, store, layout: tuple, size: int):
+        old = self.generation
+        self.generation += 1
+        self.layout = layout
+        self.rows = self.dead_rows = self.record_bytes = 0
+        self.capacity = self.record_capacity = 0
+        sample = store.stored_rows(0, min(size, 1))
+        self.columns = {}
+        self._grow(store, size, 0, sample.dtype, sample.shape[1])
+        with open(os.path.join(self.directory, f"codec.{self.generation}.pkl"), "wb") as f:
+            pickle.dump(store.codec, f)
+        self.full_publishes += 1
+        # Readers still on the old generation keep their mappings; unlinking only frees them once unmapped
+        for path in glob.glob(os.path.join(self.directory, f"*.{old}.*")):
+            os.remove(path)
+
+    def _map(self, name: str, dtype, shape: tuple) -> np.memmap:
+        path = column_path(self.directory, name, self.generation)
+        with open(path, "ab") as f:
+            f.truncate(int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+    def _grow(self, store, rows: int, record_bytes: int, codes_dtype=None, codes_width: Optional[int] = None):
+        """Extend the files in place (new rows read as zeros) so they hold `rows` rows and `record_bytes`"""
+        if rows > self.capacity or not self.columns:
+            capacity = max(self.capacity, self.initial_capacity)
+            while capacity < rows:
+                capacity *= 2
+            self.capacity = capacity
+            codes = self.columns.get("codes")
+            self.columns["codes"] = self._map("codes", codes_dtype or codes.dtype,
+                                              (capacity, codes_width or codes.shape[1]))
+            if store.full_precision is not None:
+                self.columns["full"] = self._map("full", np.float32, (capacity, store.dimension))
+            for name, dtype in ROW_COLUMNS.items():
+                self.columns[name] = self._map(name, dtype, (capacity,))
+        if record_bytes > self.record_capacity or "records" not in self.columns:
+            capacity = max(self.record_capacity, self.initial_capacity * 64)
+            while capacity < record_bytes:
+                capacity *= 2
+            self.record_capacity = capacity
+            self.columns["records"] = self._map("records", np.uint8, (capacity,))
+
+    def _append(self, db, start: int, stop: int):
+        store = db.vectors
+        columns = db.metadata.column_slice(start, stop)
+        records = [
+            json.dumps([embedding_id, chunk_id, attributes], separators=(",", ":")).encode("utf-8")
+            for embedding_id, chunk_id, attributes in zip(store.ids[start:stop], columns["chunk"],
+                                                          columns["attributes"])
+        ]
+        ends = self.record_bytes + np.cumsum([len(record) for record in records], dtype=np.int64)
+        self._grow(store, stop, int(ends[-1]))
+        self.columns["records"][self.record_bytes:ends[-1]] = np.frombuffer(b"".join(records), dtype=np.uint8)
+        self.columns["record_end"][start:stop] = ends
+        for name in ("task", "model", "timestamp"):
+            self.columns[name][start:stop] = columns[name]
+        for block_start in range(start, stop, SCAN_BLOCK_ROWS):
+            block_stop = min(block_start + SCAN_BLOCK_ROWS, stop)
+            self.columns["codes"][block_start:block_stop] = store.stored_rows(block_start, block_stop)
+            if "full" in self.columns:
+                self.columns["full"][block_start:block_stop] = store.full_precision.rows(slice(block_start, block_stop))
+        self.record_bytes = int(ends[-1])
+
+    def _write_header(self, header: dict):
+        path = os.path.join(self.directory, HEADER_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump(header, f)
+        os.replace(path + ".tmp", path)
+
+    def close(self):
+        self.columns = {}
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def get_stats(self) -> dict:
+        return {
+            "directory": self.directory,
+            "generation": self.generation,
+            "rows": self.rows,
+            "publishes": self.publishes,
+            "full_publishes": self.full_publishes,
+            "mapped_bytes": sum(column.nbytes for column in self.columns.values())
+        }
+
+
+class SharedStoreReader:
+    """
+    Read-only view of what a SharedStorePublisher published, for search
+    processes. Every search first compares the publisher's counter with the
+    last one seen; when it moved, the header is re-read and the files are
+    remapped if the generation or their capacity changed. Searches are the
+    exact scans of VectorStore over the mapped codes, so results match the
+    writer's flat search.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._control = np.memmap(os.path.join(directory, CONTROL_FILE), dtype=np.int64, mode="r", shape=(1,))
+        self.seen = -1
+        self.header: dict = {"generation": 0, "rows": 0}
+        self.mapped: Optional[tuple] = None
+        self.columns: Dict[str, np.memmap] = {}
+        self.store: Optional[VectorStore] = None
+        self.task_codes: Dict[str, int] = {}
+
+    def refresh(self):
+        seen = int(self._control[0])
+        if seen == self.seen:
+            return
+        for attempt in range(REFRESH_MAX_ATTEMPTS):
+            with open(os.path.join(self.directory, HEADER_FILE)) as f:
+                header = json.load(f)
+            try:
+                self._attach(header)
+                break
+            except FileNotFoundError:
+                # The writer moved to a newer generation between the header and its files
+                if attempt == REFRESH_MAX_ATTEMPTS - 1:
+                    raise
+        self.header = header
+        self.seen = seen
+        self.task_codes = {task_id: code for code, task_id in enumerate(header.get("tasks", []))}
+
+    def _attach(self, header: dict):
+        if not header["rows"]:
+            self.store = None
+            return
+        key = (header["generation"], header["capacity"], header["record_capacity"])
+        if key != self.mapped:
+            generation, capacity = header["generation"], header["capacity"]
+            columns = {name: np.memmap(column_path(self.directory, name, generation), dtype=dtype, mode="r",
+                                       shape=(capacity,))
+                       for name, dtype in ROW_COLUMNS.items()}
+            columns["codes"] = np.memmap(column_path(self.directory, "codes", generation),
+                                         dtype=np.dtype(header["codes_dtype"]), mode="r",
+                                         shape=(capacity, header["codes_width"]))
+            if header["full_precision"]:
+                columns["full"] = np.memmap(column_path(self.directory, "full", generation), dtype=np.float32,
+                                            mode="r", shape=(capacity, header["dimension"]))
+            columns["records"] = np.memmap(column_path(self.directory, "records", generation), dtype=np.uint8,
+                                           mode="r", shape=(header["record_capacity"],))
+            with open(os.path.join(self.directory, f"codec.{generation}.pkl"), "rb") as f:
+                codec = pickle.load(f)
+            self.store = VectorStore(dimension=header["dimension"], codec=codec,
+                                     rerank_factor=header["rerank_factor"])
+            self.columns = columns
+            self.mapped = key
+        self.store.attach(self.columns["codes"], header["rows"], self.columns["dead"], header["dead_rows"],
+                          self.columns.get("full"))
+
+    def search(self, query_vector, top_k: int, task_ids: Optional[List[str]] = None) -> List[dict]:
+        self.refresh()
+        store, rows = self.store, self.header["rows"]
+        if store is None or rows == self.header["dead_rows"]:
+            return []
+        live = store.live_mask()
+        if not task_ids:
+            top_rows, scores = store.search(query_vector, top_k, mask=live)
+            return self._format_results(top_rows, scores)
+        codes = [self.task_codes[task_id] for task_id in set(task_ids) if task_id in self.task_codes]
+        mask = np.isin(self.columns["task"][:rows], codes)
+        if live is not None:
+            mask &= live
+        ranges = mask_ranges(mask)
+        if not ranges:
+            return []
+        if len(ranges) <= MAX_SLICES:
+            top_rows, scores = store.search(query_vector, top_k, ranges=ranges)
+        else:
+            top_rows, scores = store.search(query_vector, top_k, mask=mask)
+        return self._format_results(top_rows, scores)
+
+    def _format_results(self, top_rows: np.ndarray, scores: np.ndarray) -> List[dict]:
+        """The writer's result dicts, decoding only the returned rows' records"""
+        header, columns = self.header, self.columns
+        ends = columns["record_end"]
+        results = []
+        for row, score in zip(top_rows.tolist(), scores.tolist()):
+            start = int(ends[row - 1]) if row else 0
+            embedding_id, chunk_id, attributes = json.loads(columns["records"][start:int(ends[row])].tobytes())
+            metadata = {
+                "chunk_id": chunk_id,
+                "task_id": header["tasks"][columns["task"][row]],
+                "model_name": header["models"][columns["model"][row]],
+                "dimension": header["dimension"],
+                "timestamp": timestamp_iso(columns["timestamp"][row])
+            }
+            if attributes:
+                metadata["metadata"] = attributes
+            results.append({"embedding_id": embedding_id, "score": score, "metadata": metadata})
+        return results
+
+
+# The reader of a search process, set up by attach_reader()
+_reader: Optional[SharedStoreReader] = None
+
+
+def attach_reader(directory: str):
+    """ProcessPoolExecutor initializer: map the published store in this worker process"""
+    global _reader
+    _reader = SharedStoreReader(directory)
+
+
+def search_shared_store(query_vector: List[float], top_k: int, task_ids: Optional[List[str]] = None) -> List[dict]:
+    """Flat search run in a process set up by attach_reader()"""
+    return _reader.search(query_vector, top_k, task_ids)
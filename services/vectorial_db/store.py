@@ -0,0 +1,740 @@
+import copy
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+
+from services.vectorial_db.codecs import Float32Codec, SCAN_BLOCK_ROWS
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize each row of a 2-D float32 array (zero rows stay zero)"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """
+    Indices of the top_k highest scores, best first.
+
+    Uses argpartition so only the selected k values are sorted: O(N + k log k)
+    instead of the O(N log N) of a full argsort.
+    """
+    n = scores.shape[0]
+    k = min(top_k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(n)
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def top_k_indices_batch(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Row-wise top_k_indices for a (queries, n) score matrix; returns (queries, k), best first"""
+    n = scores.shape[1]
+    k = min(top_k, n)
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(n), scores.shape)
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+class FullPrecisionStore:
+    """
+    Growable float32 matrix kept beside lossy codes for exact re-ranking.
+
+    Rows are aligned with the VectorStore rows. When a path is given the
+    matrix lives in a memory-mapped file, so it costs page cache rather than
+    heap and only the re-ranked candidates are ever read back.
+    """
+
+    def __init__(self, dimension: int, path: Optional[str] = None, initial_capacity: int = 1024,
+                 matrix: Optional[np.ndarray] = None):
+        self.dimension = dimension
+        self.path = path
+        # An existing matrix (a read-only mapping of another process's rows) is used as is
+        self._matrix = matrix if matrix is not None else self._allocate(initial_capacity)
+
+    def _allocate(self, capacity: int) -> np.ndarray:
+        if self.path is None:
+            return np.empty((capacity, self.dimension), dtype=np.float32)
+        with open(self.path, "ab") as f:
+            f.truncate(capacity * self.dimension * 4)
+        return np.memmap(self.path, dtype=np.float32, mode="r+", shape=(capacity, self.dimension))
+
+    def write(self, start: int, vectors: np.ndarray):
+        required = start + vectors.shape[0]
+        capacity = self._matrix.shape[0]
+        if required > capacity:
+            while capacity < required:
+                capacity *= 2
+            if self.path is None:
+                grown = self._allocate(capacity)
+                grown[:start] = self._matrix[:start]
+                self._matrix = grown
+            else:
+                self._matrix.flush()
+                self._matrix = self._allocate(capacity)
+        self._matrix[start:required] = vectors
+
+    def rows(self, rows) -> np.ndarray:
+        return np.asarray(self._matrix[rows])
+
+    def permute(self, order: np.ndarray):
+        """Reorder the first len(order) rows: new row i holds what was row order[i]"""
+        if self.path is None:
+            self._matrix[:order.shape[0]] = self._matrix[order]
+            return
+        tmp_path = self.path + ".tmp"
+        permuted = np.memmap(tmp_path, dtype=np.float32, mode="w+", shape=self._matrix.shape)
+        for start in range(0, order.shape[0], SCAN_BLOCK_ROWS):
+            block = order[start:start + SCAN_BLOCK_ROWS]
+            permuted[start:start + block.shape[0]] = self._matrix[block]
+        permuted.flush()
+        del permuted
+        os.replace(tmp_path, self.path)
+        self._matrix = np.memmap(self.path, dtype=np.float32, mode="r+", shape=self._matrix.shape)
+
+    def rewritten(self, keep: np.ndarray) -> np.ndarray:
+        """Rows `keep` copied into a fresh matrix (a side file when memory-mapped), for install()"""
+        shape = (max(self._matrix.shape[0], keep.shape[0]), self.dimension)
+        if self.path is None:
+            target = np.empty(shape, dtype=np.float32)
+        else:
+            target = np.memmap(self.path + ".rewrite", dtype=np.float32, mode="w+", shape=shape)
+        for start in range(0, keep.shape[0], SCAN_BLOCK_ROWS):
+            block = keep[start:start + SCAN_BLOCK_ROWS]
+            target[start:start + block.shape[0]] = self._matrix[block]
+        if self.path is not None:
+            target.flush()
+        return target
+
+    def install(self, matrix: np.ndarray):
+        if self.path is None:
+            self._matrix = matrix
+            return
+        shape = matrix.shape
+        del matrix
+        os.replace(self.path + ".rewrite", self.path)
+        self._matrix = np.memmap(self.path, dtype=np.float32, mode="r+", shape=shape)
+
+    def discard(self, matrix: np.ndarray):
+        if self.path is not None:
+            del matrix
+            os.remove(self.path + ".rewrite")
+
+
+class VectorStore:
+    """
+    Contiguous, growable matrix of L2-normalized vectors, stored through a codec.
+
+    Rows are normalized once when added, so cosine similarity at query time is
+    a single pass over the codes. The matrix doubles its capacity when full
+    and keeps an id <-> row index alongside it.
+
+    Deleted rows are tombstoned rather than moved: scans mask them out until
+    a rewrite copies the live rows into fresh storage and drops them.
+
+    Codecs that need training (sq8, pq, binary, pca) keep rows as float32
+    until `codec_train_threshold` rows exist, then train on them and
+    re-encode. With `rerank_factor` > 0, a full-precision side store is kept
+    and the best top_k * rerank_factor candidates by codec score are
+    re-scored exactly; it also lets build_refit() retrain the codec on the
+    data stored since and re-encode every row.
+
+    Full scans of at least 2 * `parallel_min_rows` rows are cut into up to
+    `scan_threads` row ranges scored in parallel threads (BLAS and most
+    NumPy kernels release the GIL), and their partial top-k merged.
+    """
+
+    def __init__(self, dimension: Optional[int] = None, initial_capacity: int = 1024, codec=None,
+                 codec_train_threshold: int = 10000, rerank_factor: int = 0, rerank_path: Optional[str] = None,
+                 scan_threads: int = 1, parallel_min_rows: int = 32768):
+        self.dimension = dimension
+        self.initial_capacity = initial_capacity
+        self.codec = codec or Float32Codec()
+        self.codec_train_threshold = codec_train_threshold
+        self.rerank_factor = rerank_factor
+        self.rerank_path = rerank_path
+        self.full_precision: Optional[FullPrecisionStore] = None
+        self._matrix: Optional[np.ndarray] = None
+        self._size = 0
+        self.ids: List[str] = []
+        self.id_to_row: Dict[str, int] = {}
+        self.dead_rows = 0
+        self._tombstones = np.zeros(0, dtype=bool)
+        self._live_mask: Optional[np.ndarray] = None
+        self.scan_threads = max(1, scan_threads)
+        self.parallel_min_rows = parallel_min_rows
+        self._scan_pool: Optional[ThreadPoolExecutor] = None
+        # Rows the codec was last trained on (0 until it is)
+        self.codec_fit_rows = 0
+        # Bumped whenever existing rows change in place (overwrite, reorder,
+        # rewrite, codec training), so mirrors of the rows know to start over
+        self.layout_version = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, embedding_id: object) -> bool:
+        return embedding_id in self.id_to_row
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.ids)
+
+    def __getitem__(self, embedding_id: str) -> np.ndarray:
+        return self.vectors_at(self.id_to_row[embedding_id])
+
+    def keys(self) -> List[str]:
+        return list(self.ids)
+
+    @property
+    def encoded(self) -> bool:
+        """True once rows are held as codec codes (always true for codecs without training)"""
+        return self.codec.trained
+
+    @property
+    def codes(self) -> np.ndarray:
+        """View over the populated rows as stored: codes, or float32 before codec training (no copy)"""
+        if self._matrix is None:
+            return np.empty((0, self.dimension or 0), dtype=np.float32)
+        return self._matrix[:self._size]
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """Every populated row as normalized float32; a view for float32 storage, a decoded copy otherwise"""
+        return self.vectors_at(slice(0, self._size))
+
+    def vectors_at(self, rows) -> np.ndarray:
+        """Normalized float32 vectors for the given rows (decoded, so approximate for lossy codecs)"""
+        if self._matrix is None:
+            return np.empty((0, self.dimension or 0), dtype=np.float32)
+        codes = self._codes_at(rows)
+        if not self.encoded:
+            return codes
+        if codes.ndim == 1:
+            return self.codec.decode(codes.reshape(1, -1))[0]
+        return self.codec.decode(codes)
+
+    def memory_bytes(self) -> int:
+        """Heap bytes held by the populated rows (excludes memory-mapped side stores)"""
+        in_heap = self.full_precision is not None and self.rerank_path is None
+        return self.codes.nbytes + (self._size * (self.dimension or 0) * 4 if in_heap else 0)
+
+    def mapped_bytes(self) -> int:
+        """Bytes of rows held in memory-mapped files rather than heap"""
+        return 0
+
+    def _codes_at(self, rows) -> np.ndarray:
+        """Stored codes for a row, slice or array of rows"""
+        return self._matrix[rows]
+
+    def stored_rows(self, start: int, stop: int) -> np.ndarray:
+        """Rows start..stop-1 as stored: codes, or float32 before codec training"""
+        return self._codes_at(slice(start, stop))
+
+    def attach(self, codes: np.ndarray, size: int, tombstones: np.ndarray, dead_rows: int,
+               full_precision: Optional[np.ndarray] = None):
+        """
+        Serve searches from rows owned by another process (read-only mappings
+        of what it published): `codes` as stored, of which the first `size`
+        are populated, and tombstones for them. The store is read-only after.
+        """
+        self._matrix = codes
+        self._size = size
+        self._tombstones = tombstones
+        self.dead_rows = dead_rows
+        self._live_mask = None
+        self.full_precision = (FullPrecisionStore(self.dimension, matrix=full_precision)
+                               if full_precision is not None else None)
+
+    def _write_rows(self, start: int, codes: np.ndarray):
+        self._matrix[start:start + codes.shape[0]] = codes
+
+    def _scan_blocks(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[int, np.ndarray]]:
+        """(first row, codes) for consecutive blocks covering rows start..stop (default: every populated row)"""
+        stop = self._size if stop is None else stop
+        if stop > start:
+            yield start, self._matrix[start:stop]
+
+    def _storage_layout(self, codec=None):
+        codec = codec or self.codec
+        if codec.trained:
+            return codec.dtype, codec.code_width(self.dimension)
+        return np.float32, self.dimension
+
+    def _ensure_capacity(self, extra_rows: int):
+        required = self._size + extra_rows
+        dtype, width = self._storage_layout()
+        if self._matrix is None:
+            capacity = max(self.initial_capacity, required)
+            self._matrix = np.empty((capacity, width), dtype=dtype)
+            return
+        capacity = self._matrix.shape[0]
+        if required <= capacity:
+            return
+        while capacity < required:
+            capacity *= 2
+        grown = np.empty((capacity, width), dtype=dtype)
+        grown[:self._size] = self._matrix[:self._size]
+        self._matrix = grown
+
+    def _encode(self, normalized: np.ndarray) -> np.ndarray:
+        return self.codec.encode(normalized) if self.encoded else normalized
+
+    def codec_due(self, rows: int) -> bool:
+        """Whether holding `rows` rows makes the store train its codec, re-encoding every row in place"""
+        return not self.encoded and rows >= self.codec_train_threshold
+
+    def _maybe_train_codec(self):
+        if not self.codec_due(self._size):
+            return
+        raw = self._matrix[:self._size]
+        self.codec.train(raw)
+        dtype, width = self._storage_layout()
+        encoded = np.empty((self._matrix.shape[0], width), dtype=dtype)
+        for start in range(0, self._size, SCAN_BLOCK_ROWS):
+            stop = min(start + SCAN_BLOCK_ROWS, self._size)
+            encoded[start:stop] = self.codec.encode(raw[start:stop])
+        self._matrix = encoded
+        self.codec_fit_rows = self._size
+        self.layout_version += 1
+
+    def _check_dimension(self, dimension: int):
+        if self.dimension is None:
+            self.dimension = dimension
+        elif dimension != self.dimension:
+            raise ValueError(f"Vector dimension {dimension} does not match store dimension {self.dimension}")
+        if self.rerank_factor and self.full_precision is None and not isinstance(self.codec, Float32Codec):
+            self.full_precision = FullPrecisionStore(self.dimension, self.rerank_path, self.initial_capacity)
+
+    def add(self, embedding_id: str, vector) -> int:
+        """Normalize and append a vector, returning its row. Re-adding an id overwrites it in place."""
+        row_vector = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+        self._check_dimension(row_vector.shape[1])
+
+        normalized = normalize_rows(row_vector)
+        if embedding_id in self.id_to_row:
+            row = self.id_to_row[embedding_id]
+            self.layout_version += 1
+        else:
+            self._ensure_capacity(1)
+            row = self._size
+            self.ids.append(embedding_id)
+            self.id_to_row[embedding_id] = row
+            self._size += 1
+        self._write_rows(row, self._encode(normalized))
+        if self.full_precision is not None:
+            self.full_precision.write(row, normalized)
+        self._maybe_train_codec()
+        return row
+
+    def _check_batch(self, embedding_ids: List[str], block: np.ndarray):
+        if block.ndim != 2 or block.shape[0] != len(embedding_ids):
+            raise ValueError("vectors must be a 2-D array with one row per id")
+        self._check_dimension(block.shape[1])
+        if any(embedding_id in self.id_to_row for embedding_id in embedding_ids) or len(set(embedding_ids)) != len(embedding_ids):
+            raise ValueError("add_batch only accepts new, unique embedding ids")
+
+    def add_batch(self, embedding_ids: List[str], vectors) -> np.ndarray:
+        """Normalize and append a block of new vectors in one copy, returning their rows"""
+        block = np.asarray(vectors, dtype=np.float32)
+        self._check_batch(embedding_ids, block)
+
+        normalized = normalize_rows(block)
+        self._ensure_capacity(block.shape[0])
+        start = self._size
+        self._write_rows(start, self._encode(normalized))
+        if self.full_precision is not None:
+            self.full_precision.write(start, normalized)
+        for offset, embedding_id in enumerate(embedding_ids):
+            self.id_to_row[embedding_id] = start + offset
+        self.ids.extend(embedding_ids)
+        self._size += block.shape[0]
+        self._maybe_train_codec()
+        return np.arange(start, self._size)
+
+    def delete(self, embedding_ids) -> int:
+        """
+        Tombstone the rows of the given ids and return how many were live.
+        The rows stay in place, masked out of scans, until a rewrite drops
+        them; a deleted id can be added again as a new row.
+        """
+        rows = [self.id_to_row.pop(embedding_id) for embedding_id in embedding_ids if embedding_id in self.id_to_row]
+        if rows:
+            if self._tombstones.shape[0] < self._size:
+                grown = np.zeros(self._size, dtype=bool)
+                grown[:self._tombstones.shape[0]] = self._tombstones
+                self._tombstones = grown
+            self._tombstones[rows] = True
+            self.dead_rows += len(rows)
+            self._live_mask = None
+        return len(rows)
+
+    def live_mask(self) -> Optional[np.ndarray]:
+        """Boolean mask of the rows that are not tombstoned, or None when nothing is deleted"""
+        if not self.dead_rows:
+            return None
+        if self._live_mask is None or self._live_mask.shape[0] != self._size:
+            mask = np.ones(self._size, dtype=bool)
+            dead = self._tombstones[:self._size]
+            mask[:dead.shape[0]] = ~dead
+            self._live_mask = mask
+        return self._live_mask
+
+    def build_rewrite(self, keep: np.ndarray, size: int, tombstoned: Optional[np.ndarray] = None) -> dict:
+        """
+        Copy the rows `keep` (distinct, all below `size`), in that order, into
+        fresh storage without touching the live store. Rows flagged in the
+        `tombstoned` mask (aligned with `keep`) are copied but stay deleted.
+
+        Rows below `size` are only read, so this may run in a worker thread
+        while searches and appends continue; commit_rewrite() installs the
+        copy and carries over the rows appended in the meantime.
+        """
+        keep = np.asarray(keep, dtype=np.int64)
+        ids = [self.ids[row] for row in keep.tolist()]
+        if tombstoned is None or not tombstoned.any():
+            tombstoned = None
+        return {
+            "keep": keep,
+            "size": size,
+            "encoded": self.encoded,
+            "ids": ids,
+            "id_to_row": {embedding_id: row for row, embedding_id in enumerate(ids)
+                          if tombstoned is None or not tombstoned[row]},
+            "tombstoned": tombstoned,
+            "codes": self._rewrite_codes(keep),
+            "full_precision": self.full_precision.rewritten(keep) if self.full_precision is not None else None
+        }
+
+    def commit_rewrite(self, built: dict) -> Optional[np.ndarray]:
+        """
+        Install a build_rewrite() copy and return new_row_of (old row -> new
+        row, -1 for dropped rows). Returns None, discarding the copy, when the
+        storage layout changed underneath it (codec training).
+        """
+        if built["encoded"] != self.encoded or (built["full_precision"] is None) != (self.full_precision is None):
+            self.discard_rewrite(built)
+            return None
+        size, kept = built["size"], len(built["ids"])
+        tail = np.arange(size, self._size)
+        tail_codes = self._codes_at(tail)
+        tail_full = self.full_precision.rows(tail) if self.full_precision is not None else None
+        new_row_of = np.full(self._size, -1, dtype=np.int64)
+        new_row_of[built["keep"]] = np.arange(kept)
+        new_row_of[size:] = np.arange(kept, kept + tail.shape[0])
+
+        self.ids = built["ids"] + self.ids[size:]
+        self.id_to_row = built["id_to_row"]
+        for offset, embedding_id in enumerate(self.ids[kept:]):
+            self.id_to_row[embedding_id] = kept + offset
+        self._install_codes(built["codes"])
+        if self.full_precision is not None:
+            self.full_precision.install(built["full_precision"])
+        self._size = kept
+        tombstoned = built["tombstoned"]
+        self.dead_rows = 0 if tombstoned is None else int(tombstoned.sum())
+        self._tombstones = np.zeros(0, dtype=bool) if tombstoned is None else tombstoned.copy()
+        self._live_mask = None
+        self.layout_version += 1
+        if tail.shape[0]:
+            self._append_codes(tail_codes, tail_full)
+        return new_row_of
+
+    def discard_rewrite(self, built: dict):
+        self._discard_codes(built["codes"])
+        if built["full_precision"] is not None:
+            self.full_precision.discard(built["full_precision"])
+
+    def _rewrite_codes(self, keep: np.ndarray, codec=None):
+        """Rows `keep` copied into fresh storage, or re-encoded from full precision through `codec`"""
+        dtype, width = self._storage_layout(codec)
+        codes = np.empty((max(self.initial_capacity, keep.shape[0]), width), dtype=dtype)
+        for start in range(0, keep.shape[0], SCAN_BLOCK_ROWS):
+            block = keep[start:start + SCAN_BLOCK_ROWS]
+            codes[start:start + block.shape[0]] = self._rewritten_rows(block, codec)
+        return codes
+
+    def _rewritten_rows(self, rows: np.ndarray, codec=None) -> np.ndarray:
+        if codec is None:
+            return self._codes_at(rows)
+        return codec.encode(self.full_precision.rows(rows))
+
+    def can_refit(self) -> bool:
+        """True when the codec is trained and the exact rows to retrain it on are kept"""
+        return self.encoded and self.full_precision is not None and not isinstance(self.codec, Float32Codec)
+
+    def build_refit(self, size: int) -> dict:
+        """
+        Train a fresh copy of the codec on the full-precision rows below
+        `size` and re-encode them into new storage, without touching the
+        live store: like build_rewrite(), safe in a worker thread beside
+        searches and appends. commit_refit() installs the result.
+        """
+        codec = copy.deepcopy(self.codec)
+        rows = np.arange(size)
+        sample = getattr(codec, "sample_rows", 65536)
+        if size > sample:
+            rows = np.sort(np.random.default_rng(size).choice(size, sample, replace=False))
+        codec.train(self.full_precision.rows(rows))
+        return {"codec": codec, "size": size, "codes": self._rewrite_codes(np.arange(size), codec)}
+
+    def commit_refit(self, built: dict):
+        """Install a build_refit() copy; rows appended since are re-encoded with the new codec"""
+        size = built["size"]
+        tail = np.arange(size, self._size)
+        tail_codes = built["codec"].encode(self.full_precision.rows(tail)) if tail.shape[0] else None
+        self._install_codes(built["codes"])
+        self.codec = built["codec"]
+        self._size = size
+        if tail_codes is not None:
+            self._append_codes(tail_codes, None)
+        self.codec_fit_rows = size
+        self.layout_version += 1
+
+    def discard_refit(self, built: dict):
+        self._discard_codes(built["codes"])
+
+    def _install_codes(self, codes):
+        self._matrix = codes
+
+    def _discard_codes(self, codes):
+        pass
+
+    def _append_codes(self, codes: np.ndarray, full: Optional[np.ndarray]):
+        """Append already-encoded rows (ids are the caller's business)"""
+        self._ensure_capacity(codes.shape[0])
+        self._write_rows(self._size, codes)
+        if full is not None:
+            self.full_precision.write(self._size, full)
+        self._size += codes.shape[0]
+
+    def _permute_codes(self, order: np.ndarray):
+        self._matrix[:self._size] = self._matrix[order]
+
+    def reorder(self, order: np.ndarray):
+        """
+        Physically reorder the rows: new row i holds what was row order[i].
+
+        Callers must renumber anything that refers to rows (ANN indexes) with
+        the inverse permutation.
+        """
+        order = np.asarray(order, dtype=np.int64)
+        if order.shape[0] != self._size:
+            raise ValueError("order must be a permutation of every row")
+        self._permute_codes(order)
+        self.layout_version += 1
+        if self.full_precision is not None:
+            self.full_precision.permute(order)
+        self.ids = [self.ids[row] for row in order.tolist()]
+        if self.dead_rows:
+            self._tombstones = ~self.live_mask()[order]
+            self._live_mask = None
+            self.id_to_row = {embedding_id: row for row, embedding_id in enumerate(self.ids) if not self._tombstones[row]}
+        else:
+            self.id_to_row = {embedding_id: row for row, embedding_id in enumerate(self.ids)}
+
+    def prepare_query(self, query_vector) -> np.ndarray:
+        query = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+        if self.dimension is not None and query.shape[0] != self.dimension:
+            raise ValueError(f"Query dimension {query.shape[0]} does not match store dimension {self.dimension}")
+        norm = np.linalg.norm(query)
+        return query / norm if norm > 0 else query
+
+    def _score_codes(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        if not self.encoded:
+            return codes @ query
+        return self.codec.scores(query, codes)
+
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Similarity of a normalized query to all rows (or the given rows), estimated by the codec"""
+        if rows is not None:
+            return self._score_codes(query, self._codes_at(rows))
+        blocks = [self._score_codes(query, codes) for _, codes in self._scan_blocks()]
+        return np.concatenate(blocks) if blocks else np.empty(0, dtype=np.float32)
+
+    def _score_codes_batch(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        if not self.encoded:
+            return queries @ codes.T
+        return self.codec.scores_batch(queries, codes)
+
+    def _scan_spans(self) -> List[Tuple[int, int]]:
+        """Every populated row as one [start, stop) span per scan thread, or one span for small stores"""
+        parts = min(self.scan_threads, self._size // self.parallel_min_rows)
+        if parts <= 1:
+            return [(0, self._size)]
+        # Cut on scan-block boundaries so no thread scores a partial block
+        step = -(-self._size // parts // SCAN_BLOCK_ROWS) * SCAN_BLOCK_ROWS
+        return [(start, min(start + step, self._size)) for start in range(0, self._size, step)]
+
+    def _map_spans(self, fn, spans: List[Tuple[int, int]]) -> list:
+        """fn(start, stop) for each span, on the scan threads when there is more than one"""
+        if len(spans) == 1:
+            return [fn(*spans[0])]
+        if self._scan_pool is None:
+            self._scan_pool = ThreadPoolExecutor(self.scan_threads, thread_name_prefix="vector-scan")
+        return list(self._scan_pool.map(lambda span: fn(*span), spans))
+
+    def _scan_top_k(self, query: np.ndarray, top_k: int,
+                    mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k over every row, one block at a time: each block's top-k is merged
+        into the running best, so only one block of scores exists at once.
+        Rows where `mask` is False are skipped. Large stores are scanned as
+        parallel spans whose partial top-k are merged at the end.
+        """
+        parts = self._map_spans(lambda start, stop: self._span_top_k(query, top_k, mask, start, stop),
+                                self._scan_spans())
+        best_rows, best_scores = parts[0]
+        if len(parts) > 1:
+            best_rows = np.concatenate([rows for rows, _ in parts])
+            best_scores = np.concatenate([scores for _, scores in parts])
+            keep = top_k_indices(best_scores, top_k)
+            best_rows, best_scores = best_rows[keep], best_scores[keep]
+        if mask is not None:
+            kept = best_scores > -np.inf
+            best_rows, best_scores = best_rows[kept], best_scores[kept]
+        return best_rows, best_scores
+
+    def _span_top_k(self, query: np.ndarray, top_k: int, mask: Optional[np.ndarray],
+                    span_start: int, span_stop: int) -> Tuple[np.ndarray, np.ndarray]:
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start, codes in self._scan_blocks(span_start, span_stop):
+            scores = self._score_codes(query, codes)
+            if mask is not None:
+                scores = np.where(mask[start:start + codes.shape[0]], scores, np.float32(-np.inf))
+            top = top_k_indices(scores, top_k)
+            best_rows = np.concatenate([best_rows, top + start])
+            best_scores = np.concatenate([best_scores, scores[top]])
+            if best_rows.shape[0] > top_k:
+                keep = top_k_indices(best_scores, top_k)
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+        return best_rows, best_scores
+
+    def _range_top_k(self, query: np.ndarray, top_k: int,
+                     ranges: List[Tuple[int, int]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k over [start, stop) row ranges, scanned in place (no gather copy).
+
+        Scores go into one buffer with a slot per filtered row and the top-k is
+        selected once, so many short ranges cost no more than a few long ones;
+        only the k winners are mapped back to rows.
+        """
+        starts = np.array([start for start, _ in ranges], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum([stop - start for start, stop in ranges])])
+        scores = np.empty(offsets[-1], dtype=np.float32)
+        for (span_start, span_stop), offset in zip(ranges, offsets.tolist()):
+            for start, codes in self._scan_blocks(span_start, span_stop):
+                position = offset + start - span_start
+                scores[position:position + codes.shape[0]] = self._score_codes(query, codes)
+        top = top_k_indices(scores, top_k)
+        which = np.searchsorted(offsets, top, side="right") - 1
+        return starts[which] + top - offsets[which], scores[top]
+
+    def search(self, query_vector, top_k: int, rows: Optional[np.ndarray] = None,
+               ranges: Optional[List[Tuple[int, int]]] = None,
+               mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Cosine search over all rows, or restricted to a subset given as an
+        array of rows (gathered), [start, stop) row ranges (scanned in place)
+        or a boolean mask over every row (full scan).
+
+        Returns (rows, scores) sorted by descending score.
+        """
+        if self._size == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        query = self.prepare_query(query_vector)
+        rerank = self.full_precision is not None and self.encoded
+        k = top_k * self.rerank_factor if rerank else top_k
+        if ranges is not None:
+            result_rows, result_scores = self._range_top_k(query, k, ranges)
+        elif rows is None:
+            result_rows, result_scores = self._scan_top_k(query, k, mask)
+        else:
+            scores = self.scores(query, rows)
+            best = top_k_indices(scores, k)
+            result_rows, result_scores = np.asarray(rows)[best], scores[best]
+        if not rerank:
+            return result_rows, result_scores
+
+        # Sorted rows read the side store sequentially
+        candidates = np.sort(result_rows)
+        exact = self.full_precision.rows(candidates) @ query
+        order = np.argsort(-exact, kind="stable")[:top_k]
+        return candidates[order], exact[order]
+
+    def search_batch(self, query_vectors, top_k: int, rows: Optional[np.ndarray] = None,
+                     ranges: Optional[List[Tuple[int, int]]] = None,
+                     mask: Optional[np.ndarray] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        search() for a (Q, dim) block of queries sharing the same rows, ranges or mask.
+
+        Each block of codes is scored against every query with one
+        matrix-matrix product, so the codes are read once per batch rather
+        than once per query. Returns one (rows, scores) pair per query.
+        """
+        queries = np.asarray(query_vectors, dtype=np.float32).reshape(-1, self.dimension or 0)
+        if self._size == 0 or queries.shape[0] == 0:
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in range(queries.shape[0])]
+
+        queries = np.stack([self.prepare_query(query) for query in queries])
+        rerank = self.full_precision is not None and self.encoded
+        k = top_k * self.rerank_factor if rerank else top_k
+        if rows is not None:
+            rows = np.asarray(rows)
+            scores = self._score_codes_batch(queries, self._codes_at(rows))
+            best = top_k_indices_batch(scores, k)
+            best_rows, best_scores = rows[best], np.take_along_axis(scores, best, axis=1)
+        else:
+            def span_top_k(span_start: int, span_stop: int) -> Tuple[np.ndarray, np.ndarray]:
+                span_rows = np.empty((queries.shape[0], 0), dtype=np.int64)
+                span_scores = np.empty((queries.shape[0], 0), dtype=np.float32)
+                for start, codes in self._scan_blocks(span_start, span_stop):
+                    scores = self._score_codes_batch(queries, codes)
+                    if mask is not None:
+                        scores = np.where(mask[start:start + codes.shape[0]], scores, np.float32(-np.inf))
+                    top = top_k_indices_batch(scores, k)
+                    span_rows = np.concatenate([span_rows, top + start], axis=1)
+                    span_scores = np.concatenate([span_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+                    if span_rows.shape[1] > k:
+                        keep = top_k_indices_batch(span_scores, k)
+                        span_rows = np.take_along_axis(span_rows, keep, axis=1)
+                        span_scores = np.take_along_axis(span_scores, keep, axis=1)
+                return span_rows, span_scores
+
+            # A full scan is split across the scan threads; task ranges are scanned in order
+            if ranges is None:
+                parts = self._map_spans(span_top_k, self._scan_spans())
+            else:
+                parts = [span_top_k(*span) for span in ranges or [(0, 0)]]
+            best_rows, best_scores = parts[0]
+            if len(parts) > 1:
+                best_rows = np.concatenate([rows for rows, _ in parts], axis=1)
+                best_scores = np.concatenate([scores for _, scores in parts], axis=1)
+                keep = top_k_indices_batch(best_scores, k)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+        if mask is not None:
+            kept = [query_scores > -np.inf for query_scores in best_scores]
+            best_rows = [query_rows[keep] for query_rows, keep in zip(best_rows, kept)]
+            best_scores = [query_scores[keep] for query_scores, keep in zip(best_scores, kept)]
+        if not rerank:
+            return list(zip(best_rows, best_scores))
+
+        results = []
+        for query, candidates in zip(queries, best_rows):
+            candidates = np.sort(candidates)
+            exact = self.full_precision.rows(candidates) @ query
+            order = np.argsort(-exact, kind="stable")[:top_k]
+            results.append((candidates[order], exact[order]))
+        return results
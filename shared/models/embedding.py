@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 
 class Embedding(BaseModel):
@@ -8,4 +8,6 @@ class Embedding(BaseModel):
     task_id: str = Field(..., description="Parent task ID")
     vector: List[float] = Field(..., description="Embedding vector")
     model_name: str = Field(default="mock-embedding-model")
-    dimension: int = Field(default=384)
\ No newline at end of file
+    dimension: int = Field(default=384)
+    task_embedding_count: Optional[int] = Field(default=None, description="Embeddings produced for the parent task")
+    metadata: Dict[str, Any] = Field(default_factory=dict, description="Metadata of the source chunk")
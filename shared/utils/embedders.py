@@ -0,0 +1,182 @@
+import os
+import re
+import zlib
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from shared.utils.mock_llm import MockEmbeddingLLM
+
+WORD_PATTERN = re.compile(r"\w+")
+# Polynomial base of the rolling n-gram hashes and the multiplier that spreads them over the buckets
+HASH_BASE = np.uint64(0x100000001B3)
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+# Salts that keep word and character n-grams of different lengths out of each other's buckets
+WORD_SALT = 0x5BD1E995
+CHAR_SALT = 0x27D4EB2F
+# Texts featurized at once: bounds the (features x projection nonzeros) temporaries
+EMBED_BLOCK_TEXTS = 256
+
+
+class HashingTfidfEmbedder:
+    """
+    Local CPU embedder: TF-IDF over hashed word and character n-grams,
+    mapped to `dimension` by a fixed sparse random projection.
+
+    Word n-grams (`word_ngrams`, of \\w+ tokens) and character n-grams
+    (`char_ngrams`, over the UTF-8 bytes) of the lowercased text are hashed
+    into 2**`feature_bits` buckets, so there is no vocabulary to build or
+    ship. Character n-grams are hashed for a whole block of texts at once
+    with NumPy rolling hashes; only tokenization runs per text.
+
+    Term counts are scaled as 1 + log(tf) and weighted by IDF. Without a
+    fitted IDF (fit(), or load_idf() of a saved one) every weight is 1.
+    Each n-gram family is L2-normalized on its own, so long texts' many
+    character n-grams do not drown out their words. The projection sends
+    every bucket to `projection_nonzeros` random dimensions with random
+    signs (a very sparse Johnson-Lindenstrauss map), generated once from
+    `seed`: every process with the same parameters embeds text identically.
+    """
+
+    name = "hashing-tfidf"
+
+    def __init__(self, dimension: int = 384, feature_bits: int = 18, word_ngrams: Tuple[int, int] = (1, 2),
+                 char_ngrams: Tuple[int, int] = (3, 5), projection_nonzeros: int = 4, seed: int = 0):
+        self.dimension = dimension
+        self.feature_bits = feature_bits
+        self.word_ngrams = word_ngrams
+        self.char_ngrams = char_ngrams
+        self.idf = np.ones(1 << feature_bits, dtype=np.float32)
+        rng = np.random.default_rng(seed)
+        self.projection_rows = rng.integers(0, dimension, size=(1 << feature_bits, projection_nonzeros),
+                                            dtype=np.int64)
+        self.projection_signs = (rng.integers(0, 2, size=(1 << feature_bits, projection_nonzeros)) * 2 - 1
+                                 ).astype(np.float32) / np.sqrt(projection_nonzeros)
+
+    def _bucket(self, hashes: np.ndarray) -> np.ndarray:
+        return ((hashes * HASH_MULTIPLIER) >> np.uint64(64 - self.feature_bits)).astype(np.int64)
+
+    def _char_features(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """(text, bucket) of every character n-gram, from rolling hashes over the concatenated bytes"""
+        encoded = [text.encode("utf-8") for text in texts]
+        lengths = np.array([len(data) for data in encoded], dtype=np.int64)
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+        text_of = np.repeat(np.arange(len(texts)), lengths)
+        # Bytes left in the text from each position on: an n-gram may start where at least n remain
+        remaining = np.repeat(np.cumsum(lengths), lengths) - np.arange(data.shape[0])
+        texts_out, buckets_out = [], []
+        for n in range(self.char_ngrams[0], self.char_ngrams[1] + 1):
+            starts = data.shape[0] - n + 1
+            if starts <= 0:
+                continue
+            hashes = np.full(starts, CHAR_SALT + n, dtype=np.uint64)
+            for offset in range(n):
+                hashes = hashes * HASH_BASE + data[offset:offset + starts]
+            whole = remaining[:starts] >= n
+            texts_out.append(text_of[:starts][whole])
+            buckets_out.append(self._bucket(hashes[whole]))
+        if not texts_out:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(texts_out), np.concatenate(buckets_out)
+
+    def _word_features(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """(text, bucket) of every word n-gram; tokens are hashed with crc32 and combined like characters"""
+        tokens = [WORD_PATTERN.findall(text) for text in texts]
+        counts = np.array([len(words) for words in tokens], dtype=np.int64)
+        hashes = np.fromiter((zlib.crc32(word.encode("utf-8")) for words in tokens for word in words),
+                             dtype=np.uint64, count=int(counts.sum()))
+        text_of = np.repeat(np.arange(len(texts)), counts)
+        remaining = np.repeat(np.cumsum(counts), counts) - np.arange(hashes.shape[0])
+        texts_out, buckets_out = [], []
+        for n in range(self.word_ngrams[0], self.word_ngrams[1] + 1):
+            starts = hashes.shape[0] - n + 1
+            if starts <= 0:
+                continue
+            combined = np.full(starts, WORD_SALT + n, dtype=np.uint64)
+            for offset in range(n):
+                combined = combined * HASH_BASE + hashes[offset:offset + starts]
+            whole = remaining[:starts] >= n
+            texts_out.append(text_of[:starts][whole])
+            buckets_out.append(self._bucket(combined[whole]))
+        if not texts_out:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(texts_out), np.concatenate(buckets_out)
+
+    def _weighted(self, n_texts: int, text_of: np.ndarray, buckets: np.ndarray):
+        """Unique (text, bucket) pairs with their TF-IDF weights, L2-normalized per text"""
+        pairs, tf = np.unique(text_of << self.feature_bits | buckets, return_counts=True)
+        text_of, buckets = pairs >> self.feature_bits, pairs & ((1 << self.feature_bits) - 1)
+        weights = (1.0 + np.log(tf)).astype(np.float32) * self.idf[buckets]
+        norms = np.sqrt(np.bincount(text_of, weights=weights ** 2, minlength=n_texts)).astype(np.float32)
+        norms[norms == 0] = 1.0
+        return text_of, buckets, weights / norms[text_of]
+
+    def _embed_block(self, texts: List[str]) -> np.ndarray:
+        lowered = [text.lower() for text in texts]
+        families = [self._weighted(len(texts), *self._word_features(lowered)),
+                    self._weighted(len(texts), *self._char_features(lowered))]
+        text_of = np.concatenate([family[0] for family in families])
+        buckets = np.concatenate([family[1] for family in families])
+        weights = np.concatenate([family[2] for family in families])
+        # Scatter-add every (text, bucket) weight into its projected dimensions in one pass
+        slots = (text_of[:, None] * self.dimension + self.projection_rows[buckets]).ravel()
+        values = (weights[:, None] * self.projection_signs[buckets]).ravel()
+        vectors = np.bincount(slots, weights=values, minlength=len(texts) * self.dimension)
+        vectors = vectors.reshape(len(texts), self.dimension).astype(np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        """Embeddings of `texts` as one (len(texts), dimension) float32 array of unit rows (zero for empty text)"""
+        vectors = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for start in range(0, len(texts), EMBED_BLOCK_TEXTS):
+            block = texts[start:start + EMBED_BLOCK_TEXTS]
+            vectors[start:start + len(block)] = self._embed_block(block)
+        return vectors
+
+    def generate_embedding(self, text: str) -> List[float]:
+        return self.embed_batch([text])[0].tolist()
+
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_batch(texts).tolist()
+
+    def fit(self, texts: List[str]) -> "HashingTfidfEmbedder":
+        """Set IDF weights from the document frequencies of a representative corpus"""
+        document_frequency = np.zeros(1 << self.feature_bits, dtype=np.int64)
+        for start in range(0, len(texts), EMBED_BLOCK_TEXTS):
+            lowered = [text.lower() for text in texts[start:start + EMBED_BLOCK_TEXTS]]
+            for text_of, buckets in (self._word_features(lowered), self._char_features(lowered)):
+                pairs = np.unique(text_of << self.feature_bits | buckets)
+                document_frequency += np.bincount(pairs & ((1 << self.feature_bits) - 1),
+                                                  minlength=document_frequency.shape[0])
+        self.idf = (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)
+        return self
+
+    def save_idf(self, path: str):
+        np.save(path, self.idf)
+
+    def load_idf(self, path: str):
+        idf = np.load(path)
+        if idf.shape != self.idf.shape:
+            raise ValueError(f"IDF table has {idf.shape[0]} buckets, expected {self.idf.shape[0]}")
+        self.idf = idf.astype(np.float32)
+
+
+def create_embedder(name: Optional[str] = None, dimension: Optional[int] = None):
+    """
+    Build the embedder selected for this deployment (EMBEDDER: mock or
+    hashing-tfidf). Services that embed documents and the ones that embed
+    queries must be configured alike, or their vectors will not compare.
+    """
+    name = name or os.getenv("EMBEDDER", "mock")
+    dimension = dimension or int(os.getenv("EMBEDDING_DIMENSION", "384"))
+    if name == "mock":
+        return MockEmbeddingLLM(dimension=dimension)
+    if name == "hashing-tfidf":
+        embedder = HashingTfidfEmbedder(dimension=dimension, feature_bits=int(os.getenv("TFIDF_FEATURE_BITS", "18")))
+        idf_path = os.getenv("TFIDF_IDF_PATH")
+        if idf_path:
+            embedder.load_idf(idf_path)
+        return embedder
+    raise ValueError(f"Unknown EMBEDDER: {name}")
@@ -0,0 +1,204 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+# SQLite's default cap on bound parameters is 999 in older builds
+DISK_LOOKUP_BATCH = 500
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form embedded and cached: NFC, whitespace runs collapsed to one space, trimmed"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(model: str, text: str) -> bytes:
+    """Content address of a (model, normalized text) pair"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(model.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(text.encode("utf-8"))
+    return digest.digest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed cache of embeddings: an LRU tier in memory in front of
+    an optional SQLite file on disk.
+
+    Texts are normalized (normalize_text) and the normalized text is what
+    gets embedded, so every text with the same key has the same vector
+    whichever variant was seen first. Keys cover the embedder's name and
+    dimension; an embedder whose weights change under the same name (e.g.
+    a new IDF table) needs a fresh cache file.
+
+    New vectors are written through to disk, so the disk tier holds
+    everything embedded (up to `max_disk_entries`, oldest dropped first) and
+    survives restarts; disk hits are promoted to memory. Repeats within one
+    batch are embedded once. Safe to use from several threads; embedding
+    itself runs outside the lock.
+    """
+
+    def __init__(self, max_entries: int = 20000, path: Optional[str] = None,
+                 max_disk_entries: Optional[int] = None):
+        self.max_entries = max_entries
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.batch_duplicates = 0
+        self.misses = 0
+        self.text_bytes_saved = 0
+        self.evictions = 0
+        self._db: Optional[sqlite3.Connection] = None
+        self.disk_entries = 0
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)")
+            self._db.commit()
+            self.disk_entries = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def __len__(self) -> int:
+        return len(self._memory)
+
+    def _remember(self, key: bytes, vector: np.ndarray):
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _read_disk(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        found = {}
+        for start in range(0, len(keys), DISK_LOOKUP_BATCH):
+            block = keys[start:start + DISK_LOOKUP_BATCH]
+            rows = self._db.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(block))})", block
+            ).fetchall()
+            found.update((key, np.frombuffer(vector, dtype=np.float32)) for key, vector in rows)
+        return found
+
+    def _write_disk(self, entries: Dict[bytes, np.ndarray]):
+        # total_changes counts only the rows actually inserted (another thread may have raced us)
+        changes = self._db.total_changes
+        self._db.executemany("INSERT OR IGNORE INTO embeddings (key, vector) VALUES (?, ?)",
+                             [(key, vector.tobytes()) for key, vector in entries.items()])
+        self.disk_entries += self._db.total_changes - changes
+        if self.max_disk_entries is not None and self.disk_entries > self.max_disk_entries:
+            # Rowids follow insertion order, so this drops the oldest entries
+            self._db.execute("DELETE FROM embeddings WHERE rowid IN "
+                             "(SELECT rowid FROM embeddings ORDER BY rowid LIMIT ?)",
+                             (self.disk_entries - self.max_disk_entries,))
+            self.disk_entries = self.max_disk_entries
+        self._db.commit()
+
+    def embed_batch(self, embedder, texts: List[str],
+                    embed: Optional[Callable[[List[str]], np.ndarray]] = None) -> np.ndarray:
+        """
+        Embeddings of `texts` as one (len(texts), dimension) float32 array.
+        Texts missing from both tiers are embedded in a single call to
+        `embed` (default: embedder.embed_batch) with their normalized text.
+        """
+        embed = embed or embedder.embed_batch
+        if not texts:
+            return embed([])
+        model = f"{embedder.name}/{embedder.dimension}"
+        normalized = [normalize_text(text) for text in texts]
+        keys = [cache_key(model, text) for text in normalized]
+        unique = dict(zip(keys, normalized))
+
+        with self._lock:
+            found = {}
+            for key in unique:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+            in_memory = len(found)
+            if self._db is not None and len(found) < len(unique):
+                on_disk = self._read_disk([key for key in unique if key not in found])
+                for key, vector in on_disk.items():
+                    self._remember(key, vector)
+                found.update(on_disk)
+            self.memory_hits += in_memory
+            self.disk_hits += len(found) - in_memory
+
+        missing = [key for key in unique if key not in found]
+        if missing:
+            vectors = np.asarray(embed([unique[key] for key in missing]), dtype=np.float32)
+            # Rows are copied so the cache does not pin the whole batch array
+            embedded = {key: vectors[i].copy() for i, key in enumerate(missing)}
+            found.update(embedded)
+            with self._lock:
+                for key, vector in embedded.items():
+                    self._remember(key, vector)
+                if self._db is not None:
+                    self._write_disk(embedded)
+
+        # Every text but the first occurrence of each missed key was served without embedding
+        missed, saved = set(missing), 0
+        for key, text in zip(keys, normalized):
+            if key in missed:
+                missed.discard(key)
+            else:
+                saved += len(text.encode("utf-8"))
+        with self._lock:
+            self.misses += len(missing)
+            self.batch_duplicates += len(keys) - len(unique)
+            self.text_bytes_saved += saved
+        return np.stack([found[key] for key in keys])
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return self._get_stats()
+
+    def _get_stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.batch_duplicates + self.misses
+        hits = lookups - self.misses
+        stats = {
+            "entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "lookups": lookups,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "batch_duplicates": self.batch_duplicates,
+            "misses": self.misses,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "text_bytes_saved": self.text_bytes_saved,
+            "memory_bytes": sum(vector.nbytes for vector in self._memory.values()),
+            "evictions": self.evictions
+        }
+        if self.path:
+            stats["disk"] = {
+                "path": self.path,
+                "entries": self.disk_entries,
+                "max_entries": self.max_disk_entries,
+                "file_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            }
+        return stats
+
+
+def embedding_cache_from_env() -> EmbeddingCache:
+    """EmbeddingCache sized by EMBEDDING_CACHE_ENTRIES, spilling to EMBEDDING_CACHE_PATH when set"""
+    max_disk_entries = os.getenv("EMBEDDING_CACHE_DISK_ENTRIES")
+    return EmbeddingCache(max_entries=int(os.getenv("EMBEDDING_CACHE_ENTRIES", "20000")),
+                          path=os.getenv("EMBEDDING_CACHE_PATH") or None,
+                          max_disk_entries=int(max_disk_entries) if max_disk_entries else None)
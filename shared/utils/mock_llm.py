@@ -1,24 +1,56 @@
 import numpy as np
 from typing import List
 import hashlib
+import threading
+
+# Philox state of a fresh stream: counter, and the output buffer, at zero
+PHILOX_ZEROS = np.zeros(4, dtype=np.uint64)
 
 
 class MockEmbeddingLLM:
+    """
+    Deterministic stand-in for an embedding model: each text maps to a unit
+    vector of normal draws from its own random stream.
+
+    The stream is a counter-based Philox generator keyed by the text's
+    128-bit MD5, so the same text embeds to the same vector whatever batch
+    or thread it arrives in, and no global random state is touched. Each
+    thread keeps one Generator and re-keys it per text, which costs far less
+    than building a seeded Generator every time.
+    """
+
+    name = "mock-embedding-model"
+
     def __init__(self, dimension: int = 384):
         self.dimension = dimension
+        self._local = threading.local()
+    
+    def _generator(self) -> np.random.Generator:
+        generator = getattr(self._local, "generator", None)
+        if generator is None:
+            generator = self._local.generator = np.random.Generator(np.random.Philox())
+        return generator
+    
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        """Embeddings of `texts` as one (len(texts), dimension) float32 array of unit rows"""
+        vectors = np.empty((len(texts), self.dimension), dtype=np.float32)
+        generator = self._generator()
+        for row, text in zip(vectors, texts):
+            generator.bit_generator.state = {
+                "bit_generator": "Philox",
+                "state": {"counter": PHILOX_ZEROS, "key": np.frombuffer(hashlib.md5(text.encode()).digest(),
+                                                                       dtype=np.uint64)},
+                "buffer": PHILOX_ZEROS, "buffer_pos": 4, "has_uint32": 0, "uinteger": 0
+            }
+            generator.standard_normal(out=row, dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors
     
     def generate_embedding(self, text: str) -> List[float]:
-        hash_obj = hashlib.md5(text.encode())
-        seed = int(hash_obj.hexdigest(), 16) % (2**32)
-        np.random.seed(seed)
-        
-        embedding = np.random.randn(self.dimension)
-        embedding = embedding / np.linalg.norm(embedding)
-        
-        return embedding.tolist()
+        return self.embed_batch([text])[0].tolist()
     
     def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
-        return [self.generate_embedding(text) for text in texts]
+        return self.embed_batch(texts).tolist()
 
 
 class MockChatLLM:
@@ -0,0 +1,50 @@
+import bisect
+import hashlib
+from typing import Dict, Iterable, List, Optional
+
+
+def stable_hash(key: str) -> int:
+    """64-bit hash that is identical in every process (unlike the salted built-in hash())"""
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class ConsistentHashRing:
+    """
+    Maps keys (task ids) to nodes (vectorial-db shard URLs) on a hash ring.
+
+    Each node owns `vnodes` points on the ring, so keys spread evenly and
+    adding or removing a node only moves about 1/N of the keys. Every
+    service builds the ring from the same VECTORIAL_DB_URLS list, so they all
+    agree on the owner of a task without talking to each other.
+    """
+
+    def __init__(self, nodes: Iterable[str], vnodes: int = 160):
+        self.nodes: List[str] = list(dict.fromkeys(nodes))
+        self.vnodes = vnodes
+        points = sorted(
+            (stable_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes)
+        )
+        self._hashes = [h for h, _ in points]
+        self._owners = [node for _, node in points]
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def node_for(self, key: str) -> str:
+        if not self.nodes:
+            raise ValueError("Hash ring has no nodes")
+        index = bisect.bisect(self._hashes, stable_hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+    def partition(self, keys: Iterable[str]) -> Dict[str, List[str]]:
+        """Group keys by owning node"""
+        owned: Dict[str, List[str]] = {}
+        for key in keys:
+            owned.setdefault(self.node_for(key), []).append(key)
+        return owned
+
+
+def ring_from_env(urls: Optional[str]) -> Optional[ConsistentHashRing]:
+    """Ring over a comma-separated URL list; None when there is nothing to shard across"""
+    nodes = [url.strip() for url in (urls or "").split(",") if url.strip()]
+    return ConsistentHashRing(nodes) if len(nodes) > 1 else None
@@ -0,0 +1,57 @@
+import json
+import struct
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Binary alternative to JSON float lists for vector-carrying requests and responses.
+# Frame: header (magic, dtype, rows, dim, fields length) | fields JSON | row-major vector block
+VECTOR_FRAME_CONTENT_TYPE = "application/x-vector-frame"
+FRAME_MAGIC = b"VF01"
+FRAME_HEADER = struct.Struct("<4sBxxxIII")
+WIRE_DTYPES = {0: np.dtype("<f4"), 1: np.dtype("<f2")}
+WIRE_DTYPE_CODES = {"float32": 0, "float16": 1}
+
+
+def encode_frame(vectors, fields: dict, dtype: str = "float32") -> bytes:
+    """
+    Pack a (rows, dim) block plus JSON-able fields into one frame.
+
+    float16 halves the bytes on the wire; the loss (about 1e-3 relative) is
+    below what cosine ranking of normalized embeddings can resolve.
+    """
+    if dtype not in WIRE_DTYPE_CODES:
+        raise ValueError(f"Unsupported wire dtype '{dtype}', choose float32 or float16")
+    code = WIRE_DTYPE_CODES[dtype]
+    block = np.asarray(vectors, dtype=WIRE_DTYPES[code])
+    if block.ndim == 1:
+        block = block.reshape(1, -1) if block.size else block.reshape(0, 0)
+    if block.ndim != 2:
+        raise ValueError("vectors must be a 1-D vector or a 2-D block")
+    meta = json.dumps(fields, separators=(",", ":")).encode("utf-8")
+    return FRAME_HEADER.pack(FRAME_MAGIC, code, block.shape[0], block.shape[1], len(meta)) + meta + block.tobytes()
+
+
+def decode_frame(data: bytes) -> Tuple[dict, np.ndarray]:
+    """(fields, float32 block of shape (rows, dim)); raises ValueError on a malformed frame"""
+    if len(data) < FRAME_HEADER.size:
+        raise ValueError("Truncated vector frame")
+    magic, code, rows, dim, meta_len = FRAME_HEADER.unpack_from(data)
+    if magic != FRAME_MAGIC or code not in WIRE_DTYPES:
+        raise ValueError("Not a vector frame")
+    dtype = WIRE_DTYPES[code]
+    start = FRAME_HEADER.size + meta_len
+    if len(data) != start + rows * dim * dtype.itemsize:
+        raise ValueError("Vector frame length does not match its header")
+    fields = json.loads(data[FRAME_HEADER.size:start])
+    vectors = np.frombuffer(data, dtype=dtype, count=rows * dim, offset=start).reshape(rows, dim)
+    return fields, vectors.astype(np.float32)
+
+
+def is_vector_frame(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.split(";")[0].strip() == VECTOR_FRAME_CONTENT_TYPE
+
+
+def accepts_vector_frame(accept: Optional[str]) -> bool:
+    """Whether an Accept header lists the binary frame type (JSON stays the default)"""
+    return bool(accept) and any(is_vector_frame(part) for part in accept.split(","))
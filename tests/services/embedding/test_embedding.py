@@ -1,11 +1,18 @@
 import pytest
+import asyncio
 from fastapi.testclient import TestClient
 from unittest.mock import patch, Mock, AsyncMock
 import queue
+import numpy as np
 
 from services.embedding.main import app, embedding_service
 from shared.models.chunk import Chunk
 from shared.models.embedding import Embedding
+from shared.utils.embedders import HashingTfidfEmbedder, create_embedder
+from shared.utils.embedding_cache import EmbeddingCache
+from shared.utils.mock_llm import MockEmbeddingLLM
+from shared.utils.sharding import ConsistentHashRing
+from shared.utils.vector_wire import VECTOR_FRAME_CONTENT_TYPE, decode_frame
 
 
 @pytest.fixture
@@ -50,6 +57,27 @@ class TestEmbeddingService:
             assert len(embedding.vector) == 384
             assert embedding.model_name == "mock-embedding-model"
     
+    @pytest.mark.asyncio
+    async def test_embedding_throughput_is_counted(self, client, sample_chunks, monkeypatch):
+        service = embedding_service
+        monkeypatch.setattr(service, "embedded_texts", 0)
+        monkeypatch.setattr(service, "embedding_seconds", 0.0)
+        monkeypatch.setattr(service, "embedding_cache", EmbeddingCache())
+        await service.generate_embeddings(sample_chunks)
+        
+        stats = client.get("/queue/status").json()["embedder"]
+        assert stats["name"] == "mock-embedding-model" and stats["dimension"] == 384
+        assert stats["embedded_texts"] == 2
+        assert stats["texts_per_second"] > 0
+        assert client.get("/queue/status").json()["scheduler"]["batches"] >= 1
+        
+        # Repeats come from the cache and do not count as embedder work
+        await service.generate_embeddings(sample_chunks)
+        assert client.get("/queue/status").json()["embedder"]["embedded_texts"] == 2
+        cache = client.get("/cache/stats").json()
+        assert cache["memory_hits"] == 2 and cache["misses"] == 2 and cache["hit_ratio"] == 0.5
+        assert cache["text_bytes_saved"] == sum(len(chunk.content) for chunk in sample_chunks)
+    
     def test_get_embeddings_from_queue(self):
         service = embedding_service
         
@@ -69,6 +97,62 @@ class TestEmbeddingService:
         
         result = service.get_embeddings(batch_size=10)
         assert len(result) == 0
+
+    @pytest.mark.asyncio
+    async def test_full_queue_waits_instead_of_dropping(self, monkeypatch):
+        service = embedding_service
+        monkeypatch.setattr(service, "embeddings_queue", queue.Queue(maxsize=3))
+        embeddings = [
+            Embedding(id=f"emb{i}", chunk_id=f"chunk{i}", task_id="task123", vector=[0.1] * 4,
+                      model_name="mock-embedding-model", dimension=4)
+            for i in range(10)
+        ]
+
+        enqueue = asyncio.ensure_future(service.enqueue_embeddings("task123", embeddings))
+        received = []
+        while len(received) < len(embeddings):
+            # The loop stays free while the queue is full, so the consumer gets to drain it
+            await asyncio.sleep(0.01)
+            received += service.get_embeddings(batch_size=2)
+        await asyncio.wait_for(enqueue, timeout=1)
+
+        assert [embedding["id"] for embedding in received] == [f"emb{i}" for i in range(10)]
+
+    @pytest.mark.asyncio
+    async def test_claimed_tasks_finish_before_the_client_closes(self, monkeypatch):
+        from shared.models.task import Task, TaskStatus
+        service = embedding_service
+        events = []
+        started = asyncio.Event()
+        
+        class FakeClient:
+            async def __aenter__(self):
+                return self
+            
+            async def __aexit__(self, *exc_info):
+                events.append("client closed")
+            
+            async def get(self, url):
+                task = Task(id="task123", filename="test.pdf", status=TaskStatus.CHUNKED)
+                return Mock(status_code=200, json=Mock(return_value=[task.dict()]))
+        
+        async def process_single_task(task, client, chunking_url):
+            started.set()
+            await asyncio.sleep(0.05)
+            events.append(f"{task.id} done")
+            service.processing_tasks.discard(task.id)
+        
+        monkeypatch.setattr("services.embedding.main.httpx.AsyncClient", FakeClient)
+        monkeypatch.setattr(service, "process_single_task", process_single_task)
+        monkeypatch.setattr(service, "processing_tasks", set())
+        
+        poller = asyncio.ensure_future(service.process_tasks_from_service("http://chunking-1:8004"))
+        await asyncio.wait_for(started.wait(), timeout=1)
+        poller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await poller
+        
+        assert events == ["task123 done", "client closed"]
     
     @pytest.mark.asyncio
     @patch('services.embedding.main.httpx.AsyncClient')
@@ -147,6 +231,21 @@ class TestAPI:
         assert data["count"] == 5
         assert len(data["embeddings"]) == 5
     
+    def test_get_embeddings_batch_as_vector_frame(self, client):
+        service = embedding_service
+        for i in range(3):
+            service.embeddings_queue.put({"id": f"emb{i}", "task_id": "task1", "vector": [float(i)] * 384})
+        
+        response = client.get("/embeddings/batch?batch_size=10",
+                              headers={"Accept": f"{VECTOR_FRAME_CONTENT_TYPE}, application/json"})
+        assert response.headers["content-type"] == VECTOR_FRAME_CONTENT_TYPE
+        fields, vectors = decode_frame(response.content)
+        assert fields["count"] == 3
+        assert [emb["id"] for emb in fields["embeddings"]] == ["emb0", "emb1", "emb2"]
+        assert "vector" not in fields["embeddings"][0]
+        assert vectors.shape == (3, 384)
+        assert vectors[2, 0] == 2.0
+    
     def test_queue_status_endpoint(self, client):
         service = embedding_service
         
@@ -165,9 +264,126 @@ class TestAPI:
         assert "task1" in data["processing_tasks"]
         assert "task2" in data["processing_tasks"]
     
+    def test_sharded_batches_only_hold_owned_tasks(self, client, monkeypatch):
+        service = embedding_service
+        shards = ["http://vectorial-db-1:8006", "http://vectorial-db-2:8006"]
+        ring = ConsistentHashRing(shards)
+        monkeypatch.setattr(service, "shard_ring", ring)
+        monkeypatch.setattr(service, "shard_queues", {url: queue.Queue(maxsize=1000) for url in shards})
+        
+        for i in range(20):
+            service.queue_for(f"task{i}").put({"id": f"emb{i}", "task_id": f"task{i}"})
+        
+        received = 0
+        for shard in shards:
+            response = client.get("/embeddings/batch", params={"batch_size": 50, "shard": shard})
+            embeddings = response.json()["embeddings"]
+            assert all(ring.node_for(emb["task_id"]) == shard for emb in embeddings)
+            received += len(embeddings)
+        assert received == 20
+        assert client.get("/embeddings/batch?batch_size=50").status_code == 400
+        assert client.get("/embeddings/batch", params={"shard": "http://vectorial-db-3:8006"}).status_code == 400
+        assert client.get("/queue/status").json()["shard_queues"] == {url: 0 for url in shards}
+    
     def test_health_check_endpoint(self, client):
         response = client.get("/health")
         assert response.status_code == 200
         assert response.json()["status"] == "healthy"
         assert response.json()["service"] == "embedding"
-        assert "worker_id" in response.json()
\ No newline at end of file
+        assert "worker_id" in response.json()
+
+class TestEmbedders:
+    def test_create_embedder_from_env(self, monkeypatch):
+        assert isinstance(create_embedder(), MockEmbeddingLLM)
+        monkeypatch.setenv("EMBEDDER", "hashing-tfidf")
+        monkeypatch.setenv("EMBEDDING_DIMENSION", "64")
+        monkeypatch.setenv("TFIDF_FEATURE_BITS", "12")
+        embedder = create_embedder()
+        assert isinstance(embedder, HashingTfidfEmbedder)
+        assert embedder.dimension == 64 and embedder.idf.shape == (4096,)
+        with pytest.raises(ValueError):
+            create_embedder("word2vec")
+    
+    def test_hashing_tfidf_batch(self):
+        embedder = HashingTfidfEmbedder(dimension=128, feature_bits=14)
+        texts = ["The cat sat on the mat.", "A cat was sitting on the mat",
+                 "Quantum chromodynamics describes quarks and gluons.", "", "Ação é olá"]
+        
+        vectors = embedder.embed_batch(texts)
+        
+        assert vectors.shape == (5, 128) and vectors.dtype == np.float32
+        assert np.allclose(np.linalg.norm(vectors[[0, 1, 2, 4]], axis=1), 1.0, atol=1e-5)
+        assert not vectors[3].any()
+        # Shared words and character n-grams make related texts closer
+        assert vectors[0] @ vectors[1] > vectors[0] @ vectors[2]
+        # A text embeds the same in any batch, and a fresh embedder with the same seed agrees
+        assert np.allclose(embedder.embed_batch(texts[::-1])[::-1], vectors, atol=1e-6)
+        assert np.allclose(HashingTfidfEmbedder(dimension=128, feature_bits=14).embed_batch(texts), vectors,
+                           atol=1e-6)
+        assert np.allclose(embedder.generate_embedding(texts[2]), vectors[2], atol=1e-6)
+        assert embedder.embed_batch([]).shape == (0, 128)
+    
+    def test_hashing_tfidf_idf(self, tmp_path):
+        corpus = [f"report {i} on the quarterly revenue of unit {i % 7}" for i in range(300)]
+        embedder = HashingTfidfEmbedder(dimension=128, feature_bits=14).fit(corpus)
+        path = str(tmp_path / "idf.npy")
+        embedder.save_idf(path)
+        
+        # A word in every document gets the minimum weight, one in a seventh of them more
+        _, everywhere = embedder._word_features(["revenue"])
+        _, some = embedder._word_features(["unit 3"])
+        assert embedder.idf[everywhere[0]] == pytest.approx(1.0)
+        assert embedder.idf[some[-1]] > 2.0
+        loaded = HashingTfidfEmbedder(dimension=128, feature_bits=14)
+        loaded.load_idf(path)
+        assert np.array_equal(loaded.embed_batch(corpus[:5]), embedder.embed_batch(corpus[:5]))
+        with pytest.raises(ValueError):
+            HashingTfidfEmbedder(dimension=128, feature_bits=12).load_idf(path)
+
+
+class TestEmbeddingCache:
+    def test_repeats_are_embedded_once(self):
+        llm = MockEmbeddingLLM(dimension=32)
+        cache = EmbeddingCache()
+        calls = []
+        
+        def embed(texts):
+            calls.append(texts)
+            return llm.embed_batch(texts)
+        
+        texts = ["same text", "same   text ", "other", "same text"]
+        vectors = cache.embed_batch(llm, texts, embed)
+        
+        # Whitespace variants share a key, and the normalized text is what gets embedded
+        assert calls == [["same text", "other"]]
+        assert np.array_equal(vectors, llm.embed_batch(["same text", "same text", "other", "same text"]))
+        assert np.array_equal(cache.embed_batch(llm, ["other", "same text"], embed), vectors[[2, 0]])
+        assert len(calls) == 1
+        stats = cache.get_stats()
+        assert (stats["misses"], stats["batch_duplicates"], stats["memory_hits"]) == (2, 2, 2)
+        assert stats["hit_ratio"] == pytest.approx(4 / 6)
+        # Another model (or dimension) never shares entries
+        assert cache.embed_batch(MockEmbeddingLLM(dimension=16), ["other"]).shape == (1, 16)
+    
+    def test_lru_spills_to_disk(self, tmp_path):
+        llm = MockEmbeddingLLM(dimension=32)
+        path = str(tmp_path / "cache" / "embeddings.sqlite")
+        cache = EmbeddingCache(max_entries=2, path=path)
+        texts = [f"chunk {i}" for i in range(5)]
+        expected = cache.embed_batch(llm, texts)
+        assert len(cache) == 2 and cache.evictions == 3
+        
+        assert np.array_equal(cache.embed_batch(llm, texts[:2]), expected[:2])
+        assert cache.disk_hits == 2 and cache.misses == 5
+        cache.close()
+        
+        # The disk tier survives a restart
+        reopened = EmbeddingCache(path=path, max_disk_entries=4)
+        assert reopened.get_stats()["disk"]["entries"] == 5
+        assert np.array_equal(reopened.embed_batch(llm, texts), expected)
+        assert reopened.disk_hits == 5 and reopened.misses == 0
+        reopened.embed_batch(llm, ["chunk 5"])
+        # Past max_disk_entries the oldest rows go first
+        assert reopened.get_stats()["disk"]["entries"] == 4
+        reopened.close()
+        assert EmbeddingCache(max_entries=0, path=path).embed_batch(llm, texts[:2]).shape == (2, 32)
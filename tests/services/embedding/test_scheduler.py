@@ -0,0 +1,134 @@
+import asyncio
+import threading
+import time
+import pytest
+import numpy as np
+
+from services.embedding.scheduler import EmbeddingScheduler
+from shared.utils.mock_llm import MockEmbeddingLLM
+
+
+class RecordingEmbedder:
+    """MockEmbeddingLLM that remembers every batch it was given"""
+
+    def __init__(self, fail_on: str = None, delay: float = 0.0):
+        self.llm = MockEmbeddingLLM(dimension=8)
+        self.batches = []
+        self.fail_on = fail_on
+        self.delay = delay
+
+    def __call__(self, texts):
+        self.batches.append(list(texts))
+        time.sleep(self.delay)
+        if self.fail_on in texts:
+            raise RuntimeError("embedder failed")
+        return self.llm.embed_batch(texts)
+
+
+def task_texts(task: str, n: int):
+    return [f"{task} chunk {i}" for i in range(n)]
+
+
+class TestEmbeddingScheduler:
+    @pytest.mark.asyncio
+    async def test_tasks_share_batches_and_get_their_own_rows(self):
+        embedder = RecordingEmbedder()
+        scheduler = EmbeddingScheduler(embedder, max_batch=64, max_wait_ms=20)
+        texts = {f"task_{t}": task_texts(f"task_{t}", 5 + t) for t in range(4)}
+
+        results = await asyncio.gather(*(scheduler.embed(task, t) for task, t in texts.items()))
+
+        for (task, t), vectors in zip(texts.items(), results):
+            assert np.array_equal(vectors, embedder.llm.embed_batch(t))
+        assert len(embedder.batches) == 1
+        stats = scheduler.get_stats()
+        assert stats["texts"] == 26 and stats["mean_tasks_per_batch"] == 4
+        assert stats["fill_ratio"] == pytest.approx(26 / 64)
+        assert stats["max_queue_delay_ms"] >= 15 and stats["pending_texts"] == 0
+        scheduler.close()
+
+    @pytest.mark.asyncio
+    async def test_full_batches_go_out_without_waiting(self):
+        embedder = RecordingEmbedder()
+        scheduler = EmbeddingScheduler(embedder, max_batch=16, max_wait_ms=10_000)
+
+        vectors = await asyncio.wait_for(scheduler.embed("big", task_texts("big", 48)), timeout=5)
+
+        assert vectors.shape == (48, 8)
+        assert [len(batch) for batch in embedder.batches] == [16, 16, 16]
+        assert scheduler.get_stats()["full_batches"] == 3
+        scheduler.close()
+
+    @pytest.mark.asyncio
+    async def test_batches_overlap_up_to_max_in_flight(self):
+        embedder = RecordingEmbedder(delay=0.05)
+        running, peak, lock = [0], [0], threading.Lock()
+
+        def embed(texts):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            try:
+                return embedder(texts)
+            finally:
+                with lock:
+                    running[0] -= 1
+
+        scheduler = EmbeddingScheduler(embed, max_batch=8, max_wait_ms=5, max_in_flight=3)
+        results = await asyncio.gather(*(scheduler.embed(f"task_{t}", task_texts(f"task_{t}", 8)) for t in range(6)))
+
+        assert all(vectors.shape == (8, 8) for vectors in results)
+        assert peak[0] == 3 and len(embedder.batches) == 6
+        assert scheduler.get_stats()["in_flight"] == 0
+        scheduler.close()
+
+    @pytest.mark.asyncio
+    async def test_a_huge_task_does_not_starve_small_ones(self):
+        embedder = RecordingEmbedder(delay=0.005)
+        scheduler = EmbeddingScheduler(embedder, max_batch=16, max_wait_ms=5)
+
+        huge = asyncio.ensure_future(scheduler.embed("huge", task_texts("huge", 400)))
+        await asyncio.sleep(0.02)
+        small = await asyncio.gather(*(scheduler.embed(f"small_{i}", task_texts(f"small_{i}", 6))
+                                       for i in range(3)))
+
+        # The small tasks were served within a couple of batches, long before the huge one finished
+        assert not huge.done()
+        small_batches = [i for i, batch in enumerate(embedder.batches) if any("small" in t for t in batch)]
+        assert len(small_batches) <= 2
+        shares = [sum(t.startswith(task) for t in embedder.batches[small_batches[0]])
+                  for task in ("huge", "small_0", "small_1", "small_2")]
+        assert shares == [4, 4, 4, 4]
+        assert all(vectors.shape == (6, 8) for vectors in small)
+        assert (await huge).shape == (400, 8)
+        scheduler.close()
+
+    @pytest.mark.asyncio
+    async def test_a_failed_batch_fails_only_its_requests(self):
+        embedder = RecordingEmbedder(fail_on="bad chunk 0")
+        scheduler = EmbeddingScheduler(embedder, max_batch=64, max_wait_ms=5)
+
+        with pytest.raises(RuntimeError):
+            await scheduler.embed("bad", task_texts("bad", 3))
+        vectors = await scheduler.embed("good", task_texts("good", 3))
+
+        assert vectors.shape == (3, 8)
+        assert scheduler.get_stats()["failed_batches"] == 1
+        scheduler.close()
+
+    @pytest.mark.asyncio
+    async def test_cancelled_requests_leave_the_queue(self):
+        embedder = RecordingEmbedder()
+        scheduler = EmbeddingScheduler(embedder, max_batch=64, max_wait_ms=50)
+
+        pending = asyncio.ensure_future(scheduler.embed("gone", task_texts("gone", 10)))
+        await asyncio.sleep(0)
+        assert scheduler.get_stats()["pending_texts"] == 10
+        pending.cancel()
+        await asyncio.sleep(0)
+        kept = await scheduler.embed("kept", task_texts("kept", 2))
+
+        assert kept.shape == (2, 8)
+        assert embedder.batches == [task_texts("kept", 2)]
+        assert scheduler.get_stats()["pending_tasks"] == 0
+        scheduler.close()
@@ -0,0 +1,39 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import numpy as np
+
+from services.embedding.workers import EmbeddingProcessPool
+from shared.utils.embedders import create_embedder
+
+
+@pytest.fixture(scope="module")
+def pool(tmp_path_factory):
+    pool = EmbeddingProcessPool(2, 384, directory=str(tmp_path_factory.mktemp("shm") / "embedding"))
+    yield pool
+    pool.close()
+
+
+class TestEmbeddingProcessPool:
+    def test_workers_embed_like_the_service(self, pool):
+        texts = [f"chunk {i}" for i in range(40)]
+        
+        vectors = pool.embed_batch(texts)
+        
+        assert vectors.shape == (40, 384) and vectors.dtype == np.float32
+        assert np.array_equal(vectors, create_embedder().embed_batch(texts))
+        assert pool.embed_batch([]).shape == (0, 384)
+    
+    def test_slots_grow_and_stay_per_thread(self, pool):
+        llm = create_embedder()
+        batches = [[f"thread {t} chunk {i}" for i in range(50 + 300 * (t % 2))] for t in range(6)]
+        
+        with ThreadPoolExecutor(max_workers=2) as threads:
+            results = list(threads.map(pool.embed_batch, batches))
+        
+        for batch, vectors in zip(batches, results):
+            assert np.array_equal(vectors, llm.embed_batch(batch))
+        # Outgrown slot files are replaced, not left behind
+        slots = [name.split(".")[0] for name in os.listdir(pool.directory)]
+        assert len(slots) == len(set(slots)) <= 3
+        assert pool.get_stats()["texts"] >= sum(len(batch) for batch in batches)
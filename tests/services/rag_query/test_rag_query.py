@@ -1,9 +1,14 @@
 import pytest
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from fastapi.testclient import TestClient
 from unittest.mock import patch, Mock, AsyncMock
 
 from services.rag_query.main import app, rag_service
+from shared.utils.embedding_cache import EmbeddingCache
 from shared.utils.mock_llm import MockEmbeddingLLM, MockChatLLM
+from shared.utils.sharding import ConsistentHashRing
+from shared.utils.vector_wire import decode_frame
 
 
 @pytest.fixture
@@ -110,6 +115,29 @@ class TestRAGQueryService:
         assert response.response is not None
         assert len(response.sources) == 0
     
+    @pytest.mark.asyncio
+    @patch('services.rag_query.main.httpx.AsyncClient')
+    async def test_repeated_queries_reuse_the_cached_embedding(self, mock_httpx_client, sample_query_request,
+                                                               client, monkeypatch):
+        service = rag_service
+        monkeypatch.setattr(service, "embedding_cache", EmbeddingCache())
+        mock_client = AsyncMock()
+        mock_httpx_client.return_value.__aenter__.return_value = mock_client
+        mock_search_response = Mock()
+        mock_search_response.status_code = 200
+        mock_search_response.json.return_value = {"results": []}
+        mock_client.post.return_value = mock_search_response
+        
+        from services.rag_query.main import QueryRequest
+        for _ in range(3):
+            await service.process_query(QueryRequest(**sample_query_request))
+        
+        sent = [decode_frame(call.kwargs["content"])[1][0] for call in mock_client.post.call_args_list]
+        expected = service.embedding_llm.embed_batch([sample_query_request["query"]])[0]
+        assert np.array_equal(sent[0], expected) and np.array_equal(sent[2], expected)
+        stats = client.get("/cache/stats").json()
+        assert stats["misses"] == 1 and stats["memory_hits"] == 2
+    
     @pytest.mark.asyncio
     @patch('services.rag_query.main.httpx.AsyncClient')
     async def test_process_query_search_failure(self, mock_httpx_client, sample_query_request):
@@ -128,6 +156,99 @@ class TestRAGQueryService:
             await service.process_query(query_req)
 
 
+class TestScatterGather:
+    SHARDS = ["http://vectorial-db-1:8006", "http://vectorial-db-2:8006", "http://vectorial-db-3:8006"]
+    
+    @pytest.fixture
+    def sharded_service(self, monkeypatch):
+        monkeypatch.setattr(rag_service, "vectorial_db_urls", self.SHARDS)
+        monkeypatch.setattr(rag_service, "shard_ring", ConsistentHashRing(self.SHARDS))
+        return rag_service
+    
+    @staticmethod
+    def shard_client(results_by_shard):
+        """Mock client answering /search with each shard's own score-sorted results"""
+        client = AsyncMock()
+        
+        async def post(url, content, headers):
+            shard = url.rsplit("/search", 1)[0]
+            if isinstance(results_by_shard[shard], Exception):
+                raise results_by_shard[shard]
+            fields, _ = decode_frame(content)
+            response = Mock(status_code=200)
+            response.json.return_value = {"results": results_by_shard[shard][:fields["top_k"]]}
+            return response
+        client.post.side_effect = post
+        return client
+    
+    @staticmethod
+    def results(shard_index, scores):
+        return [{"embedding_id": f"emb_{shard_index}_{i}", "score": score, "metadata": {}}
+                for i, score in enumerate(scores)]
+    
+    @pytest.mark.asyncio
+    async def test_unfiltered_query_merges_every_shard(self, sharded_service):
+        client = self.shard_client({
+            self.SHARDS[0]: self.results(0, [0.9, 0.5, 0.1]),
+            self.SHARDS[1]: self.results(1, [0.8, 0.7, 0.6]),
+            self.SHARDS[2]: self.results(2, [0.95, 0.2]),
+        })
+        merged = await sharded_service.search_shards(client, [0.1] * 384, 4, None)
+        assert [r["score"] for r in merged] == [0.95, 0.9, 0.8, 0.7]
+        assert client.post.call_count == 3
+    
+    @pytest.mark.asyncio
+    async def test_task_filter_queries_only_owning_shards(self, sharded_service):
+        ring = sharded_service.shard_ring
+        task_ids = ["task_a", "task_b"]
+        client = self.shard_client({url: self.results(i, [0.5]) for i, url in enumerate(self.SHARDS)})
+        await sharded_service.search_shards(client, [0.1] * 384, 3, task_ids)
+        
+        sent = {call.args[0].rsplit("/search", 1)[0]: decode_frame(call.kwargs["content"])[0]["task_ids"]
+                for call in client.post.call_args_list}
+        assert sent == ring.partition(task_ids)
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("sharded", [True, False])
+    async def test_empty_task_filter_searches_every_task(self, monkeypatch, sharded):
+        monkeypatch.setattr(rag_service, "vectorial_db_urls", self.SHARDS)
+        monkeypatch.setattr(rag_service, "shard_ring", ConsistentHashRing(self.SHARDS) if sharded else None)
+        client = self.shard_client({url: self.results(i, [0.3 * i]) for i, url in enumerate(self.SHARDS)})
+        merged = await rag_service.search_shards(client, [0.1] * 384, 5, [])
+        
+        assert [r["score"] for r in merged] == [0.6, 0.3, 0.0]
+        assert all(decode_frame(call.kwargs["content"])[0]["task_ids"] is None for call in client.post.call_args_list)
+    
+    @pytest.mark.asyncio
+    async def test_failed_shard_degrades_to_partial_results(self, sharded_service):
+        client = self.shard_client({
+            self.SHARDS[0]: self.results(0, [0.9]),
+            self.SHARDS[1]: Exception("Connection error"),
+            self.SHARDS[2]: self.results(2, [0.4]),
+        })
+        merged = await sharded_service.search_shards(client, [0.1] * 384, 5, None)
+        assert [r["score"] for r in merged] == [0.9, 0.4]
+    
+    @pytest.mark.asyncio
+    async def test_json_only_shard_is_remembered(self, monkeypatch):
+        monkeypatch.setattr(rag_service, "json_only_shards", set())
+        client = AsyncMock()
+        
+        async def post(url, json=None, content=None, headers=None):
+            if content is not None:
+                return Mock(status_code=422)
+            response = Mock(status_code=200)
+            response.json.return_value = {"results": [{"embedding_id": "emb1", "score": 0.5}]}
+            return response
+        client.post.side_effect = post
+        
+        for _ in range(2):
+            results = await rag_service.search_shard(client, "http://old-db:8006", [0.1] * 384, 3, None)
+            assert results == [{"embedding_id": "emb1", "score": 0.5}]
+        assert rag_service.json_only_shards == {"http://old-db:8006"}
+        assert client.post.call_count == 3
+
+
 class TestAPI:
     @patch('services.rag_query.main.httpx.AsyncClient')
     def test_query_endpoint_success(self, mock_httpx_client, client, sample_query_request, sample_search_results):
@@ -210,6 +331,32 @@ class TestMockLLMs:
         assert len(embeddings) == 2
         assert all(len(emb) == 384 for emb in embeddings)
     
+    def test_mock_embedding_llm_batch(self):
+        llm = MockEmbeddingLLM(dimension=64)
+        texts = [f"chunk {i}" for i in range(50)]
+        
+        vectors = llm.embed_batch(texts)
+        
+        assert vectors.shape == (50, 64) and vectors.dtype == np.float32
+        assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0, atol=1e-6)
+        # A text embeds the same alone, in any batch and as a list
+        assert np.array_equal(llm.embed_batch(texts[::-1])[::-1], vectors)
+        assert llm.generate_embedding(texts[7]) == vectors[7].tolist()
+        assert llm.embed_batch([]).shape == (0, 64)
+        assert not np.allclose(vectors[0], vectors[1])
+    
+    def test_mock_embedding_llm_is_thread_safe(self):
+        llm = MockEmbeddingLLM(dimension=64)
+        texts = [f"chunk {i}" for i in range(200)]
+        expected = llm.embed_batch(texts)
+        
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda offset: llm.embed_batch(texts[offset:] + texts[:offset]),
+                                    range(0, 200, 10)))
+        
+        for offset, vectors in zip(range(0, 200, 10), results):
+            assert np.array_equal(np.roll(vectors, offset, axis=0), expected)
+    
     def test_mock_chat_llm(self):
         llm = MockChatLLM()
         
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import numpy as np
+
+from services.vectorial_db.batcher import SearchBatcher
+from services.vectorial_db.main import VectorDatabase
+from shared.models.embedding import Embedding
+
+
+@pytest.fixture
+def db():
+    rng = np.random.default_rng(5)
+    db = VectorDatabase()
+    for i in range(40):
+        db.add_embedding(Embedding(
+            id=f"emb_{i}",
+            chunk_id=f"chunk_{i}",
+            task_id="task_a" if i % 2 else "task_b",
+            vector=rng.standard_normal(16).tolist(),
+            model_name="mock-model",
+            dimension=16
+        ))
+    return db
+
+
+class TestSearchBatcher:
+    @pytest.mark.asyncio
+    async def test_concurrent_queries_share_one_batch(self, db):
+        batcher = SearchBatcher(db, window_ms=20, max_batch=64)
+        queries = [db.vectors[f"emb_{i}"].tolist() for i in range(10)]
+        
+        results = await asyncio.gather(*(batcher.search(query, top_k=1) for query in queries))
+        
+        assert [r[0]["embedding_id"] for r in results] == [f"emb_{i}" for i in range(10)]
+        assert batcher.get_stats()["batches"] == 1
+        assert batcher.get_stats()["mean_batch_size"] == 10
+    
+    @pytest.mark.asyncio
+    async def test_max_batch_flushes_early(self, db):
+        batcher = SearchBatcher(db, window_ms=10_000, max_batch=4)
+        queries = [db.vectors[f"emb_{i}"].tolist() for i in range(8)]
+        
+        results = await asyncio.wait_for(
+            asyncio.gather(*(batcher.search(query, top_k=1) for query in queries)), timeout=5
+        )
+        
+        assert len(results) == 8
+        assert batcher.get_stats()["batches"] == 2
+    
+    @pytest.mark.asyncio
+    async def test_task_filter_and_top_k_per_query(self, db):
+        batcher = SearchBatcher(db, window_ms=5)
+        query = db.vectors["emb_1"].tolist()
+        
+        filtered, unfiltered = await asyncio.gather(
+            batcher.search(query, top_k=3, task_ids=["task_b"]),
+            batcher.search(query, top_k=5)
+        )
+        
+        assert len(filtered) == 3
+        assert {r["metadata"]["task_id"] for r in filtered} == {"task_b"}
+        assert len(unfiltered) == 5
+        assert unfiltered[0]["embedding_id"] == "emb_1"
+    
+    @pytest.mark.asyncio
+    async def test_bad_query_only_fails_itself(self, db):
+        batcher = SearchBatcher(db, window_ms=5)
+        
+        bad, good = await asyncio.gather(
+            batcher.search([0.1] * 3, top_k=1),
+            batcher.search(db.vectors["emb_7"].tolist(), top_k=1),
+            return_exceptions=True
+        )
+        
+        assert isinstance(bad, ValueError)
+        assert good[0]["embedding_id"] == "emb_7"
+    
+    @pytest.mark.asyncio
+    async def test_batches_run_on_the_executor(self, db):
+        threads = set()
+        search_batch = db.search_batch
+        
+        def recording_search_batch(*args, **kwargs):
+            threads.add(threading.current_thread().name)
+            return search_batch(*args, **kwargs)
+        
+        db.search_batch = recording_search_batch
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="search") as executor:
+            batcher = SearchBatcher(db, window_ms=5, executor=executor)
+            bad, good = await asyncio.gather(
+                batcher.search([0.1] * 3, top_k=1),
+                batcher.search(db.vectors["emb_3"].tolist(), top_k=1),
+                return_exceptions=True
+            )
+        
+        assert isinstance(bad, ValueError)
+        assert good[0]["embedding_id"] == "emb_3"
+        assert threads and all(name.startswith("search") for name in threads)
+    
+    @pytest.mark.asyncio
+    async def test_failed_executor_batch_fails_every_query(self, db):
+        def broken_answer(pending):
+            raise RuntimeError("search executor failed")
+        
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            batcher = SearchBatcher(db, window_ms=5, executor=executor)
+            batcher._answer = broken_answer
+            results = await asyncio.wait_for(asyncio.gather(
+                batcher.search(db.vectors["emb_1"].tolist(), top_k=1),
+                batcher.search(db.vectors["emb_2"].tolist(), top_k=1),
+                return_exceptions=True
+            ), timeout=1)
+        
+        assert all(isinstance(result, RuntimeError) for result in results)
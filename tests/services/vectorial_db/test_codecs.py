@@ -0,0 +1,195 @@
+import pytest
+import numpy as np
+
+from services.vectorial_db.codecs import (
+    BinaryCodec, Float32Codec, Float16Codec, PCACodec, ScalarQuantizer8Codec, ProductQuantizerCodec, create_codec,
+    kmeans
+)
+from services.vectorial_db.main import VectorDatabase
+from services.vectorial_db.segments import SegmentedVectorStore
+from services.vectorial_db.store import VectorStore, normalize_rows
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(3)
+    return normalize_rows(rng.standard_normal((600, 32)).astype(np.float32))
+
+
+def trained(codec, vectors):
+    codec.train(vectors)
+    return codec
+
+
+class TestCodecs:
+    @pytest.mark.parametrize("codec,tolerance", [
+        (Float32Codec(), 1e-6),
+        (Float16Codec(), 1e-3),
+        (ScalarQuantizer8Codec(), 1e-2),
+        (PCACodec(dimensions=32), 1e-5),
+    ])
+    def test_round_trip(self, codec, tolerance, vectors):
+        codec = trained(codec, vectors)
+        decoded = codec.decode(codec.encode(vectors))
+        assert np.max(np.abs(decoded - vectors)) < tolerance
+
+    @pytest.mark.parametrize("codec", [
+        Float16Codec(), ScalarQuantizer8Codec(), ProductQuantizerCodec(n_subspaces=8), PCACodec(dimensions=8)
+    ])
+    def test_scores_match_decoded_dot_product(self, codec, vectors):
+        codec = trained(codec, vectors)
+        codes = codec.encode(vectors)
+        query = vectors[0]
+        assert np.allclose(codec.scores(query, codes), codec.decode(codes) @ query, atol=1e-4)
+
+    def test_code_sizes(self):
+        assert Float16Codec().encode(np.zeros((1, 384))).nbytes == 768
+        assert ScalarQuantizer8Codec().code_width(384) == 384
+        assert ProductQuantizerCodec(n_subspaces=48).code_width(384) == 48
+        assert trained(BinaryCodec(), np.zeros((1, 384))).encode(np.ones((1, 384))).nbytes == 48
+        assert PCACodec(dimensions=64).code_width(384) == 64
+
+    def test_pca_keeps_the_dominant_axes(self):
+        rng = np.random.default_rng(4)
+        low_rank = rng.standard_normal((500, 4)) @ rng.standard_normal((4, 32))
+        codec = trained(PCACodec(dimensions=4), low_rank.astype(np.float32))
+        assert codec.explained_variance > 0.999
+        assert np.allclose(codec.components @ codec.components.T, np.eye(4), atol=1e-5)
+        assert np.max(np.abs(codec.decode(codec.encode(low_rank)) - low_rank)) < 1e-3
+
+    def test_binary_scores_are_sign_vector_dot_products(self, vectors):
+        codec = trained(BinaryCodec(), vectors[:, :30])
+        codes = codec.encode(vectors[:, :30])
+        assert codes.shape == (600, 1) and codes.dtype == np.uint64
+        query = vectors[7, :30]
+        signs = codec.decode(codes)
+        assert np.allclose(codec.scores(query, codes), signs @ codec.decode(codec.encode(query[None]))[0], atol=1e-6)
+        assert codec.scores(query, codes)[7] == 1.0
+        assert np.allclose(codec.scores_batch(vectors[:3, :30], codes),
+                           np.stack([codec.scores(q, codes) for q in vectors[:3, :30]]))
+
+    def test_pq_requires_divisible_dimension(self, vectors):
+        with pytest.raises(ValueError):
+            ProductQuantizerCodec(n_subspaces=5).train(vectors)
+
+    def test_kmeans_separates_obvious_clusters(self):
+        points = np.array([[0, 0], [0, 0.1], [10, 10], [10, 10.1]], dtype=np.float32)
+        centroids = kmeans(points, 2)
+        assert sorted(np.round(centroids[:, 0]).tolist()) == [0.0, 10.0]
+
+    def test_create_codec(self):
+        assert create_codec("pq", pq_subspaces=16).n_subspaces == 16
+        assert create_codec("binary").name == "binary"
+        assert create_codec("pca", pca_dimensions=16).dimensions == 16
+        with pytest.raises(ValueError):
+            create_codec("zstd")
+
+
+class TestCodecStore:
+    def test_trains_codec_at_threshold(self, vectors):
+        store = VectorStore(codec=ScalarQuantizer8Codec(), codec_train_threshold=100)
+        store.add_batch([f"emb_{i}" for i in range(99)], vectors[:99])
+        assert not store.encoded
+        assert store.codes.dtype == np.float32
+
+        store.add("emb_99", vectors[99])
+        assert store.encoded
+        assert store.codes.dtype == np.uint8
+        assert np.allclose(store["emb_5"], vectors[5], atol=1e-2)
+
+    def test_compressed_memory_is_smaller(self, vectors):
+        full = VectorStore()
+        half = VectorStore(codec=Float16Codec())
+        for store in (full, half):
+            store.add_batch([f"emb_{i}" for i in range(600)], vectors)
+        assert half.memory_bytes() * 2 == full.memory_bytes()
+
+    def test_pq_search_with_rerank_returns_exact_scores(self, vectors):
+        store = VectorStore(codec=ProductQuantizerCodec(n_subspaces=8), codec_train_threshold=300, rerank_factor=4)
+        store.add_batch([f"emb_{i}" for i in range(600)], vectors)
+
+        rows, scores = store.search(vectors[10], top_k=5)
+
+        assert rows[0] == 10
+        assert np.allclose(scores, vectors[rows] @ vectors[10], atol=1e-5)
+
+    def test_binary_prefilter_with_rerank_returns_exact_scores(self, vectors):
+        store = VectorStore(codec=BinaryCodec(), codec_train_threshold=300, rerank_factor=10)
+        store.add_batch([f"emb_{i}" for i in range(600)], vectors)
+        assert store.codes.dtype == np.uint64
+
+        rows, scores = store.search(vectors[10], top_k=5)
+        assert rows[0] == 10
+        assert np.allclose(scores, vectors[rows] @ vectors[10], atol=1e-5)
+        (batch_rows, batch_scores), = store.search_batch([vectors[10]], top_k=5)
+        assert batch_rows.tolist() == rows.tolist() and np.allclose(batch_scores, scores)
+
+    def test_pca_coarse_pass_with_rerank_returns_exact_scores(self, vectors):
+        store = VectorStore(codec=PCACodec(dimensions=8), codec_train_threshold=300, rerank_factor=10)
+        store.add_batch([f"emb_{i}" for i in range(600)], vectors)
+        assert store.codes.shape == (600, 8) and store.codec_fit_rows == 600
+
+        rows, scores = store.search(vectors[42], top_k=5)
+        assert rows[0] == 42
+        assert np.allclose(scores, vectors[rows] @ vectors[42], atol=1e-5)
+
+    @pytest.mark.parametrize("make_store", [
+        lambda tmp_path: VectorStore(codec=PCACodec(dimensions=8), codec_train_threshold=100, rerank_factor=4),
+        lambda tmp_path: SegmentedVectorStore(str(tmp_path), segment_rows=128, codec=PCACodec(dimensions=8),
+                                              codec_train_threshold=100, rerank_factor=4),
+    ], ids=["heap", "segmented"])
+    def test_refit_retrains_and_re_encodes_every_row(self, vectors, tmp_path, make_store):
+        store = make_store(tmp_path)
+        store.add_batch([f"emb_{i}" for i in range(100)], vectors[:100])
+        store.add_batch([f"emb_{i}" for i in range(100, 400)], vectors[100:400])
+        assert store.codec_fit_rows == 100
+        old_components = store.codec.components.copy()
+        built = store.build_refit(len(store))
+        # Rows appended while the refit was building are encoded with the new codec on commit
+        store.add_batch([f"emb_{i}" for i in range(400, 600)], vectors[400:])
+        store.commit_refit(built)
+
+        assert store.codec is built["codec"] and store.codec_fit_rows == 400
+        assert not np.allclose(store.codec.components, old_components)
+        assert np.allclose(store.codes, store.codec.encode(vectors), atol=1e-5)
+        assert store.search(vectors[555], top_k=1)[0][0] == 555
+
+    def test_memory_mapped_rerank_store(self, vectors, tmp_path):
+        path = str(tmp_path / "full_precision.f32")
+        store = VectorStore(codec=ScalarQuantizer8Codec(), codec_train_threshold=50, rerank_factor=2,
+                            rerank_path=path, initial_capacity=16)
+        store.add_batch([f"emb_{i}" for i in range(600)], vectors)
+
+        rows, _ = store.search(vectors[321], top_k=3)
+        assert rows[0] == 321
+        assert np.allclose(store.full_precision.rows(np.array([321])), vectors[321:322], atol=1e-6)
+
+
+class TestCodecRefit:
+    def db(self, vectors, rows):
+        db = VectorDatabase(store=VectorStore(codec=PCACodec(dimensions=24), codec_train_threshold=100,
+                                              rerank_factor=4))
+        for start, stop in ((0, 100), (100, rows)):
+            db.add_embeddings([{"id": f"emb_{i}", "chunk_id": f"chunk_{i}", "task_id": f"task_{i % 2}"}
+                               for i in range(start, stop)], vectors=vectors[start:stop])
+        return db
+
+    def test_refit_is_due_once_the_store_grows(self, vectors):
+        db = self.db(vectors, 150)
+        assert db.vectors.codec_fit_rows == 100
+        assert not db.refit_due(2.0) and db.refit_due(1.5) and not db.refit_due(0)
+        assert db.refit()
+        assert db.vectors.codec_fit_rows == 150 and not db.refit_due(1.5)
+        assert VectorDatabase().start_refit() is None
+
+    def test_delete_during_build_abandons_the_refit(self, vectors):
+        db = self.db(vectors, 300)
+        codec = db.vectors.codec
+        job = db.build_refit(db.start_refit())
+        db.delete_task("task_1")
+        assert not db.commit_refit(job)
+        assert db.vectors.codec is codec
+        assert db.refit()
+        found = db.search(vectors[10].tolist(), top_k=3)
+        assert found[0]["embedding_id"] == "emb_10"
+        assert all(r["metadata"]["task_id"] == "task_0" for r in found)
@@ -0,0 +1,162 @@
+import pytest
+import numpy as np
+
+from services.vectorial_db.hnsw import HNSWIndex
+from services.vectorial_db.ivf import IVFIndex
+from services.vectorial_db.main import VectorDatabase
+from services.vectorial_db.segments import SegmentedVectorStore
+from services.vectorial_db.store import VectorStore
+from shared.models.embedding import Embedding
+
+DIM = 16
+
+
+def add_rows(db, start, stop, tasks=("task_a", "task_b", "task_c")):
+    rng = np.random.default_rng(start)
+    for i in range(start, stop):
+        db.add_embedding(Embedding(
+            id=f"emb_{i}",
+            chunk_id=f"chunk_{i}",
+            task_id=tasks[i % len(tasks)],
+            vector=rng.standard_normal(DIM).tolist(),
+            model_name="mock-model",
+            dimension=DIM
+        ))
+    return db
+
+
+def exact_ids(db, query, top_k, task_ids=None):
+    """Reference: brute force over the embeddings that are still stored"""
+    ids = [i for t, ids in db.task_embeddings.items() if task_ids is None or t in task_ids for i in ids]
+    vectors = np.stack([db.vectors[i] for i in ids])
+    q = np.asarray(query, dtype=np.float32)
+    order = np.argsort(-(vectors @ (q / np.linalg.norm(q))), kind="stable")[:top_k]
+    return [ids[i] for i in order]
+
+
+def result_ids(results):
+    return [r["embedding_id"] for r in results]
+
+
+class TestVectorStoreDelete:
+    def test_deleted_rows_are_masked_out(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((50, DIM)).astype(np.float32)
+        store = VectorStore()
+        store.add_batch([f"v{i}" for i in range(50)], vectors)
+
+        assert store.live_mask() is None
+        assert store.delete(["v3", "v7", "missing"]) == 2
+        assert store.delete(["v3"]) == 0
+        assert store.dead_rows == 2
+        assert "v3" not in store
+        live = store.live_mask()
+        assert not live[3] and not live[7] and live.sum() == 48
+
+        rows, _ = store.search(vectors[3], top_k=50, mask=live)
+        assert 3 not in rows.tolist() and 7 not in rows.tolist()
+        assert len(rows) == 48
+        (batch_rows, _), = store.search_batch([vectors[7]], top_k=5, mask=live)
+        assert 7 not in batch_rows.tolist()
+
+    def test_re_added_id_gets_a_new_row(self):
+        store = VectorStore()
+        store.add("a", np.ones(DIM))
+        store.delete(["a"])
+        row = store.add("a", np.ones(DIM))
+        assert row == 1 and store.id_to_row == {"a": 1}
+        assert store.live_mask().tolist() == [False, True]
+
+    def test_rewrite_drops_dead_rows_and_keeps_tail(self):
+        rng = np.random.default_rng(1)
+        store = VectorStore()
+        store.add_batch([f"v{i}" for i in range(20)], rng.standard_normal((20, DIM)))
+        store.delete(["v0", "v5"])
+        built = store.build_rewrite(np.flatnonzero(store.live_mask()), len(store))
+        # Appended while the copy was being built
+        tail = rng.standard_normal((3, DIM)).astype(np.float32)
+        store.add_batch(["t0", "t1", "t2"], tail)
+        before = {embedding_id: store[embedding_id] for embedding_id in store.id_to_row}
+
+        new_row_of = store.commit_rewrite(built)
+        assert new_row_of[0] == -1 and new_row_of[5] == -1 and new_row_of[22] == 20
+        assert len(store) == 21 and store.dead_rows == 0 and store.live_mask() is None
+        assert store.ids[-3:] == ["t0", "t1", "t2"]
+        for embedding_id, vector in before.items():
+            assert np.allclose(store[embedding_id], vector)
+
+
+@pytest.mark.parametrize("make_db", [
+    lambda tmp_path: VectorDatabase(),
+    lambda tmp_path: VectorDatabase(store=SegmentedVectorStore(str(tmp_path), segment_rows=32)),
+    lambda tmp_path: VectorDatabase(index=IVFIndex(n_lists=4, train_threshold=50)),
+    lambda tmp_path: VectorDatabase(index=HNSWIndex(M=8, ef_construction=64, ef_search=128)),
+], ids=["flat", "segmented", "ivf", "hnsw"])
+class TestDeleteTask:
+    def test_deleted_task_disappears_from_search(self, tmp_path, make_db):
+        db = add_rows(make_db(tmp_path), 0, 150)
+        assert db.delete_task("task_b") == 50
+        assert db.delete_task("task_b") == 0
+        assert "task_b" not in db.task_embeddings and "task_b" not in db.task_ranges
+        stats = db.get_stats()
+        assert stats["total_embeddings"] == 100 and stats["deleted_rows"] == 50
+
+        query = np.random.default_rng(42).standard_normal(DIM)
+        found = result_ids(db.search(query.tolist(), top_k=10, nprobe=4))
+        assert len(found) == 10
+        assert all(db.metadata[i]["task_id"] != "task_b" for i in found)
+        assert db.search(query.tolist(), top_k=5, task_ids=["task_b"]) == []
+        batched, = db.search_batch([query.tolist()], [10], [None], nprobe=4)
+        assert result_ids(batched) == found
+
+    def test_purge_preserves_results(self, tmp_path, make_db):
+        db = add_rows(make_db(tmp_path), 0, 150)
+        db.delete_task("task_a")
+        queries = np.random.default_rng(7).standard_normal((5, DIM))
+        before = [result_ids(db.search(q.tolist(), top_k=5, task_ids=["task_c"])) for q in queries]
+
+        assert db.purge()
+        assert not db.purge()
+        assert len(db.vectors) == 100 and db.dead_ratio() == 0.0
+        for q, expected in zip(queries, before):
+            assert result_ids(db.search(q.tolist(), top_k=5, task_ids=["task_c"])) == expected
+            assert result_ids(db.search(q.tolist(), top_k=5, task_ids=["task_c"])) == exact_ids(db, q, 5, ["task_c"])
+        unfiltered = result_ids(db.search(queries[0].tolist(), top_k=5, nprobe=4))
+        assert set(unfiltered) & set(exact_ids(db, queries[0], 5))
+        # Later appends and compaction still work on the rewritten store
+        add_rows(db, 150, 180)
+        assert db.compact() or db.fragmentation() == 1.0
+        assert sorted(db.vectors.ids) == sorted(i for ids in db.task_embeddings.values() for i in ids)
+
+
+class TestPurgeJob:
+    def test_rows_appended_during_build_survive(self):
+        db = add_rows(VectorDatabase(), 0, 60)
+        db.delete_task("task_a")
+        job = db.start_purge()
+        assert db.start_purge() is None  # one purge at a time
+        db.build_purge(job)
+        add_rows(db, 60, 66)
+        assert db.commit_purge(job)
+        assert len(db.vectors) == 46
+        for task_id, ranges in db.task_ranges.items():
+            rows = [row for start, stop in ranges for row in range(start, stop)]
+            assert sorted(db.vectors.ids[row] for row in rows) == sorted(db.task_embeddings[task_id])
+
+    def test_concurrent_delete_abandons_the_build(self):
+        db = add_rows(VectorDatabase(), 0, 60)
+        db.delete_task("task_a")
+        job = db.build_purge(db.start_purge())
+        db.delete_task("task_b")
+        assert not db.commit_purge(job)
+        assert len(db.vectors) == 60 and db.vectors.dead_rows == 40
+        assert db.purge() and len(db.vectors) == 20
+
+    def test_compact_keeps_deleted_rows_masked(self):
+        db = add_rows(VectorDatabase(), 0, 90)
+        db.delete_task("task_b")
+        assert db.compact()
+        assert db.task_ranges == {"task_a": [[0, 30]], "task_c": [[30, 60]]}
+        assert db.vectors.live_mask()[60:].sum() == 0
+        query = np.random.default_rng(3).standard_normal(DIM)
+        assert result_ids(db.search(query.tolist(), top_k=60)) == exact_ids(db, query, 60)
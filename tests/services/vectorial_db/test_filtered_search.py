@@ -0,0 +1,166 @@
+import pytest
+import numpy as np
+
+from services.vectorial_db.hnsw import HNSWIndex
+from services.vectorial_db.ivf import IVFIndex
+from services.vectorial_db.main import VectorDatabase
+from services.vectorial_db.planner import QueryPlanner, PLAN_ANN, PLAN_EMPTY, PLAN_GATHER, PLAN_MASK, PLAN_SLICES
+from services.vectorial_db.segments import SegmentedVectorStore
+from shared.models.embedding import Embedding
+
+DIM = 16
+
+
+def interleaved_db(db=None, n=120, tasks=("task_a", "task_b", "task_c")):
+    """Rows from several tasks arriving round-robin, so every task is fragmented"""
+    db = db or VectorDatabase()
+    rng = np.random.default_rng(9)
+    for i in range(n):
+        db.add_embedding(Embedding(
+            id=f"emb_{i}",
+            chunk_id=f"chunk_{i}",
+            task_id=tasks[i % len(tasks)],
+            vector=rng.standard_normal(DIM).tolist(),
+            model_name="mock-model",
+            dimension=DIM
+        ))
+    return db
+
+
+def exact_filtered(db, query, top_k, task_ids):
+    """Reference: brute force over the task's embeddings"""
+    ids = [i for t in task_ids for i in db.task_embeddings.get(t, [])]
+    vectors = np.stack([db.vectors[i] for i in ids])
+    q = np.asarray(query, dtype=np.float32)
+    scores = vectors @ (q / np.linalg.norm(q))
+    order = np.argsort(-scores, kind="stable")[:top_k]
+    return [ids[i] for i in order]
+
+
+class TestQueryPlanner:
+    def test_plans(self):
+        planner = QueryPlanner(ann_min_selectivity=0.3, max_slices=4, mask_min_selectivity=0.05)
+        assert planner.plan(1000, 0, 0, index_trained=True) == PLAN_EMPTY
+        assert planner.plan(1000, 500, 50, index_trained=True) == PLAN_ANN
+        assert planner.plan(1000, 500, 2, index_trained=False) == PLAN_SLICES
+        assert planner.plan(1000, 100, 2, index_trained=True) == PLAN_SLICES
+        assert planner.plan(1000, 100, 50, index_trained=False) == PLAN_MASK
+        assert planner.plan(1000, 10, 10, index_trained=False) == PLAN_GATHER
+
+    def test_ann_top_k_scales_with_selectivity(self):
+        planner = QueryPlanner(ann_overfetch=2.0)
+        assert planner.ann_top_k(5, 1000, 500) == 20
+        assert planner.ann_top_k(5, 100, 1) == 100
+
+
+class TestTaskRanges:
+    def test_contiguous_task_is_one_range(self):
+        db = interleaved_db(tasks=("task_a",), n=10)
+        assert db.task_ranges == {"task_a": [[0, 10]]}
+        assert db.fragmentation() == 1.0
+
+    def test_interleaved_tasks_fragment(self):
+        db = interleaved_db(n=9)
+        assert db.task_ranges["task_a"] == [[0, 1], [3, 4], [6, 7]]
+        assert db.fragmentation() == 3.0
+
+    def test_multiple_tasks_merge_adjacent_ranges(self):
+        db = interleaved_db(n=9)
+        assert db._task_ranges(["task_a", "task_b"]) == [(0, 2), (3, 5), (6, 8)]
+
+
+class TestFilteredSearch:
+    @pytest.mark.parametrize("planner,expected_plan", [
+        (QueryPlanner(max_slices=1000), PLAN_SLICES),
+        (QueryPlanner(max_slices=1, mask_min_selectivity=0.0), PLAN_MASK),
+        (QueryPlanner(max_slices=1, mask_min_selectivity=1.0), PLAN_GATHER),
+    ])
+    def test_every_exact_plan_matches_brute_force(self, planner, expected_plan):
+        db = interleaved_db(VectorDatabase(planner=planner))
+        query = db.vectors["emb_4"].tolist()
+        for task_ids in (["task_b"], ["task_a", "task_c"]):
+            results = db.search(query, top_k=5, task_ids=task_ids)
+            assert [r["embedding_id"] for r in results] == exact_filtered(db, query, 5, task_ids)
+        assert db.plan_counts == {expected_plan: 2}
+
+    def test_ann_plan_post_filters_index_results(self):
+        db = interleaved_db(VectorDatabase(index=HNSWIndex(M=8, ef_construction=40),
+                                           planner=QueryPlanner(ann_min_selectivity=0.2)))
+        query = db.vectors["emb_7"].tolist()
+        results = db.search(query, top_k=3, task_ids=["task_b"])
+        assert db.plan_counts == {PLAN_ANN: 1}
+        assert results[0]["embedding_id"] == "emb_7"
+        assert {r["metadata"]["task_id"] for r in results} == {"task_b"}
+
+    def test_unknown_task_returns_nothing(self):
+        db = interleaved_db()
+        assert db.search([0.1] * DIM, top_k=5, task_ids=["missing"]) == []
+
+    def test_batch_uses_slices(self):
+        db = interleaved_db()
+        query = db.vectors["emb_10"].tolist()
+        batched = db.search_batch([query, query], [3, 3], [["task_b"], ["task_b", "task_c"]])
+        assert [r["embedding_id"] for r in batched[0]] == exact_filtered(db, query, 3, ["task_b"])
+        assert [r["embedding_id"] for r in batched[1]] == exact_filtered(db, query, 3, ["task_b", "task_c"])
+
+
+class TestCompaction:
+    def test_compaction_makes_tasks_contiguous(self):
+        db = interleaved_db()
+        query = db.vectors["emb_5"].tolist()
+        before = {t: db.search(query, top_k=4, task_ids=[t]) for t in db.task_embeddings}
+
+        assert db.compact()
+        assert db.fragmentation() == 1.0
+        assert db.task_ranges == {"task_a": [[0, 40]], "task_b": [[40, 80]], "task_c": [[80, 120]]}
+        for task_id, expected in before.items():
+            results = db.search(query, top_k=4, task_ids=[task_id])
+            assert [r["embedding_id"] for r in results] == [r["embedding_id"] for r in expected]
+            assert [r["score"] for r in results] == pytest.approx([r["score"] for r in expected], abs=1e-5)
+        assert db.vectors.ids[:2] == ["emb_0", "emb_3"]
+        assert not db.compact()
+
+    @pytest.mark.parametrize("index", [IVFIndex(n_lists=4, train_threshold=50), HNSWIndex(M=8, ef_construction=40)])
+    def test_index_is_renumbered(self, index):
+        db = interleaved_db(VectorDatabase(index=index))
+        query = db.vectors["emb_31"].tolist()
+        assert db.compact()
+        results = db.search(query, top_k=1, nprobe=4)
+        assert results[0]["embedding_id"] == "emb_31"
+
+    def test_compaction_of_segmented_store(self, tmp_path):
+        db = interleaved_db(VectorDatabase(store=SegmentedVectorStore(str(tmp_path), segment_rows=32)))
+        expected = db.vectors.matrix[[db.vectors.id_to_row[f"emb_{i}"] for i in range(120)]]
+        assert db.compact()
+        assert len(db.vectors.segments) == 3
+        actual = db.vectors.matrix[[db.vectors.id_to_row[f"emb_{i}"] for i in range(120)]]
+        assert np.allclose(actual, expected)
+        assert all(name.startswith("segment_0001_") for name in (p.name for p in tmp_path.iterdir()))
+
+    def test_appends_during_a_compaction_build_are_carried_over(self):
+        db = interleaved_db()
+        job = db.start_compact()
+        assert db.start_compact() is None and db.start_purge() is None
+        db.build_compact(job)
+        rng = np.random.default_rng(4)
+        for i in range(6):
+            db.add_embedding(Embedding(id=f"late_{i}", chunk_id=f"late_{i}", task_id=("task_b", "task_d")[i % 2],
+                                       vector=rng.standard_normal(DIM).tolist(), model_name="mock-model",
+                                       dimension=DIM))
+
+        assert db.commit_compact(job)
+        assert db.task_ranges["task_a"] == [[0, 40]]
+        assert db.task_ranges["task_b"] == [[40, 80], [120, 121], [122, 123], [124, 125]]
+        assert db.task_ranges["task_d"] == [[121, 122], [123, 124], [125, 126]]
+        query = db.vectors["emb_4"].tolist()
+        assert db.search(query, top_k=1, task_ids=["task_b"])[0]["embedding_id"] == "emb_4"
+        assert exact_filtered(db, query, 4, ["task_b"]) == [r["embedding_id"] for r in
+                                                             db.search(query, top_k=4, task_ids=["task_b"])]
+
+    def test_compaction_is_abandoned_when_rows_change_during_its_build(self):
+        db = interleaved_db()
+        job = db.build_compact(db.start_compact())
+        db.delete_task("task_b")
+        assert not db.commit_compact(job)
+        assert db.fragmentation() > 1.0
+        assert db.compact() and db.task_ranges == {"task_a": [[0, 40]], "task_c": [[40, 80]]}
@@ -0,0 +1,209 @@
+import pytest
+import numpy as np
+from fastapi.testclient import TestClient
+
+from services.vectorial_db.filters import (
+    BitmapIndex, BoolOp, Condition, FilterError, mask_ranges, pack_mask, parse_filter, unpack_words
+)
+from services.vectorial_db.hnsw import HNSWIndex
+from services.vectorial_db.ivf import IVFIndex
+from services.vectorial_db.main import VectorDatabase, app, vector_service
+from services.vectorial_db.metadata import timestamp_micros
+from services.vectorial_db.result_cache import SearchResultCache
+from shared.models.embedding import Embedding
+
+DIM = 16
+USERS = ("alice", "bob", "carol", "dave")
+
+
+def tagged_db(db=None, n=200):
+    """Rows cycling through tasks, users, languages and two models"""
+    db = db or VectorDatabase()
+    rng = np.random.default_rng(3)
+    for i in range(n):
+        db.add_embedding(Embedding(
+            id=f"emb_{i}",
+            chunk_id=f"chunk_{i}",
+            task_id=f"task_{i % 3}",
+            vector=rng.standard_normal(DIM).tolist(),
+            model_name="model_a" if i % 5 else "model_b",
+            dimension=DIM,
+            metadata={"user_id": USERS[i % 4], "lang": "en" if i % 2 else "fr", "page": i}
+        ))
+    return db
+
+
+def exact_where(db, query, top_k, keep):
+    """Reference: brute force over the stored embeddings whose metadata passes keep()"""
+    ids = [i for i in db.metadata if keep(db.metadata[i])]
+    if not ids:
+        return []
+    vectors = np.stack([db.vectors[i] for i in ids])
+    q = np.asarray(query, dtype=np.float32)
+    order = np.argsort(-(vectors @ (q / np.linalg.norm(q))), kind="stable")[:top_k]
+    return [ids[i] for i in order]
+
+
+def result_ids(results):
+    return [r["embedding_id"] for r in results]
+
+
+def user(name):
+    return {"field": "metadata.user_id", "eq": name}
+
+
+class TestParseFilter:
+    def test_nodes(self):
+        assert parse_filter(user("alice")) == Condition("metadata.user_id", "in", ["alice"])
+        assert parse_filter({"or": [user("alice"), {"not": {"field": "model_name", "in": ["m"]}}]}) == BoolOp(
+            "or", [Condition("metadata.user_id", "in", ["alice"]),
+                   BoolOp("not", [Condition("model_name", "in", ["m"])])])
+        window = parse_filter({"field": "timestamp", "gte": "2024-05-01T00:00:00", "lt": "2024-06-01T00:00:00"})
+        assert window == BoolOp("and", [Condition("timestamp", "gte", timestamp_micros("2024-05-01T00:00:00")),
+                                        Condition("timestamp", "lt", timestamp_micros("2024-06-01T00:00:00"))])
+
+    @pytest.mark.parametrize("spec", [
+        [],
+        {"and": []},
+        {"and": [user("a")], "or": [user("b")]},
+        {"field": "owner", "eq": "a"},
+        {"field": "metadata.", "eq": "a"},
+        {"field": "model_name", "gt": "a"},
+        {"field": "model_name", "eq": "a", "in": ["b"]},
+        {"field": "model_name", "in": "a"},
+        {"field": "timestamp", "eq": "2024-05-01T00:00:00"},
+        {"field": "timestamp", "gte": "yesterday"},
+    ])
+    def test_rejects(self, spec):
+        with pytest.raises(FilterError):
+            parse_filter(spec)
+
+
+class TestBitmapIndex:
+    def test_pack_round_trip_and_ranges(self):
+        mask = np.random.default_rng(0).random(130) < 0.3
+        assert (unpack_words(pack_mask(mask), 130) == mask).all()
+        assert mask_ranges(np.array([1, 1, 0, 0, 1, 0, 1], dtype=bool)) == [(0, 2), (4, 5), (6, 7)]
+        assert mask_ranges(np.zeros(3, dtype=bool)) == []
+
+    def test_matching_follows_moves(self):
+        index = BitmapIndex()
+        index.add_rows(np.arange(6), [{"model_name": "m", "metadata": {"user_id": USERS[i % 2]}} for i in range(6)])
+        alice = lambda: unpack_words(index.matching("metadata.user_id", ["alice"], 1), 6)
+        assert np.flatnonzero(alice()).tolist() == [0, 2, 4]
+
+        index.clear_row(2)
+        assert np.flatnonzero(alice()).tolist() == [0, 4]
+        index.permute(np.array([5, 4, 3, 2, 1, 0]))
+        assert np.flatnonzero(alice()).tolist() == [1, 5]
+        index.rewrite(np.array([-1, 0, 1, 2, 3, -1]))
+        assert np.flatnonzero(unpack_words(index.matching("metadata.user_id", ["alice"], 1), 4)).tolist() == [0]
+
+    def test_high_cardinality_field_stops_being_indexed(self):
+        index = BitmapIndex(max_values=4)
+        index.add_rows(np.arange(10), [{"model_name": "m", "metadata": {"page": i}} for i in range(10)])
+        assert index.get_stats()["unindexed_fields"] == ["metadata.page"]
+        with pytest.raises(FilterError):
+            index.matching("metadata.page", [1], 1)
+
+
+@pytest.mark.parametrize("make_db", [
+    lambda: VectorDatabase(),
+    lambda: VectorDatabase(index=IVFIndex(n_lists=4, train_threshold=50)),
+    lambda: VectorDatabase(index=HNSWIndex(M=8, ef_construction=64, ef_search=256)),
+], ids=["flat", "ivf", "hnsw"])
+class TestFilteredSearch:
+    CASES = [
+        (user("alice"), lambda m: m["metadata"]["user_id"] == "alice"),
+        ({"and": [user("bob"), {"field": "model_name", "eq": "model_a"}]},
+         lambda m: m["metadata"]["user_id"] == "bob" and m["model_name"] == "model_a"),
+        ({"or": [user("alice"), {"field": "metadata.lang", "eq": "fr"}]},
+         lambda m: m["metadata"]["user_id"] == "alice" or m["metadata"]["lang"] == "fr"),
+        ({"not": {"field": "metadata.user_id", "in": ["alice", "bob"]}},
+         lambda m: m["metadata"]["user_id"] not in ("alice", "bob")),
+        ({"and": [{"field": "task_id", "eq": "task_1"}, {"field": "metadata.lang", "eq": "en"}]},
+         lambda m: m["task_id"] == "task_1" and m["metadata"]["lang"] == "en"),
+        (user("nobody"), lambda m: False),
+    ]
+
+    def test_matches_brute_force(self, make_db):
+        db = tagged_db(make_db())
+        queries = np.random.default_rng(5).standard_normal((5, DIM))
+        for spec, keep in self.CASES:
+            for query in queries:
+                assert result_ids(db.search(query.tolist(), top_k=5, where=spec)) == \
+                    exact_where(db, query, 5, keep), spec
+
+    def test_combines_with_task_ids(self, make_db):
+        db = tagged_db(make_db())
+        query = np.random.default_rng(6).standard_normal(DIM)
+        found = db.search(query.tolist(), top_k=5, task_ids=["task_2"], where=user("carol"))
+        assert result_ids(found) == exact_where(
+            db, query, 5, lambda m: m["task_id"] == "task_2" and m["metadata"]["user_id"] == "carol")
+        assert all(r["metadata"]["metadata"]["user_id"] == "carol" for r in found)
+
+    def test_survives_delete_compact_and_purge(self, make_db):
+        db = tagged_db(make_db())
+        query = np.random.default_rng(7).standard_normal(DIM)
+        keep = lambda m: m["metadata"]["user_id"] == "dave"
+        db.delete_task("task_0")
+        assert result_ids(db.search(query.tolist(), top_k=5, where=user("dave"))) == exact_where(db, query, 5, keep)
+        assert db.compact()
+        assert result_ids(db.search(query.tolist(), top_k=5, where=user("dave"))) == exact_where(db, query, 5, keep)
+        assert db.purge()
+        assert result_ids(db.search(query.tolist(), top_k=5, where=user("dave"))) == exact_where(db, query, 5, keep)
+
+
+class TestTimestampFilter:
+    def test_range_on_ingestion_time(self):
+        db = VectorDatabase()
+        vectors = np.random.default_rng(8).standard_normal((20, DIM)).astype(np.float32)
+        for start, stamp in ((0, "2024-05-01T00:00:00"), (10, "2024-06-01T00:00:00")):
+            db.apply_add_batch([f"emb_{i}" for i in range(start, start + 10)], vectors[start:start + 10], [
+                {"chunk_id": f"chunk_{i}", "task_id": "task", "model_name": "m", "dimension": DIM,
+                 "timestamp": stamp} for i in range(start, start + 10)])
+        may = {"field": "timestamp", "gte": "2024-05-01T00:00:00", "lt": "2024-05-15T00:00:00"}
+        found = db.search(vectors[15].tolist(), top_k=20, where=may)
+        assert sorted(result_ids(found)) == sorted(f"emb_{i}" for i in range(10))
+        assert result_ids(db.search(vectors[15].tolist(), top_k=1, where={"not": may})) == ["emb_15"]
+
+    def test_overwrite_updates_the_bitmaps(self):
+        db = tagged_db(n=4)
+        db.add_embedding(Embedding(id="emb_0", chunk_id="chunk_0", task_id="task_0", vector=[1.0] * DIM,
+                                   dimension=DIM, metadata={"user_id": "zoe"}))
+        assert result_ids(db.search([1.0] * DIM, top_k=5, where=user("zoe"))) == ["emb_0"]
+        assert "emb_0" not in result_ids(db.search([1.0] * DIM, top_k=5, where=user("alice")))
+
+
+class TestFilterCache:
+    def test_filter_is_part_of_the_key(self):
+        db = tagged_db(VectorDatabase(cache=SearchResultCache(max_entries=16)), n=40)
+        query = np.random.default_rng(9).standard_normal(DIM).tolist()
+        alice = db.search(query, top_k=3, where=user("alice"))
+        bob = db.search(query, top_k=3, where=user("bob"))
+        assert {r["metadata"]["metadata"]["user_id"] for r in bob} == {"bob"}
+        assert db.search(query, top_k=3, where=user("alice")) == alice
+        assert db.cache.get_stats()["hits"] == 1
+
+
+class TestFilterAPI:
+    def test_search_endpoint_filters(self):
+        vector_service.db = tagged_db(n=40)
+        client = TestClient(app)
+        response = client.post("/search", json={"query_vector": [0.1] * DIM, "top_k": 50,
+                                                "filter": {"field": "metadata.user_id", "in": ["alice", "bob"]}})
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert len(results) == 20
+        assert {r["metadata"]["metadata"]["user_id"] for r in results} == {"alice", "bob"}
+
+    def test_invalid_filter_is_422(self):
+        db = VectorDatabase()
+        db.bitmaps = BitmapIndex(max_values=8)
+        vector_service.db = tagged_db(db, n=40)
+        client = TestClient(app)
+        response = client.post("/search", json={"query_vector": [0.1] * DIM, "filter": {"field": "owner", "eq": 1}})
+        assert response.status_code == 422
+        response = client.post("/search", json={"query_vector": [0.1] * DIM,
+                                                "filter": {"field": "metadata.page", "eq": 1}})
+        assert response.status_code == 422
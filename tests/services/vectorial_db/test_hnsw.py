@@ -0,0 +1,61 @@
+import pytest
+import numpy as np
+
+from services.vectorial_db.hnsw import HNSWIndex
+from services.vectorial_db.store import VectorStore
+
+
+@pytest.fixture
+def store():
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((500, 16)).astype(np.float32)
+    store = VectorStore()
+    store.add_batch([f"emb_{i}" for i in range(500)], vectors)
+    return store
+
+
+@pytest.fixture
+def index(store):
+    index = HNSWIndex(M=8, ef_construction=64, ef_search=64)
+    for row in range(len(store)):
+        index.add(store, row)
+    return index
+
+
+class TestHNSWIndex:
+    def test_every_row_is_on_level_zero(self, index):
+        assert len(index) == 500
+        assert index.trained
+
+    def test_neighbour_lists_respect_limits(self, index):
+        for level, layer in enumerate(index.graph):
+            limit = index.max_neighbors_0 if level == 0 else index.M
+            assert all(len(links) <= limit for links in layer.values())
+
+    def test_finds_exact_match(self, store, index):
+        rows, scores = index.search(store, store.matrix[42], top_k=1)
+        assert rows[0] == 42
+        assert scores[0] == pytest.approx(1.0, abs=1e-5)
+
+    def test_recall_against_exact_scan(self, store, index):
+        rng = np.random.default_rng(2)
+        hits = 0
+        for query in rng.standard_normal((20, 16)):
+            exact, _ = store.search(query, 10)
+            approx, _ = index.search(store, query, 10, ef_search=100)
+            hits += len(set(exact.tolist()) & set(approx.tolist()))
+        assert hits / 200 >= 0.9
+
+    def test_results_sorted_descending(self, store, index):
+        _, scores = index.search(store, store.matrix[0] + 0.1, top_k=10)
+        assert np.all(np.diff(scores) <= 0)
+
+    def test_empty_index_returns_nothing(self, store):
+        rows, _ = HNSWIndex().search(store, store.matrix[0], top_k=5)
+        assert len(rows) == 0
+
+    def test_train_rebuilds_graph(self, store):
+        index = HNSWIndex(M=8)
+        index.train(store)
+        assert len(index) == 500
+        assert not index.should_train(10 ** 6)
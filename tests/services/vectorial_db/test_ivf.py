@@ -0,0 +1,143 @@
+import pytest
+import numpy as np
+
+from services.vectorial_db.hnsw import HNSWIndex
+from services.vectorial_db.ivf import IVFIndex, spherical_kmeans, assign_to_centroids
+from services.vectorial_db.main import VectorDatabase
+from services.vectorial_db.store import VectorStore
+
+
+@pytest.fixture
+def clustered_store():
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((8, 16)).astype(np.float32)
+    labels = rng.integers(0, 8, size=800)
+    vectors = centers[labels] + 0.05 * rng.standard_normal((800, 16)).astype(np.float32)
+    store = VectorStore()
+    store.add_batch([f"emb_{i}" for i in range(800)], vectors)
+    return store
+
+
+class TestKMeans:
+    def test_centroids_are_unit_norm(self, clustered_store):
+        centroids = spherical_kmeans(clustered_store.matrix, 8)
+        assert centroids.shape == (8, 16)
+        assert np.allclose(np.linalg.norm(centroids, axis=1), 1.0, atol=1e-5)
+
+    def test_assignment_picks_most_similar_centroid(self):
+        centroids = np.eye(3, dtype=np.float32)
+        vectors = np.array([[0.9, 0.1, 0.0], [0.0, 0.2, 0.8]], dtype=np.float32)
+        assert assign_to_centroids(vectors, centroids).tolist() == [0, 2]
+
+
+class TestIVFIndex:
+    def test_train_builds_posting_lists_covering_every_row(self, clustered_store):
+        index = IVFIndex(n_lists=8)
+        index.train(clustered_store)
+
+        all_rows = np.concatenate([np.array(lst) for lst in index.lists])
+        assert index.trained
+        assert sorted(all_rows.tolist()) == list(range(800))
+
+    def test_should_train_threshold(self):
+        index = IVFIndex(train_threshold=100)
+        assert not index.should_train(99)
+        assert index.should_train(100)
+
+    def test_search_finds_exact_neighbour_with_all_probes(self, clustered_store):
+        index = IVFIndex(n_lists=8)
+        index.train(clustered_store)
+
+        query = clustered_store.matrix[123]
+        exact_rows, _ = clustered_store.search(query, 10)
+        ivf_rows, _ = index.search(clustered_store, query, 10, nprobe=8)
+
+        assert ivf_rows.tolist() == exact_rows.tolist()
+
+    def test_nprobe_limits_candidates(self, clustered_store):
+        index = IVFIndex(n_lists=8)
+        index.train(clustered_store)
+
+        query = clustered_store.matrix[0]
+        assert len(index.candidates(query, nprobe=1)) < len(index.candidates(query, nprobe=8))
+
+    def test_incremental_add_assigns_new_rows(self, clustered_store):
+        index = IVFIndex(n_lists=8)
+        index.train(clustered_store)
+
+        vector = clustered_store.matrix[5] + 0.01
+        row = clustered_store.add("new", vector)
+        index.add(clustered_store, row)
+
+        assert index.row_list[row] == index.row_list[5]
+        assert row in index.lists[index.row_list[row]]
+
+
+class TestBackgroundRebuild:
+    def db(self, vectors, rows):
+        db = VectorDatabase(index=IVFIndex(n_lists=4, train_threshold=100), background_rebuilds=True)
+        db.add_embeddings([{"id": f"emb_{i}", "chunk_id": f"chunk_{i}", "task_id": f"task_{i % 2}"}
+                           for i in range(rows)], vectors=vectors[:rows])
+        return db
+
+    def add(self, db, vectors, start, stop):
+        db.add_embeddings([{"id": f"emb_{i}", "chunk_id": f"chunk_{i}", "task_id": f"task_{i % 2}"}
+                           for i in range(start, stop)], vectors=vectors[start:stop])
+
+    @pytest.fixture
+    def vectors(self, clustered_store):
+        return clustered_store.matrix.copy()
+
+    def test_writes_never_train_inline(self, vectors):
+        db = self.db(vectors, 300)
+        assert not db.index.trained and db.rebuild_due(4)
+        # Untrained, searches fall back to the exact flat scan
+        assert db.search(vectors[7].tolist(), top_k=1)[0]["embedding_id"] == "emb_7"
+
+    def test_old_index_serves_until_the_swap_then_covers_the_delta(self, vectors):
+        db = self.db(vectors, 300)
+        assert db.rebuild()
+        serving = db.index
+        job = db.build_rebuild(db.start_rebuild())
+        assert db.start_rebuild() is None
+        self.add(db, vectors, 300, 500)
+        assert db.index is serving
+        assert db.search(vectors[450].tolist(), top_k=1, nprobe=4)[0]["embedding_id"] == "emb_450"
+
+        assert db.commit_rebuild(job)
+        assert db.index is job["index"] and db.index is not serving and db.index_rows == 300
+        covered = np.concatenate([np.array(lst) for lst in db.index.lists])
+        assert sorted(covered.tolist()) == list(range(500))
+        assert db.search(vectors[450].tolist(), top_k=1, nprobe=4)[0]["embedding_id"] == "emb_450"
+
+    def test_rebuild_is_due_once_the_store_grows(self, vectors):
+        db = self.db(vectors, 200)
+        assert db.rebuild()
+        self.add(db, vectors, 200, 600)
+        assert not db.rebuild_due(4) and db.rebuild_due(3) and not db.rebuild_due(0)
+        assert db.rebuild() and db.index_rows == 600 and not db.rebuild_due(3)
+        assert not VectorDatabase(index=HNSWIndex(M=4)).rebuild_due(4)
+
+    def test_delete_during_build_abandons_the_rebuild(self, vectors):
+        db = self.db(vectors, 300)
+        job = db.build_rebuild(db.start_rebuild())
+        db.delete_task("task_1")
+        assert not db.commit_rebuild(job)
+        assert not db.index.trained
+        assert db.rebuild()
+        found = db.search(vectors[10].tolist(), top_k=3, nprobe=4)
+        assert found[0]["embedding_id"] == "emb_10"
+        assert all(r["metadata"]["task_id"] == "task_0" for r in found)
+
+    def test_hnsw_rebuild_has_its_own_random_generator(self, vectors):
+        db = VectorDatabase(index=HNSWIndex(M=4), background_rebuilds=True)
+        self.add(db, vectors, 0, 100)
+        live_state = db.index.rng.bit_generator.state
+        job = db.start_rebuild()
+        assert job["index"].rng is not db.index.rng
+        db.build_rebuild(job)
+        # The build, which runs in a worker thread, left the serving index's generator alone
+        assert db.index.rng.bit_generator.state == live_state
+        self.add(db, vectors, 100, 150)
+        assert db.commit_rebuild(job)
+        assert db.search(vectors[120].tolist(), top_k=1, ef_search=20)[0]["embedding_id"] == "emb_120"
@@ -0,0 +1,71 @@
+import numpy as np
+
+from services.vectorial_db.main import VectorDatabase
+from services.vectorial_db.metadata import ColumnarMetadata, timestamp_iso, timestamp_micros
+from services.vectorial_db.persistence import VectorPersistence
+from services.vectorial_db.store import VectorStore
+
+DIM = 8
+
+
+def row_metadata(i, task_id="task_a", model_name="mock-model", timestamp="2024-05-01T12:30:45.123456"):
+    return {"chunk_id": f"chunk_{i}", "task_id": task_id, "model_name": model_name,
+            "dimension": DIM, "timestamp": timestamp}
+
+
+def filled(n):
+    store = VectorStore()
+    store.add_batch([f"emb_{i}" for i in range(n)], np.random.default_rng(0).standard_normal((n, DIM)))
+    metadata = ColumnarMetadata(store, initial_capacity=4)
+    metadata.set_rows(np.arange(n), [row_metadata(i, task_id=f"task_{i % 3}") for i in range(n)])
+    return store, metadata
+
+
+class TestTimestamps:
+    def test_iso_round_trip(self):
+        for value in ("2024-05-01T12:30:45.123456", "2024-05-01T12:30:45", "1969-12-31T23:59:59.5"):
+            assert timestamp_iso(timestamp_micros(value)) == value.replace(".5", ".500000")
+
+    def test_aware_timestamps_are_stored_as_utc(self):
+        assert timestamp_iso(timestamp_micros("2024-05-01T14:30:00+02:00")) == "2024-05-01T12:30:00"
+
+
+class TestColumnarMetadata:
+    def test_reads_like_a_dict(self):
+        store, metadata = filled(10)
+        expected = {f"emb_{i}": row_metadata(i, task_id=f"task_{i % 3}") for i in range(10)}
+        assert metadata == expected
+        assert metadata["emb_4"] == expected["emb_4"]
+        assert "emb_4" in metadata and "emb_99" not in metadata
+        assert len(metadata) == 10
+        assert metadata.task_of("emb_5") == "task_2"
+        assert len(metadata.tasks) == 3 and len(metadata.models) == 1
+
+    def test_deleted_ids_disappear(self):
+        store, metadata = filled(5)
+        store.delete(["emb_1"])
+        assert "emb_1" not in metadata and len(metadata) == 4
+
+    def test_permute_and_rewrite_follow_the_store(self):
+        store, metadata = filled(6)
+        order = np.array([5, 4, 3, 2, 1, 0])
+        store.reorder(order)
+        metadata.permute(order)
+        assert metadata.at_row(0)["chunk_id"] == "chunk_5"
+        assert metadata == {f"emb_{i}": row_metadata(i, task_id=f"task_{i % 3}") for i in range(6)}
+
+        new_row_of = np.array([0, -1, 1, -1, 2, 3])
+        metadata.rewrite(new_row_of)
+        assert [metadata.at_row(row)["chunk_id"] for row in range(4)] == ["chunk_5", "chunk_3", "chunk_1", "chunk_0"]
+
+    def test_database_round_trip_through_snapshot(self, tmp_path):
+        db = VectorDatabase(persistence=VectorPersistence(str(tmp_path)))
+        db.add_embeddings([dict(row_metadata(i), id=f"emb_{i}") for i in range(4)],
+                          vectors=np.eye(4, DIM, dtype=np.float32))
+        db.snapshot()
+        db.persistence.close()
+
+        restored = VectorDatabase(persistence=VectorPersistence(str(tmp_path)))
+        restored.recover()
+        assert restored.metadata == db.metadata
+        assert restored.search(np.eye(1, DIM)[0].tolist(), top_k=1)[0]["metadata"] == db.metadata["emb_0"]
@@ -0,0 +1,244 @@
+import os
+import numpy as np
+import pytest
+
+from services.vectorial_db.main import VectorDatabase
+from services.vectorial_db.hnsw import HNSWIndex
+from services.vectorial_db.persistence import VectorPersistence, WriteAheadLog, OP_ADD
+from shared.models.embedding import Embedding
+
+
+def make_embedding(i, task_id="task_1", dim=16, rng=None):
+    rng = rng or np.random.default_rng(i)
+    return Embedding(
+        id=f"emb_{i}",
+        chunk_id=f"chunk_{i}",
+        task_id=task_id,
+        vector=rng.standard_normal(dim).tolist(),
+        model_name="mock-model",
+        dimension=dim
+    )
+
+
+def open_db(data_dir, index=None):
+    db = VectorDatabase(index=index, persistence=VectorPersistence(str(data_dir)))
+    db.recover()
+    return db
+
+
+def assert_same_state(db, other):
+    assert other.vectors.ids == db.vectors.ids
+    assert np.allclose(other.vectors.matrix, db.vectors.matrix)
+    assert other.metadata == db.metadata
+    assert other.task_embeddings == db.task_embeddings
+
+
+class TestWriteAheadLog:
+    def test_round_trip(self, tmp_path):
+        path = str(tmp_path / "wal.log")
+        wal = WriteAheadLog(path)
+        wal.append(OP_ADD, {"id": "a", "task_id": "t"}, np.arange(4, dtype=np.float32))
+        wal.append(OP_ADD, {"id": "b", "task_id": "t"}, np.ones(4, dtype=np.float32))
+        wal.close()
+
+        records = list(WriteAheadLog.replay(path))
+        assert [record["id"] for _, record, _ in records] == ["a", "b"]
+        assert np.array_equal(records[0][2], np.arange(4, dtype=np.float32))
+
+    def test_torn_tail_is_truncated(self, tmp_path):
+        path = str(tmp_path / "wal.log")
+        wal = WriteAheadLog(path)
+        wal.append(OP_ADD, {"id": "a"}, np.ones(4, dtype=np.float32))
+        wal.close()
+        intact_size = os.path.getsize(path)
+        with open(path, "ab") as f:
+            f.write(b"A\x05\x00\x00")  # crash in the middle of the next record
+
+        assert [record["id"] for _, record, _ in WriteAheadLog.replay(path)] == ["a"]
+        wal = WriteAheadLog(path)
+        assert os.path.getsize(path) == intact_size
+        wal.append(OP_ADD, {"id": "b"}, np.ones(4, dtype=np.float32))
+        wal.close()
+        assert [record["id"] for _, record, _ in WriteAheadLog.replay(path)] == ["a", "b"]
+
+    def test_corrupt_record_stops_replay(self, tmp_path):
+        path = str(tmp_path / "wal.log")
+        wal = WriteAheadLog(path)
+        wal.append(OP_ADD, {"id": "a"}, np.ones(4, dtype=np.float32))
+        wal.close()
+        with open(path, "r+b") as f:
+            f.seek(-6, os.SEEK_END)
+            f.write(b"\xff")
+
+        assert list(WriteAheadLog.replay(path)) == []
+
+
+class TestVectorPersistence:
+    def test_recover_from_wal_only(self, tmp_path):
+        db = open_db(tmp_path)
+        for i in range(10):
+            db.add_embedding(make_embedding(i, task_id="task_1" if i < 6 else "task_2"))
+        db.persistence.close()
+
+        restored = open_db(tmp_path)
+        assert_same_state(db, restored)
+
+    def test_recover_bulk_batches(self, tmp_path):
+        db = open_db(tmp_path)
+        db.add_embeddings([make_embedding(i).dict() for i in range(8)])
+        db.add_embedding(make_embedding(3, task_id="task_1"))
+        db.add_embeddings([make_embedding(i, task_id="task_2").dict() for i in range(8, 12)])
+        db.persistence.close()
+
+        restored = open_db(tmp_path)
+        assert_same_state(db, restored)
+        assert restored.persistence.wal.records_since_snapshot == 13
+
+    def test_torn_batch_is_dropped_whole(self, tmp_path):
+        db = open_db(tmp_path)
+        db.add_embeddings([make_embedding(i).dict() for i in range(4)])
+        db.persistence.close()
+        intact_size = os.path.getsize(tmp_path / "wal.log")
+        db = open_db(tmp_path)
+        db.add_embeddings([make_embedding(i).dict() for i in range(4, 8)])
+        db.persistence.close()
+        with open(tmp_path / "wal.log", "r+b") as f:
+            f.truncate(intact_size + 100)
+
+        restored = open_db(tmp_path)
+        assert restored.vectors.ids == [f"emb_{i}" for i in range(4)]
+
+    def test_recover_from_snapshot_and_tail(self, tmp_path):
+        db = open_db(tmp_path)
+        for i in range(20):
+            db.add_embedding(make_embedding(i))
+        snapshot = db.snapshot()
+        assert snapshot["rows"] == 20
+        assert db.persistence.wal.records_since_snapshot == 0
+        for i in range(20, 25):
+            db.add_embedding(make_embedding(i, task_id="task_2"))
+        db.persistence.close()
+
+        restored = open_db(tmp_path)
+        assert_same_state(db, restored)
+        assert restored.persistence.wal.records_since_snapshot == 5
+
+    def test_re_added_id_after_snapshot_overwrites(self, tmp_path):
+        db = open_db(tmp_path)
+        db.add_embedding(make_embedding(0))
+        db.snapshot()
+        db.add_embedding(make_embedding(0, rng=np.random.default_rng(99)))
+        db.persistence.close()
+
+        restored = open_db(tmp_path)
+        assert len(restored.vectors) == 1
+        assert restored.task_embeddings == {"task_1": ["emb_0"]}
+        assert np.allclose(restored.vectors["emb_0"], db.vectors["emb_0"])
+
+    def test_crash_between_snapshot_renames(self, tmp_path):
+        db = open_db(tmp_path)
+        for i in range(8):
+            db.add_embedding(make_embedding(i))
+        db.snapshot()
+        db.add_embedding(make_embedding(8))
+        db.persistence.close()
+        # The previous snapshot was moved aside but the new one never landed
+        os.replace(tmp_path / "snapshot", tmp_path / "snapshot.old")
+
+        restored = open_db(tmp_path)
+        assert_same_state(db, restored)
+
+    def test_sealed_logs_are_replayed(self, tmp_path):
+        db = open_db(tmp_path)
+        for i in range(4):
+            db.add_embedding(make_embedding(i))
+        # Crash after the WAL was sealed but before the snapshot was written
+        db.persistence.wal.seal(str(tmp_path / "wal.0.sealed"))
+        db.add_embedding(make_embedding(4))
+        db.persistence.close()
+
+        restored = open_db(tmp_path)
+        assert_same_state(db, restored)
+
+    def test_writes_during_a_snapshot_build_land_in_the_new_log(self, tmp_path):
+        db = open_db(tmp_path)
+        for i in range(10):
+            db.add_embedding(make_embedding(i))
+        job = db.start_snapshot()
+        assert db.start_snapshot() is None
+        db.add_embedding(make_embedding(10, task_id="task_2"))
+        db.build_snapshot(job)
+        db.add_embedding(make_embedding(11, task_id="task_2"))
+
+        assert db.commit_snapshot(job)["rows"] == 10
+        assert not list(tmp_path.glob("wal.*.sealed"))
+        assert db.persistence.wal.records_since_snapshot == 2
+        db.persistence.close()
+
+        restored = open_db(tmp_path)
+        assert_same_state(db, restored)
+
+    def test_snapshot_is_abandoned_when_rows_are_rewritten_during_its_build(self, tmp_path):
+        db = open_db(tmp_path)
+        for i in range(10):
+            db.add_embedding(make_embedding(i, task_id="task_1" if i < 6 else "task_2"))
+        job = db.build_snapshot(db.start_snapshot())
+        db.delete_task("task_1")
+        assert db.purge()
+
+        assert db.commit_snapshot(job) is None
+        assert not (tmp_path / "snapshot").exists() and len(list(tmp_path.glob("wal.*.sealed"))) == 1
+        db.persistence.close()
+
+        restored = open_db(tmp_path)
+        assert restored.task_embeddings == db.task_embeddings
+        for i in range(6, 10):
+            assert np.allclose(restored.vectors[f"emb_{i}"], db.vectors[f"emb_{i}"])
+        assert restored.snapshot()["rows"] == 4
+
+    def test_empty_snapshot(self, tmp_path):
+        db = open_db(tmp_path)
+        assert db.snapshot()["rows"] == 0
+        db.persistence.close()
+
+        restored = open_db(tmp_path)
+        assert len(restored.vectors) == 0
+
+    def test_index_is_rebuilt_after_recovery(self, tmp_path):
+        db = open_db(tmp_path, index=HNSWIndex(M=4, ef_construction=16))
+        for i in range(30):
+            db.add_embedding(make_embedding(i))
+        db.snapshot()
+        db.persistence.close()
+
+        restored = open_db(tmp_path, index=HNSWIndex(M=4, ef_construction=16))
+        assert restored.index.trained
+        assert len(restored.index) == 30
+        query = db.vectors["emb_7"]
+        assert restored.search(query.tolist(), top_k=1)[0]["embedding_id"] == "emb_7"
+
+    def test_deleted_task_stays_deleted(self, tmp_path):
+        db = open_db(tmp_path)
+        for i in range(10):
+            db.add_embedding(make_embedding(i, task_id="task_1" if i % 2 else "task_2"))
+        assert db.delete_task("task_2") == 5
+        db.persistence.close()
+
+        restored = open_db(tmp_path)
+        assert restored.task_embeddings == db.task_embeddings
+        assert set(restored.vectors.id_to_row) == {f"emb_{i}" for i in range(1, 10, 2)}
+        assert restored.get_stats()["total_embeddings"] == 5
+
+    def test_snapshot_leaves_out_deleted_rows(self, tmp_path):
+        db = open_db(tmp_path)
+        for i in range(10):
+            db.add_embedding(make_embedding(i, task_id="task_1" if i < 6 else "task_2"))
+        db.delete_task("task_1")
+        assert db.snapshot()["rows"] == 4
+        db.persistence.close()
+
+        restored = open_db(tmp_path)
+        assert restored.vectors.ids == [f"emb_{i}" for i in range(6, 10)]
+        assert restored.vectors.dead_rows == 0
+        for i in range(6, 10):
+            assert np.allclose(restored.vectors[f"emb_{i}"], db.vectors[f"emb_{i}"])
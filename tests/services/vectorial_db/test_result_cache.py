@@ -0,0 +1,115 @@
+import numpy as np
+
+from services.vectorial_db.hnsw import HNSWIndex
+from services.vectorial_db.main import VectorDatabase
+from services.vectorial_db.result_cache import SearchResultCache, query_key
+from shared.models.embedding import Embedding
+
+DIM = 16
+
+
+def make_embedding(i, task_id):
+    return Embedding(
+        id=f"emb_{i}",
+        chunk_id=f"chunk_{i}",
+        task_id=task_id,
+        vector=np.random.default_rng(i).standard_normal(DIM).tolist(),
+        model_name="mock-model",
+        dimension=DIM
+    )
+
+
+def cached_db(n=30, **kwargs):
+    db = VectorDatabase(cache=SearchResultCache(max_entries=100), **kwargs)
+    for i in range(n):
+        db.add_embedding(make_embedding(i, "task_a" if i % 2 else "task_b"))
+    return db
+
+
+class TestSearchResultCache:
+    def test_key_ignores_scale_and_precision(self):
+        query = np.random.default_rng(0).standard_normal(DIM)
+        assert query_key(query, 5) == query_key(query * 2, 5)
+        assert query_key(query.tolist(), 5) == query_key(query.astype(np.float32), 5)
+        assert query_key(query, 5, ["b", "a"]) == query_key(query, 5, ["a", "b", "a"])
+        assert query_key(query, 5) != query_key(query, 6)
+        assert query_key(query, 5) != query_key(query, 5, ["a"])
+        assert query_key(query, 5) != query_key(-query, 5)
+
+    def test_lru_eviction(self):
+        cache = SearchResultCache(max_entries=2)
+        cache.put("a", 0, [1])
+        cache.put("b", 0, [2])
+        assert cache.get("a", 0) == [1]
+        cache.put("c", 0, [3])
+        assert cache.get("b", 0) is None
+        assert cache.get("a", 0) == [1] and cache.get("c", 0) == [3]
+        assert cache.get_stats()["evictions"] == 1
+
+    def test_version_mismatch_and_ttl_are_misses(self, monkeypatch):
+        cache = SearchResultCache(ttl_seconds=10)
+        cache.put("a", 1, [1])
+        assert cache.get("a", 2) is None
+        assert len(cache) == 0
+
+        now = [100.0]
+        monkeypatch.setattr("services.vectorial_db.result_cache.time.monotonic", lambda: now[0])
+        cache.put("b", 1, [2])
+        now[0] += 11
+        assert cache.get("b", 1) is None
+        stats = cache.get_stats()
+        assert stats["invalidations"] == 1 and stats["expirations"] == 1
+        assert stats["hits"] == 0 and stats["misses"] == 2
+
+
+class TestCachedSearch:
+    def test_repeated_query_is_a_hit(self):
+        db = cached_db()
+        query = make_embedding(3, "task_a").vector
+        first = db.search(query, top_k=5)
+        assert db.search(query, top_k=5) is first
+        assert db.cache.hits == 1 and db.cache.misses == 1
+        assert db.get_stats()["result_cache"]["hit_rate"] == 0.5
+
+    def test_writes_invalidate_only_affected_tasks(self):
+        db = cached_db()
+        query = make_embedding(3, "task_a").vector
+        db.search(query, top_k=5, task_ids=["task_a"])
+        db.search(query, top_k=5)
+
+        db.add_embedding(make_embedding(100, "task_b"))
+        db.search(query, top_k=5, task_ids=["task_a"])
+        assert db.cache.hits == 1
+        db.search(query, top_k=5)
+        assert db.cache.invalidations == 1
+
+        # A new vector in task_a that matches the query exactly must show up
+        db.add_embeddings([{"id": "dup", "chunk_id": "dup", "task_id": "task_a"}], vectors=np.array([query]))
+        results = db.search(query, top_k=5, task_ids=["task_a"])
+        assert db.cache.invalidations == 2
+        assert {r["embedding_id"] for r in results[:2]} == {"emb_3", "dup"}
+
+    def test_delete_invalidates(self):
+        db = cached_db()
+        query = make_embedding(4, "task_b").vector
+        assert db.search(query, top_k=1, task_ids=["task_b"])[0]["embedding_id"] == "emb_4"
+        db.delete_task("task_b")
+        assert db.search(query, top_k=1, task_ids=["task_b"]) == []
+        assert all(r["metadata"]["task_id"] == "task_a" for r in db.search(query, top_k=5))
+
+    def test_batch_search_shares_the_cache(self):
+        db = cached_db()
+        queries = [make_embedding(i, "task_a").vector for i in range(3)]
+        single = [db.search(q, top_k=3, task_ids=["task_a"]) for q in queries[:2]]
+        batched = db.search_batch(queries, [3, 3, 3], [["task_a"]] * 3)
+        assert batched[:2] == single
+        assert db.cache.hits == 2 and db.cache.misses == 3
+        assert db.search(queries[2], top_k=3, task_ids=["task_a"]) is batched[2]
+
+    def test_index_retrain_invalidates(self):
+        db = cached_db(index=HNSWIndex(M=8, ef_construction=32))
+        query = make_embedding(5, "task_a").vector
+        db.search(query, top_k=3)
+        db.train_index()
+        db.search(query, top_k=3)
+        assert db.cache.hits == 0 and db.cache.invalidations == 1
@@ -0,0 +1,74 @@
+import os
+import pytest
+import numpy as np
+
+from services.vectorial_db.codecs import ScalarQuantizer8Codec
+from services.vectorial_db.ivf import IVFIndex
+from services.vectorial_db.segments import SegmentedVectorStore
+from services.vectorial_db.store import VectorStore
+
+
+@pytest.fixture
+def random_vectors():
+    rng = np.random.default_rng(11)
+    return rng.standard_normal((250, 16)).astype(np.float32)
+
+
+def filled(store, vectors):
+    store.add_batch([f"emb_{i}" for i in range(len(vectors))], vectors)
+    return store
+
+
+class TestSegmentedVectorStore:
+    def test_full_segments_are_sealed_to_disk(self, tmp_path, random_vectors):
+        store = filled(SegmentedVectorStore(str(tmp_path), segment_rows=64), random_vectors)
+        assert len(store.segments) == 3
+        assert sorted(os.listdir(tmp_path)) == ["segment_0000_000000.bin", "segment_0000_000001.bin", "segment_0000_000002.bin"]
+        assert store.mapped_bytes() == 3 * 64 * 16 * 4
+        assert store.memory_bytes() == (250 - 192) * 16 * 4
+
+    def test_matches_in_memory_store(self, tmp_path, random_vectors):
+        segmented = filled(SegmentedVectorStore(str(tmp_path), segment_rows=64), random_vectors)
+        plain = filled(VectorStore(), random_vectors)
+        assert np.allclose(segmented.matrix, plain.matrix)
+        for query in random_vectors[:10]:
+            rows, scores = segmented.search(query, top_k=7)
+            expected_rows, expected_scores = plain.search(query, top_k=7)
+            assert rows.tolist() == expected_rows.tolist()
+            assert np.allclose(scores, expected_scores)
+
+    def test_subset_search_spans_segments(self, tmp_path, random_vectors):
+        store = filled(SegmentedVectorStore(str(tmp_path), segment_rows=64), random_vectors)
+        rows = np.array([3, 70, 140, 200, 249])
+        found, _ = store.search(random_vectors[140], top_k=1, rows=rows)
+        assert found.tolist() == [140]
+
+    def test_one_by_one_adds_and_overwrite_in_sealed_segment(self, tmp_path, random_vectors):
+        store = SegmentedVectorStore(str(tmp_path), segment_rows=32)
+        for i, vector in enumerate(random_vectors[:100]):
+            store.add(f"emb_{i}", vector)
+        assert len(store.segments) == 3
+        row = store.add("emb_5", random_vectors[150])
+        assert row == 5
+        assert len(store) == 100
+        assert store.search(random_vectors[150], top_k=1)[0].tolist() == [5]
+
+    def test_codec_is_trained_before_first_seal(self, tmp_path, random_vectors):
+        store = filled(SegmentedVectorStore(str(tmp_path), segment_rows=64, codec=ScalarQuantizer8Codec(),
+                                            codec_train_threshold=10000), random_vectors)
+        assert store.encoded
+        assert all(segment.dtype == np.uint8 for segment in store.segments)
+        rows, _ = store.search(random_vectors[77], top_k=1)
+        assert rows.tolist() == [77]
+
+    def test_stale_segment_files_are_removed(self, tmp_path):
+        (tmp_path / "segment_000000.bin").write_bytes(b"stale")
+        SegmentedVectorStore(str(tmp_path), segment_rows=8)
+        assert os.listdir(tmp_path) == []
+
+    def test_ivf_over_segments(self, tmp_path, random_vectors):
+        store = filled(SegmentedVectorStore(str(tmp_path), segment_rows=64), random_vectors)
+        index = IVFIndex(n_lists=4, nprobe=4)
+        index.train(store)
+        rows, _ = index.search(store, random_vectors[200], top_k=1)
+        assert rows.tolist() == [200]
@@ -0,0 +1,38 @@
+from collections import Counter
+
+from shared.utils.sharding import ConsistentHashRing, ring_from_env, stable_hash
+
+NODES = [f"http://vectorial-db-{i}:8006" for i in range(1, 5)]
+
+
+class TestConsistentHashRing:
+    def test_stable_hash_is_deterministic(self):
+        assert stable_hash("task_1") == stable_hash("task_1")
+        assert stable_hash("task_1") != stable_hash("task_2")
+
+    def test_keys_spread_over_all_nodes(self):
+        ring = ConsistentHashRing(NODES, vnodes=160)
+        counts = Counter(ring.node_for(f"task_{i}") for i in range(4000))
+        assert set(counts) == set(NODES)
+        assert max(counts.values()) < 1.5 * 1000
+
+    def test_adding_a_node_moves_only_its_share(self):
+        keys = [f"task_{i}" for i in range(4000)]
+        before = ConsistentHashRing(NODES)
+        after = ConsistentHashRing(NODES + ["http://vectorial-db-5:8006"])
+        moved = [k for k in keys if before.node_for(k) != after.node_for(k)]
+        assert all(after.node_for(k) == "http://vectorial-db-5:8006" for k in moved)
+        assert len(moved) < 0.35 * len(keys)
+
+    def test_partition_groups_by_owner(self):
+        ring = ConsistentHashRing(NODES)
+        keys = [f"task_{i}" for i in range(50)]
+        owned = ring.partition(keys)
+        assert sorted(k for ks in owned.values() for k in ks) == sorted(keys)
+        assert all(ring.node_for(k) == node for node, ks in owned.items() for k in ks)
+
+    def test_ring_from_env(self):
+        assert ring_from_env(None) is None
+        assert ring_from_env("http://vectorial-db-1:8006") is None
+        ring = ring_from_env(" http://a:8006 , http://b:8006,")
+        assert ring.nodes == ["http://a:8006", "http://b:8006"]
@@ -0,0 +1,180 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+import numpy as np
+
+from services.vectorial_db.codecs import ScalarQuantizer8Codec
+from services.vectorial_db.main import SearchRequest, VectorDatabase, vector_service
+from services.vectorial_db.shared_store import (
+    SharedStorePublisher, SharedStoreReader, attach_reader, search_shared_store
+)
+from services.vectorial_db.store import VectorStore
+
+DIM = 16
+
+
+def add_rows(db, vectors, start, stop, tasks=4):
+    db.add_embeddings([{"id": f"emb_{i}", "chunk_id": f"chunk_{i}", "task_id": f"task_{i % tasks}",
+                        "metadata": {"page": i} if i % 2 else {}} for i in range(start, stop)],
+                      vectors=vectors[start:stop])
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(5).standard_normal((600, DIM)).astype(np.float32)
+
+
+@pytest.fixture
+def shared(tmp_path):
+    publisher = SharedStorePublisher(str(tmp_path / "shm"), initial_capacity=64)
+    yield publisher, SharedStoreReader(publisher.directory)
+    publisher.close()
+
+
+def assert_same_results(db, reader, query, top_k=5, task_ids=None):
+    expected = db.search(query.tolist(), top_k=top_k, task_ids=task_ids)
+    found = reader.search(query.tolist(), top_k, task_ids)
+    assert [r["embedding_id"] for r in found] == [r["embedding_id"] for r in expected]
+    assert [r["metadata"] for r in found] == [r["metadata"] for r in expected]
+    assert np.allclose([r["score"] for r in found], [r["score"] for r in expected], atol=1e-6)
+
+
+class TestSharedStore:
+    def test_reader_matches_the_writer(self, vectors, shared):
+        publisher, reader = shared
+        db = VectorDatabase()
+        assert reader.search(vectors[0].tolist(), 5) == []
+        add_rows(db, vectors, 0, 300)
+        assert publisher.publish(db) and not publisher.publish(db)
+
+        for row in (3, 150, 299):
+            assert_same_results(db, reader, vectors[row])
+            assert_same_results(db, reader, vectors[row], task_ids=["task_1", "task_3"])
+        assert reader.search(vectors[0].tolist(), 5, ["missing"]) == []
+
+    def test_appends_are_picked_up_in_the_same_generation(self, vectors, shared):
+        publisher, reader = shared
+        db = VectorDatabase()
+        add_rows(db, vectors, 0, 50)
+        publisher.publish(db)
+        assert_same_results(db, reader, vectors[10])
+
+        # Past the initial capacity: the files grow in place and the reader remaps them
+        add_rows(db, vectors, 50, 600, tasks=7)
+        publisher.publish(db)
+        assert publisher.generation == 1 and publisher.full_publishes == 1
+        assert_same_results(db, reader, vectors[555])
+        assert_same_results(db, reader, vectors[555], task_ids=["task_6"])
+
+    def test_publish_between_a_store_append_and_its_metadata(self, vectors, shared):
+        publisher, reader = shared
+        db = VectorDatabase()
+        add_rows(db, vectors, 0, 50)
+        publisher.publish(db)
+        register_rows = db._register_rows
+
+        def publish_then_register(*args):
+            # A publish in the worker thread lands after the rows reach the store, before their metadata
+            publisher.publish(db)
+            register_rows(*args)
+
+        db._register_rows = publish_then_register
+        add_rows(db, vectors, 50, 80, tasks=5)
+        assert publisher.rows == 50
+
+        assert publisher.publish(db)
+        found = reader.search(vectors[64].tolist(), 3, ["task_4"])
+        assert found[0]["embedding_id"] == "emb_64" and found[0]["metadata"]["chunk_id"] == "chunk_64"
+        assert_same_results(db, reader, vectors[64], task_ids=["task_4"])
+
+    def test_deletes_only_rewrite_tombstones(self, vectors, shared):
+        publisher, reader = shared
+        db = VectorDatabase()
+        add_rows(db, vectors, 0, 200)
+        publisher.publish(db)
+        db.delete_task("task_1")
+        publisher.publish(db)
+
+        assert publisher.generation == 1
+        found = reader.search(vectors[5].tolist(), 20)
+        assert all(r["metadata"]["task_id"] != "task_1" for r in found)
+        assert_same_results(db, reader, vectors[5], top_k=20)
+        assert reader.search(vectors[5].tolist(), 5, ["task_1"]) == []
+
+    @pytest.mark.parametrize("rewrite", ["overwrite", "compact", "purge"])
+    def test_row_rewrites_start_a_new_generation(self, vectors, shared, rewrite):
+        publisher, reader = shared
+        db = VectorDatabase()
+        add_rows(db, vectors, 0, 200)
+        add_rows(db, vectors, 200, 260, tasks=2)
+        db.delete_task("task_3")
+        publisher.publish(db)
+        assert_same_results(db, reader, vectors[7])
+
+        if rewrite == "overwrite":
+            add_rows(db, vectors[::-1].copy(), 0, 1)
+        elif rewrite == "compact":
+            assert db.compact()
+        else:
+            assert db.purge()
+        publisher.publish(db)
+
+        assert publisher.generation == 2
+        assert_same_results(db, reader, vectors[7])
+        assert_same_results(db, reader, vectors[220], task_ids=["task_0"])
+
+    def test_codec_rows_are_re_ranked_from_full_precision(self, vectors, shared):
+        publisher, reader = shared
+        db = VectorDatabase(store=VectorStore(codec=ScalarQuantizer8Codec(), codec_train_threshold=100,
+                                              rerank_factor=4))
+        add_rows(db, vectors, 0, 50)
+        publisher.publish(db)
+        # Training the codec re-encodes every row
+        add_rows(db, vectors, 50, 400)
+        publisher.publish(db)
+
+        assert publisher.generation == 2 and "full" in publisher.columns
+        assert_same_results(db, reader, vectors[321])
+        assert reader.store.encoded and reader.store.codes.dtype == np.uint8
+
+    def test_search_processes(self, vectors, shared):
+        publisher, _ = shared
+        db = VectorDatabase()
+        add_rows(db, vectors, 0, 300)
+        publisher.publish(db)
+        with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=attach_reader, initargs=(publisher.directory,)) as pool:
+            found = pool.submit(search_shared_store, vectors[42].tolist(), 3).result()
+            assert found == db.search(vectors[42].tolist(), top_k=3)
+            add_rows(db, vectors, 300, 400)
+            publisher.publish(db)
+            found = list(pool.map(search_shared_store, [vectors[i].tolist() for i in (350, 399)], [1, 1]))
+            assert [r[0]["embedding_id"] for r in found] == ["emb_350", "emb_399"]
+
+    @pytest.mark.asyncio
+    async def test_service_publishes_in_the_background(self, vectors, shared, monkeypatch):
+        publisher, reader = shared
+        db = VectorDatabase()
+        add_rows(db, vectors, 0, 100)
+        monkeypatch.setattr(vector_service, "db", db)
+        monkeypatch.setattr(vector_service, "publisher", publisher)
+        monkeypatch.setattr(vector_service, "search_processes", object())
+        monkeypatch.setattr(vector_service, "published_generation", None)
+        monkeypatch.setattr(vector_service, "publish_task", None)
+        request = SearchRequest(query_vector=vectors[7].tolist(), top_k=1)
+
+        # Nothing published yet, so the writer answers
+        assert not vector_service.searches_in_processes(request)
+        vector_service.schedule_publish()
+        await vector_service.publish_task
+        assert vector_service.searches_in_processes(request)
+        assert_same_results(db, reader, vectors[7])
+
+        add_rows(db, vectors, 100, 150)
+        vector_service.schedule_publish()
+        # Readers keep the last published generation until the background publish lands
+        assert reader.search(vectors[120].tolist(), 1)[0]["embedding_id"] != "emb_120"
+        await vector_service.publish_task
+        assert reader.search(vectors[120].tolist(), 1)[0]["embedding_id"] == "emb_120"
+        assert vector_service.published_generation == db._generation
@@ -0,0 +1,135 @@
+import pytest
+import numpy as np
+
+from services.vectorial_db.codecs import SCAN_BLOCK_ROWS
+from services.vectorial_db.store import VectorStore, top_k_indices, normalize_rows
+
+
+@pytest.fixture
+def random_vectors():
+    rng = np.random.default_rng(42)
+    return rng.standard_normal((200, 32)).astype(np.float32)
+
+
+class TestTopK:
+    def test_top_k_indices_sorted_descending(self):
+        scores = np.array([0.1, 0.9, 0.5, 0.7, 0.3], dtype=np.float32)
+        assert top_k_indices(scores, 3).tolist() == [1, 3, 2]
+
+    def test_top_k_larger_than_input(self):
+        scores = np.array([0.2, 0.8], dtype=np.float32)
+        assert top_k_indices(scores, 10).tolist() == [1, 0]
+
+    def test_top_k_zero(self):
+        assert top_k_indices(np.array([0.5]), 0).tolist() == []
+
+
+class TestVectorStore:
+    def test_rows_are_normalized_float32(self, random_vectors):
+        store = VectorStore()
+        for i, vector in enumerate(random_vectors):
+            store.add(f"emb_{i}", vector)
+
+        assert store.matrix.dtype == np.float32
+        assert np.allclose(np.linalg.norm(store.matrix, axis=1), 1.0, atol=1e-5)
+
+    def test_growth_preserves_rows(self, random_vectors):
+        store = VectorStore(initial_capacity=4)
+        for i, vector in enumerate(random_vectors):
+            store.add(f"emb_{i}", vector)
+
+        assert len(store) == 200
+        assert np.allclose(store.matrix, normalize_rows(random_vectors), atol=1e-6)
+        assert store.id_to_row["emb_150"] == 150
+        assert store.ids[150] == "emb_150"
+
+    def test_re_adding_id_overwrites_row(self):
+        store = VectorStore()
+        store.add("a", [1.0, 0.0])
+        store.add("a", [0.0, 2.0])
+
+        assert len(store) == 1
+        assert np.allclose(store["a"], [0.0, 1.0])
+
+    def test_dimension_mismatch_raises(self):
+        store = VectorStore()
+        store.add("a", [1.0, 0.0])
+        with pytest.raises(ValueError):
+            store.add("b", [1.0, 0.0, 0.0])
+
+    def test_search_matches_exact_cosine(self, random_vectors):
+        store = VectorStore()
+        for i, vector in enumerate(random_vectors):
+            store.add(f"emb_{i}", vector)
+
+        query = np.random.default_rng(7).standard_normal(32)
+        rows, scores = store.search(query, top_k=10)
+
+        expected = normalize_rows(random_vectors.astype(np.float64)) @ (query / np.linalg.norm(query))
+        assert rows.tolist() == np.argsort(-expected)[:10].tolist()
+        assert np.allclose(scores, np.sort(expected)[::-1][:10], atol=1e-5)
+
+    def test_search_subset_of_rows(self, random_vectors):
+        store = VectorStore()
+        for i, vector in enumerate(random_vectors):
+            store.add(f"emb_{i}", vector)
+
+        subset = np.array([3, 10, 50, 199])
+        rows, _ = store.search(random_vectors[50], top_k=2, rows=subset)
+
+        assert rows[0] == 50
+        assert set(rows.tolist()) <= set(subset.tolist())
+
+    def test_search_empty_store(self):
+        rows, scores = VectorStore().search([0.1, 0.2], top_k=5)
+        assert len(rows) == 0
+        assert len(scores) == 0
+
+    def test_add_batch_appends_contiguous_block(self, random_vectors):
+        store = VectorStore(initial_capacity=8)
+        store.add("first", random_vectors[0])
+        rows = store.add_batch([f"emb_{i}" for i in range(1, 50)], random_vectors[1:50])
+
+        assert rows.tolist() == list(range(1, 50))
+        assert np.allclose(store["emb_20"], normalize_rows(random_vectors[20:21])[0], atol=1e-6)
+
+    def test_add_batch_rejects_existing_ids(self, random_vectors):
+        store = VectorStore()
+        store.add("a", random_vectors[0])
+        with pytest.raises(ValueError):
+            store.add_batch(["a", "b"], random_vectors[:2])
+
+
+class TestParallelScan:
+    def test_spans_follow_scan_blocks(self, random_vectors):
+        store = VectorStore(scan_threads=4, parallel_min_rows=10)
+        store.add_batch([f"emb_{i}" for i in range(200)], random_vectors)
+        assert store._scan_spans() == [(0, 200)]  # smaller than one scan block
+
+        many = np.random.default_rng(1).standard_normal((20000, 8)).astype(np.float32)
+        store = VectorStore(scan_threads=4, parallel_min_rows=1000)
+        store.add_batch([f"emb_{i}" for i in range(20000)], many)
+        spans = store._scan_spans()
+        assert len(spans) == 3 and spans[0] == (0, 8192) and spans[-1][1] == 20000
+
+    def test_parallel_scan_matches_sequential(self):
+        rows = 3 * SCAN_BLOCK_ROWS + 100
+        vectors = np.random.default_rng(2).standard_normal((rows, 16)).astype(np.float32)
+        sequential = VectorStore()
+        parallel = VectorStore(scan_threads=4, parallel_min_rows=SCAN_BLOCK_ROWS // 2)
+        for store in (sequential, parallel):
+            store.add_batch([f"emb_{i}" for i in range(rows)], vectors)
+            store.delete([f"emb_{i}" for i in range(0, rows, 7)])
+        assert len(parallel._scan_spans()) == 4
+
+        queries = vectors[:5]
+        mask = sequential.live_mask()
+        for query in queries:
+            for store_mask in (None, mask):
+                expected = sequential.search(query, 10, mask=store_mask)
+                found = parallel.search(query, 10, mask=store_mask)
+                assert found[0].tolist() == expected[0].tolist()
+                assert np.allclose(found[1], expected[1])
+        for expected, found in zip(sequential.search_batch(queries, 10, mask=mask),
+                                   parallel.search_batch(queries, 10, mask=mask)):
+            assert found[0].tolist() == expected[0].tolist()
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from shared.utils.vector_wire import (
+    VECTOR_FRAME_CONTENT_TYPE, accepts_vector_frame, decode_frame, encode_frame, is_vector_frame
+)
+
+
+class TestVectorFrame:
+    def test_float32_round_trip_is_exact(self):
+        vectors = np.random.default_rng(0).standard_normal((5, 384)).astype(np.float32)
+        fields, decoded = decode_frame(encode_frame(vectors, {"ids": list("abcde")}))
+        assert fields == {"ids": list("abcde")}
+        assert decoded.dtype == np.float32
+        assert np.array_equal(decoded, vectors)
+
+    def test_float16_halves_the_payload(self):
+        vectors = np.random.default_rng(1).standard_normal((10, 384)).astype(np.float32)
+        full, half = encode_frame(vectors, {}), encode_frame(vectors, {}, dtype="float16")
+        assert len(full) - len(half) == 10 * 384 * 2
+        _, decoded = decode_frame(half)
+        assert np.allclose(decoded, vectors, rtol=1e-3, atol=1e-3)
+
+    def test_single_vector_and_empty_batch(self):
+        assert decode_frame(encode_frame([0.5, 1.0], {}))[1].shape == (1, 2)
+        assert decode_frame(encode_frame([], {"count": 0}))[1].shape == (0, 0)
+
+    @pytest.mark.parametrize("data", [b"", b"XXXX" + bytes(20), encode_frame([[1.0, 2.0]], {})[:-1]])
+    def test_malformed_frames_are_rejected(self, data):
+        with pytest.raises(ValueError):
+            decode_frame(data)
+
+    def test_content_negotiation_helpers(self):
+        assert is_vector_frame(f"{VECTOR_FRAME_CONTENT_TYPE}; charset=binary")
+        assert not is_vector_frame("application/json")
+        assert accepts_vector_frame(f"{VECTOR_FRAME_CONTENT_TYPE}, application/json")
+        assert not accepts_vector_frame("*/*")
+        assert not accepts_vector_frame(None)
@@ -1,10 +1,17 @@
+import concurrent.futures
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pytest
 from fastapi.testclient import TestClient
 import numpy as np
 from unittest.mock import patch, Mock, AsyncMock
 
-from services.vectorial_db.main import app, vector_service, VectorDatabase
+from services.vectorial_db.main import app, vector_service, VectorDatabase, create_index, SEARCH_MAX_ATTEMPTS
+from services.vectorial_db.ivf import IVFIndex
+from services.vectorial_db.hnsw import HNSWIndex
+from services.vectorial_db.persistence import VectorPersistence
 from shared.models.embedding import Embedding
+from shared.utils.vector_wire import VECTOR_FRAME_CONTENT_TYPE, encode_frame
 
 
 @pytest.fixture
@@ -44,7 +51,11 @@ class TestVectorDatabase:
         db.add_embedding(embedding)
         
         assert "test_emb" in db.vectors
-        assert np.array_equal(db.vectors["test_emb"], np.array([0.1] * 384))
+        # Stored rows are L2-normalized float32
+        expected = np.array([0.1] * 384, dtype=np.float32)
+        expected /= np.linalg.norm(expected)
+        assert db.vectors["test_emb"].dtype == np.float32
+        assert np.allclose(db.vectors["test_emb"], expected)
         assert "test_emb" in db.metadata
         assert db.metadata["test_emb"]["chunk_id"] == "test_chunk"
         assert db.metadata["test_emb"]["task_id"] == "test_task"
@@ -97,6 +108,179 @@ class TestVectorDatabase:
         assert stats["total_tasks"] == 2
         assert "task_123" in stats["tasks"]
         assert "task_456" in stats["tasks"]
+    
+    def test_search_batch_matches_single_searches(self, sample_embeddings):
+        db = VectorDatabase()
+        for emb in sample_embeddings:
+            db.add_embedding(emb)
+        
+        queries = [emb.vector for emb in sample_embeddings]
+        top_k = [1, 3, 5, 2, 4]
+        task_ids = [None, ["task_123"], None, ["task_456"], ["missing"]]
+        batched = db.search_batch(queries, top_k, task_ids)
+        
+        for query, k, tasks, results in zip(queries, top_k, task_ids, batched):
+            expected = db.search(query, top_k=k, task_ids=tasks)
+            assert [r["embedding_id"] for r in results] == [r["embedding_id"] for r in expected]
+            assert [r["score"] for r in results] == pytest.approx([r["score"] for r in expected], abs=1e-5)
+
+    def test_search_is_repeated_when_a_delete_races_it(self, sample_embeddings):
+        db = VectorDatabase()
+        for emb in sample_embeddings:
+            db.add_embedding(emb)
+
+        search = db._search
+        calls = []
+
+        def racing_search(*args):
+            # A delete lands on the event loop while the first scan is running
+            calls.append(args)
+            if len(calls) == 1:
+                db.delete_task("task_123")
+            return search(*args)
+
+        db._search = racing_search
+        results = db.search(sample_embeddings[0].vector, top_k=5)
+
+        assert len(calls) == 2
+        assert [r["metadata"]["task_id"] for r in results] == ["task_456", "task_456"]
+
+    def test_last_search_attempt_holds_off_writes(self, sample_embeddings):
+        db = VectorDatabase()
+        for emb in sample_embeddings:
+            db.add_embedding(emb)
+
+        search = db._search
+        writers, blocked = [], []
+
+        def racing_search(*args):
+            # Every attempt races an overwrite from another thread
+            moved = Embedding(**dict(sample_embeddings[len(writers)].dict(), task_id="task_789"))
+            writers.append(threading.Thread(target=db.add_embedding, args=(moved,)))
+            writers[-1].start()
+            writers[-1].join(timeout=0.2)
+            blocked.append(writers[-1].is_alive())
+            return search(*args)
+
+        db._search = racing_search
+        results = db.search(sample_embeddings[0].vector, top_k=5)
+        writers[-1].join(timeout=5)
+
+        # The last attempt held the write lock, so its overwrite waited for the read to finish
+        assert blocked == [False] * (SEARCH_MAX_ATTEMPTS - 1) + [True]
+        tasks = {r["embedding_id"]: r["metadata"]["task_id"] for r in results}
+        assert tasks == {"emb_0": "task_789", "emb_1": "task_789", "emb_2": "task_123",
+                         "emb_3": "task_456", "emb_4": "task_456"}
+        assert db.metadata.task_of("emb_2") == "task_789"
+
+    def test_search_overlapping_a_compaction_is_repeated(self, sample_embeddings):
+        db = VectorDatabase()
+        for i in (0, 3, 1, 4, 2):
+            db.add_embedding(sample_embeddings[i])
+        assert db.fragmentation() > 1
+
+        commit_rewrite = db.vectors.commit_rewrite
+        found = []
+
+        def search_mid_compaction(built):
+            # The store is reordered, its metadata not yet: a search on another thread gets time to finish
+            new_row_of = commit_rewrite(built)
+            found.append(executor.submit(db.search, sample_embeddings[1].vector, 1))
+            concurrent.futures.wait(found, timeout=0.2)
+            return new_row_of
+
+        db.vectors.commit_rewrite = search_mid_compaction
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            assert db.compact()
+            results = found[0].result(timeout=5)
+
+        assert results[0]["embedding_id"] == "emb_1" and results[0]["metadata"]["chunk_id"] == "chunk_1"
+        assert db.search(sample_embeddings[1].vector, top_k=1)[0]["embedding_id"] == "emb_1"
+
+    def test_ivf_index_trains_at_threshold_and_searches(self, sample_embeddings):
+        db = VectorDatabase(index=IVFIndex(n_lists=2, train_threshold=5))
+        
+        for emb in sample_embeddings[:4]:
+            db.add_embedding(emb)
+        assert not db.index.trained
+        
+        db.add_embedding(sample_embeddings[4])
+        assert db.index.trained
+        
+        results = db.search(sample_embeddings[0].vector, top_k=1, nprobe=2)
+        assert results[0]["embedding_id"] == "emb_0"
+        assert db.get_stats()["index"]["type"] == "ivf"
+    
+    def test_hnsw_index_online_inserts(self, sample_embeddings):
+        db = VectorDatabase(index=HNSWIndex(M=4))
+        
+        for emb in sample_embeddings:
+            db.add_embedding(emb)
+        
+        assert len(db.index) == 5
+        results = db.search(sample_embeddings[2].vector, top_k=2, ef_search=10)
+        assert results[0]["embedding_id"] == "emb_2"
+        
+        filtered = db.search(sample_embeddings[2].vector, top_k=5, task_ids=["task_456"])
+        assert {r["metadata"]["task_id"] for r in filtered} == {"task_456"}
+    
+    @pytest.mark.parametrize("index", [None, HNSWIndex(M=4)])
+    def test_bulk_add_matches_one_by_one(self, index, sample_embeddings):
+        one_by_one = VectorDatabase(index=HNSWIndex(M=4) if index is not None else None)
+        for emb in sample_embeddings:
+            one_by_one.add_embedding(emb)
+        bulk = VectorDatabase(index=index)
+        
+        received = bulk.add_embeddings([emb.dict() for emb in sample_embeddings])
+        
+        assert received == {"task_123": 3, "task_456": 2}
+        assert bulk.vectors.ids == one_by_one.vectors.ids
+        assert np.allclose(bulk.vectors.matrix, one_by_one.vectors.matrix)
+        assert bulk.task_embeddings == one_by_one.task_embeddings
+        assert bulk.task_ranges == one_by_one.task_ranges
+        results = bulk.search(sample_embeddings[3].vector, top_k=1, ef_search=10)
+        assert results[0]["embedding_id"] == "emb_3"
+    
+    def test_bulk_add_overwrites_repeated_ids(self, sample_embeddings):
+        db = VectorDatabase()
+        db.add_embedding(sample_embeddings[0])
+        batch = [emb.dict() for emb in sample_embeddings[:3]] + [dict(sample_embeddings[2].dict(), vector=[0.5] * 384)]
+        
+        db.add_embeddings(batch)
+        
+        assert len(db.vectors) == 3
+        assert db.task_embeddings["task_123"] == ["emb_0", "emb_1", "emb_2"]
+        assert np.allclose(db.vectors["emb_2"], np.full(384, 1 / np.sqrt(384)))
+
+    def test_readding_an_id_under_another_task_moves_it(self, sample_embeddings):
+        db = VectorDatabase()
+        for emb in sample_embeddings:
+            db.add_embedding(emb)
+
+        db.add_embedding(Embedding(**dict(sample_embeddings[1].dict(), task_id="task_456")))
+
+        query = sample_embeddings[1].vector
+        kept = db.search(query, top_k=5, task_ids=["task_123"])
+        assert sorted(r["embedding_id"] for r in kept) == ["emb_0", "emb_2"]
+        moved = db.search(query, top_k=5, task_ids=["task_456"])
+        assert moved[0]["embedding_id"] == "emb_1"
+        assert sorted(r["embedding_id"] for r in moved) == ["emb_1", "emb_3", "emb_4"]
+        assert db.task_ranges == {"task_123": [[0, 1], [2, 3]], "task_456": [[1, 2], [3, 5]]}
+
+        # Moving the last rows out of a task drops it; deleting the new task takes the moved row along
+        for emb in (sample_embeddings[0], sample_embeddings[2]):
+            db.add_embedding(Embedding(**dict(emb.dict(), task_id="task_456")))
+        assert "task_123" not in db.task_embeddings
+        assert db.task_ranges == {"task_456": [[0, 5]]}
+        assert db.delete_task("task_456") == 5
+        assert db.search(query, top_k=5) == []
+
+    def test_create_index(self):
+        assert create_index("flat") is None
+        assert isinstance(create_index("ivf"), IVFIndex)
+        assert isinstance(create_index("hnsw"), HNSWIndex)
+        with pytest.raises(ValueError):
+            create_index("unknown")
 
 
 class TestVectorDatabaseService:
@@ -123,6 +307,82 @@ class TestVectorDatabaseService:
         
         assert len(service.db.vectors) == 0
 
+    
+    @pytest.mark.asyncio
+    async def test_task_is_vectorized_once_all_embeddings_arrive(self, sample_embeddings, monkeypatch):
+        service = vector_service
+        monkeypatch.setattr(service, "db", VectorDatabase())
+        monkeypatch.setattr(service, "expected_embeddings", {})
+        monkeypatch.setattr(service, "vectorized_tasks", set())
+        payloads = [dict(emb.dict(), task_embedding_count=3 if emb.task_id == "task_123" else 2)
+                    for emb in sample_embeddings]
+        client = AsyncMock()
+        client.put.return_value = Mock(status_code=200)
+        
+        service.ingest_batch(payloads[:2])
+        await service.report_vectorized_tasks(client)
+        assert client.put.call_count == 0
+        
+        # Re-delivered embeddings do not count twice
+        service.ingest_batch(payloads[1:2])
+        await service.report_vectorized_tasks(client)
+        assert client.put.call_count == 0
+        
+        service.ingest_batch(payloads[2:])
+        await service.report_vectorized_tasks(client)
+        updated = sorted(call.args[0] for call in client.put.call_args_list)
+        assert updated == [f"{service.master_task_db_url}/tasks/task_123/status",
+                           f"{service.master_task_db_url}/tasks/task_456/status"]
+        assert service.expected_embeddings == {}
+        assert service.vectorized_tasks == set()
+    
+    @pytest.mark.asyncio
+    async def test_failed_status_update_is_retried(self, sample_embeddings, monkeypatch):
+        service = vector_service
+        monkeypatch.setattr(service, "db", VectorDatabase())
+        monkeypatch.setattr(service, "expected_embeddings", {})
+        monkeypatch.setattr(service, "vectorized_tasks", set())
+        client = AsyncMock()
+        client.put.return_value = Mock(status_code=503)
+        
+        service.ingest_batch([dict(sample_embeddings[3].dict(), task_embedding_count=1)])
+        await service.report_vectorized_tasks(client)
+        assert service.vectorized_tasks == {"task_456"}
+        
+        client.put.return_value = Mock(status_code=200)
+        await service.report_vectorized_tasks(client)
+        assert service.vectorized_tasks == set()
+        assert client.put.call_count == 2
+
+    
+    @pytest.mark.asyncio
+    async def test_maintenance_builds_compactions_and_snapshots_off_the_loop(self, sample_embeddings, monkeypatch, tmp_path):
+        service = vector_service
+        db = VectorDatabase(persistence=VectorPersistence(str(tmp_path)))
+        for i in (0, 3, 1, 4, 2):
+            db.add_embedding(sample_embeddings[i])
+        monkeypatch.setattr(service, "db", db)
+        monkeypatch.setattr(service, "running", True)
+        monkeypatch.setattr(service, "snapshot_interval", 0)
+        monkeypatch.setattr(service, "snapshot_min_records", 1)
+        monkeypatch.setattr(service, "compact_max_ranges", 1.0)
+        built_on = {}
+
+        def on_thread(build):
+            def run(job):
+                built_on[build.__name__] = threading.get_ident()
+                # One pass of the loop is enough
+                service.running = build.__name__ != "build_snapshot"
+                return build(job)
+            return run
+
+        db.build_compact = on_thread(db.build_compact)
+        db.build_snapshot = on_thread(db.build_snapshot)
+        await service.maintenance_loop()
+
+        assert set(built_on) == {"build_compact", "build_snapshot"}
+        assert threading.get_ident() not in built_on.values()
+        assert db.fragmentation() == 1.0 and db.persistence.last_snapshot["rows"] == 5
 
 class TestAPI:
     def test_search_endpoint(self, client, sample_embeddings):
@@ -154,6 +414,66 @@ class TestAPI:
         for result in data["results"]:
             assert result["metadata"]["task_id"] == "task_123"
     
+    def test_search_endpoint_with_nprobe(self, client, sample_embeddings):
+        vector_service.db = VectorDatabase(index=IVFIndex(n_lists=2, train_threshold=1))
+        
+        for emb in sample_embeddings:
+            vector_service.db.add_embedding(emb)
+        
+        response = client.post("/search", json={
+            "query_vector": sample_embeddings[3].vector,
+            "top_k": 1,
+            "nprobe": 2
+        })
+        
+        assert response.status_code == 200
+        assert response.json()["results"][0]["embedding_id"] == "emb_3"
+    
+    def test_search_batch_endpoint(self, client, sample_embeddings):
+        for emb in sample_embeddings:
+            vector_service.db.add_embedding(emb)
+        
+        response = client.post("/search/batch", json={
+            "queries": [
+                {"query_vector": sample_embeddings[0].vector, "top_k": 2},
+                {"query_vector": sample_embeddings[4].vector, "top_k": 5, "task_ids": ["task_456"]}
+            ]
+        })
+        
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert len(results) == 2
+        assert len(results[0]) == 2
+        assert results[0][0]["embedding_id"] == "emb_0"
+        assert [r["embedding_id"] for r in results[1]][0] == "emb_4"
+        assert {r["metadata"]["task_id"] for r in results[1]} == {"task_456"}
+    
+    def test_search_endpoint_accepts_vector_frames(self, client, sample_embeddings):
+        for emb in sample_embeddings:
+            vector_service.db.add_embedding(emb)
+        headers = {"Content-Type": VECTOR_FRAME_CONTENT_TYPE}
+        
+        frame = encode_frame(sample_embeddings[1].vector, {"top_k": 2, "task_ids": ["task_123"]})
+        response = client.post("/search", content=frame, headers=headers)
+        assert response.status_code == 200
+        assert response.json()["results"][0]["embedding_id"] == "emb_1"
+        
+        frame = encode_frame([sample_embeddings[0].vector, sample_embeddings[4].vector],
+                             {"queries": [{"top_k": 1}, {"top_k": 1, "task_ids": ["task_456"]}]}, dtype="float16")
+        response = client.post("/search/batch", content=frame, headers=headers)
+        assert [r[0]["embedding_id"] for r in response.json()["results"]] == ["emb_0", "emb_4"]
+    
+    def test_search_endpoint_rejects_bad_bodies(self, client):
+        headers = {"Content-Type": VECTOR_FRAME_CONTENT_TYPE}
+        assert client.post("/search", content=b"garbage", headers=headers).status_code == 400
+        frame = encode_frame([0.1] * 384, {"top_k": "many"})
+        assert client.post("/search", content=frame, headers=headers).status_code == 422
+        assert client.post("/search", json={"top_k": 3}).status_code == 422
+    
+    def test_train_index_endpoint_requires_index(self, client):
+        response = client.post("/index/train")
+        assert response.status_code == 400
+    
     def test_stats_endpoint(self, client, sample_embeddings):
         service = vector_service
         
@@ -183,7 +503,32 @@ class TestAPI:
         
         response = client.get("/embeddings/non_existent_task")
         assert response.status_code == 404
-    
+
+    def test_delete_task_embeddings_endpoint(self, client, sample_embeddings):
+        service = vector_service
+
+        for emb in sample_embeddings:
+            service.db.add_embedding(emb)
+        service.vectorized_tasks.add("task_123")
+
+        response = client.delete("/embeddings/task_123")
+
+        assert response.status_code == 200
+        assert response.json() == {"task_id": "task_123", "deleted": 3}
+        assert "task_123" not in service.vectorized_tasks
+        assert client.get("/embeddings/task_123").status_code == 404
+
+        response = client.post("/search", json={"query_vector": sample_embeddings[0].vector, "top_k": 5})
+        results = response.json()["results"]
+        assert len(results) == 2
+        assert all(r["metadata"]["task_id"] == "task_456" for r in results)
+
+        stats = client.get("/stats").json()
+        assert stats["total_embeddings"] == 2
+        assert stats["deleted_rows"] == 3
+
+        assert client.delete("/embeddings/task_123").status_code == 404
+
     def test_health_check_endpoint(self, client):
         response = client.get("/health")
         